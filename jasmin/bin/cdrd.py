@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+import os
+import signal
+import sys
+import syslog
+
+from lockfile import FileLock, LockTimeout, AlreadyLocked
+from twisted.internet import reactor, defer
+from twisted.python import usage
+
+from jasmin.cdr.configs import CDRConfig
+from jasmin.cdr.sinks import SQLSink
+from jasmin.cdr.writer import CDRWriter
+from jasmin.queues.configs import AmqpConfig
+from jasmin.queues.factory import AmqpFactory
+from jasmin.config import ROOT_PATH
+from jasmin.bin import BaseDaemon
+
+CONFIG_PATH = os.getenv('CONFIG_PATH', '%s/etc/jasmin/' % ROOT_PATH)
+
+
+class Options(usage.Options):
+    optParameters = [
+        ['config', 'c', '%s/cdr.cfg' % CONFIG_PATH,
+         'Jasmin cdrd configuration file'],
+        ['id', 'i', 'master',
+         'Daemon id, need to be different for each cdrd daemon'],
+    ]
+
+    optFlags = [
+    ]
+
+
+class CdrDaemon(BaseDaemon):
+    def startAMQPBrokerService(self):
+        """Start AMQP Broker"""
+
+        AMQPServiceConfigInstance = AmqpConfig(self.options['config'])
+        self.components['amqp-broker-factory'] = AmqpFactory(AMQPServiceConfigInstance)
+        self.components['amqp-broker-factory'].preConnect()
+
+        # Add service
+        self.components['amqp-broker-client'] = reactor.connectTCP(
+            AMQPServiceConfigInstance.host,
+            AMQPServiceConfigInstance.port,
+            self.components['amqp-broker-factory'])
+
+    def stopAMQPBrokerService(self):
+        """Stop AMQP Broker"""
+
+        return self.components['amqp-broker-client'].disconnect()
+
+    def startCDRWriterService(self):
+        """Start CDRWriter"""
+
+        CDRConfigInstance = CDRConfig(self.options['config'])
+        self.components['cdr-writer'] = CDRWriter(CDRConfigInstance, SQLSink(CDRConfigInstance))
+
+        # AMQP Broker is used to listen to CDRWriter queue
+        return self.components['cdr-writer'].addAmqpBroker(self.components['amqp-broker-factory'])
+
+    def stopCDRWriterService(self):
+        """Stop CDRWriter"""
+        return self.components['cdr-writer'].stopService()
+
+    @defer.inlineCallbacks
+    def start(self):
+        """Start Cdrd daemon"""
+        syslog.syslog(syslog.LOG_INFO, "Starting Cdr Daemon ...")
+
+        ########################################################
+        # Start AMQP Broker
+        try:
+            self.startAMQPBrokerService()
+            yield self.components['amqp-broker-factory'].getChannelReadyDeferred()
+        except Exception as e:
+            syslog.syslog(syslog.LOG_ERR, "  Cannot start AMQP Broker: %s" % e)
+        else:
+            syslog.syslog(syslog.LOG_INFO, "  AMQP Broker Started.")
+
+        ########################################################
+        try:
+            # Start CDRWriter
+            yield self.startCDRWriterService()
+        except Exception as e:
+            syslog.syslog(syslog.LOG_ERR, "  Cannot start CDRWriter: %s" % e)
+        else:
+            syslog.syslog(syslog.LOG_INFO, "  CDRWriter Started.")
+
+    @defer.inlineCallbacks
+    def stop(self):
+        """Stop Cdrd daemon"""
+        syslog.syslog(syslog.LOG_INFO, "Stopping Cdr Daemon ...")
+
+        # Buffered records are written before disconnecting: their messages are acked
+        if 'cdr-writer' in self.components:
+            yield self.stopCDRWriterService()
+            syslog.syslog(syslog.LOG_INFO, "  CDRWriter stopped.")
+
+        if 'amqp-broker-client' in self.components:
+            yield self.stopAMQPBrokerService()
+            syslog.syslog(syslog.LOG_INFO, "  AMQP Broker disconnected.")
+
+        reactor.stop()
+
+    def sighandler_stop(self, signum, frame):
+        """Handle stop signal cleanly"""
+        syslog.syslog(syslog.LOG_INFO, "Received signal to stop Cdr Daemon")
+
+        return self.stop()
+
+
+if __name__ == '__main__':
+    lock = None
+    try:
+        options = Options()
+        options.parseOptions()
+
+        # Must not be executed simultaneously (c.f. #265)
+        lock = FileLock("/tmp/cdrd-%s" % options['id'])
+
+        # Ensure there are no paralell runs of this script
+        lock.acquire(timeout=2)
+
+        # Prepare to start
+        cdr_d = CdrDaemon(options)
+        # Setup signal handlers
+        signal.signal(signal.SIGINT, cdr_d.sighandler_stop)
+        signal.signal(signal.SIGTERM, cdr_d.sighandler_stop)
+        # Start CdrDaemon
+        cdr_d.start()
+
+        reactor.run()
+    except usage.UsageError as errortext:
+        print('%s: %s' % (sys.argv[0], errortext))
+        print('%s: Try --help for usage details.' % (sys.argv[0]))
+    except LockTimeout:
+        print("Lock not acquired ! exiting")
+    except AlreadyLocked:
+        print("There's another instance on cdrd running, exiting.")
+    finally:
+        # Release the lock
+        if lock is not None and lock.i_am_locking():
+            lock.release()
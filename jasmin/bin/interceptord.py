@@ -55,6 +55,7 @@ class InterceptorDaemon(BaseDaemon):
 
     def stopInterceptorPBService(self):
         """Stop Interceptor PB server"""
+        self.components['interceptor-pb-factory'].stop()
         return self.components['interceptor-pb-server'].stopListening()
 
     @defer.inlineCallbacks
@@ -0,0 +1,6 @@
+#!/usr/bin/python3
+
+from jasmin.tools.bench.cli import main
+
+if __name__ == '__main__':
+    main()
@@ -14,8 +14,8 @@ from twisted.python import usage
 from twisted.spread import pb
 from twisted.web import server
 
-from jasmin.interceptor.configs import InterceptorPBClientConfig
-from jasmin.interceptor.proxies import InterceptorPBProxy
+from jasmin.interceptor.configs import InterceptorPBClientConfig, InterceptorPBConfig
+from jasmin.interceptor.proxies import InterceptorPBProxy, InterceptorEmbedded
 from jasmin.managers.clients import SMPPClientManagerPB
 from jasmin.managers.configs import SMPPClientPBConfig, DLRLookupConfig
 from jasmin.managers.dlr import DLRLookup
@@ -134,12 +134,20 @@ class JasminDaemon(BaseDaemon):
             pb.PBServerFactory(jPBPortalRoot),
             interface=RouterPBConfigInstance.bind)
 
+        # Redis is used to share users quotas with the other jasmind instances
+        if RouterPBConfigInstance.quota_backend == 'redis':
+            if 'rc' not in self.components:
+                raise Exception('quota_backend is redis but RedisClient is not started')
+            self.components['router-pb-factory'].addRedisClient(self.components['rc'])
+
         # AMQP Broker is used to listen to deliver_sm/dlr queues
         return self.components['router-pb-factory'].addAmqpBroker(self.components['amqp-broker-factory'])
 
+    @defer.inlineCallbacks
     def stopRouterPBService(self):
         """Stop Router PB server"""
-        return self.components['router-pb-server'].stopListening()
+        yield self.components['router-pb-factory'].stopQuotaLedger()
+        yield self.components['router-pb-server'].stopListening()
 
     def startSMPPClientManagerPBService(self):
         """Start SMPP Client Manager PB server"""
@@ -326,6 +334,11 @@ class JasminDaemon(BaseDaemon):
         """Start Interceptor client"""
 
         InterceptorPBClientConfigInstance = InterceptorPBClientConfig(self.options['config'])
+        if InterceptorPBClientConfigInstance.mode == 'embedded':
+            self.components['interceptor-pb-client'] = InterceptorEmbedded(
+                InterceptorPBConfig(self.options['config']))
+            return defer.succeed(None)
+
         self.components['interceptor-pb-client'] = InterceptorPBProxy()
 
         return self.components['interceptor-pb-client'].connect(
@@ -0,0 +1,4 @@
+# Copyright (c) Jookies LTD <jasmin@jookies.net>
+# See LICENSE for details.
+
+"""Jasmin SMS Gateway by Jookies LTD <jasmin@jookies.net>"""
@@ -0,0 +1,46 @@
+"""
+Config file handler for 'cdr' section in cdr.cfg
+"""
+
+import logging
+import os
+
+from jasmin.config import ConfigFile, ROOT_PATH, LOG_PATH
+
+CONFIG_PATH = os.getenv('CONFIG_PATH', '%s/etc/jasmin/' % ROOT_PATH)
+STORE_PATH = os.getenv('STORE_PATH', '%s/store/' % CONFIG_PATH)
+
+SINKS = ['sqlite', 'mysql', 'postgresql']
+
+
+class CDRConfig(ConfigFile):
+    """Config handler for 'cdr' section"""
+
+    def __init__(self, config_file=None):
+        ConfigFile.__init__(self, config_file)
+
+        self.sink = self._get('cdr', 'sink', 'sqlite')
+        if self.sink not in SINKS:
+            raise ValueError('Invalid cdr sink: %s, possible values are %s' % (self.sink, ', '.join(SINKS)))
+
+        self.sqlite_path = self._get('cdr', 'sqlite_path', '%s/cdr.sqlite' % STORE_PATH)
+        self.db_host = self._get('cdr', 'db_host', '127.0.0.1')
+        # 0 for the driver's default port
+        self.db_port = self._getint('cdr', 'db_port', 0)
+        self.db_database = self._get('cdr', 'db_database', 'jasmin')
+        self.db_user = self._get('cdr', 'db_user', 'jasmin')
+        self.db_pass = self._get('cdr', 'db_pass', 'jadmin')
+        self.db_table = self._get('cdr', 'db_table', 'submit_log')
+
+        # Records are written in one transaction every flush_interval milliseconds or as soon
+        # as flush_size records are buffered, messages are acked once their batch is committed
+        self.flush_size = self._getint('cdr', 'flush_size', 500)
+        self.flush_interval = self._getint('cdr', 'flush_interval', 1000)
+        self.prefetch_count = self._getint('cdr', 'prefetch_count', 2 * self.flush_size)
+
+        # Logging
+        self.log_level = logging.getLevelName(self._get('cdr', 'log_level', 'INFO'))
+        self.log_file = self._get('cdr', 'log_file', '%s/cdr.log' % LOG_PATH)
+        self.log_rotate = self._get('cdr', 'log_rotate', 'W6')
+        self.log_format = self._get('cdr', 'log_format', '%(asctime)s %(levelname)-8s %(process)d %(message)s')
+        self.log_date_format = self._get('cdr', 'log_date_format', '%Y-%m-%d %H:%M:%S')
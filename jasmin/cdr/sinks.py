@@ -0,0 +1,139 @@
+"""
+CDR sinks, writing batches of records and status updates in one transaction through
+twisted.enterprise.adbapi (the database driver is imported when the sink is created)
+"""
+
+from twisted.enterprise import adbapi
+
+COLUMNS = ['msgid', 'source_connector', 'routed_cid', 'source_addr', 'destination_addr', 'rate', 'charge',
+           'pdu_count', 'short_message', 'binary_message', 'status', 'uid', 'trials', 'created_at', 'status_at']
+
+DIALECTS = {
+    'sqlite': {
+        'param': '?',
+        'blob': 'BLOB',
+        'timestamp': 'TIMESTAMP',
+        'upsert': 'ON CONFLICT (msgid) DO UPDATE SET trials = trials + excluded.trials, status = excluded.status, '
+                  'status_at = excluded.status_at',
+        # SQLite builds may limit a statement to 999 parameters
+        'max_params': 999,
+        'inline_indexes': False,
+    },
+    'mysql': {
+        'param': '%s',
+        'blob': 'BLOB',
+        'timestamp': 'DATETIME',
+        'upsert': 'ON DUPLICATE KEY UPDATE trials = trials + VALUES(trials), status = VALUES(status), '
+                  'status_at = VALUES(status_at)',
+        'max_params': 30000,
+        'inline_indexes': True,
+    },
+    'postgresql': {
+        'param': '%s',
+        'blob': 'BYTEA',
+        'timestamp': 'TIMESTAMP(0)',
+        'upsert': 'ON CONFLICT (msgid) DO UPDATE SET trials = {table}.trials + EXCLUDED.trials, '
+                  'status = EXCLUDED.status, status_at = EXCLUDED.status_at',
+        'max_params': 30000,
+        'inline_indexes': False,
+    },
+}
+
+INDEXED_COLUMNS = ['routed_cid', 'status', 'uid', 'created_at']
+
+
+class SQLSink:
+    """Write CDRs to the db_table table of a SQLite, MySQL or PostgreSQL database"""
+
+    def __init__(self, config):
+        self.table = config.db_table
+        self.dialect = DIALECTS[config.sink]
+
+        if config.sink == 'sqlite':
+            # One connection, sqlite is not for concurrent writers
+            self.pool = adbapi.ConnectionPool('sqlite3', config.sqlite_path, check_same_thread=False,
+                                              cp_min=1, cp_max=1)
+        else:
+            kwargs = {'host': config.db_host, 'user': config.db_user, 'password': config.db_pass}
+            if config.db_port > 0:
+                kwargs['port'] = config.db_port
+            if config.sink == 'mysql':
+                self.pool = adbapi.ConnectionPool('mysql.connector', database=config.db_database,
+                                                  cp_min=1, cp_max=1, cp_reconnect=True, **kwargs)
+            else:
+                self.pool = adbapi.ConnectionPool('psycopg2', dbname=config.db_database,
+                                                  cp_min=1, cp_max=1, cp_reconnect=True, **kwargs)
+
+        # Rows per INSERT statement
+        self.insert_rows = self.dialect['max_params'] // len(COLUMNS)
+
+    def create_table_sql(self):
+        d = self.dialect
+        columns = [
+            'msgid VARCHAR(45) NOT NULL PRIMARY KEY',
+            'source_connector VARCHAR(15)',
+            'routed_cid VARCHAR(30)',
+            'source_addr VARCHAR(40)',
+            'destination_addr VARCHAR(40) NOT NULL',
+            'rate DECIMAL(12, 7)',
+            'charge DECIMAL(12, 7)',
+            'pdu_count SMALLINT DEFAULT 1',
+            'short_message %s' % d['blob'],
+            'binary_message %s' % d['blob'],
+            'status VARCHAR(15) NOT NULL',
+            'uid VARCHAR(15) NOT NULL',
+            'trials SMALLINT DEFAULT 1',
+            'created_at %s NOT NULL' % d['timestamp'],
+            'status_at %s NOT NULL' % d['timestamp'],
+        ]
+
+        if d['inline_indexes']:
+            columns.extend(['INDEX (%s)' % column for column in INDEXED_COLUMNS])
+            return ['CREATE TABLE IF NOT EXISTS %s (%s)' % (self.table, ', '.join(columns))]
+
+        statements = ['CREATE TABLE IF NOT EXISTS %s (%s)' % (self.table, ', '.join(columns))]
+        for column in INDEXED_COLUMNS:
+            statements.append('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (
+                self.table, column, self.table, column))
+
+        return statements
+
+    def insert_sql(self, rows):
+        placeholders = '(%s)' % ', '.join([self.dialect['param']] * len(COLUMNS))
+        return 'INSERT INTO %s (%s) VALUES %s %s' % (
+            self.table, ', '.join(COLUMNS), ', '.join([placeholders] * rows),
+            self.dialect['upsert'].format(table=self.table))
+
+    def update_status_sql(self):
+        return 'UPDATE %s SET status = %s, status_at = %s, trials = trials + %s WHERE msgid = %s' % (
+            self.table, self.dialect['param'], self.dialect['param'], self.dialect['param'], self.dialect['param'])
+
+    def setup(self):
+        """Create the CDR table if it does not exist"""
+
+        def _setup(txn):
+            for statement in self.create_table_sql():
+                txn.execute(statement)
+
+        return self.pool.runInteraction(_setup)
+
+    def _write(self, txn, records, statuses):
+        for i in range(0, len(records), self.insert_rows):
+            chunk = records[i:i + self.insert_rows]
+            params = []
+            for record in chunk:
+                params.extend(record[column] for column in COLUMNS)
+            txn.execute(self.insert_sql(len(chunk)), params)
+
+        if len(statuses) > 0:
+            txn.executemany(self.update_status_sql(),
+                            [(status, status_at, trials, msgid)
+                             for msgid, (status, status_at, trials) in statuses.items()])
+
+    def write(self, records, statuses):
+        """Insert records (dicts keyed by COLUMNS) and update statuses ({msgid: (status, status_at,
+        trials)}) in one transaction, return a deferred firing once it is committed"""
+        return self.pool.runInteraction(self._write, records, statuses)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,276 @@
+"""
+CDR writer, consumes submit.sm.*, submit.sm.resp.* and dlr_thrower.* messages and writes
+one record per sent message to a CDR sink (c.f. jasmin.cdr.sinks)
+
+Records are created by the SubmitSm (with a PENDING status when its SubmitSmResp was not received
+before the flush) and their status is updated by SubmitSmResp and delivery receipts, writes are
+buffered and flushed in one transaction; consumed messages are acked (with multiple=True) once
+their batch is committed, a failed batch is kept and retried with the next flush.
+"""
+
+import binascii
+import logging
+import pickle
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import TimedRotatingFileHandler
+
+from twisted.application.service import Service
+from twisted.internet import defer, task
+from txamqp.queue import Closed
+from smpp.pdu.pdu_types import DataCoding
+
+from jasmin.queues.retry import original_routing_key
+from jasmin.tools import codec
+
+LOG_CATEGORY = "jasmin-cdr"
+
+
+PENDING = 'PENDING'
+
+
+def submit_sm_record(routing_key, properties, body):
+    """Return the record of a consumed SubmitSm, its status and trials are set by the SubmitSmResp"""
+    pdu = codec.loads(body)
+    headers = properties.get('headers') or {}
+
+    pdu_count = 1
+    short_message = pdu.params['short_message'] or b''
+    # Is it a multipart message ?
+    while hasattr(pdu, 'nextPdu'):
+        # Remove UDH from first part
+        if pdu_count == 1:
+            short_message = short_message[6:]
+
+        pdu = pdu.nextPdu
+
+        pdu_count += 1
+        short_message += pdu.params['short_message'][6:]
+
+    binary_message = binascii.hexlify(short_message)
+
+    # If it's a binary message, assume it's utf_16_be encoded
+    dc = pdu.params['data_coding']
+    if (isinstance(dc, int) and dc == 8) or (isinstance(dc, DataCoding) and str(dc.schemeData) == 'UCS2'):
+        short_message = short_message.decode('utf_16_be', 'ignore').encode('utf_8')
+
+    source_addr = pdu.params['source_addr']
+    if isinstance(source_addr, bytes):
+        source_addr = source_addr.decode()
+    destination_addr = pdu.params['destination_addr']
+    if isinstance(destination_addr, bytes):
+        destination_addr = destination_addr.decode()
+
+    record = {
+        'msgid': properties['message-id'],
+        'source_connector': headers.get('source_connector'),
+        'routed_cid': routing_key[10:],
+        'source_addr': source_addr or '',
+        'destination_addr': destination_addr,
+        'rate': 0,
+        'charge': 0,
+        'pdu_count': pdu_count,
+        'short_message': short_message,
+        'binary_message': binary_message,
+        'status': PENDING,
+        'uid': '0',
+        'trials': 0,
+        'created_at': headers.get('created_at'),
+        'status_at': headers.get('created_at'),
+    }
+
+    bill = headers.get('submit_sm_resp_bill') or headers.get('submit_sm_bill')
+    if bill is not None:
+        submit_sm_bill = pickle.loads(bill)
+        record['rate'] = submit_sm_bill.getTotalAmounts()
+        record['charge'] = submit_sm_bill.getTotalAmounts() * pdu_count
+        record['uid'] = str(submit_sm_bill.user.uid)
+
+    return record
+
+
+class CDRWriter(Service):
+    name = 'CDRWriter'
+    queueName = 'cdr_writer'
+    consumerTag = 'CDRWriter'
+    routingKeys = ['submit.sm.*', 'submit.sm.resp.*', 'dlr_thrower.*']
+
+    def __init__(self, config, sink):
+        self.config = config
+        self.sink = sink
+        self.amqpBroker = None
+        self.q = None
+
+        # Buffered records and status updates ({msgid: (status, status_at, trials)})
+        self.records = OrderedDict()
+        self.statuses = {}
+        # Highest consumed delivery tag
+        self.last_delivery_tag = None
+
+        self.flushing = None
+        self.flushTimer = task.LoopingCall(self.flush)
+
+        # Set up a dedicated logger
+        self.log = logging.getLogger(LOG_CATEGORY)
+        if len(self.log.handlers) != 1:
+            self.log.setLevel(self.config.log_level)
+            if 'stdout' in self.config.log_file:
+                handler = logging.StreamHandler(sys.stdout)
+            else:
+                handler = TimedRotatingFileHandler(filename=self.config.log_file, when=self.config.log_rotate)
+            formatter = logging.Formatter(self.config.log_format, self.config.log_date_format)
+            handler.setFormatter(formatter)
+            self.log.addHandler(handler)
+            self.log.propagate = False
+
+    @defer.inlineCallbacks
+    def addAmqpBroker(self, amqpBroker):
+        self.amqpBroker = amqpBroker
+        self.log.info('Added amqpBroker')
+
+        if not self.amqpBroker.connected:
+            self.log.warning('AMQP Broker channel is not yet ready, waiting for it to become ready.')
+            yield self.amqpBroker.channelReady
+            self.log.info("AMQP Broker channel is ready now, let's go !")
+
+        yield self.sink.setup()
+
+        # Messages are acked once committed, up to prefetch_count messages are waiting for it
+        yield self.amqpBroker.chan.basic_qos(prefetch_count=self.config.prefetch_count)
+        yield self.amqpBroker.chan.exchange_declare(exchange='messaging', type='topic')
+        yield self.amqpBroker.named_queue_declare(queue=self.queueName)
+        for routing_key in self.routingKeys:
+            yield self.amqpBroker.chan.queue_bind(queue=self.queueName, exchange='messaging',
+                                                  routing_key=routing_key)
+        yield self.amqpBroker.chan.basic_consume(queue=self.queueName, no_ack=False,
+                                                 consumer_tag=self.consumerTag)
+        self.q = yield self.amqpBroker.client.queue(self.consumerTag)
+        self.q.get().addCallback(self.callback).addErrback(self.errback)
+
+        if self.config.flush_interval > 0:
+            self.flushTimer.start(self.config.flush_interval / 1000, now=False)
+
+        self.log.info('%s is consuming from %s', self.name, self.queueName)
+
+    @defer.inlineCallbacks
+    def stopService(self):
+        if self.flushTimer.running:
+            self.flushTimer.stop()
+
+        if self.q is not None:
+            self.q.close()
+
+        yield self.flush()
+        self.sink.close()
+
+        Service.stopService(self)
+
+    def callback(self, message):
+        self.q.get().addCallback(self.callback).addErrback(self.errback)
+
+        try:
+            self.handle(original_routing_key(message), message.content.properties, message.content.body)
+        except Exception as e:
+            # Acked with the next batch, a message that cannot be decoded would come back again
+            self.log.error('Cannot handle message [msgid:%s] having routing_key [%s]: %r',
+                           message.content.properties.get('message-id'), message.routing_key, e)
+
+        self.last_delivery_tag = message.delivery_tag
+
+        if len(self.records) + len(self.statuses) >= self.config.flush_size:
+            self.flush()
+
+    def errback(self, error):
+        if error.check(Closed) is None:
+            self.log.error("Error in callback: %s", error)
+
+    def handle(self, routing_key, properties, body):
+        """Buffer the record or status update of a consumed message"""
+        msgid = properties['message-id']
+        headers = properties.get('headers') or {}
+
+        if routing_key.startswith('submit.sm.resp.'):
+            status = codec.loads(body).status.name
+            status_at = headers.get('created_at')
+            self.update_status(msgid, status, status_at or str(datetime.now()), 1)
+        elif routing_key.startswith('submit.sm.'):
+            record = submit_sm_record(routing_key, properties, body)
+            # Retried, SubmitSmResp of the earlier tries are counted
+            if msgid in self.records:
+                record['trials'] += self.records.pop(msgid)['trials']
+            elif msgid in self.statuses:
+                record['trials'] += self.statuses.pop(msgid)[2]
+            self.records[msgid] = record
+        elif routing_key.startswith('dlr_thrower.'):
+            message_status = headers['message_status']
+            if message_status[:5] == 'ESME_':
+                # Receipt of a SubmitSmResp, already recorded
+                return
+
+            self.update_status(msgid, message_status, str(datetime.now()))
+        else:
+            self.log.error('Unknown routing_key: %s', routing_key)
+
+    def update_status(self, msgid, status, status_at, trials=0):
+        """Update the status of a buffered record or buffer the update of a written one"""
+        if msgid in self.records:
+            record = self.records[msgid]
+            record['status'] = status
+            record['status_at'] = status_at
+            record['trials'] += trials
+        else:
+            # A SubmitSmResp of an unknown record updates nothing
+            trials += self.statuses[msgid][2] if msgid in self.statuses else 0
+            self.statuses[msgid] = (status, status_at, trials)
+
+    def flush(self):
+        """Write buffered records and status updates, ack their messages once committed"""
+        if self.flushing is not None:
+            return self.flushing
+
+        if self.last_delivery_tag is None:
+            return defer.succeed(None)
+
+        records, statuses, delivery_tag = self.records, self.statuses, self.last_delivery_tag
+        self.records, self.statuses, self.last_delivery_tag = OrderedDict(), {}, None
+
+        if len(records) + len(statuses) == 0:
+            d = defer.succeed(None)
+        else:
+            d = self.sink.write(list(records.values()), statuses)
+
+        def committed(_):
+            self.flushing = None
+            self.log.debug('Committed %s records and %s status updates', len(records), len(statuses))
+            if self.amqpBroker is not None:
+                return self.amqpBroker.chan.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
+        def failed(error):
+            self.flushing = None
+            self.log.error('Cannot write %s records and %s status updates, will retry: %s',
+                           len(records), len(statuses), error.getErrorMessage())
+
+            # Older records and status updates are going first
+            for msgid, record in self.records.items():
+                if msgid in records:
+                    record['trials'] += records.pop(msgid)['trials']
+                records[msgid] = record
+            for msgid, (status, status_at, trials) in self.statuses.items():
+                if msgid in statuses:
+                    trials += statuses[msgid][2]
+                statuses[msgid] = (status, status_at, trials)
+            self.records, self.statuses = records, statuses
+            if self.last_delivery_tag is None:
+                self.last_delivery_tag = delivery_tag
+
+        def ack_failed(error):
+            # Never fail the flush, flushTimer would stop for good; unacked messages are delivered
+            # again once the channel is reopened and their records are upserted
+            self.log.error('Cannot ack messages up to delivery tag %s: %s', delivery_tag, error.getErrorMessage())
+
+        # Set before adding callbacks, they are called right away when there's nothing to write
+        self.flushing = d
+        d.addCallbacks(committed, failed)
+        d.addErrback(ack_failed)
+        return d
@@ -34,7 +34,12 @@ class InterceptorPBConfig(ConfigFile):
             'interceptor', 'log_format', '%(asctime)s %(levelname)-8s %(process)d %(message)s')
         self.log_date_format = self._get('interceptor', 'log_date_format', '%Y-%m-%d %H:%M:%S')
 
-        self.log_slow_script = self._getint('interceptor', 'log_slow_script', 1)
+        self.log_slow_script = self._getfloat('interceptor', 'log_slow_script', 1)
+
+        # Script execution pool, scripts are run in the reactor thread when workers is 0
+        self.workers = self._getint('interceptor', 'workers', 0)
+        self.script_timeout = self._getfloat('interceptor', 'script_timeout', 30)
+        self.max_pending_scripts = self._getint('interceptor', 'max_pending_scripts', 1000)
 
 
 class InterceptorPBClientConfig(ConfigFile):
@@ -43,6 +48,9 @@ class InterceptorPBClientConfig(ConfigFile):
     def __init__(self, config_file=None):
         ConfigFile.__init__(self, config_file)
 
+        # pb: scripts are run by interceptord, embedded: scripts are run inside jasmind
+        self.mode = self._get('interceptor-client', 'mode', 'pb')
+
         self.host = self._get('interceptor-client', 'host', '127.0.0.1')
         self.port = self._getint('interceptor-client', 'port', 8987)
 
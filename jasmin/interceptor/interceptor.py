@@ -4,9 +4,13 @@ import sys
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
+from twisted.internet import defer
+from twisted.python import failure
 from twisted.spread import pb
 
-from jasmin.tools.eval import CompiledNode
+from jasmin.interceptor import pool
+from jasmin.interceptor.stats import InterceptorStatsCollector
+from jasmin.routing.Routables import Routable
 
 LOG_CATEGORY = "jasmin-interceptor-pb"
 
@@ -29,6 +33,16 @@ class InterceptorPB(pb.Avatar):
             self.log.addHandler(handler)
             self.log.propagate = False
 
+        self.stats = InterceptorStatsCollector()
+
+        # Run scripts out of the reactor thread
+        self.pool = None
+        if self.config.workers > 0:
+            self.pool = pool.ScriptPool(self.config.workers,
+                                        self.config.script_timeout,
+                                        self.config.max_pending_scripts)
+            self.log.info('Running scripts with %s workers.', self.config.workers)
+
         self.log.info('Interceptor configured and ready.')
 
     def setAvatar(self, avatar):
@@ -39,59 +53,130 @@ class InterceptorPB(pb.Avatar):
 
         self.avatar = avatar
 
+    def stop(self):
+        if self.pool is not None:
+            self.pool.stop()
+
+    def perspective_stats(self):
+        return pickle.dumps(self.getStats(), pickle.HIGHEST_PROTOCOL)
+
+    def getStats(self):
+        """Return per-script statistics along with their latency histogram"""
+        stats = {}
+        for script_id, script_stats in self.stats.scripts.items():
+            stats[script_id] = dict(script_stats.getStats())
+            stats[script_id]['latency'] = {
+                'buckets': script_stats.latency.getBuckets(),
+                'count': script_stats.latency.count,
+                'sum': script_stats.latency.sum,
+            }
+
+        return stats
+
     def perspective_run_script(self, pyCode, routable):
         """Will execute pyCode with the routable argument"""
-        routable = pickle.loads(routable)
-        smpp_status = http_status = None
-
-        try:
-            self.log.info('Running with a %s (from:%s, to:%s).',
-                          routable.pdu.id,
-                          routable.pdu.params['source_addr'],
-                          routable.pdu.params['destination_addr'])
-            self.log.debug('Running [%s]', pyCode)
-            self.log.debug('... having routable with pdu: %s', routable.pdu)
-            node = CompiledNode().get(pyCode)
-            glo = {'routable': routable, 'smpp_status': smpp_status, 'http_status': http_status, 'extra': {}}
-
-            # Run script and measure execution time
-            start = dt.datetime.now()
-            eval(node, {}, glo)
-            end = dt.datetime.now()
-            delay = (end - start).seconds
-            self.log.debug('... took %s seconds.', delay)
-        except Exception as e:
-            self.log.error('Executing script on routable (from:%s, to:%s) returned: %s',
+        d = self.run_script(pyCode, pickle.loads(routable), routable)
+        d.addCallback(self._pickle_routable)
+        return d
+
+    def _pickle_routable(self, r):
+        if isinstance(r, Routable):
+            return pickle.dumps(r, pickle.HIGHEST_PROTOCOL)
+
+        return r
+
+    def run_script(self, pyCode, routable, pickled_routable=None):
+        """Will execute pyCode with the routable argument and return a deferred fired with the
+        updated routable (pickled when run by a pool worker), a statuses dict or False on error
+        """
+        stats = self.stats.get(pyCode)
+        stats.inc('run_count')
+        stats.set('last_run_at', dt.datetime.now())
+
+        self.log.info('Running with a %s (from:%s, to:%s).',
+                      routable.pdu.id,
+                      routable.pdu.params['source_addr'],
+                      routable.pdu.params['destination_addr'])
+        self.log.debug('Running [%s]', pyCode)
+        self.log.debug('... having routable with pdu: %s', routable.pdu)
+
+        if self.pool is None:
+            try:
+                r = pool.run(pyCode, routable)
+            except Exception as e:
+                return defer.succeed(self.script_failed(e, pyCode, routable))
+            else:
+                return defer.succeed(self.script_done(r, pyCode))
+
+        if pickled_routable is None:
+            pickled_routable = pickle.dumps(routable, pickle.HIGHEST_PROTOCOL)
+
+        d = self.pool.run(pyCode, pickled_routable)
+        d.addCallbacks(self.script_done, self.script_failed,
+                       callbackArgs=(pyCode,), errbackArgs=(pyCode, routable))
+        return d
+
+    def script_failed(self, error, pyCode, routable):
+        if isinstance(error, failure.Failure):
+            error = error.value
+        stats = self.stats.get(pyCode)
+
+        # Pool failures are returned as explicit statuses with an error key, callers can tell
+        # them apart from statuses set by the script itself
+        if isinstance(error, (pool.PoolFullError, defer.CancelledError)):
+            stats.inc('rejected_count')
+            self.log.error('Rejecting script on routable (from:%s, to:%s): %s',
+                           routable.pdu.params['source_addr'],
+                           routable.pdu.params['destination_addr'],
+                           error if isinstance(error, pool.PoolFullError) else 'pool stopped')
+            # ESME_RSYSERR
+            return {'http_status': 503, 'smpp_status': 8, 'extra': {}, 'error': 'overload'}
+        elif isinstance(error, defer.TimeoutError):
+            stats.inc('timeout_count')
+            self.log.error('Executing script on routable (from:%s, to:%s) timed out: %s',
                            routable.pdu.params['source_addr'],
                            routable.pdu.params['destination_addr'],
-                           '%s: %s' % (type(e), e))
-            return False
+                           error)
+            # ESME_RSYSERR
+            return {'http_status': 504, 'smpp_status': 8, 'extra': {}, 'error': 'timeout'}
+
+        stats.inc('error_count')
+        self.log.error('Executing script on routable (from:%s, to:%s) returned: %s',
+                       routable.pdu.params['source_addr'],
+                       routable.pdu.params['destination_addr'],
+                       '%s: %s' % (type(error), error))
+        return False
+
+    def script_done(self, result, pyCode):
+        glo, delay = result
+        self.stats.get(pyCode).latency.observe(delay)
+        self.log.debug('... took %.3f seconds.', delay)
+
+        if 0 <= self.config.log_slow_script <= delay:
+            self.log.warning('Execution delay [%.3fs] for script [%s].', delay, pyCode)
+
+        if glo['smpp_status'] is None and glo['http_status'] is None:
+            return glo['routable']
         else:
-            if 0 <= self.config.log_slow_script <= delay:
-                self.log.warning('Execution delay [%ss] for script [%s].', delay, pyCode)
+            # If we have one of the statuses set to non-zero value
+            #  then both of them must be non-zero to avoid misbehaviour
+            #  of differents apis: if we return an error in smpp, we must
+            #  do the same in http as well.
+            if glo['smpp_status'] is None or not isinstance(glo['smpp_status'], int):
+                # ESME_RUNKNOWNERR
+                self.log.info(
+                    'Setting smpp_status to 255 when having http_status = %s and smpp_status = %s.',
+                    glo['http_status'],
+                    glo['smpp_status'])
+                glo['smpp_status'] = 255
+            elif glo['http_status'] is None or not isinstance(glo['http_status'], int):
+                # Unknown Error
+                self.log.info(
+                    'Setting http_status to 520 when having smpp_status = %s and http_status = %s.',
+                    glo['smpp_status'],
+                    glo['http_status'])
+                glo['http_status'] = 520
 
-            if glo['smpp_status'] is None and glo['http_status'] is None:
-                return pickle.dumps(glo['routable'], pickle.HIGHEST_PROTOCOL)
-            else:
-                # If we have one of the statuses set to non-zero value
-                #  then both of them must be non-zero to avoid misbehaviour
-                #  of differents apis: if we return an error in smpp, we must
-                #  do the same in http as well.
-                if glo['smpp_status'] is None or not isinstance(glo['smpp_status'], int):
-                    # ESME_RUNKNOWNERR
-                    self.log.info(
-                        'Setting smpp_status to 255 when having http_status = %s and smpp_status = %s.',
-                        glo['http_status'],
-                        glo['smpp_status'])
-                    glo['smpp_status'] = 255
-                elif glo['http_status'] is None or not isinstance(glo['http_status'], int):
-                    # Unknown Error
-                    self.log.info(
-                        'Setting http_status to 520 when having smpp_status = %s and http_status = %s.',
-                        glo['smpp_status'],
-                        glo['http_status'])
-                    glo['http_status'] = 520
-
-                r = {'http_status': glo['http_status'], 'smpp_status': glo['smpp_status'], 'extra': glo['extra']}
-                self.log.info('Returning statuses: %s', r)
-                return r
+            r = {'http_status': glo['http_status'], 'smpp_status': glo['smpp_status'], 'extra': glo['extra']}
+            self.log.info('Returning statuses: %s', r)
+            return r
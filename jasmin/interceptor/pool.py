@@ -0,0 +1,159 @@
+"""
+Process pool running interceptor scripts out of the reactor thread
+"""
+
+import multiprocessing
+import pickle
+import time
+from collections import deque
+
+from twisted.internet import defer, reactor
+
+from jasmin.tools.eval import CompiledNode
+
+
+class PoolFullError(Exception):
+    """Raised when too many scripts are waiting for a worker"""
+
+
+def run(pyCode, routable):
+    """Run pyCode with the routable argument, return the script results and the
+    execution delay (in seconds)"""
+    glo = {'routable': routable, 'smpp_status': None, 'http_status': None, 'extra': {}}
+
+    start = time.monotonic()
+    eval(CompiledNode().get(pyCode), {}, glo)
+    delay = time.monotonic() - start
+
+    # Anything else the script defined (functions, logging handlers ...) may not be picklable
+    return {key: glo[key] for key in ['routable', 'smpp_status', 'http_status', 'extra']}, delay
+
+
+def execute(pyCode, routable):
+    """Worker side of run(): routable is pickled in both ways"""
+    glo, delay = run(pyCode, pickle.loads(routable))
+    glo['routable'] = pickle.dumps(glo['routable'], pickle.HIGHEST_PROTOCOL)
+
+    return glo, delay
+
+
+def warm_up(scripts):
+    """Compile scripts in the worker's CompiledNode cache"""
+    for pyCode in scripts:
+        CompiledNode().get(pyCode)
+
+
+class ScriptPool:
+    """A pool of worker processes executing interceptor scripts
+
+    - Every worker is a single process pool of its own, scripts are queued until a worker is
+      idle,
+    - A script running for more than timeout seconds (counted from when a worker starts running
+      it) is failed with a TimeoutError, its worker cannot be interrupted so it is terminated and
+      replaced, scripts running on the other workers are not affected,
+    - When max_pending scripts are already submitted, the next ones are failed at once with a
+      PoolFullError instead of being queued.
+    """
+
+    def __init__(self, workers, timeout=0, max_pending=0, clock=reactor):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.clock = clock
+
+        # Scripts submitted so far, used for warming up new workers
+        self.scripts = set()
+        self.pending = 0
+        # Scripts waiting for an idle worker: (pyCode, routable, deferred)
+        self.queue = deque()
+        self.idle = []
+        # Busy workers: {worker: (deferred, timeout call)}
+        self.running = {}
+
+        self.start()
+
+    def start(self):
+        # Workers are started now instead of on the first scripts
+        self.idle = [self.start_worker() for _ in range(self.workers)]
+
+    def start_worker(self):
+        # Workers are forked by a forkserver: forking the reactor process while pool threads are
+        # holding locks may deadlock the new workers
+        return multiprocessing.get_context('forkserver').Pool(
+            1, initializer=warm_up, initargs=(list(self.scripts),))
+
+    def restart_worker(self, worker):
+        """Replace worker with a new one, the busy worker cannot be interrupted: it is
+        terminated with its pool"""
+        self.idle.append(self.start_worker())
+        reactor.callInThread(worker.terminate)
+
+    def stop(self):
+        workers = self.idle + list(self.running)
+        running, queue = self.running, self.queue
+        self.idle, self.running, self.queue = [], {}, deque()
+        self.pending = 0
+
+        for worker in workers:
+            worker.terminate()
+        for d, timeout_call in running.values():
+            if timeout_call is not None and timeout_call.active():
+                timeout_call.cancel()
+            d.errback(defer.CancelledError())
+        for _, _, d in queue:
+            d.errback(defer.CancelledError())
+
+    def run(self, pyCode, routable):
+        """Return a deferred fired with execute() result"""
+        if 0 < self.max_pending <= self.pending:
+            return defer.fail(PoolFullError('%s scripts are pending' % self.pending))
+
+        self.scripts.add(pyCode)
+        self.pending += 1
+
+        d = defer.Deferred()
+        self.queue.append((pyCode, routable, d))
+        self._dispatch()
+
+        return d
+
+    def _dispatch(self):
+        """Hand queued scripts over to the idle workers"""
+        while self.idle and self.queue:
+            worker = self.idle.pop()
+            pyCode, routable, d = self.queue.popleft()
+
+            timeout_call = None
+            if self.timeout > 0:
+                timeout_call = self.clock.callLater(self.timeout, self._timedOut, worker, d)
+            self.running[worker] = (d, timeout_call)
+
+            worker.apply_async(
+                execute, (pyCode, routable),
+                callback=lambda r, worker=worker, d=d: reactor.callFromThread(self._done, worker, d, r),
+                error_callback=lambda e, worker=worker, d=d: reactor.callFromThread(self._done, worker, d, e))
+
+    def _done(self, worker, d, result):
+        # Timed out or stopped already
+        if worker not in self.running or self.running[worker][0] is not d:
+            return
+
+        _, timeout_call = self.running.pop(worker)
+        if timeout_call is not None and timeout_call.active():
+            timeout_call.cancel()
+        self.pending -= 1
+        self.idle.append(worker)
+        self._dispatch()
+
+        if isinstance(result, Exception):
+            d.errback(result)
+        else:
+            d.callback(result)
+
+    def _timedOut(self, worker, d):
+        del self.running[worker]
+        self.pending -= 1
+        self.restart_worker(worker)
+        self._dispatch()
+
+        d.errback(defer.TimeoutError('Script execution exceeded %ss' % self.timeout))
@@ -1,3 +1,7 @@
+from twisted.internet import defer
+
+from jasmin.interceptor.interceptor import InterceptorPB
+from jasmin.tools.latency import LatencyStatsCollector
 from jasmin.tools.proxies import ConnectedPB
 from jasmin.tools.proxies import JasminPBProxy
 from jasmin.routing.Routables import Routable
@@ -27,4 +31,51 @@ class InterceptorPBProxy(JasminPBProxy):
         if isinstance(routable, Routable) is False:
             raise InvalidRoutableObject(routable)
 
-        return self.pb.callRemote('run_script', script.pyCode, self.pickle(routable))
+        return LatencyStatsCollector().timeDeferred(
+            self.pb.callRemote('run_script', script.pyCode, self.pickle(routable)), 'interceptor')
+
+    @ConnectedPB
+    def stats(self):
+        """Will return InterceptorPB per-script statistics"""
+
+        d = self.pb.callRemote('stats')
+        d.addCallback(self.unpickle)
+        return d
+
+
+class InterceptorEmbedded:
+    """Runs interceptor scripts inside jasmind, it's used in place of InterceptorPBProxy
+    when interceptor-client mode is 'embedded'
+
+    The routable is not pickled and goes through no network round trip, scripts are run
+    against the routable itself (unless they're run by a pool of workers).
+    """
+
+    def __init__(self, InterceptorPBConfig):
+        self.interceptor = InterceptorPB(InterceptorPBConfig)
+        self.isConnected = True
+
+    def disconnect(self):
+        self.interceptor.stop()
+        self.isConnected = False
+
+        return defer.succeed(None)
+
+    def run_script(self, script, routable):
+        """Will run script with routable as argument
+
+        It will return updated (or not) routable.
+        """
+
+        if isinstance(script, InterceptorScript) is False:
+            raise InvalidScriptObject(script)
+        if isinstance(routable, Routable) is False:
+            raise InvalidRoutableObject(routable)
+
+        return LatencyStatsCollector().timeDeferred(
+            self.interceptor.run_script(script.pyCode, routable), 'interceptor')
+
+    def stats(self):
+        """Will return per-script statistics"""
+
+        return defer.succeed(self.interceptor.getStats())
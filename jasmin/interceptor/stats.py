@@ -0,0 +1,39 @@
+import hashlib
+
+from jasmin.tools.singleton import Singleton
+from jasmin.tools.stats import Stats, Histogram
+
+
+class InterceptorScriptStatistics(Stats):
+    """Interceptor script statistics holder"""
+
+    def __init__(self, script_id):
+        self.script_id = script_id
+
+        self.init()
+
+    def init(self):
+        self._stats = {
+            'run_count': 0,
+            'error_count': 0,
+            'timeout_count': 0,
+            'rejected_count': 0,
+            'last_run_at': 0,
+        }
+        self.latency = Histogram()
+
+    def getStats(self):
+        return self._stats
+
+
+class InterceptorStatsCollector(metaclass=Singleton):
+    """Interceptor statistics collection holder"""
+    scripts = {}
+
+    def get(self, pyCode):
+        """Return a script's stats object or instanciate a new one"""
+        script_id = hashlib.sha1(pyCode.encode() if isinstance(pyCode, str) else pyCode).hexdigest()[:12]
+        if script_id not in self.scripts:
+            self.scripts[script_id] = InterceptorScriptStatistics(script_id)
+
+        return self.scripts[script_id]
@@ -1,25 +1,41 @@
 import pickle
 import datetime
+import functools
 import sys
 import time
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
-from twisted.internet import defer
+from twisted.internet import defer, task
 from twisted.spread import pb
 
 import jasmin
 from jasmin.protocols.smpp.protocol import SMPPServerProtocol
 from jasmin.protocols.smpp.services import SMPPClientService
+from jasmin.tools import codec, qos
 from jasmin.tools.migrations.configuration import ConfigurationMigrator
+from jasmin.tools.retrials import RetrialTracker
 from smpp.pdu.pdu_types import RegisteredDeliveryReceipt
 from smpp.twisted.protocol import SMPPSessionStates
 from .configs import SMPPClientSMListenerConfig
 from .content import SubmitSmContent
+from .dlrmap import set_dlr_map
 from .listeners import SMPPClientSMListener
 
 LOG_CATEGORY = "jasmin-pb-client-mgmt"
 
+BOUND_STATES = (SMPPSessionStates.BOUND_TX, SMPPSessionStates.BOUND_RX, SMPPSessionStates.BOUND_TRX)
+
+
+def aggregate_session_state(states):
+    """Return a connector's session state out of its binds session states: the first bound one
+    or the first bind's one when none is bound"""
+    for state in states:
+        if state in BOUND_STATES:
+            return state
+
+    return states[0]
+
 
 class ConfigProfileLoadingError(Exception):
     """
@@ -38,6 +54,14 @@ class SMPPClientManagerPB(pb.Avatar):
         self.RouterPB = None
         self.connectors = []
         self.declared_queues = []
+        # Connectors session states index (cid: SMPPSessionStates), updated by
+        # SMPPClientFactory on every session state transition
+        self.session_states = {}
+        # submit.sm.<cid> queues depth (cid: message count), polled only when
+        # failover_max_queue_depth is set
+        self.queue_depths = {}
+        self.queueDepthPoller = None
+        self.queueDepthChannel = None
         self.pickleProtocol = pickle.HIGHEST_PROTOCOL
 
         # Persistence flag, accessed through perspective_is_persisted
@@ -76,6 +100,10 @@ class SMPPClientManagerPB(pb.Avatar):
 
         self.log.info('Added amqpBroker to SMPPClientManagerPB')
 
+        if self.config.failover_max_queue_depth > 0 and self.queueDepthPoller is None:
+            self.queueDepthPoller = task.LoopingCall(self.pollQueueDepths)
+            self.queueDepthPoller.start(self.config.queue_depth_poll_interval, now=False)
+
     def addRedisClient(self, redisClient):
         self.redisClient = redisClient
 
@@ -106,12 +134,17 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.debug('getConnectorDetails [%s] returned None', cid)
             return None
 
+        states = self.getBindSessionStates(c)
+
         details = {}
         details['id'] = c['id']
-        details['session_state'] = c['service'].SMPPClientFactory.getSessionState().name
-        details['service_status'] = c['service'].running
-        details['start_count'] = c['service'].startCounter
-        details['stop_count'] = c['service'].stopCounter
+        details['session_state'] = aggregate_session_state(states).name
+        details['service_status'] = self.getServiceStatus(c)
+        details['start_count'] = c['binds'][0]['service'].startCounter
+        details['stop_count'] = c['binds'][0]['service'].stopCounter
+        details['bind_count'] = len(states)
+        details['bound_count'] = len([state for state in states if state in BOUND_STATES])
+        details['bind_session_states'] = [state.name for state in states]
 
         self.log.debug('getConnectorDetails [%s] returned details', cid)
         return details
@@ -119,6 +152,8 @@ class SMPPClientManagerPB(pb.Avatar):
     def delConnector(self, cid):
         for i in range(len(self.connectors)):
             if str(self.connectors[i]['id']) == str(cid):
+                self.session_states.pop(self.connectors[i]['id'], None)
+                self.queue_depths.pop(self.connectors[i]['id'], None)
                 del self.connectors[i]
                 self.log.debug('Deleted connector [%s].', cid)
                 return True
@@ -126,6 +161,207 @@ class SMPPClientManagerPB(pb.Avatar):
         self.log.debug('Deleting connector [%s] failed.', cid)
         return False
 
+    def getServiceStatus(self, connector):
+        """Binds are started and stopped together, the first one is never dropped"""
+        return connector['binds'][0]['service'].running
+
+    def getBindSessionStates(self, connector):
+        return [bind['service'].SMPPClientFactory.getSessionState() for bind in connector['binds']]
+
+    def addBind(self, connector):
+        """Add a SMPP client service and its SM listener to connector's binds"""
+        serviceManager = SMPPClientService(connector['config'], self.config)
+
+        # Instanciate a SM listener
+        smListener = SMPPClientSMListener(
+            config=connector['sm_listener_config'],
+            SMPPClientFactory=serviceManager.SMPPClientFactory,
+            amqpBroker=self.amqpBroker,
+            redisClient=self.redisClient,
+            RouterPB=self.RouterPB,
+            interceptorpb_client=self.interceptorpb_client,
+            qos_bucket=connector['qos_bucket'],
+            submit_retrials=connector['submit_retrials'])
+
+        # Deliver_sm are sent to smListener's deliver_sm callback method
+        serviceManager.SMPPClientFactory.msgHandler = smListener.deliver_sm_event_interceptor
+
+        # The first bind keeps the consumer tag used before connectors got several binds, tags of
+        # dropped binds are not reused: their queue may still have their listener waiting on it
+        if connector['bind_serial'] == 0:
+            consumerTagName = 'SMPPClientFactory-%s' % connector['id']
+        else:
+            consumerTagName = 'SMPPClientFactory-%s-%s' % (connector['id'], connector['bind_serial'])
+        connector['bind_serial'] += 1
+
+        bind = {
+            'consumer_tag_name': consumerTagName,
+            'service': serviceManager,
+            'consumer_tag': None,
+            'submit_sm_q': None,
+            'channel': None,
+            'lock': defer.DeferredLock(),
+            'sm_listener': smListener}
+        connector['binds'].append(bind)
+
+        # Keep the session states index current
+        serviceManager.SMPPClientFactory.addSessionStateObserver(
+            functools.partial(self.bindSessionStateChanged, connector, bind))
+
+        return bind
+
+    @defer.inlineCallbacks
+    def resizeBinds(self, connector):
+        """Add or drop (stopped) binds to get as many binds as set in connector's bind_count"""
+        bind_count = getattr(connector['config'], 'bind_count', 1)
+
+        while len(connector['binds']) < bind_count:
+            self.addBind(connector)
+        while len(connector['binds']) > bind_count:
+            bind = connector['binds'].pop()
+            yield self.closeBindChannel(connector, bind)
+
+        self.session_states[connector['id']] = aggregate_session_state(self.getBindSessionStates(connector))
+
+    @defer.inlineCallbacks
+    def closeBindChannel(self, connector, bind):
+        if bind['channel'] is not None and not bind['channel'].closed:
+            try:
+                yield bind['sm_listener'].flushAcks()
+                yield bind['channel'].channel_close()
+            except Exception as e:
+                self.log.warning('Error closing channel of connector [%s]: %s', connector['id'], e)
+
+    def bindSessionStateChanged(self, connector, bind, cid, state):
+        # Removed connector or dropped bind
+        if (not any(c is connector for c in self.connectors)
+                or not any(b is bind for b in connector['binds'])):
+            return
+
+        self.session_states[cid] = aggregate_session_state(self.getBindSessionStates(connector))
+
+        if len(connector['binds']) > 1:
+            self.syncBindConsumer(connector, bind)
+
+    @defer.inlineCallbacks
+    def syncBindConsumer(self, connector, bind):
+        """Binds of a multi-bind connector are consuming only while they are bound: messages are
+        taken by the live binds instead of being requeued by the others"""
+        yield bind['lock'].acquire()
+        try:
+            bound = (self.getServiceStatus(connector) == 1
+                     and bind['service'].SMPPClientFactory.getSessionState() in BOUND_STATES)
+            if bound and bind['consumer_tag'] is None:
+                yield self.startBindConsumer(connector, bind)
+            elif not bound and bind['consumer_tag'] is not None:
+                yield self.stopBindConsumer(connector, bind)
+        except Exception as e:
+            self.log.error('Error updating %s consumer: %s', bind['consumer_tag_name'], e)
+        finally:
+            bind['lock'].release()
+
+    @defer.inlineCallbacks
+    def startBindConsumer(self, connector, bind):
+        # Subscribe to submit.sm.%cid queue
+        # check jasmin.queues.test.test_amqp.PublishConsumeTestCase.test_simple_publish_consume_by_topic
+        submit_sm_queue = 'submit.sm.%s' % connector['id']
+        consumerTag = bind['consumer_tag_name']
+
+        # Every bind is consuming on its own channel, this way its prefetch window
+        # is not shared with other binds and connectors
+        if (bind['channel'] is None or bind['channel'].closed
+                or bind['channel'].client is not self.amqpBroker.client):
+            bind['channel'] = yield self.amqpBroker.open_channel()
+        yield bind['channel'].basic_qos(
+            prefetch_count=getattr(connector['config'], 'submit_sm_prefetch_count', 1))
+
+        # Using the same consumerTag will prevent getting multiple consumers on the same queue
+        # This can resolve the dark hole issue #234
+
+        # Stop the queue consumer if any
+        if bind['consumer_tag'] is not None:
+            self.log.debug('Stopping %s consumer in connector [%s]', bind['consumer_tag'], connector['id'])
+            yield bind['channel'].basic_cancel(consumer_tag=bind['consumer_tag'])
+
+        # Start a new consumer
+        yield bind['channel'].basic_consume(queue=submit_sm_queue, no_ack=False, consumer_tag=consumerTag)
+
+        submit_sm_q = yield self.amqpBroker.client.queue(consumerTag)
+        self.log.info('%s is consuming from queue: %s', consumerTag, submit_sm_queue)
+
+        # Set callbacks for every consumed message from submit_sm_queue queue, queues are kept
+        # by consumer tag: a previous consumer may have left its callbacks waiting on it
+        if len(submit_sm_q.waiting) == 0:
+            submit_sm_q.get().addCallback(bind['sm_listener'].submit_sm_callback).addErrback(
+                bind['sm_listener'].submit_sm_errback)
+
+        # Set bind data
+        bind['sm_listener'].setSubmitSmQ(submit_sm_q, bind['channel'])
+        bind['consumer_tag'] = consumerTag
+        bind['submit_sm_q'] = submit_sm_q
+
+    @defer.inlineCallbacks
+    def stopBindConsumer(self, connector, bind):
+        if bind['consumer_tag'] is None:
+            return
+
+        self.log.debug('Stopping %s consumer in connector [%s]', bind['consumer_tag'], connector['id'])
+        consumerTag = bind['consumer_tag']
+
+        # Cleaning
+        bind['submit_sm_q'] = None
+        bind['consumer_tag'] = None
+
+        yield bind['channel'].basic_cancel(consumer_tag=consumerTag)
+
+    def isConnectorBound(self, cid):
+        return self.session_states.get(cid) in BOUND_STATES
+
+    def isConnectorOverloaded(self, cid):
+        return 0 < self.config.failover_max_queue_depth < self.queue_depths.get(cid, 0)
+
+    def getFailoverConnector(self, route):
+        """Iterate through a failover route's connectors and return the first bound one.
+
+        When failover_max_queue_depth is set, bound connectors having more queued messages are
+        skipped unless all of them are, the first bound connector is returned then.
+        """
+        overloaded = None
+        connector = route.getConnector()
+        while connector is not None:
+            if self.isConnectorBound(connector.cid):
+                if not self.isConnectorOverloaded(connector.cid):
+                    return connector
+                self.log.debug('Connector [%s] is overloaded: %s queued messages',
+                               connector.cid, self.queue_depths[connector.cid])
+                if overloaded is None:
+                    overloaded = connector
+            else:
+                self.log.debug('Connector [%s] is not bound', connector.cid)
+
+            connector = route.getConnector()
+
+        return overloaded
+
+    @defer.inlineCallbacks
+    def pollQueueDepths(self):
+        """Update self.queue_depths with the current submit.sm.<cid> queues depth"""
+        if self.amqpBroker is None or not self.amqpBroker.connected:
+            return
+
+        try:
+            # Passive declarations are made on a dedicated channel since the broker is closing
+            # the channel when a queue is not found
+            if (self.queueDepthChannel is None or self.queueDepthChannel.closed
+                    or self.queueDepthChannel.client is not self.amqpBroker.client):
+                self.queueDepthChannel = yield self.amqpBroker.open_channel()
+
+            for cid in list(self.session_states):
+                r = yield self.queueDepthChannel.queue_declare(queue='submit.sm.%s' % cid, passive=True)
+                self.queue_depths[cid] = r.message_count
+        except Exception as e:
+            self.log.warning('Error polling submit.sm queues depth: %s', e)
+
     def perspective_version_release(self):
         return jasmin.get_release()
 
@@ -144,7 +380,7 @@ class SMPPClientManagerPB(pb.Avatar):
                 connectors.append({
                     'id': c['id'],
                     'config': c['config'],
-                    'service_status': c['service'].running})
+                    'service_status': self.getServiceStatus(c)})
 
             # Write configuration with datetime stamp
             fh = open(path, 'wb')
@@ -241,9 +477,6 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.error('AMQP Broker channel is not yet ready')
             defer.returnValue(False)
 
-        # Fix prefetch limit per consumer to 1 to get correct throttling
-        yield self.amqpBroker.chan.basic_qos(prefetch_count=1)
-
         # Declare queues
         # First declare the messaging exchange (has no effect if its already declared)
         yield self.amqpBroker.chan.exchange_declare(exchange='messaging', type='topic')
@@ -251,33 +484,28 @@ class SMPPClientManagerPB(pb.Avatar):
         submit_sm_queue = 'submit.sm.%s' % c.id
         routing_key = 'submit.sm.%s' % c.id
         self.log.info('Binding %s queue to %s route_key', submit_sm_queue, routing_key)
-        yield self.amqpBroker.named_queue_declare(queue=submit_sm_queue)
-        yield self.amqpBroker.chan.queue_bind(queue=submit_sm_queue,
-                                              exchange="messaging",
-                                              routing_key=routing_key)
-
-        # Instanciate smpp client service manager
-        serviceManager = SMPPClientService(c, self.config)
-
-        # Instanciate a SM listener
-        smListener = SMPPClientSMListener(
-            config=SMPPClientSMListenerConfig(self.config.config_file),
-            SMPPClientFactory=serviceManager.SMPPClientFactory,
-            amqpBroker=self.amqpBroker,
-            redisClient=self.redisClient,
-            RouterPB=self.RouterPB,
-            interceptorpb_client=self.interceptorpb_client)
-
-        # Deliver_sm are sent to smListener's deliver_sm callback method
-        serviceManager.SMPPClientFactory.msgHandler = smListener.deliver_sm_event_interceptor
-
-        self.connectors.append({
+        # Messages are consumed by priority (highest first) when submit_sm_max_priority is set,
+        # a queue declared with another max priority is migrated
+        arguments = {}
+        if self.config.submit_sm_max_priority > 0:
+            arguments['x-max-priority'] = self.config.submit_sm_max_priority
+        yield self.amqpBroker.migrating_queue_declare(submit_sm_queue, arguments,
+                                                      exchange="messaging",
+                                                      routing_key=routing_key)
+
+        smListenerConfig = SMPPClientSMListenerConfig(self.config.config_file)
+        connector = {
             'id': c.id,
             'config': c,
-            'service': serviceManager,
-            'consumer_tag': None,
-            'submit_sm_q': None,
-            'sm_listener': smListener})
+            'sm_listener_config': smListenerConfig,
+            # Binds are sharing the connector's throughput and retrial counts
+            'qos_bucket': qos.TokenBucket(c.submit_sm_throughput),
+            'submit_retrials': RetrialTracker('smppc:%s' % c.id, smListenerConfig.retrials_max_size,
+                                              smListenerConfig.retrials_ttl),
+            'binds': [],
+            'bind_serial': 0}
+        self.connectors.append(connector)
+        yield self.resizeBinds(connector)
 
         self.log.info('Added a new connector: %s', c.id)
 
@@ -296,14 +524,19 @@ class SMPPClientManagerPB(pb.Avatar):
         if connector is None:
             self.log.error('Trying to remove a connector with an unknown cid: %s', cid)
             defer.returnValue(False)
-        if connector['service'].running == 1:
+        if self.getServiceStatus(connector) == 1:
             self.log.debug('Stopping service for connector [%s] before removing it', cid)
-            connector['service'].stopService()
+            for bind in connector['binds']:
+                bind['service'].stopService()
 
         # Stop the queue consumer
         self.log.debug('Stopping submit_sm_q consumer in connector [%s]', cid)
         yield self.perspective_connector_stop(cid)
 
+        # Close the connector's channels
+        for bind in connector['binds']:
+            yield self.closeBindChannel(connector, bind)
+
         if self.delConnector(cid):
             self.log.info('Removed connector [%s]', cid)
             # Set persistance state to False (pending for persistance)
@@ -349,58 +582,35 @@ class SMPPClientManagerPB(pb.Avatar):
         if self.amqpBroker.connected == False:
             self.log.error('AMQP Broker channel is not yet ready')
             defer.returnValue(False)
-        if connector['service'].running == 1:
+        if self.getServiceStatus(connector) == 1:
             self.log.error('Connector [%s] is already running.', cid)
             defer.returnValue(False)
-        acceptedStartStates = [None, SMPPSessionStates.NONE, SMPPSessionStates.UNBOUND]
-        if connector['service'].SMPPClientFactory.getSessionState() not in acceptedStartStates:
-            self.log.error(
-                'Connector [%s] cannot be started when in session_state: %s',
-                cid,
-                connector['service'].SMPPClientFactory.getSessionState())
-            defer.returnValue(False)
-
-        connector['service'].startService()
-
-        # Start the queue consumer
-        self.log.debug('Starting submit_sm_q consumer in connector [%s]', cid)
-
-        # Subscribe to submit.sm.%cid queue
-        # check jasmin.queues.test.test_amqp.PublishConsumeTestCase.test_simple_publish_consume_by_topic
-        submit_sm_queue = 'submit.sm.%s' % connector['id']
-        consumerTag = 'SMPPClientFactory-%s' % (connector['id'])
-
-        try:
-            # Using the same consumerTag will prevent getting multiple consumers on the same queue
-            # This can resolve the dark hole issue #234
-
-            # Stop the queue consumer if any
-            if connector['consumer_tag'] is not None:
-                self.log.debug('Stopping submit_sm_q consumer in connector [%s]', cid)
-                yield self.amqpBroker.chan.basic_cancel(consumer_tag=connector['consumer_tag'])
-
-            # Start a new consumer
-            yield self.amqpBroker.chan.basic_consume(queue=submit_sm_queue,
-                                                     no_ack=False, consumer_tag=consumerTag)
-        except Exception as e:
-            self.log.error('Error consuming from queue %s: %s', submit_sm_queue, e)
-            defer.returnValue(False)
 
-        submit_sm_q = yield self.amqpBroker.client.queue(consumerTag)
-        self.log.info('%s is consuming from queue: %s', consumerTag, submit_sm_queue)
+        # bind_count may have been updated through jcli
+        yield self.resizeBinds(connector)
 
-        # Set callbacks for every consumed message from submit_sm_queue queue
-        d = submit_sm_q.get()
-        d.addCallback(connector['sm_listener'].submit_sm_callback).addErrback(
-            connector['sm_listener'].submit_sm_errback)
+        acceptedStartStates = [None, SMPPSessionStates.NONE, SMPPSessionStates.UNBOUND]
+        for session_state in self.getBindSessionStates(connector):
+            if session_state not in acceptedStartStates:
+                self.log.error(
+                    'Connector [%s] cannot be started when in session_state: %s', cid, session_state)
+                defer.returnValue(False)
+
+        for bind in connector['binds']:
+            bind['service'].startService()
+
+        # Start the queue consumer, binds of a multi-bind connector are starting theirs once bound
+        if len(connector['binds']) == 1:
+            self.log.debug('Starting submit_sm_q consumer in connector [%s]', cid)
+            bind = connector['binds'][0]
+            try:
+                yield bind['lock'].run(self.startBindConsumer, connector, bind)
+            except Exception as e:
+                self.log.error('Error consuming from queue submit.sm.%s: %s', cid, e)
+                defer.returnValue(False)
 
         self.log.info('Started connector [%s]', cid)
 
-        # Set connector data
-        connector['sm_listener'].setSubmitSmQ(submit_sm_q)
-        connector['consumer_tag'] = consumerTag
-        connector['submit_sm_q'] = submit_sm_q
-
         # Set persistance state to False (pending for persistance)
         self.persisted = False
 
@@ -418,17 +628,11 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.error('Trying to stop a connector with an unknown cid: %s', cid)
             defer.returnValue(False)
 
-        # Stop the queue consumer
-        if connector['consumer_tag'] is not None:
-            self.log.debug('Stopping submit_sm_q consumer in connector [%s]', cid)
-            yield self.amqpBroker.chan.basic_cancel(consumer_tag=connector['consumer_tag'])
-
-            # Cleaning
-            self.log.debug('Cleaning objects in connector [%s]', cid)
-            connector['submit_sm_q'] = None
-            connector['consumer_tag'] = None
+        # Stop the queue consumers
+        for bind in connector['binds']:
+            yield bind['lock'].run(self.stopBindConsumer, connector, bind)
 
-        if connector['service'].running == 0:
+        if self.getServiceStatus(connector) == 0:
             self.log.error('Connector [%s] is already stopped.', cid)
             defer.returnValue(False)
 
@@ -437,26 +641,32 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.debug('Deleting queue [%s]', submitSmQueueName)
             yield self.amqpBroker.chan.queue_delete(queue=submitSmQueueName)
 
-        # Reject & requeue any pending message to avoid loosing messages after
-        # clearing timers
-        if len(connector['sm_listener'].rejectTimers) > 0:
-            for msgid, timer in list(connector['sm_listener'].rejectTimers.items()):
-                if timer.active():
-                    func = timer.func
-                    kw = timer.kw
-                    timer.cancel()
-                    del connector['sm_listener'].rejectTimers[msgid]
+        for bind in connector['binds']:
+            smListener = bind['sm_listener']
 
-                    self.log.debug('Rejecting/requeuing msgid [%s] before stopping connector', msgid)
-                    yield func(**kw)
+            # Reject & requeue any pending message to avoid loosing messages after
+            # clearing timers
+            if len(smListener.rejectTimers) > 0:
+                for msgid, timer in list(smListener.rejectTimers.items()):
+                    if timer.active():
+                        func = timer.func
+                        kw = timer.kw
+                        timer.cancel()
+                        del smListener.rejectTimers[msgid]
 
-        # Stop timers in message listeners
-        self.log.debug('Clearing sm_listener timers in connector [%s]', cid)
-        connector['sm_listener'].clearAllTimers()
-        connector['sm_listener'].submit_sm_q = None
+                        self.log.debug('Rejecting/requeuing msgid [%s] before stopping connector', msgid)
+                        yield func(**kw)
 
-        # Stop SMPP connector
-        connector['service'].stopService()
+            # Send pending acks before clearing timers
+            yield smListener.flushAcks()
+
+            # Stop timers in message listeners
+            self.log.debug('Clearing sm_listener timers in connector [%s]', cid)
+            smListener.clearAllTimers()
+            smListener.submit_sm_q = None
+
+            # Stop SMPP connector
+            bind['service'].stopService()
 
         self.log.info('Stopped connector [%s]', cid)
 
@@ -491,7 +701,7 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.error('Trying to get service status of a connector with an unknown cid: %s', cid)
             return False
 
-        service_status = connector['service'].running
+        service_status = self.getServiceStatus(connector)
         self.log.info('Connector [%s] service status is: %s', cid, str(service_status))
 
         return service_status
@@ -507,7 +717,7 @@ class SMPPClientManagerPB(pb.Avatar):
             self.log.error('Trying to get session state of a connector with an unknown cid: %s', cid)
             return False
 
-        session_state = connector['service'].SMPPClientFactory.getSessionState()
+        session_state = aggregate_session_state(self.getBindSessionStates(connector))
         self.log.info('Connector [%s] session state is: %s', cid, session_state)
 
         if session_state is None:
@@ -580,6 +790,10 @@ class SMPPClientManagerPB(pb.Avatar):
             PickledSubmitSmPDU = SubmitSmPDU
             SubmitSmPDU = pickle.loads(PickledSubmitSmPDU)
 
+        # Encode SubmitSmPDU with the configured codec before publishing
+        if self.config.pdu_codec != 'pickle':
+            PickledSubmitSmPDU = codec.dumps(SubmitSmPDU, self.config.pdu_codec, self.pickleProtocol)
+
         # Publishing a pickled PDU
         self.log.debug('Publishing SubmitSmPDU with routing_key=%s, priority=%s', pubQueueName, priority)
         c = SubmitSmContent(
@@ -612,9 +826,8 @@ class SMPPClientManagerPB(pb.Avatar):
                               'method': dlr_method,
                               'connector': dlr_connector,
                               'expiry': connector['config'].dlr_expiry}
-                self.redisClient.hmset(hashKey, hashValues).addCallback(
-                    lambda response: self.redisClient.expire(
-                        hashKey, connector['config'].dlr_expiry))
+                set_dlr_map(self.redisClient, hashKey, hashValues, connector['config'].dlr_expiry,
+                            self.config.compact_dlr_maps)
         elif (isinstance(source_connector, SMPPServerProtocol) and
               SubmitSmPDU.params['registered_delivery'].receipt != RegisteredDeliveryReceipt.NO_SMSC_DELIVERY_RECEIPT_REQUESTED):
             # If submit_sm is successfully sent from a SMPPServerProtocol connector and DLR is
@@ -643,8 +856,7 @@ class SMPPClientManagerPB(pb.Avatar):
                               'sub_date': datetime.datetime.now(),
                               'rd_receipt': SubmitSmPDU.params['registered_delivery'].receipt,
                               'expiry': source_connector.factory.config.dlr_expiry}
-                self.redisClient.hmset(hashKey, hashValues).addCallback(
-                    lambda response: self.redisClient.expire(
-                        hashKey, source_connector.factory.config.dlr_expiry))
+                set_dlr_map(self.redisClient, hashKey, hashValues, source_connector.factory.config.dlr_expiry,
+                            self.config.compact_dlr_maps)
 
         defer.returnValue(c.properties['message-id'])
@@ -8,6 +8,7 @@ import logging
 import os
 
 from jasmin.config import ConfigFile, ROOT_PATH, LOG_PATH
+from jasmin.tools.codec import CODECS
 
 DEFAULT_LOGFORMAT = '%(asctime)s %(levelname)-8s %(process)d %(message)s'
 
@@ -39,6 +40,26 @@ class SMPPClientPBConfig(ConfigFile):
         self.log_date_format = self._get('client-management', 'log_date_format', '%Y-%m-%d %H:%M:%S')
         self.pickle_protocol = self._getint('client-management', 'pickle_protocol', 2)
 
+        # Codec used to encode PDUs published to submit.sm.*, deliver.sm.* and submit.sm.resp.* queues
+        self.pdu_codec = self._get('client-management', 'pdu_codec', 'pickle')
+        if self.pdu_codec not in CODECS:
+            raise ValueError('Invalid pdu_codec: %s' % self.pdu_codec)
+
+        # submit.sm.<cid> queues are priority queues (AMQP priority property, 0 being the lowest)
+        # when submit_sm_max_priority is greater than 0, disabled by default to keep existing queues
+        self.submit_sm_max_priority = self._getint('client-management', 'submit_sm_max_priority', 0)
+        if self.submit_sm_max_priority < 0 or self.submit_sm_max_priority > 255:
+            raise ValueError('Invalid submit_sm_max_priority: %s' % self.submit_sm_max_priority)
+
+        # Store DLR maps as compact binary blobs instead of redis hashes
+        self.compact_dlr_maps = self._getbool('client-management', 'compact_dlr_maps', False)
+
+        # Failover routes are skipping connectors having more than failover_max_queue_depth
+        # messages waiting in their submit.sm queue (0 to disable), queues depth are polled
+        # every queue_depth_poll_interval seconds
+        self.failover_max_queue_depth = self._getint('client-management', 'failover_max_queue_depth', 0)
+        self.queue_depth_poll_interval = self._getint('client-management', 'queue_depth_poll_interval', 5)
+
 
 class SMPPClientSMListenerConfig(ConfigFile):
     """Config handler for 'sm-listener' section"""
@@ -64,6 +85,13 @@ class SMPPClientSMListenerConfig(ConfigFile):
         self.submit_retrial_delay_smppc_not_ready = self._getint(
             'sm-listener', 'submit_retrial_delay_smppc_not_ready', 30)
 
+        # Parts of long deliver_sm are dropped when the message is not completed in time
+        self.long_deliver_sm_expiry = self._getint('sm-listener', 'long_deliver_sm_expiry', 300)
+
+        # Submit retrials tracker bounds
+        self.retrials_max_size = self._getint('sm-listener', 'retrials_max_size', 100000)
+        self.retrials_ttl = self._getint('sm-listener', 'retrials_ttl', 86400)
+
         self.dlr_lookup_retry_delay = self._getint(
             'sm-listener', 'dlr_lookup_retry_delay', 10)
 
@@ -89,9 +117,16 @@ class DLRLookupConfig(ConfigFile):
         self.dlr_lookup_retry_delay = self._getint('dlr', 'dlr_lookup_retry_delay', 10)
         self.dlr_lookup_max_retries = self._getint('dlr', 'dlr_lookup_max_retries', 2)
 
+        # Lookup retrials tracker bounds
+        self.retrials_max_size = self._getint('dlr', 'retrials_max_size', 100000)
+        self.retrials_ttl = self._getint('dlr', 'retrials_ttl', 86400)
+
         self.smpp_receipt_on_success_submit_sm_resp = self._getbool('dlr', 'smpp_receipt_on_success_submit_sm_resp',
                                                                     False)
 
+        # Store DLR maps as compact binary blobs instead of redis hashes
+        self.compact_dlr_maps = self._getbool('dlr', 'compact_dlr_maps', False)
+
         self.log_level = logging.getLevelName(self._get('dlr', 'log_level', 'INFO'))
         self.log_file = self._get('dlr', 'log_file', '%s/messages.log' % LOG_PATH)
         self.log_rotate = self._get('dlr', 'log_rotate', 'midnight')
@@ -12,6 +12,8 @@ from smpp.pdu.pdu_types import CommandId, CommandStatus
 
 from pkg_resources import iter_entry_points
 
+from jasmin.tools import codec as _codec
+
 
 class InvalidParameterError(Exception):
     """Raised when a parameter is invalid
@@ -34,11 +36,11 @@ class PDU(Content):
     pickleProtocol = pickle.HIGHEST_PROTOCOL
 
     def __init__(self, body="", children=None, properties=None, pickleProtocol=pickle.HIGHEST_PROTOCOL,
-                 prePickle=False):
+                 prePickle=False, codec='pickle'):
         self.pickleProtocol = pickleProtocol
 
         if prePickle is True:
-            body = pickle.dumps(body, self.pickleProtocol)
+            body = _codec.dumps(body, codec, self.pickleProtocol)
 
         # Add creation date in header
         if 'headers' not in properties:
@@ -147,7 +149,7 @@ class SubmitSmContent(PDU):
                  source_connector='httpapi', destination_cid=None):
         props = {}
 
-        # RabbitMQ does not support priority (yet), anyway, we may use any other amqp broker that supports it
+        # Consumed by priority when submit.sm queues are priority queues (submit_sm_max_priority)
         if not isinstance(priority, int):
             raise InvalidParameterError("Invalid priority argument: %s" % priority)
         if not isinstance(priority, int) or priority < 0:
@@ -174,17 +176,17 @@ class SubmitSmContent(PDU):
 class SubmitSmRespContent(PDU):
     """A SMPP SubmitSmResp Content"""
 
-    def __init__(self, body, msgid, pickleProtocol=pickle.HIGHEST_PROTOCOL, prePickle=True):
+    def __init__(self, body, msgid, pickleProtocol=pickle.HIGHEST_PROTOCOL, prePickle=True, codec='pickle'):
         props = {'message-id': msgid}
 
-        PDU.__init__(self, body, properties=props, pickleProtocol=pickleProtocol, prePickle=prePickle)
+        PDU.__init__(self, body, properties=props, pickleProtocol=pickleProtocol, prePickle=prePickle, codec=codec)
 
 
 class DeliverSmContent(PDU):
     """A SMPP DeliverSm Content"""
 
     def __init__(self, body, sourceCid, pickleProtocol=pickle.HIGHEST_PROTOCOL, prePickle=True,
-                 concatenated=False, will_be_concatenated=False):
+                 concatenated=False, will_be_concatenated=False, codec='pickle'):
         props = {}
 
         props['message-id'] = randomUniqueId('deliver_sm', None, sourceCid, None)
@@ -195,7 +197,7 @@ class DeliverSmContent(PDU):
                             'concatenated': concatenated,
                             'will_be_concatenated': will_be_concatenated}
 
-        PDU.__init__(self, body, properties=props, pickleProtocol=pickleProtocol, prePickle=prePickle)
+        PDU.__init__(self, body, properties=props, pickleProtocol=pickleProtocol, prePickle=prePickle, codec=codec)
 
 
 class SubmitSmRespBillContent(Content):
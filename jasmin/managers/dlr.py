@@ -9,6 +9,10 @@ from txredisapi import ConnectionError
 from smpp.pdu.pdu_types import RegisteredDeliveryReceipt
 
 from jasmin.managers.content import DLRContentForHttpapi, DLRContentForSmpps
+from jasmin.managers.dlrmap import set_dlr_map, get_dlr_map, DLRMapCodecError
+from jasmin.queues.retry import retry_count, original_routing_key
+from jasmin.tools.latency import LatencyStatsCollector
+from jasmin.tools.retrials import RetrialTracker
 from jasmin.tools.singleton import Singleton
 from jasmin.tools import to_enum
 
@@ -40,7 +44,8 @@ class DLRLookup:
         self.amqpBroker = amqpBroker
         self.redisClient = redisClient
         self.requeue_timers = {}
-        self.lookup_retrials = {}
+        self.lookup_retrials = RetrialTracker('DLRLookup-%s' % self.pid, config.retrials_max_size,
+                                              config.retrials_ttl)
 
         # Set up a dedicated logger
         self.log = logging.getLogger(LOG_CATEGORY)
@@ -75,7 +80,15 @@ class DLRLookup:
     def rejectAndRequeueMessage(self, message, delay=True):
         msgid = message.content.properties['message-id']
 
-        if delay:
+        if delay and self.amqpBroker.config.retry_queues:
+            # Requeue through a retry queue, nothing is held by this process
+            requeue_delay = yield self.amqpBroker.requeue_delayed(
+                'DLRLookup-%s' % self.pid, message, self.config.dlr_lookup_retry_delay,
+                self.lookup_retrials.get(msgid, 1))
+            yield self.ackMessage(message)
+            self.log.debug("Requeued Content[%s] through a retry queue with delay: %s seconds",
+                           msgid, requeue_delay)
+        elif delay:
             self.log.debug("Requeuing Content[%s] with delay: %s seconds",
                            msgid, self.config.dlr_lookup_retry_delay)
 
@@ -101,18 +114,16 @@ class DLRLookup:
 
     @defer.inlineCallbacks
     def rejectMessage(self, message, requeue=0):
-        if requeue == 0 and message.content.properties['message-id'] in self.lookup_retrials:
+        if requeue == 0:
             # Remove retrial tracker
-            del self.lookup_retrials[message.content.properties['message-id']]
+            self.lookup_retrials.pop(message.content.properties['message-id'])
 
         yield self.amqpBroker.chan.basic_reject(delivery_tag=message.delivery_tag, requeue=requeue)
 
     @defer.inlineCallbacks
     def ackMessage(self, message):
         # Remove retrial tracker
-        if message.content.properties['message-id'] in self.lookup_retrials:
-            # Remove retrial tracker
-            del self.lookup_retrials[message.content.properties['message-id']]
+        self.lookup_retrials.pop(message.content.properties['message-id'])
 
         yield self.amqpBroker.chan.basic_ack(message.delivery_tag)
 
@@ -129,18 +140,17 @@ class DLRLookup:
         self.setup_callbacks(self.q)
 
         # retrial tracking
-        if message.content.properties['message-id'] in self.lookup_retrials:
-            self.lookup_retrials[message.content.properties['message-id']] += 1
-        else:
-            self.lookup_retrials[message.content.properties['message-id']] = 1
+        # Messages coming back from a retry queue are carrying their retry count
+        self.lookup_retrials.inc(message.content.properties['message-id'], 1 + retry_count(message))
 
         # Dispatching
-        if message.routing_key == 'dlr.submit_sm_resp':
-            yield self.submit_sm_resp_dlr_callback(message)
-        elif message.routing_key == 'dlr.deliver_sm':
-            yield self.deliver_sm_dlr_callback(message)
+        routing_key = original_routing_key(message)
+        if routing_key == 'dlr.submit_sm_resp':
+            yield LatencyStatsCollector().timeDeferred(self.submit_sm_resp_dlr_callback(message), 'dlr_lookup')
+        elif routing_key == 'dlr.deliver_sm':
+            yield LatencyStatsCollector().timeDeferred(self.deliver_sm_dlr_callback(message), 'dlr_lookup')
         else:
-            self.log.error('Unknown routing_key in dlr_callback_dispatcher: %s', message.routing_key)
+            self.log.error('Unknown routing_key in dlr_callback_dispatcher: %s', routing_key)
             yield self.rejectMessage(message)
 
     def dlr_errback(self, error):
@@ -170,7 +180,7 @@ class DLRLookup:
             # Check for DLR request from redis 'dlr' key
             # If there's a pending delivery receipt request then serve it
             # back by publishing a DLRContentForHttpapi to the messaging exchange
-            dlr = yield self.redisClient.hgetall("dlr:%s" % msgid)
+            dlr = yield get_dlr_map(self.redisClient, "dlr:%s" % msgid, self.config.compact_dlr_maps)
 
             if dlr is None or len(dlr) == 0:
                 raise DLRMapNotFound('No dlr map for msgid[%s]' % msgid)
@@ -222,8 +232,8 @@ class DLRLookup:
                                    smpp_msgid, msgid, dlr_expiry)
                     hashKey = "queue-msgid:%s" % smpp_msgid
                     hashValues = {'msgid': msgid, 'connector_type': 'httpapi'}
-                    yield self.redisClient.hmset(hashKey, hashValues)
-                    yield self.redisClient.expire(hashKey, dlr_expiry)
+                    yield set_dlr_map(self.redisClient, hashKey, hashValues, dlr_expiry,
+                                      self.config.compact_dlr_maps)
             elif dlr['sc'] == 'smppsapi':
                 self.log.debug('There is a SMPPs mapping for msgid[%s] ...', msgid)
                 system_id = dlr['system_id']
@@ -273,9 +283,9 @@ class DLRLookup:
                                        smpp_msgid, msgid, smpps_map_expiry)
                         hashKey = "queue-msgid:%s" % smpp_msgid
                         hashValues = {'msgid': msgid, 'connector_type': 'smppsapi'}
-                        yield self.redisClient.hmset(hashKey, hashValues)
-                        yield self.redisClient.expire(hashKey, smpps_map_expiry)
-        except DLRMapError as e:
+                        yield set_dlr_map(self.redisClient, hashKey, hashValues, smpps_map_expiry,
+                                          self.config.compact_dlr_maps)
+        except (DLRMapError, DLRMapCodecError) as e:
             self.log.error('[msgid:%s] DLR Content: %s', msgid, e)
             yield self.rejectMessage(message)
         except (RedisError, ConnectionError) as e:
@@ -315,7 +325,7 @@ class DLRLookup:
             if self.redisClient is None:
                 raise RedisError('RC undefined !')
 
-            q = yield self.redisClient.hgetall("queue-msgid:%s" % msgid)
+            q = yield get_dlr_map(self.redisClient, "queue-msgid:%s" % msgid, self.config.compact_dlr_maps)
             if len(q) != 2 or 'msgid' not in q or 'connector_type' not in q:
                 raise DLRMapNotFound('Got a DLR for an unknown message id: %s (coded:%s)' % (pdu_dlr_id, msgid))
 
@@ -323,7 +333,7 @@ class DLRLookup:
             connector_type = q['connector_type']
 
             # Get dlr and ensure it's sc (source_connector) is same as q['connector_type']
-            dlr = yield self.redisClient.hgetall("dlr:%s" % submit_sm_queue_id)
+            dlr = yield get_dlr_map(self.redisClient, "dlr:%s" % submit_sm_queue_id, self.config.compact_dlr_maps)
             if dlr is None or len(dlr) == 0:
                 raise DLRMapNotFound('Got a DLR for an unknown message id: %s (coded:%s)' % (pdu_dlr_id, msgid))
             if len(dlr) > 0 and dlr['sc'] != connector_type:
@@ -406,7 +416,7 @@ class DLRLookup:
                     if pdu_dlr_status in final_states:
                         self.log.debug('Removing SMPPs dlr map for msgid[%s]', submit_sm_queue_id)
                         yield self.redisClient.delete('dlr:%s' % submit_sm_queue_id)
-        except DLRMapError as e:
+        except (DLRMapError, DLRMapCodecError) as e:
             self.log.error('[msgid:%s] DLRMapError: %s', msgid, e)
             yield self.rejectMessage(message)
         except (RedisError, ConnectionError) as e:
@@ -0,0 +1,219 @@
+"""
+DLR maps storage in redis
+
+DLR maps (dlr:<msgid> and queue-msgid:<smpp_msgid> keys) are stored either as redis hashes
+(legacy format) or as one compact versioned binary blob set with SET EX, both formats are
+decoded into the same dict so existing hash entries keep working when switching to compact
+encoding.
+"""
+
+import datetime
+import struct
+
+from twisted.internet import defer
+from txredisapi import ResponseError
+from smpp.pdu.pdu_types import RegisteredDeliveryReceipt, AddrNpi, AddrTon
+
+# Bump when changing any of the layouts below, older versions must still be decoded
+VERSION = 1
+
+KIND_HTTPAPI = 1
+KIND_SMPPSAPI = 2
+KIND_QUEUE_MSGID = 3
+
+# version, kind
+HEADER = struct.Struct('!BB')
+# connector_type
+QUEUE_MSGID_LAYOUT = struct.Struct('!B')
+# level, expiry
+HTTPAPI_LAYOUT = struct.Struct('!BI')
+# source_addr_ton, source_addr_npi, dest_addr_ton, dest_addr_npi, rd_receipt, expiry, sub_date
+SMPPSAPI_LAYOUT = struct.Struct('!BBBBBIq')
+STRING_LENGTH = struct.Struct('!H')
+
+# Enums are stored by their index, None by NONE_INDEX
+NONE_INDEX = 255
+ADDR_TON = list(AddrTon)
+ADDR_NPI = list(AddrNpi)
+RD_RECEIPT = list(RegisteredDeliveryReceipt)
+
+CONNECTOR_TYPES = ['httpapi', 'smppsapi']
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class DLRMapCodecError(Exception):
+    """Raised when a DLR map cannot be encoded or decoded"""
+
+
+def _pack_string(value):
+    if value is None:
+        value = b''
+    elif not isinstance(value, bytes):
+        value = str(value).encode()
+
+    return STRING_LENGTH.pack(len(value)) + value
+
+
+def _unpack_strings(raw, offset, count):
+    """Return count strings starting at offset"""
+    values = []
+    for _ in range(count):
+        length, = STRING_LENGTH.unpack_from(raw, offset)
+        offset += STRING_LENGTH.size
+        value = raw[offset:offset + length]
+        offset += length
+
+        # Mimic redis hashes replies: return bytes only when not decodable
+        try:
+            value = value.decode()
+        except UnicodeDecodeError:
+            pass
+        values.append(value)
+
+    if offset > len(raw):
+        raise DLRMapCodecError('Truncated DLR map: %r' % raw)
+
+    return values
+
+
+def _enum_index(values, value):
+    if value is None:
+        return NONE_INDEX
+    if isinstance(value, str):
+        # A value read back from a legacy hash, e.g. 'AddrTon.NATIONAL'
+        for _value in values:
+            if value in (str(_value), _value.name):
+                return values.index(_value)
+
+    return values.index(value)
+
+
+def _enum_str(values, index):
+    if index == NONE_INDEX:
+        return 'None'
+
+    return str(values[index])
+
+
+def _to_microseconds(date):
+    if isinstance(date, str):
+        date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S.%f' if '.' in date else '%Y-%m-%d %H:%M:%S')
+
+    delta = date - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def encode(mapping):
+    """Encode a DLR map into a compact binary blob"""
+    try:
+        if 'sc' not in mapping:
+            return (HEADER.pack(VERSION, KIND_QUEUE_MSGID) +
+                    QUEUE_MSGID_LAYOUT.pack(CONNECTOR_TYPES.index(mapping['connector_type'])) +
+                    _pack_string(mapping['msgid']))
+        elif mapping['sc'] == 'httpapi':
+            return (HEADER.pack(VERSION, KIND_HTTPAPI) +
+                    HTTPAPI_LAYOUT.pack(int(mapping['level']), int(mapping['expiry'])) +
+                    _pack_string(mapping['url']) +
+                    _pack_string(mapping['method']) +
+                    _pack_string(mapping['connector']))
+        elif mapping['sc'] == 'smppsapi':
+            return (HEADER.pack(VERSION, KIND_SMPPSAPI) +
+                    SMPPSAPI_LAYOUT.pack(_enum_index(ADDR_TON, mapping['source_addr_ton']),
+                                         _enum_index(ADDR_NPI, mapping['source_addr_npi']),
+                                         _enum_index(ADDR_TON, mapping['dest_addr_ton']),
+                                         _enum_index(ADDR_NPI, mapping['dest_addr_npi']),
+                                         _enum_index(RD_RECEIPT, mapping['rd_receipt']),
+                                         int(mapping['expiry']),
+                                         _to_microseconds(mapping['sub_date'])) +
+                    _pack_string(mapping['system_id']) +
+                    _pack_string(mapping['source_addr']) +
+                    _pack_string(mapping['destination_addr']))
+        else:
+            raise DLRMapCodecError('Unknown sc: %s' % mapping['sc'])
+    except (KeyError, ValueError, struct.error) as e:
+        raise DLRMapCodecError('Cannot encode %s: %r' % (mapping, e))
+
+
+def decode(raw):
+    """Decode a compact binary blob into a DLR map, the returned dict is the same as
+    what a legacy hash lookup (hgetall) would return"""
+    if isinstance(raw, str):
+        # Redis client decodes replies when they are valid utf-8
+        raw = raw.encode()
+
+    try:
+        version, kind = HEADER.unpack_from(raw)
+        if version != VERSION:
+            raise DLRMapCodecError('Unsupported DLR map version: %s' % version)
+
+        offset = HEADER.size
+        if kind == KIND_QUEUE_MSGID:
+            connector_type, = QUEUE_MSGID_LAYOUT.unpack_from(raw, offset)
+            msgid, = _unpack_strings(raw, offset + QUEUE_MSGID_LAYOUT.size, 1)
+
+            return {'msgid': msgid, 'connector_type': CONNECTOR_TYPES[connector_type]}
+        elif kind == KIND_HTTPAPI:
+            level, expiry = HTTPAPI_LAYOUT.unpack_from(raw, offset)
+            url, method, connector = _unpack_strings(raw, offset + HTTPAPI_LAYOUT.size, 3)
+
+            return {'sc': 'httpapi', 'url': url, 'level': level, 'method': method,
+                    'connector': connector, 'expiry': expiry}
+        elif kind == KIND_SMPPSAPI:
+            (source_addr_ton, source_addr_npi, dest_addr_ton, dest_addr_npi, rd_receipt, expiry,
+             sub_date) = SMPPSAPI_LAYOUT.unpack_from(raw, offset)
+            system_id, source_addr, destination_addr = _unpack_strings(raw, offset + SMPPSAPI_LAYOUT.size, 3)
+
+            return {'sc': 'smppsapi',
+                    'system_id': system_id,
+                    'source_addr_ton': _enum_str(ADDR_TON, source_addr_ton),
+                    'source_addr_npi': _enum_str(ADDR_NPI, source_addr_npi),
+                    'source_addr': source_addr,
+                    'dest_addr_ton': _enum_str(ADDR_TON, dest_addr_ton),
+                    'dest_addr_npi': _enum_str(ADDR_NPI, dest_addr_npi),
+                    'destination_addr': destination_addr,
+                    'sub_date': str(EPOCH + datetime.timedelta(microseconds=sub_date)),
+                    'rd_receipt': _enum_str(RD_RECEIPT, rd_receipt),
+                    'expiry': expiry}
+        else:
+            raise DLRMapCodecError('Unknown DLR map kind: %s' % kind)
+    except (IndexError, struct.error) as e:
+        raise DLRMapCodecError('Cannot decode %r: %r' % (raw, e))
+
+
+def set_dlr_map(redisClient, key, mapping, expiry, compact=False):
+    """Write the DLR map to redis, compact or as a legacy hash"""
+    if compact:
+        return redisClient.set_expire(key, encode(mapping), expiry)
+    else:
+        return redisClient.hmset_expire(key, mapping, expiry)
+
+
+@defer.inlineCallbacks
+def get_dlr_map(redisClient, key, compact=False):
+    """Read the DLR map from redis, returns an empty dict if not found
+
+    The configured format is read first, the other one is only tried when redis replies the key
+    holds a different type (maps written before switching formats), this is keeping hits and
+    misses at one round trip."""
+    try:
+        if compact:
+            raw = yield redisClient.get(key)
+        else:
+            dlr_map = yield redisClient.hgetall(key)
+            defer.returnValue(dlr_map)
+    except ResponseError as e:
+        if 'WRONGTYPE' not in str(e):
+            raise
+
+        if compact:
+            # Legacy hash format
+            dlr_map = yield redisClient.hgetall(key)
+            defer.returnValue(dlr_map)
+        else:
+            raw = yield redisClient.get(key)
+
+    if raw is None:
+        defer.returnValue({})
+
+    defer.returnValue(decode(raw))
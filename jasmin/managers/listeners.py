@@ -2,7 +2,7 @@
 import pickle
 import sys
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from logging.handlers import TimedRotatingFileHandler
 
 from dateutil import parser
@@ -15,12 +15,17 @@ from smpp.twisted.protocol import DataHandlerResponse
 from smpp.pdu.error import SMPPRequestTimoutError
 
 from jasmin.managers.configs import SMPPClientPBConfig
+from jasmin.managers import reassembly
 from jasmin.managers.content import SubmitSmRespContent, DeliverSmContent, SubmitSmRespBillContent, DLR
 from jasmin.protocols.smpp.error import *
 from jasmin.protocols.smpp.operations import SMPPOperationFactory
-from jasmin.routing.Routables import RoutableDeliverSm
+from jasmin.queues.ack import AckBatcher
+from jasmin.queues.retry import retry_count
+from jasmin.routing.Routables import Routable, RoutableDeliverSm
 from jasmin.routing.jasminApi import Connector
-from jasmin.tools import qos
+from jasmin.tools import codec, qos
+from jasmin.tools.latency import LatencyStatsCollector
+from jasmin.tools.retrials import RetrialTracker
 
 LOG_CATEGORY = "jasmin-sm-listener"
 
@@ -31,7 +36,8 @@ class SMPPClientSMListener:
     SubmitSm, DeliverSm and SubmitSm PDUs for a given SMPP connection
     """
 
-    def __init__(self, config, SMPPClientFactory, amqpBroker, redisClient, RouterPB=None, interceptorpb_client=None):
+    def __init__(self, config, SMPPClientFactory, amqpBroker, redisClient, RouterPB=None, interceptorpb_client=None,
+                 qos_bucket=None, submit_retrials=None):
         self.config = config
         self.SMPPClientFactory = SMPPClientFactory
         self.SMPPOperationFactory = SMPPOperationFactory(self.SMPPClientFactory.config)
@@ -40,13 +46,22 @@ class SMPPClientSMListener:
         self.RouterPB = RouterPB
         self.interceptorpb_client = interceptorpb_client
         self.submit_sm_q = None
-        self.qos_last_submit_sm_at = None
+        self.ackBatcher = None
+        # Listeners of a connector's binds are sharing its throughput and retrial counts
+        if qos_bucket is None:
+            qos_bucket = qos.TokenBucket(self.SMPPClientFactory.config.submit_sm_throughput)
+        self.qos_bucket = qos_bucket
         self.rejectTimers = {}
-        self.submit_retrials = {}
+        if submit_retrials is None:
+            submit_retrials = RetrialTracker('smppc:%s' % self.SMPPClientFactory.config.id,
+                                             self.config.retrials_max_size, self.config.retrials_ttl)
+        self.submit_retrials = submit_retrials
         self.qosTimer = None
 
-        # Set pickleProtocol
-        self.pickleProtocol = SMPPClientPBConfig(self.config.config_file).pickle_protocol
+        # Set pickleProtocol and pduCodec
+        SMPPClientPBConfigInstance = SMPPClientPBConfig(self.config.config_file)
+        self.pickleProtocol = SMPPClientPBConfigInstance.pickle_protocol
+        self.pduCodec = SMPPClientPBConfigInstance.pdu_codec
 
         # Set up a dedicated logger
         self.log = logging.getLogger(LOG_CATEGORY)
@@ -62,10 +77,26 @@ class SMPPClientSMListener:
             self.log.addHandler(handler)
             self.log.propagate = False
 
-    def setSubmitSmQ(self, queue):
+    def setSubmitSmQ(self, queue, chan=None):
         self.log.debug('Setting a new submit_sm_q: %s', queue)
         self.submit_sm_q = queue
 
+        # Acks and rejects must be sent on the channel the queue is consumed from
+        if chan is None:
+            chan = self.amqpBroker.chan
+        if self.ackBatcher is None or self.ackBatcher.chan is not chan:
+            self.ackBatcher = AckBatcher(chan)
+
+        # Batching may have been updated through jcli
+        self.ackBatcher.batch_size = getattr(self.SMPPClientFactory.config, 'submit_sm_ack_batch_size', 1)
+        self.ackBatcher.interval = getattr(self.SMPPClientFactory.config, 'submit_sm_ack_batch_interval', 0.1)
+
+    def flushAcks(self):
+        if self.ackBatcher is None:
+            return defer.succeed(None)
+
+        return self.ackBatcher.flush()
+
     def clearRejectTimer(self, msgid):
         if msgid in self.rejectTimers:
             timer = self.rejectTimers[msgid]
@@ -87,6 +118,8 @@ class SMPPClientSMListener:
     def clearAllTimers(self):
         self.clearQosTimer()
         self.clearRejectTimers()
+        if self.ackBatcher is not None:
+            self.ackBatcher.cancelTimer()
 
     @defer.inlineCallbacks
     def rejectAndRequeueMessage(self, message, delay=True):
@@ -99,6 +132,16 @@ class SMPPClientSMListener:
             else:
                 requeue_delay = self.SMPPClientFactory.config.requeue_delay
 
+            if self.amqpBroker.config.retry_queues:
+                # Requeue through a retry queue, nothing is held by this process
+                requeue_delay = yield self.amqpBroker.requeue_delayed(
+                    'submit.sm.%s' % self.SMPPClientFactory.config.id, message, requeue_delay,
+                    self.submit_retrials.get(msgid, 1))
+                yield self.ackMessage(message)
+                self.log.debug("Requeued SubmitSmPDU[%s] through a retry queue in %s seconds",
+                               msgid, requeue_delay)
+                return
+
             self.log.debug("Requeuing SubmitSmPDU[%s] in %s seconds",
                            msgid, requeue_delay)
 
@@ -119,11 +162,33 @@ class SMPPClientSMListener:
 
     @defer.inlineCallbacks
     def rejectMessage(self, message, requeue=0):
-        yield self.amqpBroker.chan.basic_reject(delivery_tag=message.delivery_tag, requeue=requeue)
+        if requeue == 0:
+            # Remove retrial tracker
+            self.submit_retrials.pop(message.content.properties['message-id'])
+
+        if self.ackBatcher is None:
+            yield self.amqpBroker.chan.basic_reject(delivery_tag=message.delivery_tag, requeue=requeue)
+        else:
+            yield self.ackBatcher.reject(message.delivery_tag, requeue)
 
     @defer.inlineCallbacks
     def ackMessage(self, message):
-        yield self.amqpBroker.chan.basic_ack(message.delivery_tag)
+        if self.ackBatcher is None:
+            yield self.amqpBroker.chan.basic_ack(message.delivery_tag)
+        else:
+            yield self.ackBatcher.ack(message.delivery_tag)
+
+    def observe_queue_latency(self, message):
+        """Observe the time message spent in submit.sm queue since its creation"""
+        try:
+            created_at = datetime.fromisoformat(message.content.properties['headers']['created_at'])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        wait_time = (datetime.now() - created_at).total_seconds()
+        LatencyStatsCollector().observe('submit_sm_queue', wait_time, self.SMPPClientFactory.config.id)
+        LatencyStatsCollector().observe('submit_sm_queue_priority', wait_time,
+                                        message.content.properties.get('priority', 0))
 
     @defer.inlineCallbacks
     def submit_sm_callback(self, message):
@@ -133,42 +198,43 @@ class SMPPClientSMListener:
         """
         msgid = None
         try:
+            if self.ackBatcher is not None:
+                self.ackBatcher.delivered(message.delivery_tag)
+
             msgid = message.content.properties['message-id']
-            SubmitSmPDU = pickle.loads(message.content.body)
+            SubmitSmPDU = codec.loads(message.content.body)
 
             self.submit_sm_q.get().addCallback(self.submit_sm_callback).addErrback(self.submit_sm_errback)
 
             self.log.debug("Callbacked a submit_sm with a SubmitSmPDU[%s] (?): %s", msgid, SubmitSmPDU)
 
             # Update submit_sm retrial tracker
-            if msgid in self.submit_retrials:
-                self.submit_retrials[msgid] += 1
-            else:
-                self.submit_retrials[msgid] = 1
+            # Messages coming back from a retry queue are carrying their retry count
+            retrials = self.submit_retrials.inc(msgid, 1 + retry_count(message))
 
-            if self.qos_last_submit_sm_at is None:
-                self.qos_last_submit_sm_at = datetime(1970, 1, 1)
+            # Time spent in queue, requeued messages are observed only once
+            if retrials == 1:
+                self.observe_queue_latency(message)
 
             if self.SMPPClientFactory.config.submit_sm_throughput > 0:
                 # QoS throttling
-                qos_throughput_second = 1 / float(self.SMPPClientFactory.config.submit_sm_throughput)
-                qos_throughput_ysecond_td = timedelta(microseconds=qos_throughput_second * 1000000)
-                qos_delay = datetime.now() - self.qos_last_submit_sm_at
-                if qos_delay < qos_throughput_ysecond_td:
-                    qos_slow_down = float((qos_throughput_ysecond_td - qos_delay).microseconds) / 1000000
+                # The throughput can be updated at runtime through jcli
+                if self.qos_bucket.rate != self.SMPPClientFactory.config.submit_sm_throughput:
+                    self.qos_bucket.set_rate(self.SMPPClientFactory.config.submit_sm_throughput)
+
+                qos_slow_down = self.qos_bucket.reserve()
+                if qos_slow_down > 0:
                     # We're faster than submit_sm_throughput,
-                    # slow down before taking a new message from the queue
+                    # slow down before handling the message
                     self.log.debug(
-                        "QoS: submit_sm_callback faster (%s) than throughput (%s), slowing down %ss (requeuing).",
-                        qos_delay, qos_throughput_ysecond_td, qos_slow_down)
+                        "QoS: submit_sm_callback faster than throughput (%s/s), slowing down %ss.",
+                        self.qos_bucket.rate, qos_slow_down)
 
                     # New QoS controller (>=0.10.13):
                     # Will pause for a delay then allow handling the message normally
                     # This will avoid impacting resources by requeuing on rabbitmq
                     yield qos.slow_down(qos_slow_down)
 
-                self.qos_last_submit_sm_at = datetime.now()
-
             # Verify if message is a SubmitSm PDU
             if isinstance(SubmitSmPDU, SubmitSM) is False:
                 self.log.error(
@@ -193,7 +259,7 @@ class SMPPClientSMListener:
                 if msgAge.seconds > self.config.submit_max_age_smppc_not_ready:
                     self.log.error(
                         "SMPPC [cid:%s] is not connected: Discarding (#%s) SubmitSmPDU[%s], over-aged %s seconds.",
-                        self.SMPPClientFactory.config.id, self.submit_retrials[msgid],
+                        self.SMPPClientFactory.config.id, retrials,
                         msgid, msgAge.seconds)
                     yield self.rejectMessage(message)
                     defer.returnValue(False)
@@ -204,7 +270,7 @@ class SMPPClientSMListener:
                         delay_str = ''
                     self.log.error(
                         "SMPPC [cid:%s] is not connected: Requeuing (#%s) SubmitSmPDU[%s]%s, aged %s seconds.",
-                        self.SMPPClientFactory.config.id, self.submit_retrials[msgid],
+                        self.SMPPClientFactory.config.id, retrials,
                         msgid, delay_str, msgAge.seconds)
                     yield self.rejectAndRequeueMessage(message,
                                                        delay=self.config.submit_retrial_delay_smppc_not_ready)
@@ -217,7 +283,7 @@ class SMPPClientSMListener:
                 if msgAge.seconds > self.config.submit_max_age_smppc_not_ready:
                     self.log.error(
                         "SMPPC [cid:%s] is not bound: Discarding (#%s) SubmitSmPDU[%s], over-aged %s seconds.",
-                        self.SMPPClientFactory.config.id, self.submit_retrials[msgid],
+                        self.SMPPClientFactory.config.id, retrials,
                         msgid, msgAge.seconds)
                     yield self.rejectMessage(message)
                     defer.returnValue(False)
@@ -227,7 +293,7 @@ class SMPPClientSMListener:
                     else:
                         delay_str = ''
                     self.log.error("SMPPC [cid:%s] is not bound: Requeuing (#%s) SubmitSmPDU[%s]%s, aged %s seconds.",
-                                   self.SMPPClientFactory.config.id, self.submit_retrials[msgid],
+                                   self.SMPPClientFactory.config.id, retrials,
                                    msgid, delay_str, msgAge)
                     yield self.rejectAndRequeueMessage(
                         message, delay=self.config.submit_retrial_delay_smppc_not_ready)
@@ -235,8 +301,9 @@ class SMPPClientSMListener:
 
             # Finally: send the sms !
             self.log.debug("Sending SubmitSmPDU[%s] through SMPPClientFactory [cid:%s] after %s requeues.",
-                           msgid, self.SMPPClientFactory.config.id, self.submit_retrials[msgid])
+                           msgid, self.SMPPClientFactory.config.id, retrials)
             d = self.SMPPClientFactory.smpp.sendDataRequest(SubmitSmPDU)
+            LatencyStatsCollector().timeDeferred(d, 'submit_sm_resp', self.SMPPClientFactory.config.id)
             d.addCallback(self.submit_sm_resp_event, message)
             yield d
         except SMPPRequestTimoutError:
@@ -271,7 +338,7 @@ class SMPPClientSMListener:
 
             if r.response.status == CommandStatus.ESME_ROK:
                 # No more retrials !
-                del self.submit_retrials[msgid]
+                self.submit_retrials.pop(msgid)
 
                 # Get bill information
                 if submit_sm_resp_bill is not None and submit_sm_resp_bill.getTotalAmounts() > 0:
@@ -343,13 +410,13 @@ class SMPPClientSMListener:
                     retrial = self.config.submit_error_retrial[r.response.status.name]
 
                     # Still have some retries to go ?
-                    if self.submit_retrials[msgid] < retrial['count']:
+                    if self.submit_retrials.get(msgid, 1) < retrial['count']:
                         # Requeue the message for later redelivery
                         yield self.rejectAndRequeueMessage(amqpMessage, delay=retrial['delay'])
                         will_be_retried = True
                     else:
                         # Prevent this list from over-growing
-                        del self.submit_retrials[msgid]
+                        self.submit_retrials.pop(msgid)
 
                 # Do not log text for privacy reasons
                 # Added in #691
@@ -409,7 +476,8 @@ class SMPPClientSMListener:
                 # Send back submit_sm_resp to submit.sm.resp.CID queue
                 # There's no actual listeners on this queue, it can be used to
                 # track submit_sm_resp messages from a 3rd party app
-                content = SubmitSmRespContent(r.response, msgid, pickleProtocol=self.pickleProtocol)
+                content = SubmitSmRespContent(r.response, msgid, pickleProtocol=self.pickleProtocol,
+                                              codec=self.pduCodec)
                 self.log.debug("Sending back SubmitSmRespContent[%s] with routing_key[%s]",
                                msgid, amqpMessage.content.properties['reply-to'])
                 yield self.amqpBroker.publish(exchange='messaging',
@@ -438,61 +506,27 @@ class SMPPClientSMListener:
                 self.log.error("Error in submit_sm_errback (%s): %s", type(e), e)
 
     @defer.inlineCallbacks
-    def concatDeliverSMs(self, HSetReturn, hashKey, splitMethod, total_segments, msg_ref_num, segment_seqnum):
-        if HSetReturn == 0:
-            self.log.warning('This hashKey %s already exists, will not reset it !', hashKey)
-            return
-
-        # @TODO: longDeliverSm part expiry must be configurable
-        yield self.redisClient.expire(hashKey, 300)
+    def concatDeliverSMs(self, result, pdu, hashKey, splitMethod, msg_ref_num):
+        state, expired, payloads = result
 
-        # This is the last part
-        if segment_seqnum == total_segments:
-            hvals = yield self.redisClient.hvals(hashKey)
-            if len(hvals) != total_segments:
-                self.log.warning(
-                    'Received the last part (msg_ref_num:%s) and did not find all parts in redis, data lost !',
-                    msg_ref_num)
-                return
+        if expired > 0:
+            self.SMPPClientFactory.stats.inc('long_mo_expired_count', expired)
+            self.log.warning('%s long DeliverSm were not completed in %ss, data lost !',
+                             expired, self.config.long_deliver_sm_expiry)
 
-            # Get PDUs
-            pdus = {}
-            for pickledValue in hvals:
-                value = pickle.loads(pickledValue)
+        if state == reassembly.DUPLICATE:
+            self.log.warning('This hashKey %s already exists, will not reset it !', hashKey)
+            return
+        elif state == reassembly.PENDING:
+            return
 
-                pdus[value['segment_seqnum']] = value['pdu']
+        self.log.debug('Got all parts of long DeliverSm (msg_ref_num:%s), concatenating them', msg_ref_num)
 
-            # Where is the message content to be found ?
-            if 'short_message' in pdus[1].params:
-                msg_content_key = 'short_message'
-            elif 'message_payload' in pdus[1].params:
-                msg_content_key = 'message_payload'
-            else:
-                self.log.warning('Cannot find message content in first pdu params: %s', pdus[1].params)
-                return
+        # Build the final pdu and return it back to deliver_sm_event
+        pdu = reassembly.reassemble(pdu, splitMethod, payloads)
 
-            # Build concat_message_content
-            concat_message_content = b''
-            for i in range(total_segments):
-                if splitMethod == 'sar':
-                    concat_message_content += pdus[i + 1].params[msg_content_key]
-                else:
-                    concat_message_content += pdus[i + 1].params[msg_content_key][6:]
-
-            # Build the final pdu and return it back to deliver_sm_event
-            pdu = pdus[1]  # Take the first part as a base of work
-            # 1. Remove message splitting information from pdu
-            if splitMethod == 'sar':
-                del pdu.params['sar_segment_seqnum']
-                del pdu.params['sar_total_segments']
-                del pdu.params['sar_msg_ref_num']
-            else:
-                pdu.params['esm_class'] = None
-            # 2. Set the new concat_message_content
-            pdu.params[msg_content_key] = concat_message_content
-
-            routable = RoutableDeliverSm(pdu, Connector(self.SMPPClientFactory.config.id))
-            yield self.deliver_sm_event_post_interception(routable=routable, smpp=None, concatenated=True)
+        routable = RoutableDeliverSm(pdu, Connector(self.SMPPClientFactory.config.id))
+        yield self.deliver_sm_event_post_interception(routable=routable, smpp=None, concatenated=True)
 
     def code_dlr_msgid(self, pdu):
         """Code the dlr msg id accordingly to SMPPc's dlr_msg_id_bases value"""
@@ -606,12 +640,15 @@ class SMPPClientSMListener:
                     raise InterceptorRunError('Failed running interception script, check log for details')
                 elif isinstance(args[0], dict) and args[0]['smpp_status'] > 0:
                     smpp.factory.stats.inc('interceptor_error_count')
+                    if args[0].get('error') == 'timeout':
+                        smpp.factory.stats.inc('interceptor_timeout_count')
                     self.log.info(
                         'Interceptor script returned %s smpp_status error.', args[0]['smpp_status'])
                     raise DeliverSmInterceptionError(code=args[0]['smpp_status'])
-                elif isinstance(args[0], (str, bytes)):
+                elif isinstance(args[0], (str, bytes, Routable)):
                     smpp.factory.stats.inc('interceptor_count')
-                    routable = pickle.loads(args[0])
+                    # The embedded interceptor returns the routable itself
+                    routable = args[0] if isinstance(args[0], Routable) else pickle.loads(args[0])
                 else:
                     smpp.factory.stats.inc('interceptor_error_count')
                     self.log.error(
@@ -626,7 +663,8 @@ class SMPPClientSMListener:
             content = DeliverSmContent(routable,
                                        self.SMPPClientFactory.config.id,
                                        pickleProtocol=self.pickleProtocol,
-                                       concatenated=concatenated)
+                                       concatenated=concatenated,
+                                       codec=self.pduCodec)
             msgid = content.properties['message-id']
 
             if routable.pdu.dlr is None:
@@ -706,23 +744,25 @@ class SMPPClientSMListener:
                             'Invalid RC found while receiving part of long DeliverSm [queue-msgid:%s], MSG IS LOST !',
                             msgid)
                     else:
-                        # Save it to redis
-                        hashKey = "longDeliverSm:%s:%s:%s" % (
+                        # Save it to redis, the message is concatenated when its last missing
+                        # part is saved
+                        hashKey = reassembly.parts_key(
                             self.SMPPClientFactory.config.id,
                             msg_ref_num,
                             routable.pdu.params['destination_addr'])
-                        hashValues = {'pdu': routable.pdu,
-                                      'total_segments': total_segments,
-                                      'msg_ref_num': msg_ref_num,
-                                      'segment_seqnum': segment_seqnum}
-                        yield self.redisClient.hset(
-                            hashKey, segment_seqnum, pickle.dumps(hashValues, self.pickleProtocol)).addCallback(
+                        yield reassembly.add_part(
+                            self.redisClient,
+                            self.SMPPClientFactory.config.id,
+                            hashKey,
+                            segment_seqnum,
+                            total_segments,
+                            reassembly.segment_payload(routable.pdu, splitMethod),
+                            self.config.long_deliver_sm_expiry).addCallback(
                             self.concatDeliverSMs,
+                            routable.pdu,
                             hashKey,
                             splitMethod,
-                            total_segments,
-                            msg_ref_num,
-                            segment_seqnum)
+                            msg_ref_num)
 
                         self.log.info(
                             "DeliverSmContent[%s] is part of long msg of (%s), will be enqueued after concatenation.",
@@ -0,0 +1,120 @@
+"""
+Long deliver_sm (SMS-MO) reassembly buffer in redis
+
+Parts of a long message are added to a redis hash (segment_seqnum: payload) by one lua script
+run, the script is returning all payloads to the listener adding the last missing part whatever
+the order parts are received in, and deletes the hash at once: two listeners can never complete
+the same message.
+
+Only part payloads (message content without UDH) are stored, the pdu of the completing part is
+used as a base for the concatenated message.
+
+Partials are tracked in a per connector sorted set scored with their expiry time, expired ones
+are counted (and removed from the set) by the next script run for the same connector.
+"""
+
+import copy
+import time
+
+from twisted.internet import defer
+
+# Redis replies are decoded to str (or int) when possible, 0xff is never found in UTF-8
+# and keeps payloads as bytes
+PAYLOAD_PREFIX = b'\xff'
+
+# add_part() states
+DUPLICATE = 0
+PENDING = 1
+COMPLETE = 2
+
+# KEYS: parts hash, pending partials sorted set
+# ARGV: segment_seqnum, payload, total_segments, expiry, now
+ADD_PART_SCRIPT = """
+local expired = redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[5])
+
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return {0, expired}
+end
+
+if redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[3]) then
+    local parts = redis.call('HGETALL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[2], KEYS[1])
+    return {2, expired, unpack(parts)}
+end
+
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[5]) + tonumber(ARGV[4]), KEYS[1])
+return {1, expired}
+"""
+
+
+def parts_key(cid, msg_ref_num, destination_addr):
+    return 'longDeliverSmParts:%s:%s:%s' % (cid, msg_ref_num, destination_addr)
+
+
+def pending_key(cid):
+    return 'longDeliverSmPending:%s' % cid
+
+
+def content_key(pdu):
+    """Return the pdu parameter holding the message content"""
+    if 'short_message' in pdu.params and len(pdu.params['short_message']) > 0:
+        return 'short_message'
+    elif 'message_payload' in pdu.params:
+        return 'message_payload'
+    elif 'short_message' in pdu.params:
+        return 'short_message'
+
+    return None
+
+
+def segment_payload(pdu, splitMethod):
+    """Return the part's message content without its concatenation UDH"""
+    payload = pdu.params[content_key(pdu)]
+    if splitMethod == 'udh':
+        payload = payload[6:]
+
+    return payload
+
+
+@defer.inlineCallbacks
+def add_part(redisClient, cid, key, segment_seqnum, total_segments, payload, expiry):
+    """Add a part to its message buffer, return a (state, expired, payloads) tuple:
+
+    - state is one of DUPLICATE, PENDING or COMPLETE,
+    - expired is the number of expired partials of the connector found since last call,
+    - payloads is the ordered list of all parts payloads when state is COMPLETE, None otherwise.
+    """
+    r = yield redisClient.eval(
+        ADD_PART_SCRIPT,
+        keys=[key, pending_key(cid)],
+        args=[segment_seqnum, PAYLOAD_PREFIX + payload, total_segments, expiry, int(time.time())])
+
+    state, expired = r[0], r[1]
+    if state != COMPLETE:
+        defer.returnValue((state, expired, None))
+
+    parts = {}
+    for i in range(2, len(r), 2):
+        parts[int(r[i])] = r[i + 1][len(PAYLOAD_PREFIX):]
+
+    defer.returnValue((state, expired, [parts[i] for i in sorted(parts)]))
+
+
+def reassemble(pdu, splitMethod, payloads):
+    """Return a copy of pdu holding the concatenated payloads and no splitting information"""
+    pdu = copy.copy(pdu)
+    pdu.params = dict(pdu.params)
+
+    # 1. Remove message splitting information from pdu
+    if splitMethod == 'sar':
+        del pdu.params['sar_segment_seqnum']
+        del pdu.params['sar_total_segments']
+        del pdu.params['sar_msg_ref_num']
+    else:
+        pdu.params['esm_class'] = None
+    # 2. Set the new concat_message_content
+    pdu.params[content_key(pdu)] = b''.join(payloads)
+
+    return pdu
@@ -11,7 +11,8 @@ from jasmin.tools.migrations.configuration import ConfigurationMigrator
 from jasmin.routing.Filters import (TransparentFilter, UserFilter, GroupFilter,
                                     ConnectorFilter, SourceAddrFilter, DestinationAddrFilter,
                                     ShortMessageFilter, DateIntervalFilter, TimeIntervalFilter,
-                                    EvalPyFilter, TagFilter)
+                                    EvalPyFilter, TagFilter, SourcePrefixFilter,
+                                    DestinationPrefixFilter)
 from jasmin.config import ROOT_PATH
 
 # Related to travis-ci builds
@@ -28,14 +29,14 @@ FilterKeyMap = {'fid': 'fid', 'type': 'type'}
 FILTERS = ['TransparentFilter', 'UserFilter', 'GroupFilter', 'ConnectorFilter',
            'SourceAddrFilter', 'DestinationAddrFilter', 'ShortMessageFilter',
            'DateIntervalFilter', 'TimeIntervalFilter', 'EvalPyFilter',
-           'TagFilter']
+           'TagFilter', 'SourcePrefixFilter', 'DestinationPrefixFilter']
 
 MOFILTERS = ['TransparentFilter', 'ConnectorFilter', 'SourceAddrFilter', 'DestinationAddrFilter',
              'ShortMessageFilter', 'DateIntervalFilter', 'TimeIntervalFilter', 'EvalPyFilter',
-             'TagFilter']
+             'TagFilter', 'SourcePrefixFilter', 'DestinationPrefixFilter']
 MTFILTERS = ['TransparentFilter', 'UserFilter', 'GroupFilter', 'SourceAddrFilter', 'DestinationAddrFilter',
              'ShortMessageFilter', 'DateIntervalFilter', 'TimeIntervalFilter', 'EvalPyFilter',
-             'TagFilter']
+             'TagFilter', 'SourcePrefixFilter', 'DestinationPrefixFilter']
 
 
 def FilterBuild(fCallback):
@@ -207,6 +208,27 @@ def FilterBuild(fCallback):
 
                     arg = pyCode
 
+                # Validate prefixes option: a file with one prefix per line (or comma separated),
+                # empty lines and lines starting with # are ignored
+                if cmd == 'prefixes':
+                    try:
+                        with open(arg, 'r') as prefixes_file:
+                            lines = prefixes_file.read().splitlines()
+                    except IOError as e:
+                        return self.protocol.sendData('[IO]: %s' % str(e))
+
+                    prefixes = []
+                    for line in lines:
+                        line = line.strip()
+                        if line == '' or line.startswith('#'):
+                            continue
+                        prefixes.extend(p.strip() for p in line.split(',') if p.strip() != '')
+
+                    if len(prefixes) == 0:
+                        return self.protocol.sendData('No prefixes found in %s' % arg)
+
+                    arg = prefixes
+
                 # Cast tag to int if possible, otherwise keep it as is
                 if cmd == 'tag':
                     try:
@@ -32,3 +32,11 @@ class HTTPApiConfig(ConfigFile):
         # Long message splitting
         self.long_content_max_parts = self._get('http-api', 'long_content_max_parts', 5)
         self.long_content_split = self._get('http-api', 'long_content_split', 'udh')  # sar or udh
+
+        # Maximum number of messages in one /sendbulk request
+        self.bulk_max_messages = self._getint('http-api', 'bulk_max_messages', 1000)
+
+        # Upper bounds (in seconds) of the latency histograms buckets exported by /metrics
+        self.metrics_latency_buckets = [float(b) for b in self._get(
+            'http-api', 'metrics_latency_buckets',
+            '0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10').split(',')]
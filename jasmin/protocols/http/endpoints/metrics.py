@@ -1,7 +1,13 @@
 from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
 
+from jasmin.managers.clients import BOUND_STATES
 from jasmin.protocols.http.stats import HttpAPIStatsCollector
 from jasmin.protocols.smpp.stats import SMPPClientStatsCollector, SMPPServerStatsCollector
+from jasmin.redis.stats import RedisStatsCollector
+from jasmin.routing.stats import ThrowerStatsCollector
+from jasmin.tools.latency import LatencyStatsCollector, STAGES
+from jasmin.tools.retrials import RetrialTrackerStatsCollector
 
 PROM_METRICS_HTTPAPI = {
     'request_count':            {'type': b'counter', 'help': b'Http request count.'},
@@ -9,6 +15,7 @@ PROM_METRICS_HTTPAPI = {
     'auth_error_count':         {'type': b'counter', 'help': b'Authentication error count.'},
     'route_error_count':        {'type': b'counter', 'help': b'Routing error count.'},
     'interceptor_error_count':  {'type': b'counter', 'help': b'Interceptor error count.'},
+    'interceptor_timeout_count': {'type': b'counter', 'help': b'Interceptor script timeouts count (included in errors).'},
     'throughput_error_count':   {'type': b'counter', 'help': b'Throughput exceeded error count.'},
     'charging_error_count':     {'type': b'counter', 'help': b'Charging error count.'},
     'server_error_count':       {'type': b'counter', 'help': b'Server error count.'},
@@ -26,7 +33,14 @@ PROM_METRICS_SMPPC = {
     'elink_count':              {'type': b'counter', 'help': b'EnquireLinks count.'},
     'throttling_error_count':   {'type': b'counter', 'help': b'Throttling errors count.'},
     'interceptor_error_count':  {'type': b'counter', 'help': b'Interception errors count.'},
+    'interceptor_timeout_count': {'type': b'counter', 'help': b'Interception script timeouts count (included in errors).'},
     'other_submit_error_count': {'type': b'counter', 'help': b'Other errors count.'},
+    'long_mo_expired_count':    {'type': b'counter', 'help': b'Long DeliverSm expired before receiving all parts count.'},
+}
+PROM_METRICS_SMPPC_GAUGES = {
+    'inflight_transactions':    {'type': b'gauge', 'help': b'SMPP transactions waiting for a response.'},
+    'reject_timers':            {'type': b'gauge', 'help': b'Messages waiting for their delayed requeue.'},
+    'bound_binds':              {'type': b'gauge', 'help': b'Currently bound sessions out of the connector binds.'},
 }
 PROM_METRICS_SMPPS_API = {
     'connected_count':          {'type': b'counter', 'help': b'Number of connected sessions.'},
@@ -47,8 +61,53 @@ PROM_METRICS_SMPPS_API = {
     'elink_count':              {'type': b'counter', 'help': b'EnquireLinks count.'},
     'throttling_error_count':   {'type': b'counter', 'help': b'Throttling errors count.'},
     'interceptor_error_count':  {'type': b'counter', 'help': b'Interception errors count.'},
+    'interceptor_timeout_count': {'type': b'counter', 'help': b'Interception script timeouts count (included in errors).'},
     'other_submit_error_count': {'type': b'counter', 'help': b'Other errors count.'},
 }
+PROM_METRICS_THROWERS = {
+    'http_pool_hit_count':      {'type': b'counter', 'help': b'Throws made through a reused http connection.'},
+    'http_pool_miss_count':     {'type': b'counter', 'help': b'Throws requiring a new http connection.'},
+    'inflight_count':           {'type': b'gauge', 'help': b'Messages currently being thrown.'},
+}
+PROM_METRICS_RETRIAL_TRACKERS = {
+    'size':                     {'type': b'gauge', 'help': b'Messages tracked for their retrials count.'},
+    'hit_count':                {'type': b'counter', 'help': b'Retried messages found in the tracker.'},
+    'miss_count':               {'type': b'counter', 'help': b'Messages not found in the tracker (first tries).'},
+    'eviction_count':           {'type': b'counter', 'help': b'Messages evicted when the tracker is full.'},
+    'expiry_count':             {'type': b'counter', 'help': b'Messages evicted after retrials_ttl seconds.'},
+}
+PROM_METRICS_REDIS = {
+    'pipeline_count':           {'type': b'counter', 'help': b'Write pipelines sent to redis.'},
+    'pipeline_command_count':   {'type': b'counter', 'help': b'Commands sent through write pipelines.'},
+    'pipeline_error_count':     {'type': b'counter', 'help': b'Failed write pipelines.'},
+    'pipeline_latency_sum':     {'type': b'counter', 'help': b'Total write pipelines latency in seconds.'},
+    'last_pipeline_size':       {'type': b'gauge', 'help': b'Commands count in the last write pipeline.'},
+    'last_pipeline_latency':    {'type': b'gauge', 'help': b'Last write pipeline latency in seconds.'},
+}
+
+
+def family(name, descriptor, samples):
+    """Render a metric family, samples are (labels, value) tuples"""
+    lines = [b'# TYPE %s %s' % (name, descriptor['type']),
+             b'# HELP %s %s' % (name, descriptor['help'])]
+    for labels, value in samples:
+        lines.append(('%s%s %s' % (name.decode(), labels, value)).encode())
+
+    return b'\n'.join(lines) + b'\n'
+
+
+def histogram_samples(histogram, label=''):
+    """Return a histogram's samples, label is a 'name="value",' string or an empty one"""
+    samples = []
+    for bound, count in histogram.getBuckets():
+        le = '+Inf' if bound == float('inf') else '%g' % bound
+        samples.append(('_bucket{%sle="%s"}' % (label, le), count))
+
+    labels = '{%s}' % label.rstrip(',') if label else ''
+    samples.append(('_sum%s' % labels, histogram.sum))
+    samples.append(('_count%s' % labels, histogram.count))
+
+    return samples
 
 
 class Metrics(Resource):
@@ -71,46 +130,83 @@ class Metrics(Resource):
         request.responseHeaders.addRawHeader(b"content-type", b"text/plain")
         request.setResponseCode(200)
 
-        # Init response payload
-        response = []
+        # Write every metric family once rendered instead of building the whole payload
+        for chunk in self.metrics():
+            request.write(chunk)
+        request.write(b'\n')
+        request.finish()
+
+        return NOT_DONE_YET
+
+    def metrics(self):
+        """Yield rendered metric families"""
 
         # Fill httpapi stats
         _s = HttpAPIStatsCollector().get()
         for metric, descriptor in PROM_METRICS_HTTPAPI.items():
-            response.extend([
-                b'# TYPE httpapi_%s %s' % (metric.encode(), descriptor['type']),
-                b'# HELP httpapi_%s %s' % (metric.encode(), descriptor['help']),
-                ('httpapi_%s %s' % (metric, _s.get(metric))).encode(),
-            ])
+            yield family(b'httpapi_%s' % metric.encode(), descriptor, [('', _s.get(metric))])
 
         # Fill smppcs stats
-        _connectors = self.SMPPClientManagerPB.perspective_connector_list()
-        _stats = {}
-        for metric, descriptor in PROM_METRICS_SMPPC.items():
-            if len(_connectors) > 0:
-                response.extend([
-                    b'# TYPE smppc_%s %s' % (metric.encode(), descriptor['type']),
-                    b'# HELP smppc_%s %s' % (metric.encode(), descriptor['help']),
-                ])
-
-            for _connector in _connectors:
-                _cid = _connector['id']
-                _s = _stats.get(_cid, SMPPClientStatsCollector().get(_cid))
-
-                response.extend([
-                    ('smppc_%s{cid="%s"} %s' % (metric, _cid, _s.get(metric))).encode(),
-                ])
+        _connectors = self.SMPPClientManagerPB.connectors
+        if len(_connectors) > 0:
+            for metric, descriptor in PROM_METRICS_SMPPC.items():
+                yield family(b'smppc_%s' % metric.encode(), descriptor, [
+                    ('{cid="%s"}' % c['id'], SMPPClientStatsCollector().get(c['id']).get(metric))
+                    for c in _connectors])
+
+            # Gauges are summed over the connectors binds
+            yield family(b'smppc_inflight_transactions', PROM_METRICS_SMPPC_GAUGES['inflight_transactions'], [
+                ('{cid="%s"}' % c['id'], sum(0 if b['service'].SMPPClientFactory.smpp is None
+                                             else len(b['service'].SMPPClientFactory.smpp.outTxns)
+                                             for b in c['binds']))
+                for c in _connectors])
+            yield family(b'smppc_reject_timers', PROM_METRICS_SMPPC_GAUGES['reject_timers'], [
+                ('{cid="%s"}' % c['id'], sum(len(b['sm_listener'].rejectTimers) for b in c['binds']))
+                for c in _connectors])
+            yield family(b'smppc_bound_binds', PROM_METRICS_SMPPC_GAUGES['bound_binds'], [
+                ('{cid="%s"}' % c['id'], len([b for b in c['binds']
+                                              if b['service'].SMPPClientFactory.getSessionState() in BOUND_STATES]))
+                for c in _connectors])
 
         # Fill smpps stats
         _s = SMPPServerStatsCollector().get('smpps_01').getStats()
         for metric, descriptor in PROM_METRICS_SMPPS_API.items():
-            response.extend([
-                b'# TYPE smppsapi_%s %s' % (metric.encode(), descriptor['type']),
-                b'# HELP smppsapi_%s %s' % (metric.encode(), descriptor['help']),
-                ('smppsapi_%s %s' % (metric, _s.get(metric))).encode(),
-            ])
-
-        # Add padding
-        response.extend([b'', b''])
-
-        return b'\n'.join(response)
+            yield family(b'smppsapi_%s' % metric.encode(), descriptor, [('', _s.get(metric))])
+
+        # Fill throwers stats
+        _throwers = ThrowerStatsCollector().throwers
+        if len(_throwers) > 0:
+            for metric, descriptor in PROM_METRICS_THROWERS.items():
+                yield family(b'thrower_%s' % metric.encode(), descriptor, [
+                    ('{thrower="%s"}' % _name, _s.get(metric)) for _name, _s in _throwers.items()])
+
+        # Fill retrial trackers stats
+        _trackers = RetrialTrackerStatsCollector().trackers
+        if len(_trackers) > 0:
+            for metric, descriptor in PROM_METRICS_RETRIAL_TRACKERS.items():
+                yield family(b'retrial_tracker_%s' % metric.encode(), descriptor, [
+                    ('{tracker="%s"}' % _name, _s.get(metric)) for _name, _s in _trackers.items()])
+
+        # Fill redis clients stats
+        _clients = RedisStatsCollector().clients
+        if len(_clients) > 0:
+            for metric, descriptor in PROM_METRICS_REDIS.items():
+                yield family(b'redis_%s' % metric.encode(), descriptor, [
+                    ('{client="%s"}' % _uuid, _s.get(metric)) for _uuid, _s in _clients.items()])
+
+        # Fill latency histograms
+        _histograms = LatencyStatsCollector().histograms
+        for stage, descriptor in STAGES.items():
+            samples = []
+            for (_stage, _label), histogram in list(_histograms.items()):
+                if _stage != stage:
+                    continue
+
+                if descriptor['label'] is not None and _label is not None:
+                    samples.extend(histogram_samples(histogram, '%s="%s",' % (descriptor['label'], _label)))
+                else:
+                    samples.extend(histogram_samples(histogram, ''))
+
+            if len(samples) > 0:
+                yield family(b'latency_%s_seconds' % stage.encode(),
+                             {'type': b'histogram', 'help': descriptor['help']}, samples)
@@ -8,7 +8,7 @@ from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
 import messaging.sms.gsm0338
 
-from jasmin.routing.Routables import RoutableSubmitSm
+from jasmin.routing.Routables import Routable, RoutableSubmitSm
 from jasmin.protocols.smpp.operations import SMPPOperationFactory
 from jasmin.protocols.http.errors import UrlArgsValidationError
 from jasmin.protocols.http.validation import UrlArgsValidator, HttpAPICredentialValidator
@@ -115,14 +115,17 @@ class Rate(Resource):
                 r = yield self.interceptorpb_client.run_script(script, routable)
                 if isinstance(r, dict) and r['http_status'] != 200:
                     self.stats.inc('interceptor_error_count')
+                    if r.get('error') == 'timeout':
+                        self.stats.inc('interceptor_timeout_count')
                     self.log.error('Interceptor script returned %s http_status error.', r['http_status'])
                     raise InterceptorRunError(
                         code=r['http_status'],
                         message='Interception specific error code %s' % r['http_status']
                     )
-                elif isinstance(r, (str, bytes)):
+                elif isinstance(r, (str, bytes, Routable)):
                     self.stats.inc('interceptor_count')
-                    routable = pickle.loads(r)
+                    # The embedded interceptor returns the routable itself
+                    routable = r if isinstance(r, Routable) else pickle.loads(r)
                 else:
                     self.stats.inc('interceptor_error_count')
                     self.log.error('Failed running interception script, got the following return: %s', r)
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 import re
 import json
 import pickle
+import time
 
 from twisted.internet import reactor, defer
 from twisted.web.resource import Resource
@@ -10,7 +11,7 @@ from smpp.pdu.constants import priority_flag_value_map
 from smpp.pdu.smpp_time import parse
 from smpp.pdu.pdu_types import RegisteredDeliveryReceipt, RegisteredDelivery
 
-from jasmin.routing.Routables import RoutableSubmitSm
+from jasmin.routing.Routables import Routable, RoutableSubmitSm
 from jasmin.protocols.smpp.configs import SMPPClientConfig
 from jasmin.protocols.smpp.operations import SMPPOperationFactory
 from jasmin.protocols.http.errors import UrlArgsValidationError
@@ -19,6 +20,7 @@ from jasmin.protocols.http.errors import (HttpApiError, AuthenticationError, Ser
                      ChargingError, ThroughputExceededError, InterceptorNotSetError,
                      InterceptorNotConnectedError, InterceptorRunError)
 from jasmin.protocols.http.endpoints import hex2bin, authenticate_user
+from jasmin.tools.latency import LatencyStatsCollector
 
 
 def update_submit_sm_pdu(routable, config, config_update_params=None):
@@ -79,7 +81,201 @@ class Send(Resource):
                                               long_content_split=HTTPApiConfig.long_content_split)
 
     @defer.inlineCallbacks
-    def route_routable(self, updated_request):
+    def intercept(self, routable):
+        """Run the MT interceptor script matching routable (if any) and return the
+        (eventually updated) routable"""
+        interceptor = self.RouterPB.getMTInterceptionTable().getInterceptorFor(routable)
+        if interceptor is not None:
+            self.log.debug("RouterPB selected %s interceptor for this SubmitSmPDU", interceptor)
+            if self.interceptorpb_client is None:
+                self.stats.inc('interceptor_error_count')
+                self.log.error("InterceptorPB not set !")
+                raise InterceptorNotSetError('InterceptorPB not set !')
+            if not self.interceptorpb_client.isConnected:
+                self.stats.inc('interceptor_error_count')
+                self.log.error("InterceptorPB not connected !")
+                raise InterceptorNotConnectedError('InterceptorPB not connected !')
+
+            script = interceptor.getScript()
+            self.log.debug("Interceptor script loaded: %s", script)
+
+            # Run !
+            r = yield self.interceptorpb_client.run_script(script, routable)
+            if isinstance(r, dict) and r['http_status'] != 200:
+                self.stats.inc('interceptor_error_count')
+                if r.get('error') == 'timeout':
+                    self.stats.inc('interceptor_timeout_count')
+                self.log.error('Interceptor script returned %s http_status error.', r['http_status'])
+                raise InterceptorRunError(
+                    code=r['http_status'],
+                    message='Interception specific error code %s' % r['http_status']
+                )
+            elif isinstance(r, (str, bytes, Routable)):
+                self.stats.inc('interceptor_count')
+                # The embedded interceptor returns the routable itself
+                routable = r if isinstance(r, Routable) else pickle.loads(r)
+            else:
+                self.stats.inc('interceptor_error_count')
+                self.log.error('Failed running interception script, got the following return: %s', r)
+                raise InterceptorRunError(message='Failed running interception script, check log for details')
+
+        defer.returnValue(routable)
+
+    def get_connector(self, route, routable):
+        """Return the connector to send routable to through route"""
+        # Is it a failover route ? then check for a bound connector, otherwise don't route
+        # The failover route requires at least one connector to be up, no message enqueuing will
+        # occur otherwise.
+        if repr(route) == 'FailoverMTRoute':
+            self.log.debug('Selected route is a failover, will ensure connector is bound:')
+            routedConnector = self.SMPPClientManagerPB.getFailoverConnector(route)
+        else:
+            routedConnector = route.getConnector()
+
+        if routedConnector is None:
+            self.stats.inc('route_error_count')
+            self.log.error("Failover route has no bound connector to handle SubmitSmPDU: %s", routable.pdu)
+            raise ConnectorNotFoundError("Failover route has no bound connectors")
+
+        return routedConnector
+
+    def check_throughput(self, user, submit_count=1):
+        """Raise ThroughputExceededError when user's http_throughput is exceeded, submit_count
+        messages are drawn from it: the next request is waiting for all of them"""
+        if (user.mt_credential.getQuota('http_throughput') and user.mt_credential.getQuota('http_throughput') >= 0) and user.getCnxStatus().httpapi[
+            'qos_last_submit_sm_at'] != 0:
+            qos_throughput_second = 1 / float(user.mt_credential.getQuota('http_throughput'))
+            qos_throughput_ysecond_td = timedelta(microseconds=qos_throughput_second * 1000000)
+            qos_delay = datetime.now() - user.getCnxStatus().httpapi['qos_last_submit_sm_at']
+            if qos_delay < qos_throughput_ysecond_td:
+                self.stats.inc('throughput_error_count')
+                self.log.error(
+                    "QoS: submit_sm_event is faster (%s) than fixed throughput (%s), user:%s, rejecting message.",
+                    qos_delay,
+                    qos_throughput_ysecond_td,
+                    user)
+
+                raise ThroughputExceededError("User throughput exceeded")
+        user.getCnxStatus().httpapi['qos_last_submit_sm_at'] = datetime.now()
+        if submit_count > 1 and user.mt_credential.getQuota('http_throughput'):
+            user.getCnxStatus().httpapi['qos_last_submit_sm_at'] += timedelta(
+                seconds=(submit_count - 1) / float(user.mt_credential.getQuota('http_throughput')))
+
+    @defer.inlineCallbacks
+    def charge(self, user, route, submit_sm_count):
+        """Charge user for submit_sm_count submit_sm through route, fires with the bill (None if
+        billing is disabled)"""
+        if self.config.billing_feature:
+            bill = route.getBillFor(user)
+            self.log.debug("SubmitSmBill [bid:%s] [ttlamounts:%s] generated for this SubmitSmPDU (x%s)",
+                           bill.bid, bill.getTotalAmounts(), submit_sm_count)
+            yield self.RouterPB.reserveQuotas(user, bill, submit_sm_count)
+
+            charging_requirements = []
+            u_balance = user.mt_credential.getAvailableQuota('balance')
+            u_subsm_count = user.mt_credential.getAvailableQuota('submit_sm_count')
+            if u_balance is not None and bill.getTotalAmounts() > 0:
+                # Ensure user have enough balance to pay submit_sm and submit_sm_resp
+                charging_requirements.append({
+                    'condition': bill.getTotalAmounts() * submit_sm_count <= u_balance,
+                    'error_message': 'Not enough balance (%s) for charging: %s' % (
+                        u_balance, bill.getTotalAmounts())})
+            if u_subsm_count is not None:
+                # Ensure user have enough submit_sm_count to to cover
+                # the bill action (decrement_submit_sm_count)
+                charging_requirements.append({
+                    'condition': bill.getAction('decrement_submit_sm_count') * submit_sm_count <= u_subsm_count,
+                    'error_message': 'Not enough submit_sm_count (%s) for charging: %s' % (
+                        u_subsm_count, bill.getAction('decrement_submit_sm_count'))})
+
+            if self.RouterPB.chargeUserForSubmitSms(user, bill, submit_sm_count, charging_requirements) is None:
+                self.stats.inc('charging_error_count')
+                self.log.error('Charging user %s failed, [bid:%s] [ttlamounts:%s] SubmitSmPDU (x%s)',
+                               user, bill.bid, bill.getTotalAmounts(), submit_sm_count)
+                raise ChargingError('Cannot charge submit_sm, check RouterPB log file for details')
+        else:
+            bill = None
+
+        defer.returnValue(bill)
+
+    def update_pdu_params(self, routable, args):
+        """Update routable's pdu(s) with priority, schedule_delivery_time and validity_period
+        from request args, return the updated routable and the priority"""
+        # Set a placeholder for any parameter update to be applied on the pdu(s)
+        param_updates = {}
+
+        # Set priority
+        priority = 0
+        if b'priority' in args:
+            priority = int(args[b'priority'][0])
+            param_updates['priority_flag'] = priority_flag_value_map[priority]
+        self.log.debug("SubmitSmPDU priority is set to %s", priority)
+
+        # Set schedule_delivery_time
+        if b'sdt' in args:
+            param_updates['schedule_delivery_time'] = parse(args[b'sdt'][0])
+            self.log.debug(
+                "SubmitSmPDU schedule_delivery_time is set to %s (%s)",
+                routable.pdu.params['schedule_delivery_time'],
+                args[b'sdt'][0])
+
+        # Set validity_period
+        if b'validity-period' in args:
+            delta = timedelta(minutes=int(args[b'validity-period'][0]))
+            param_updates['validity_period'] = datetime.today() + delta
+            self.log.debug(
+                "SubmitSmPDU validity_period is set to %s (+%s minutes)",
+                routable.pdu.params['validity_period'],
+                args[b'validity-period'][0])
+
+        # Got any updates to apply on pdu(s) ?
+        if len(param_updates) > 0:
+            routable = update_submit_sm_pdu(routable=routable, config=param_updates,
+                                            config_update_params=list(param_updates))
+
+        return routable, priority
+
+    def set_dlr(self, routable, args):
+        """Set DLR bit mask on routable's last pdu from request args, return a
+        (dlr_url, dlr_level, dlr_level_text, dlr_method) tuple"""
+        _last_pdu = routable.pdu
+        while True:
+            if hasattr(_last_pdu, 'nextPdu'):
+                _last_pdu = _last_pdu.nextPdu
+            else:
+                break
+        # DLR setting is clearly described in #107
+        _last_pdu.params['registered_delivery'] = RegisteredDelivery(
+            RegisteredDeliveryReceipt.NO_SMSC_DELIVERY_RECEIPT_REQUESTED)
+        if args[b'dlr'][0] == b'yes':
+            _last_pdu.params['registered_delivery'] = RegisteredDelivery(
+                RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED)
+            self.log.debug(
+                "SubmitSmPDU registered_delivery is set to %s",
+                str(_last_pdu.params['registered_delivery']))
+
+            dlr_level = int(args[b'dlr-level'][0])
+            if b'dlr-url' in args:
+                dlr_url = args[b'dlr-url'][0]
+            else:
+                dlr_url = None
+            if args[b'dlr-level'][0] == b'1':
+                dlr_level_text = 'SMS-C'
+            elif args[b'dlr-level'][0] == b'2':
+                dlr_level_text = 'Terminal'
+            else:
+                dlr_level_text = 'All'
+            dlr_method = args[b'dlr-method'][0]
+        else:
+            dlr_url = None
+            dlr_level = 0
+            dlr_level_text = 'No'
+            dlr_method = None
+
+        return dlr_url, dlr_level, dlr_level_text, dlr_method
+
+    @defer.inlineCallbacks
+    def route_routable(self, updated_request, started_at=None):
         try:
             # Do we have a hex-content ?
             if b'hex-content' not in updated_request.args:
@@ -151,37 +347,7 @@ class Send(Resource):
                     self.log.debug('Tagged routable %s: +%s', routable, tag)
 
             # Intercept
-            interceptor = self.RouterPB.getMTInterceptionTable().getInterceptorFor(routable)
-            if interceptor is not None:
-                self.log.debug("RouterPB selected %s interceptor for this SubmitSmPDU", interceptor)
-                if self.interceptorpb_client is None:
-                    self.stats.inc('interceptor_error_count')
-                    self.log.error("InterceptorPB not set !")
-                    raise InterceptorNotSetError('InterceptorPB not set !')
-                if not self.interceptorpb_client.isConnected:
-                    self.stats.inc('interceptor_error_count')
-                    self.log.error("InterceptorPB not connected !")
-                    raise InterceptorNotConnectedError('InterceptorPB not connected !')
-
-                script = interceptor.getScript()
-                self.log.debug("Interceptor script loaded: %s", script)
-
-                # Run !
-                r = yield self.interceptorpb_client.run_script(script, routable)
-                if isinstance(r, dict) and r['http_status'] != 200:
-                    self.stats.inc('interceptor_error_count')
-                    self.log.error('Interceptor script returned %s http_status error.', r['http_status'])
-                    raise InterceptorRunError(
-                        code=r['http_status'],
-                        message='Interception specific error code %s' % r['http_status']
-                    )
-                elif isinstance(r, (str, bytes)):
-                    self.stats.inc('interceptor_count')
-                    routable = pickle.loads(r)
-                else:
-                    self.stats.inc('interceptor_error_count')
-                    self.log.error('Failed running interception script, got the following return: %s', r)
-                    raise InterceptorRunError(message='Failed running interception script, check log for details')
+            routable = yield self.intercept(routable)
 
             # Get the route
             route = self.RouterPB.getMTRoutingTable().getRouteFor(routable)
@@ -192,32 +358,7 @@ class Send(Resource):
 
             # Get connector from selected route
             self.log.debug("RouterPB selected %s route for this SubmitSmPDU", route)
-            routedConnector = route.getConnector()
-            # Is it a failover route ? then check for a bound connector, otherwise don't route
-            # The failover route requires at least one connector to be up, no message enqueuing will
-            # occur otherwise.
-            if repr(route) == 'FailoverMTRoute':
-                self.log.debug('Selected route is a failover, will ensure connector is bound:')
-                while True:
-                    c = self.SMPPClientManagerPB.perspective_connector_details(routedConnector.cid)
-                    if c:
-                        self.log.debug('Connector [%s] is: %s', routedConnector.cid, c['session_state'])
-                    else:
-                        self.log.debug('Connector [%s] is not found', routedConnector.cid)
-
-                    if c and c['session_state'][:6] == 'BOUND_':
-                        # Choose this connector
-                        break
-                    else:
-                        # Check next connector, None if no more connectors are available
-                        routedConnector = route.getConnector()
-                        if routedConnector is None:
-                            break
-
-            if routedConnector is None:
-                self.stats.inc('route_error_count')
-                self.log.error("Failover route has no bound connector to handle SubmitSmPDU: %s", routable.pdu)
-                raise ConnectorNotFoundError("Failover route has no bound connectors")
+            routedConnector = self.get_connector(route, routable)
 
             # Re-update SubmitSmPDU with parameters from the route's connector
             connector_config = self.SMPPClientManagerPB.perspective_connector_config(routedConnector.cid)
@@ -225,89 +366,14 @@ class Send(Resource):
                 connector_config = pickle.loads(connector_config)
                 routable = update_submit_sm_pdu(routable=routable, config=connector_config)
 
-            # Set a placeholder for any parameter update to be applied on the pdu(s)
-            param_updates = {}
-
-            # Set priority
-            priority = 0
-            if b'priority' in updated_request.args:
-                priority = int(updated_request.args[b'priority'][0])
-                param_updates['priority_flag'] = priority_flag_value_map[priority]
-            self.log.debug("SubmitSmPDU priority is set to %s", priority)
-
-            # Set schedule_delivery_time
-            if b'sdt' in updated_request.args:
-                param_updates['schedule_delivery_time'] = parse(updated_request.args[b'sdt'][0])
-                self.log.debug(
-                    "SubmitSmPDU schedule_delivery_time is set to %s (%s)",
-                    routable.pdu.params['schedule_delivery_time'],
-                    updated_request.args[b'sdt'][0])
-
-            # Set validity_period
-            if b'validity-period' in updated_request.args:
-                delta = timedelta(minutes=int(updated_request.args[b'validity-period'][0]))
-                param_updates['validity_period'] = datetime.today() + delta
-                self.log.debug(
-                    "SubmitSmPDU validity_period is set to %s (+%s minutes)",
-                    routable.pdu.params['validity_period'],
-                    updated_request.args[b'validity-period'][0])
-
-            # Got any updates to apply on pdu(s) ?
-            if len(param_updates) > 0:
-                routable = update_submit_sm_pdu(routable=routable, config=param_updates,
-                                                config_update_params=list(param_updates))
+            # Set priority, schedule_delivery_time and validity_period
+            routable, priority = self.update_pdu_params(routable, updated_request.args)
 
             # Set DLR bit mask on the last pdu
-            _last_pdu = routable.pdu
-            while True:
-                if hasattr(_last_pdu, 'nextPdu'):
-                    _last_pdu = _last_pdu.nextPdu
-                else:
-                    break
-            # DLR setting is clearly described in #107
-            _last_pdu.params['registered_delivery'] = RegisteredDelivery(
-                RegisteredDeliveryReceipt.NO_SMSC_DELIVERY_RECEIPT_REQUESTED)
-            if updated_request.args[b'dlr'][0] == b'yes':
-                _last_pdu.params['registered_delivery'] = RegisteredDelivery(
-                    RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED)
-                self.log.debug(
-                    "SubmitSmPDU registered_delivery is set to %s",
-                    str(_last_pdu.params['registered_delivery']))
-
-                dlr_level = int(updated_request.args[b'dlr-level'][0])
-                if b'dlr-url' in updated_request.args:
-                    dlr_url = updated_request.args[b'dlr-url'][0]
-                else:
-                    dlr_url = None
-                if updated_request.args[b'dlr-level'][0] == b'1':
-                    dlr_level_text = 'SMS-C'
-                elif updated_request.args[b'dlr-level'][0] == b'2':
-                    dlr_level_text = 'Terminal'
-                else:
-                    dlr_level_text = 'All'
-                dlr_method = updated_request.args[b'dlr-method'][0]
-            else:
-                dlr_url = None
-                dlr_level = 0
-                dlr_level_text = 'No'
-                dlr_method = None
+            dlr_url, dlr_level, dlr_level_text, dlr_method = self.set_dlr(routable, updated_request.args)
 
             # QoS throttling
-            if (user.mt_credential.getQuota('http_throughput') and user.mt_credential.getQuota('http_throughput') >= 0) and user.getCnxStatus().httpapi[
-                'qos_last_submit_sm_at'] != 0:
-                qos_throughput_second = 1 / float(user.mt_credential.getQuota('http_throughput'))
-                qos_throughput_ysecond_td = timedelta(microseconds=qos_throughput_second * 1000000)
-                qos_delay = datetime.now() - user.getCnxStatus().httpapi['qos_last_submit_sm_at']
-                if qos_delay < qos_throughput_ysecond_td:
-                    self.stats.inc('throughput_error_count')
-                    self.log.error(
-                        "QoS: submit_sm_event is faster (%s) than fixed throughput (%s), user:%s, rejecting message.",
-                        qos_delay,
-                        qos_throughput_ysecond_td,
-                        user)
-
-                    raise ThroughputExceededError("User throughput exceeded")
-            user.getCnxStatus().httpapi['qos_last_submit_sm_at'] = datetime.now()
+            self.check_throughput(user)
 
             # Get number of PDUs to be sent (for billing purpose)
             _pdu = routable.pdu
@@ -317,34 +383,7 @@ class Send(Resource):
                 submit_sm_count += 1
 
             # Pre-sending submit_sm: Billing processing
-            if self.config.billing_feature:
-                bill = route.getBillFor(user)
-                self.log.debug("SubmitSmBill [bid:%s] [ttlamounts:%s] generated for this SubmitSmPDU (x%s)",
-                               bill.bid, bill.getTotalAmounts(), submit_sm_count)
-                charging_requirements = []
-                u_balance = user.mt_credential.getQuota('balance')
-                u_subsm_count = user.mt_credential.getQuota('submit_sm_count')
-                if u_balance is not None and bill.getTotalAmounts() > 0:
-                    # Ensure user have enough balance to pay submit_sm and submit_sm_resp
-                    charging_requirements.append({
-                        'condition': bill.getTotalAmounts() * submit_sm_count <= u_balance,
-                        'error_message': 'Not enough balance (%s) for charging: %s' % (
-                            u_balance, bill.getTotalAmounts())})
-                if u_subsm_count is not None:
-                    # Ensure user have enough submit_sm_count to to cover
-                    # the bill action (decrement_submit_sm_count)
-                    charging_requirements.append({
-                        'condition': bill.getAction('decrement_submit_sm_count') * submit_sm_count <= u_subsm_count,
-                        'error_message': 'Not enough submit_sm_count (%s) for charging: %s' % (
-                            u_subsm_count, bill.getAction('decrement_submit_sm_count'))})
-
-                if self.RouterPB.chargeUserForSubmitSms(user, bill, submit_sm_count, charging_requirements) is None:
-                    self.stats.inc('charging_error_count')
-                    self.log.error('Charging user %s failed, [bid:%s] [ttlamounts:%s] SubmitSmPDU (x%s)',
-                                   user, bill.bid, bill.getTotalAmounts(), submit_sm_count)
-                    raise ChargingError('Cannot charge submit_sm, check RouterPB log file for details')
-            else:
-                bill = None
+            bill = yield self.charge(user, route, submit_sm_count)
 
             ########################################################
             # Send SubmitSmPDU through smpp client manager PB server
@@ -369,6 +408,8 @@ class Send(Resource):
             else:
                 self.stats.inc('success_count')
                 self.stats.set('last_success_at', datetime.now())
+                if started_at is not None:
+                    LatencyStatsCollector().observe('httpapi_send', time.monotonic() - started_at)
                 self.log.debug('SubmitSmPDU sent to [cid:%s], result = %s', routedConnector.cid, c.result)
                 response = {'return': c.result, 'status': 200}
         except HttpApiError as e:
@@ -425,6 +466,7 @@ class Send(Resource):
 
         self.stats.inc('request_count')
         self.stats.set('last_request_at', datetime.now())
+        started_at = time.monotonic()
 
         # updated_request will be filled with default values where request will never get modified
         # updated_request is used for sending the SMS, request is just kept as an original request object
@@ -509,7 +551,7 @@ class Send(Resource):
                 raise UrlArgsValidationError("content and hex-content cannot be used both in same request.")
 
             # Continue routing in a separate thread
-            reactor.callFromThread(self.route_routable, updated_request=updated_request)
+            reactor.callFromThread(self.route_routable, updated_request=updated_request, started_at=started_at)
         except HttpApiError as e:
             self.log.error("Error: %s", e)
             response = {'return': e.message, 'status': e.code}
@@ -0,0 +1,370 @@
+from datetime import datetime
+import re
+import json
+import pickle
+
+from twisted.internet import reactor, defer
+from twisted.web.server import NOT_DONE_YET
+
+from jasmin.routing.Routables import RoutableSubmitSm
+from jasmin.protocols.http.validation import UrlArgsValidator, HttpAPICredentialValidator
+from jasmin.protocols.http.errors import (HttpApiError, UrlArgsValidationError, ServerError, RouteNotFoundError,
+                                          CredentialValidationError)
+from jasmin.protocols.http.endpoints import hex2bin, authenticate_user
+from jasmin.protocols.http.endpoints.send import Send, update_submit_sm_pdu
+
+DESTINATION_PATTERN = re.compile(rb'^\+{0,1}\d+$')
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode()
+    return value
+
+
+class SendBulk(Send):
+    """/sendbulk: send one content to many destinations (or many messages) in one request
+
+    The user is authenticated and charged once per request (and route) instead of once per
+    message, the throughput is drawn from once for all the messages.
+    """
+
+    @defer.inlineCallbacks
+    def route_routables(self, updated_request, messages):
+        results = []
+        try:
+            # Authentication
+            user = authenticate_user(
+                updated_request.args[b'username'][0],
+                updated_request.args[b'password'][0],
+                self.RouterPB,
+                self.stats,
+                self.log
+            )
+
+            if not user.mt_credential.getAuthorization('http_bulk'):
+                raise CredentialValidationError(
+                    'Authorization failed for user [%s] (Cannot send bulk MT messages).' % user)
+
+            # Update CnxStatus
+            user.getCnxStatus().httpapi['connects_count'] += 1
+            user.getCnxStatus().httpapi['submit_sm_request_count'] += len(messages)
+            user.getCnxStatus().httpapi['last_activity_at'] = datetime.now()
+
+            # QoS throttling: every message of the bulk counts
+            self.check_throughput(user, len(messages))
+
+            connector_configs = {}
+            # Messages grouped by route for charging them at once
+            route_groups = {}
+
+            for to, short_message in messages:
+                result = {'to': to.decode()}
+                results.append(result)
+
+                try:
+                    # Build SubmitSmPDU
+                    SubmitSmPDU = self.opFactory.SubmitSM(
+                        source_addr=None if b'from' not in updated_request.args else updated_request.args[b'from'][0],
+                        destination_addr=to,
+                        short_message=short_message,
+                        data_coding=int(updated_request.args[b'coding'][0]),
+                        custom_tlvs=updated_request.args[b'custom_tlvs'][0])
+
+                    # Make Credential validation
+                    message_args = dict(updated_request.args)
+                    message_args[b'to'] = [to]
+                    if b'content' in message_args:
+                        message_args[b'content'] = [short_message]
+                    v = HttpAPICredentialValidator('Send', user, _MessageRequest(message_args), submit_sm=SubmitSmPDU)
+                    v.validate()
+
+                    # Update SubmitSmPDU by default values from user MtMessagingCredential
+                    _pdu = SubmitSmPDU
+                    while _pdu is not None:
+                        v.updatePDUWithUserDefaults(_pdu)
+                        _pdu = getattr(_pdu, 'nextPdu', None)
+
+                    routable = RoutableSubmitSm(SubmitSmPDU, user)
+                    if b'tags' in updated_request.args:
+                        for tag in updated_request.args[b'tags'][0].split(b','):
+                            routable.addTag(tag.decode() if isinstance(tag, bytes) else tag)
+
+                    # Intercept
+                    routable = yield self.intercept(routable)
+
+                    # Get the route
+                    route = self.RouterPB.getMTRoutingTable().getRouteFor(routable)
+                    if route is None:
+                        self.stats.inc('route_error_count')
+                        self.log.error("No route matched from user %s for SubmitSmPDU: %s", user, routable.pdu)
+                        raise RouteNotFoundError("No route found")
+
+                    # Get connector from selected route
+                    routedConnector = self.get_connector(route, routable)
+
+                    # Re-update SubmitSmPDU with parameters from the route's connector
+                    if routedConnector.cid not in connector_configs:
+                        connector_config = self.SMPPClientManagerPB.perspective_connector_config(routedConnector.cid)
+                        if connector_config:
+                            connector_config = pickle.loads(connector_config)
+                        connector_configs[routedConnector.cid] = connector_config
+                    if connector_configs[routedConnector.cid]:
+                        routable = update_submit_sm_pdu(routable=routable, config=connector_configs[routedConnector.cid])
+
+                    # Set priority, schedule_delivery_time, validity_period and DLR bit mask
+                    routable, priority = self.update_pdu_params(routable, updated_request.args)
+                    dlr_url, dlr_level, dlr_level_text, dlr_method = self.set_dlr(routable, updated_request.args)
+
+                    # Get number of PDUs to be sent (for billing purpose)
+                    _pdu = routable.pdu
+                    submit_sm_count = 1
+                    while hasattr(_pdu, 'nextPdu'):
+                        _pdu = _pdu.nextPdu
+                        submit_sm_count += 1
+
+                    group = route_groups.setdefault(id(route), {'route': route, 'submit_sm_count': 0, 'messages': []})
+                    group['submit_sm_count'] += submit_sm_count
+                    group['messages'].append({
+                        'result': result, 'routable': routable, 'connector': routedConnector, 'priority': priority,
+                        'dlr': (dlr_url, dlr_level, dlr_level_text, dlr_method), 'short_message': short_message})
+                except HttpApiError as e:
+                    self.log.error("Error: %s", e)
+                    result['error'] = e.message.decode() if isinstance(e.message, bytes) else e.message
+
+            # Charge and send, one charging per route
+            sending = []
+            for group in route_groups.values():
+                try:
+                    bill = yield self.charge(user, group['route'], group['submit_sm_count'])
+                except HttpApiError as e:
+                    self.log.error("Error: %s", e)
+                    for message in group['messages']:
+                        message['result']['error'] = e.message.decode() if isinstance(e.message, bytes) else e.message
+                    continue
+
+                for message in group['messages']:
+                    dlr_url, dlr_level, _, dlr_method = message['dlr']
+                    d = self.SMPPClientManagerPB.perspective_submit_sm(
+                        uid=user.uid,
+                        cid=message['connector'].cid,
+                        SubmitSmPDU=message['routable'].pdu,
+                        submit_sm_bill=bill,
+                        priority=message['priority'],
+                        pickled=False,
+                        dlr_url=dlr_url,
+                        dlr_level=dlr_level,
+                        dlr_method=dlr_method,
+                        dlr_connector=message['connector'].cid)
+                    sending.append(d)
+                    message['deferred'] = d
+
+            # All the SubmitSm are published without waiting for each other
+            yield defer.DeferredList(sending, consumeErrors=True)
+
+            for group in route_groups.values():
+                for message in group['messages']:
+                    if 'deferred' not in message:
+                        continue
+
+                    msgid = message['deferred'].result if message['deferred'].called else None
+                    if not msgid:
+                        self.stats.inc('server_error_count')
+                        self.log.error('Failed to send SubmitSmPDU to [cid:%s]', message['connector'].cid)
+                        message['result']['error'] = ServerError(
+                            'Cannot send submit_sm, check SMPPClientManagerPB log file for details').message
+                        continue
+
+                    self.stats.inc('success_count')
+                    self.stats.set('last_success_at', datetime.now())
+                    message['result']['message_id'] = msgid
+                    self.log_sms_mt(user, message, msgid)
+
+            response = {'return': {'messages': results}, 'status': 200}
+        except HttpApiError as e:
+            self.log.error("Error: %s", e)
+            response = {'return': e.message, 'status': e.code}
+        except Exception as e:
+            self.log.error("Error: %s", e)
+            response = {'return': "Unknown error: %s" % e, 'status': 500}
+            raise
+        finally:
+            self.log.debug("Returning %s to %s.", response, updated_request.getClientIP())
+            updated_request.setResponseCode(response['status'])
+
+            if isinstance(response['return'], bytes):
+                updated_request.write(json.dumps(response['return'].decode()).encode())
+            else:
+                updated_request.write(json.dumps(response['return']).encode())
+            updated_request.finish()
+
+    def log_sms_mt(self, user, message, msgid):
+        # Do not log text for privacy reasons
+        # Added in #691
+        short_message = message['short_message']
+        if self.config.log_privacy:
+            logged_content = '** %s byte content **' % len(short_message)
+        else:
+            logged_content = '%r' % re.sub(rb'[^\x20-\x7E]+', b'.', short_message)
+
+        self.log.info(
+            'SMS-MT [uid:%s] [cid:%s] [msgid:%s] [prio:%s] [dlr:%s] [from:%s] [to:%s] [content:%s]',
+            user.uid,
+            message['connector'].cid,
+            msgid,
+            message['priority'],
+            message['dlr'][2],
+            message['routable'].pdu.params['source_addr'],
+            message['routable'].pdu.params['destination_addr'],
+            logged_content)
+
+    def get_messages(self, args):
+        """Return a list of (to, short_message) from request args, raise UrlArgsValidationError
+        on any invalid destination or content"""
+        if b'messages' in args:
+            if b'to' in args or b'content' in args or b'hex-content' in args:
+                raise UrlArgsValidationError("messages cannot be used with to, content or hex-content.")
+            if not isinstance(args[b'messages'][0], list):
+                raise UrlArgsValidationError("messages must be a list.")
+
+            messages = []
+            for message in args[b'messages'][0]:
+                if not isinstance(message, dict) or 'to' not in message:
+                    raise UrlArgsValidationError("Every message must have a to.")
+                if ('content' in message) == ('hex-content' in message):
+                    raise UrlArgsValidationError("Every message must have either content or hex-content.")
+
+                messages.append((_to_bytes(message['to']),
+                                 _to_bytes(message.get('content')),
+                                 _to_bytes(message.get('hex-content'))))
+        else:
+            if b'to' not in args:
+                raise UrlArgsValidationError("Mandatory argument [to] is not found.")
+            if b'content' not in args and b'hex-content' not in args:
+                raise UrlArgsValidationError("content or hex-content not present.")
+            elif b'content' in args and b'hex-content' in args:
+                raise UrlArgsValidationError("content and hex-content cannot be used both in same request.")
+
+            content = _to_bytes(args[b'content'][0]) if b'content' in args else None
+            hex_content = _to_bytes(args[b'hex-content'][0]) if b'hex-content' in args else None
+            messages = [(_to_bytes(to), content, hex_content) for to in args[b'to']]
+
+        if len(messages) == 0:
+            raise UrlArgsValidationError("No destinations found.")
+        if len(messages) > self.config.bulk_max_messages:
+            raise UrlArgsValidationError("Too many messages (%s), maximum is %s." % (
+                len(messages), self.config.bulk_max_messages))
+
+        _messages = []
+        for to, content, hex_content in messages:
+            if not isinstance(to, bytes) or DESTINATION_PATTERN.match(to) is None:
+                raise UrlArgsValidationError("Argument [to] has an invalid value: [%s]." % to)
+
+            if hex_content is not None:
+                short_message = hex2bin(hex_content)
+            elif args[b'coding'][0] == b'0':
+                # Convert utf8 to GSM 03.38
+                short_message = content.decode().encode('gsm0338', 'replace')
+            else:
+                # Otherwise forward it as is
+                short_message = content
+            _messages.append((to, short_message))
+
+        return _messages
+
+    def render_POST(self, request):
+        """
+        /sendbulk request processing
+
+        Arguments are the same as /send, except for:
+        - to: may be repeated (or a list when posting json) for sending content to many destinations,
+        - messages: (json only) a list of {"to": .., "content": ..} or {"to": .., "hex-content": ..}
+        """
+
+        self.log.debug("Rendering /sendbulk response with args: %s from %s", request.args, request.getClientIP())
+        request.responseHeaders.addRawHeader(b"content-type", b"application/json")
+
+        self.stats.inc('request_count')
+        self.stats.set('last_request_at', datetime.now())
+
+        updated_request = request
+
+        try:
+            fields = {b'to': {'optional': True, 'pattern': DESTINATION_PATTERN},
+                      b'messages': {'optional': True},
+                      b'from': {'optional': True},
+                      b'coding': {'optional': True, 'pattern': re.compile(rb'^(0|1|2|3|4|5|6|7|8|9|10|13|14){1}$')},
+                      b'username': {'optional': False, 'pattern': re.compile(rb'^.{1,16}$')},
+                      b'password': {'optional': False, 'pattern': re.compile(rb'^.{1,16}$')},
+                      b'priority': {'optional': True, 'pattern': re.compile(rb'^[0-3]$')},
+                      b'sdt': {'optional': True,
+                               'pattern': re.compile(rb'^\d{2}\d{2}\d{2}\d{2}\d{2}\d{2}\d{1}\d{2}(\+|-|R)$')},
+                      b'validity-period': {'optional': True, 'pattern': re.compile(rb'^\d+$')},
+                      b'dlr': {'optional': False, 'pattern': re.compile(rb'^(yes|no)$')},
+                      b'dlr-url': {'optional': True, 'pattern': re.compile(rb'^(http|https)\://.*$')},
+                      b'dlr-level': {'optional': True, 'pattern': re.compile(rb'^[1-3]$')},
+                      b'dlr-method': {'optional': True, 'pattern': re.compile(rb'^(get|post)$', re.IGNORECASE)},
+                      b'tags': {'optional': True, 'pattern': re.compile(rb'^([-a-zA-Z0-9,])*$')},
+                      b'content': {'optional': True},
+                      b'hex-content': {'optional': True},
+                      b'custom_tlvs': {'optional': True}}
+
+            if updated_request.getHeader(b'content-type') == b'application/json':
+                json_data = json.loads(updated_request.content.read())
+                for key, value in json_data.items():
+                    if isinstance(key, str):
+                        key = key.encode()
+
+                    if key == b'to' and isinstance(value, list):
+                        updated_request.args[key] = [_to_bytes(to) for to in value]
+                    else:
+                        # Make the values look like they came from form encoding all surrounded by [ ]
+                        updated_request.args[key] = [_to_bytes(value)]
+
+            # Same defaults as /send
+            if b'custom_tlvs' not in updated_request.args:
+                updated_request.args[b'custom_tlvs'] = [[]]
+            if b'coding' not in updated_request.args:
+                updated_request.args[b'coding'] = [b'0']
+            if b'dlr-url' in updated_request.args or b'dlr-level' in updated_request.args:
+                updated_request.args[b'dlr'] = [b'yes']
+            if b'dlr' not in updated_request.args:
+                updated_request.args[b'dlr'] = [b'no']
+            if updated_request.args[b'dlr'][0] == b'yes':
+                if b'dlr-level' not in updated_request.args:
+                    updated_request.args[b'dlr-level'] = [1]
+                if b'dlr-method' not in updated_request.args:
+                    updated_request.args[b'dlr-method'] = [b'POST']
+            if b'dlr-method' in updated_request.args:
+                updated_request.args[b'dlr-method'][0] = updated_request.args[b'dlr-method'][0].upper()
+
+            # Make validation
+            if b'to' in updated_request.args and len(updated_request.args[b'to']) == 0:
+                raise UrlArgsValidationError("No destinations found.")
+            v = UrlArgsValidator(updated_request, fields)
+            v.validate()
+            messages = self.get_messages(updated_request.args)
+
+            # Continue routing in a separate thread
+            reactor.callFromThread(self.route_routables, updated_request=updated_request, messages=messages)
+        except HttpApiError as e:
+            self.log.error("Error: %s", e)
+            updated_request.setResponseCode(e.code)
+
+            if isinstance(e.message, bytes):
+                return json.dumps(e.message.decode()).encode()
+            return json.dumps(e.message).encode()
+        except Exception as e:
+            self.log.error("Error: %s", e)
+            updated_request.setResponseCode(500)
+
+            return json.dumps("Unknown error: %s" % e).encode()
+        else:
+            return NOT_DONE_YET
+
+
+class _MessageRequest:
+    """Request-like object holding one bulk message args, used for credential validation"""
+
+    def __init__(self, args):
+        self.args = args
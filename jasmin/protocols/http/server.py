@@ -7,11 +7,13 @@ from twisted.web.resource import Resource
 
 import jasmin
 from jasmin.protocols.http.endpoints.send import Send
+from jasmin.protocols.http.endpoints.sendbulk import SendBulk
 from jasmin.protocols.http.endpoints.rate import Rate
 from jasmin.protocols.http.endpoints.ping import Ping
 from jasmin.protocols.http.endpoints.balance import Balance
 from jasmin.protocols.http.endpoints.metrics import Metrics
 from jasmin.protocols.http.stats import HttpAPIStatsCollector
+from jasmin.tools.latency import LatencyStatsCollector
 
 LOG_CATEGORY = "jasmin-http-api"
 
@@ -27,6 +29,7 @@ class HTTPApi(Resource):
         # Setup stats collector
         stats = HttpAPIStatsCollector().get()
         stats.set('created_at', datetime.now())
+        LatencyStatsCollector().setBuckets(config.metrics_latency_buckets)
 
         # Set up a dedicated logger
         log = logging.getLogger(LOG_CATEGORY)
@@ -42,6 +45,8 @@ class HTTPApi(Resource):
         # Set http url routings
         log.debug("Setting http url routing for /send")
         self.putChild(b'send', Send(config, RouterPB, SMPPClientManagerPB, stats, log, interceptor))
+        log.debug("Setting http url routing for /sendbulk")
+        self.putChild(b'sendbulk', SendBulk(config, RouterPB, SMPPClientManagerPB, stats, log, interceptor))
         log.debug("Setting http url routing for /rate")
         self.putChild(b'rate', Rate(config, RouterPB, stats, log, interceptor))
         log.debug("Setting http url routing for /balance")
@@ -19,6 +19,7 @@ class HttpAPIStatistics(Stats):
             'route_error_count': 0,
             'interceptor_error_count': 0,
             'interceptor_count': 0,
+            'interceptor_timeout_count': 0,
             'throughput_error_count': 0,
             'charging_error_count': 0,
             'server_error_count': 0,
@@ -132,6 +132,13 @@ class SMPPClientConfig:
         self.bindOperation = kwargs.get('bindOperation', 'transceiver')
         if self.bindOperation not in ['transceiver', 'transmitter', 'receiver']:
             raise UnknownValue('Invalid bindOperation: %s' % self.bindOperation)
+        # Number of binds opened with the same account, they are consuming from the connector's
+        # queue and sharing its submit_sm_throughput
+        self.bind_count = kwargs.get('bind_count', 1)
+        if not isinstance(self.bind_count, int):
+            raise TypeMismatch('bind_count must be an integer')
+        if self.bind_count < 1:
+            raise UnknownValue('Invalid bind_count: %s' % self.bind_count)
 
         # These are default parameters, c.f. _setConfigParamsInPDU method in SMPPOperationFactory
         self.service_type = kwargs.get('service_type', None)
@@ -184,6 +191,24 @@ class SMPPClientConfig:
         if (not isinstance(self.submit_sm_throughput, int)
             and not isinstance(self.submit_sm_throughput, float)):
             raise TypeMismatch('submit_sm_throughput must be an integer or float')
+        # Number of submit_sm consumed from the connector's queue without being acked yet,
+        # 0 means no limit
+        self.submit_sm_prefetch_count = kwargs.get('submit_sm_prefetch_count', 1)
+        if not isinstance(self.submit_sm_prefetch_count, int):
+            raise TypeMismatch('submit_sm_prefetch_count must be an integer')
+        if self.submit_sm_prefetch_count < 0:
+            raise UnknownValue('Invalid submit_sm_prefetch_count: %s' % self.submit_sm_prefetch_count)
+        # Acks are sent (using multiple=True) every submit_sm_ack_batch_size messages or after
+        # submit_sm_ack_batch_interval seconds, 1 means every message is acked on its own
+        self.submit_sm_ack_batch_size = kwargs.get('submit_sm_ack_batch_size', 1)
+        if not isinstance(self.submit_sm_ack_batch_size, int):
+            raise TypeMismatch('submit_sm_ack_batch_size must be an integer')
+        if self.submit_sm_ack_batch_size < 1:
+            raise UnknownValue('Invalid submit_sm_ack_batch_size: %s' % self.submit_sm_ack_batch_size)
+        self.submit_sm_ack_batch_interval = kwargs.get('submit_sm_ack_batch_interval', 0.1)
+        if (not isinstance(self.submit_sm_ack_batch_interval, int)
+            and not isinstance(self.submit_sm_ack_batch_interval, float)):
+            raise TypeMismatch('submit_sm_ack_batch_interval must be an integer or float')
 
         # DLR Message id bases from submit_sm_resp to deliver_sm, possible values:
         # [0] (default) : submit_sm_resp and deliver_sm messages IDs are on the same base.
@@ -11,7 +11,7 @@ from OpenSSL import SSL
 from twisted.internet import defer, reactor, ssl
 from twisted.internet.protocol import ClientFactory
 
-from jasmin.routing.Routables import RoutableSubmitSm
+from jasmin.routing.Routables import Routable, RoutableSubmitSm
 from smpp.twisted.protocol import DataHandlerResponse, SMPPSessionStates
 from smpp.twisted.server import SMPPBindManager as _SMPPBindManager
 from smpp.twisted.server import SMPPServerFactory as _SMPPServerFactory
@@ -48,6 +48,7 @@ class SMPPClientFactory(ClientFactory):
         self.smpp = None
         self.connectionRetry = True
         self.config = config
+        self.sessionStateObservers = []
 
         # Setup statistics collector
         self.stats = SMPPClientStatsCollector().get(cid=self.config.id)
@@ -202,6 +203,14 @@ class SMPPClientFactory(ClientFactory):
         else:
             return self.smpp.sessionState
 
+    def addSessionStateObserver(self, observer):
+        """observer is called with (cid, session_state) on every session state transition"""
+        self.sessionStateObservers.append(observer)
+
+    def sessionStateChanged(self, state):
+        for observer in self.sessionStateObservers:
+            observer(self.config.id, state)
+
 
 class CtxFactory(ssl.ClientContextFactory):
     def __init__(self, config):
@@ -224,6 +233,9 @@ class SMPPServerFactory(_SMPPServerFactory):
         # A dict of protocol instances for each of the current connections,
         # indexed by system_id
         self.bound_connections = {}
+        # Callables notified with (system_id, bound) when a system_id gets its first
+        # binding or loses its last one
+        self.bound_systemid_observers = []
         self._auth_portal = auth_portal
         self.RouterPB = RouterPB
         self.SMPPClientManagerPB = SMPPClientManagerPB
@@ -338,6 +350,7 @@ class SMPPServerFactory(_SMPPServerFactory):
         else:
             return self.submit_sm_post_interception(routable=routable, system_id=system_id, proto=proto)
 
+    @defer.inlineCallbacks
     def submit_sm_post_interception(self, *args, **kw):
         """This event handler will deliver the submit_sm to the right smppc connector.
         Note that Jasmin deliver submit_sm messages like this:
@@ -360,6 +373,8 @@ class SMPPServerFactory(_SMPPServerFactory):
                     raise InterceptorRunError('Failed running interception script, check log for details')
                 elif isinstance(args[0], dict) and args[0]['smpp_status'] > 0:
                     self.stats.inc('interceptor_error_count')
+                    if args[0].get('error') == 'timeout':
+                        self.stats.inc('interceptor_timeout_count')
                     self.log.error('Interceptor script returned %s smpp_status error.', args[0]['smpp_status'])
                     raise SubmitSmInterceptionError(code=args[0]['smpp_status'])
                 elif isinstance(args[0], dict) and args[0]['smpp_status'] == 0:
@@ -369,9 +384,10 @@ class SMPPServerFactory(_SMPPServerFactory):
                     if 'message_id' in args[0]['extra']:
                         message_id = str(args[0]['extra']['message_id'])
                     raise SubmitSmInterceptionSuccess()
-                elif isinstance(args[0], (str, bytes)):
+                elif isinstance(args[0], (str, bytes, Routable)):
                     self.stats.inc('interceptor_count')
-                    routable = pickle.loads(args[0])
+                    # The embedded interceptor returns the routable itself
+                    routable = args[0] if isinstance(args[0], Routable) else pickle.loads(args[0])
                 else:
                     self.stats.inc('interceptor_error_count')
                     self.log.error('Failed running interception script, got the following return: %s',
@@ -395,27 +411,14 @@ class SMPPServerFactory(_SMPPServerFactory):
 
             # Get connector from selected route
             self.log.debug("RouterPB selected %s route for this SubmitSmPDU", route)
-            routedConnector = route.getConnector()
             # Is it a failover route ? then check for a bound connector, otherwise don't route
             # The failover route requires at least one connector to be up, no message enqueuing will
             # occur otherwise.
             if repr(route) == 'FailoverMTRoute':
                 self.log.debug('Selected route is a failover, will ensure connector is bound:')
-                while True:
-                    c = self.SMPPClientManagerPB.perspective_connector_details(routedConnector.cid)
-                    if c:
-                        self.log.debug('Connector [%s] is: %s', routedConnector.cid, c['session_state'])
-                    else:
-                        self.log.debug('Connector [%s] is not found', routedConnector.cid)
-
-                    if c and c['session_state'][:6] == 'BOUND_':
-                        # Choose this connector
-                        break
-                    else:
-                        # Check next connector, None if no more connectors are available
-                        routedConnector = route.getConnector()
-                        if routedConnector is None:
-                            break
+                routedConnector = self.SMPPClientManagerPB.getFailoverConnector(route)
+            else:
+                routedConnector = route.getConnector()
 
             if routedConnector is None:
                 self.log.error("Failover route has no bound connector to handle SubmitSmPDU: %s",
@@ -443,9 +446,11 @@ class SMPPServerFactory(_SMPPServerFactory):
                 bill = route.getBillFor(routable.user)
                 self.log.debug("SubmitSmBill [bid:%s] [ttlamounts:%s] generated for this SubmitSmPDU",
                                bill.bid, bill.getTotalAmounts())
+                yield self.RouterPB.reserveQuotas(routable.user, bill)
+
                 charging_requirements = []
-                u_balance = routable.user.mt_credential.getQuota('balance')
-                u_subsm_count = routable.user.mt_credential.getQuota('submit_sm_count')
+                u_balance = routable.user.mt_credential.getAvailableQuota('balance')
+                u_subsm_count = routable.user.mt_credential.getAvailableQuota('submit_sm_count')
                 if u_balance is not None and bill.getTotalAmounts() > 0:
                     # Ensure user have enough balance to pay submit_sm and submit_sm_resp
                     charging_requirements.append({
@@ -558,6 +563,7 @@ class SMPPServerFactory(_SMPPServerFactory):
         self.log.debug('Adding SMPP binding for %s', system_id)
         if system_id not in self.bound_connections:
             self.bound_connections[system_id] = SMPPBindManager(user)
+            self.notifyBoundSystemIdObservers(system_id, True)
         self.bound_connections[system_id].addBinding(connection)
         bind_type = connection.bind_type
         self.log.info("Added %s bind for '%s'. Active binds: %s.",
@@ -580,6 +586,17 @@ class SMPPServerFactory(_SMPPServerFactory):
             # If this is the last binding for this service then remove the BindManager
             if self.bound_connections[system_id].getBindingCount() == 0:
                 self.bound_connections.pop(system_id)
+                self.notifyBoundSystemIdObservers(system_id, False)
+
+    def addBoundSystemIdObserver(self, observer):
+        self.bound_systemid_observers.append(observer)
+
+    def notifyBoundSystemIdObservers(self, system_id, bound):
+        for observer in self.bound_systemid_observers:
+            try:
+                observer(system_id, bound)
+            except Exception as e:
+                self.log.error('Error notifying bound system_id observer %s: %s', observer, e)
 
     def canOpenNewConnection(self, user, bind_type):
         """
@@ -1,4 +1,3 @@
-import pickle
 import sys
 import logging
 from logging.handlers import TimedRotatingFileHandler
@@ -7,6 +6,7 @@ from twisted.internet import defer
 from twisted.spread import pb
 
 import jasmin
+from jasmin.tools import codec
 
 LOG_CATEGORY = "jasmin-smpps-pb"
 
@@ -16,6 +16,8 @@ class SMPPServerPB(pb.Avatar):
         self.config = SmppServerPBConfig
         self.avatar = None
         self.smpps = None
+        # Remote listeners (pb.Referenceable) of bound system_ids changes
+        self.bound_systemids_listeners = []
 
         # Set up a dedicated logger
         self.log = logging.getLogger(LOG_CATEGORY)
@@ -47,6 +49,29 @@ class SMPPServerPB(pb.Avatar):
             self.log.info('Replaced SMPP Server: %s', smppsFactory.config.id)
 
         self.smpps = smppsFactory
+        self.smpps.addBoundSystemIdObserver(self.bound_systemid_changed)
+
+    def bound_systemid_changed(self, system_id, bound):
+        """Push system_id binding change to the subscribed listeners"""
+        for listener in list(self.bound_systemids_listeners):
+            d = listener.callRemote('bound_systemid_changed', system_id, bound)
+            d.addErrback(self._bound_systemid_push_failed, listener)
+
+    def _bound_systemid_push_failed(self, failure, listener):
+        self.log.error('Cannot push bound system_id change to %s: %s', listener, failure.getErrorMessage())
+
+    def _remove_bound_systemids_listener(self, listener):
+        if listener in self.bound_systemids_listeners:
+            self.bound_systemids_listeners.remove(listener)
+
+    def perspective_subscribe_bound_systemids(self, listener):
+        """Subscribe listener to bound system_ids changes and return the bound system_ids,
+        listener's remote_bound_systemid_changed(system_id, bound) will be called on changes"""
+
+        self.bound_systemids_listeners.append(listener)
+        listener.notifyOnDisconnect(self._remove_bound_systemids_listener)
+
+        return self.perspective_list_bound_systemids()
 
     def perspective_list_bound_systemids(self):
         """Returning list of bound smpp systemd_ids"""
@@ -72,7 +97,7 @@ class SMPPServerPB(pb.Avatar):
             defer.returnValue(False)
         else:
             if pickled:
-                pdu = pickle.loads(pdu)
+                pdu = codec.loads(pdu)
 
             try:
                 # Push pdu through the deliverer
@@ -84,6 +109,16 @@ class SMPPServerPB(pb.Avatar):
             else:
                 defer.returnValue(True)
 
+    def perspective_deliverer_send_requests(self, requests, pickled=True):
+        """Batched perspective_deliverer_send_request: requests is a list of (system_id, pdu),
+        a list of results is returned in the same order"""
+
+        d = defer.DeferredList(
+            [self.perspective_deliverer_send_request(system_id, pdu, pickled) for system_id, pdu in requests],
+            consumeErrors=True)
+        d.addCallback(lambda results: [success and result for success, result in results])
+        return d
+
     def perspective_version_release(self):
         return jasmin.get_release()
 
@@ -32,6 +32,20 @@ class SMPPClientProtocol(twistedSMPPClientProtocol):
 
         self.longSubmitSmTxns = {}
 
+    @property
+    def sessionState(self):
+        return self._sessionState
+
+    @sessionState.setter
+    def sessionState(self, state):
+        """Every session state transition is signaled to the factory, this is keeping
+        SMPPClientManagerPB's session states index current"""
+        self._sessionState = state
+
+        # Factory is set after instanciation, initial state is not signaled
+        if getattr(self, 'factory', None) is not None:
+            self.factory.sessionStateChanged(state)
+
     def PDUReceived(self, pdu):
         self.log.debug("SMPP Client received PDU [command: %s, seq_number: %s, command_status: %s]",
                        pdu.commandId, pdu.seqNum, pdu.status)
@@ -1,13 +1,78 @@
+import logging
 import pickle
 
+from twisted.internet import defer, reactor
+from twisted.spread import pb
+
+from jasmin.tools import codec
 from jasmin.tools.proxies import ConnectedPB
 from jasmin.tools.proxies import JasminPBProxy
 
+LOG_CATEGORY = "jasmin-smpps-pb-proxy"
+
+
+class BoundSystemIdsListener(pb.Referenceable):
+    """Keep SMPPServerPBProxy's bound system_ids registry current with changes pushed
+    by SMPPServerPB"""
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    def remote_bound_systemid_changed(self, system_id, bound):
+        if self.proxy.bound_systemids is None:
+            return
+
+        if bound:
+            self.proxy.bound_systemids.add(system_id)
+        else:
+            self.proxy.bound_systemids.discard(system_id)
+
 
 class SMPPServerPBProxy(JasminPBProxy):
     """This is a proxy to SMPPServerPB perspective broker
     used mainly for delivering dlr and deliver_sm from a standalone process"""
 
+    # Bound system_ids, kept current by SMPPServerPB, None until subscribed
+    bound_systemids = None
+    # Maximum deliverer_send_request calls sent in one round trip
+    deliverer_batch_size = 100
+    # SMPPServerPB having subscribe_bound_systemids are also having deliverer_send_requests and
+    # decoding every pdu codec, requests to older ones are sent one by one and pickled
+    deliverer_batching = False
+    # Replaced by the thrower's logger (c.f. jasmin.routing.throwers.Thrower.addSmpps)
+    log = logging.getLogger(LOG_CATEGORY)
+
+    def _connected(self, perspective):
+        JasminPBProxy._connected(self, perspective)
+
+        self.bound_systemids = None
+        self.deliverer_batching = False
+        self.deliverer_batch = []
+
+        d = self.pb.callRemote('subscribe_bound_systemids', BoundSystemIdsListener(self))
+        d.addCallbacks(self._subscribed, self._subscription_failed)
+        return d
+
+    def _subscribed(self, systemids):
+        self.bound_systemids = set(systemids)
+        self.deliverer_batching = True
+
+    def _subscription_failed(self, failure):
+        # Registry and batching are not used with older SMPPServerPB
+        self.log.warning(
+            'Cannot subscribe to SMPPServerPB bound system_ids, list_bound_systemids and '
+            'deliverer_send_request will be called for every message: %s', failure.getErrorMessage())
+
+    def _disconnected(self, connector, reason):
+        JasminPBProxy._disconnected(self, connector, reason)
+
+        self.bound_systemids = None
+
+    def disconnect(self):
+        self.bound_systemids = None
+
+        return JasminPBProxy.disconnect(self)
+
     @ConnectedPB
     def version_release(self):
         return self.pb.callRemote('version_release')
@@ -22,7 +87,48 @@ class SMPPServerPBProxy(JasminPBProxy):
 
     @ConnectedPB
     def deliverer_send_request(self, system_id, pdu):
-        # TODO: pickle may get swaped with msgpack in future ...
-        pdu = pickle.dumps(pdu, pickle.HIGHEST_PROTOCOL)
+        """Requests made in the same reactor iteration are sent in one deliverer_send_requests
+        round trip, pdu can be given encoded already (as consumed from a queue)"""
+        if not self.deliverer_batching:
+            if isinstance(pdu, bytes):
+                # Older SMPPServerPB are only unpickling
+                pdu = codec.loads(pdu)
+
+            return self.pb.callRemote('deliverer_send_request', system_id,
+                                      pickle.dumps(pdu, pickle.HIGHEST_PROTOCOL))
+
+        if not isinstance(pdu, bytes):
+            # TODO: pickle may get swaped with msgpack in future ...
+            pdu = pickle.dumps(pdu, pickle.HIGHEST_PROTOCOL)
+
+        d = defer.Deferred()
+        self.deliverer_batch.append((system_id, pdu, d))
+
+        if len(self.deliverer_batch) >= self.deliverer_batch_size:
+            self._flush_deliverer_batch()
+        elif len(self.deliverer_batch) == 1:
+            reactor.callLater(0, self._flush_deliverer_batch)
+
+        return d
+
+    def _flush_deliverer_batch(self):
+        batch, self.deliverer_batch = self.deliverer_batch, []
+        if len(batch) == 0:
+            return
+
+        if len(batch) == 1:
+            system_id, pdu, d = batch[0]
+            defer.maybeDeferred(self.pb.callRemote, 'deliverer_send_request', system_id, pdu).chainDeferred(d)
+            return
+
+        def _fire(results):
+            for (_, _, d), result in zip(batch, results):
+                d.callback(result)
+
+        def _fail(failure):
+            for _, _, d in batch:
+                d.errback(failure)
 
-        return self.pb.callRemote('deliverer_send_request', system_id, pdu)
+        r = defer.maybeDeferred(self.pb.callRemote, 'deliverer_send_requests',
+                                [(system_id, pdu) for system_id, pdu, _ in batch])
+        r.addCallbacks(_fire, _fail)
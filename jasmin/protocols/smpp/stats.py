@@ -38,7 +38,9 @@ class ClientConnectorStatistics(ConnectorStatistics):
             "throttling_error_count": 0,
             "other_submit_error_count": 0,
             "interceptor_error_count": 0,
-            "interceptor_count": 0}
+            "interceptor_count": 0,
+            "interceptor_timeout_count": 0,
+            "long_mo_expired_count": 0}
 
     def getStats(self):
         return self._stats
@@ -71,7 +73,8 @@ class ServerConnectorStatistics(ConnectorStatistics):
             "throttling_error_count": 0,
             "other_submit_error_count": 0,
             "interceptor_error_count": 0,
-            "interceptor_count": 0}
+            "interceptor_count": 0,
+            "interceptor_timeout_count": 0}
 
     def getStats(self):
         return self._stats
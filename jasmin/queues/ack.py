@@ -0,0 +1,82 @@
+from twisted.internet import defer, reactor
+
+
+class AckBatcher:
+    """Batch basic_ack calls on a channel using multiple=True acks
+
+    Every delivery is tracked until it is settled (acked or rejected), acks are flushed every
+    batch_size acks or after interval seconds, whichever comes first:
+    - the highest acked delivery tag below the lowest unsettled one is acked with multiple=True,
+    - acked delivery tags above an unsettled one (a message waiting for its delayed requeue for
+      example) are acked one by one, multiple=True would have acked the unsettled one too.
+
+    Deliveries are numbered in order on a channel, one AckBatcher must be used per channel and
+    the channel's consumers must call delivered() for every message they get from their queues.
+    """
+
+    def __init__(self, chan, batch_size=1, interval=0.1, clock=reactor):
+        self.chan = chan
+        self.batch_size = batch_size
+        self.interval = interval
+        self.clock = clock
+
+        # Delivered but neither acked nor rejected
+        self.unsettled = set()
+        # Acked but not flushed
+        self.pending = []
+        self.timer = None
+
+    def delivered(self, delivery_tag):
+        self.unsettled.add(delivery_tag)
+
+    def ack(self, delivery_tag):
+        self.unsettled.discard(delivery_tag)
+
+        if self.batch_size <= 1:
+            return self.chan.basic_ack(delivery_tag=delivery_tag)
+
+        self.pending.append(delivery_tag)
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+
+        if self.timer is None:
+            self.timer = self.clock.callLater(self.interval, self.flush)
+        return defer.succeed(None)
+
+    def reject(self, delivery_tag, requeue=0):
+        self.unsettled.discard(delivery_tag)
+
+        return self.chan.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+
+    def flush(self):
+        """Send pending acks"""
+        self.cancelTimer()
+
+        if len(self.pending) == 0:
+            return defer.succeed(None)
+
+        pending = sorted(self.pending)
+        self.pending = []
+
+        if len(self.unsettled) > 0:
+            lowest_unsettled = min(self.unsettled)
+            multiple = [tag for tag in pending if tag < lowest_unsettled]
+            single = [tag for tag in pending if tag > lowest_unsettled]
+        else:
+            multiple, single = pending, []
+
+        acks = []
+        if len(multiple) == 1:
+            acks.append(self.chan.basic_ack(delivery_tag=multiple[0]))
+        elif len(multiple) > 1:
+            acks.append(self.chan.basic_ack(delivery_tag=multiple[-1], multiple=True))
+        for tag in single:
+            acks.append(self.chan.basic_ack(delivery_tag=tag))
+
+        return defer.DeferredList(acks, fireOnOneErrback=True, consumeErrors=True)
+
+    def cancelTimer(self):
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
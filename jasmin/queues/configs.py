@@ -50,6 +50,12 @@ class AmqpConfig(ConfigFile):
         self.reconnectOnConnectionFailureDelay = self._getint(
             'amqp-broker', 'connection_failure_retry_delay', 10)
 
+        # Delayed requeues (retries) are acked and published to ttl retry queues dead-lettering
+        # them back instead of being held unacked by in-process timers
+        self.retry_queues = self._getbool('amqp-broker', 'retry_queues', False)
+        self.retry_backoff = self._getfloat('amqp-broker', 'retry_backoff', 2)
+        self.retry_max_delay = self._getint('amqp-broker', 'retry_max_delay', 3600)
+
     def getSpec(self):
         """Will return the specifications from self.spec file"""
 
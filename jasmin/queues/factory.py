@@ -4,8 +4,10 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 from twisted.internet.protocol import ClientFactory
 from twisted.internet import defer, reactor
-from txamqp.client import TwistedDelegate
+from txamqp.client import TwistedDelegate, ChannelClosed
 from jasmin.queues.protocol import AmqpProtocol
+from jasmin.queues.retry import (RETRY_COUNT_HEADER, RETRY_ROUTING_KEY_HEADER, retry_queue_name,
+                                 backoff_delay as retry_backoff_delay)
 
 LOG_CATEGORY = "jasmin-amqp-factory"
 
@@ -24,6 +26,7 @@ class AmqpFactory(ClientFactory):
 
         self.amqp = None  # The protocol instance.
         self.client = None  # Alias for protocol instance
+        self.lastChannelId = None
 
         self.queues = []
 
@@ -166,6 +169,7 @@ class AmqpFactory(ClientFactory):
         self.log.info("Got channel")
 
         self.chan = chan
+        self.lastChannelId = chan.id
         self.queues = []
 
         d = self.chan.channel_open()
@@ -214,10 +218,127 @@ class AmqpFactory(ClientFactory):
 
         return self.chan.queue_declare(*args, **keys).addCallback(self._queue_declared)
 
+    @defer.inlineCallbacks
+    def open_channel(self):
+        """Open a new channel on the current connection, this is used by consumers needing
+        their own basic_qos (prefetch window) without changing the one of self.chan
+        """
+
+        if not self.connected:
+            raise Exception('AMQP Client is not connected, cannot open a channel')
+
+        # Channel ids are not reused: txamqp keeps closed channels in client.channels
+        self.lastChannelId += 1
+        chan = yield self.client.channel(self.lastChannelId)
+        yield chan.channel_open()
+        self.log.info("Channel %s is open", chan.id)
+
+        defer.returnValue(chan)
+
     def _queue_declared(self, queue):
         self.log.info("A new queue has been successfully declared [%s]", queue.queue)
         self.queues.append(queue.queue)
 
+    @defer.inlineCallbacks
+    def migrating_queue_declare(self, queue, arguments, exchange, routing_key):
+        """Declare queue with arguments (x-max-priority for example) and bind it to exchange,
+        a queue already existing with other arguments is migrated:
+
+        - a temporary <queue>.migration queue is bound to exchange in its place,
+        - its messages are moved to <queue>.migration,
+        - it is deleted, declared again with the new arguments and bound,
+        - <queue>.migration is unbound and its messages are moved back.
+
+        Messages published while bindings are swapped may be routed to both queues (and delivered
+        twice), none is dropped; a <queue>.migration left by an interrupted migration is drained
+        into queue.
+        """
+
+        if not self.connected:
+            raise Exception('AMQP Client is not connected, cannot queue_declare')
+
+        migration_queue = '%s.migration' % queue
+
+        # The broker is closing the channel when arguments are not matching
+        chan = yield self.open_channel()
+        try:
+            yield chan.queue_declare(queue=queue, arguments=arguments)
+        except ChannelClosed as e:
+            self.log.warning('Queue [%s] is declared with other arguments, migrating it: %s', queue, e)
+
+            chan = yield self.open_channel()
+            yield chan.queue_declare(queue=migration_queue, arguments=arguments)
+            yield chan.queue_bind(queue=migration_queue, exchange=exchange, routing_key=routing_key)
+            yield chan.queue_unbind(queue=queue, exchange=exchange, routing_key=routing_key)
+            moved = yield self._move_messages(chan, queue, migration_queue)
+
+            yield chan.queue_delete(queue=queue)
+            yield chan.queue_declare(queue=queue, arguments=arguments)
+            self.log.info('Queue [%s] migrated with %s messages', queue, moved)
+        else:
+            # A crashed migration may have left messages in the migration queue
+            try:
+                check_chan = yield self.open_channel()
+                yield check_chan.queue_declare(queue=migration_queue, passive=True)
+            except ChannelClosed:
+                migration_queue = None
+            else:
+                yield check_chan.channel_close()
+                self.log.warning('Queue [%s] was left by an interrupted migration, draining it', migration_queue)
+
+        yield chan.queue_bind(queue=queue, exchange=exchange, routing_key=routing_key)
+
+        if migration_queue is not None:
+            yield chan.queue_unbind(queue=migration_queue, exchange=exchange, routing_key=routing_key)
+            moved = yield self._move_messages(chan, migration_queue, queue)
+            yield chan.queue_delete(queue=migration_queue)
+            self.log.info('Moved %s messages from [%s] to [%s]', moved, migration_queue, queue)
+
+        yield chan.channel_close()
+        if queue not in self.queues:
+            self.queues.append(queue)
+
+    @defer.inlineCallbacks
+    def requeue_delayed(self, queue, message, delay, retry):
+        """Publish message again to queue in delay seconds (growing with retry, the message's
+        retry count) through a ttl retry queue, return the applied delay
+
+        The caller must ack the message once this is done, the retry survives this process.
+        """
+
+        delay = retry_backoff_delay(delay, retry, self.config.retry_backoff, self.config.retry_max_delay)
+        retry_queue = retry_queue_name(queue, delay)
+        if retry_queue not in self.queues:
+            yield self.chan.queue_declare(queue=retry_queue, arguments={
+                'x-message-ttl': int(delay * 1000),
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': queue})
+            self.queues.append(retry_queue)
+
+        headers = message.content.properties.get('headers') or {}
+        message.content.properties['headers'] = headers
+        headers[RETRY_COUNT_HEADER] = retry
+        headers.setdefault(RETRY_ROUTING_KEY_HEADER, message.routing_key)
+
+        yield self.chan.basic_publish(exchange='', routing_key=retry_queue, content=message.content)
+
+        defer.returnValue(delay)
+
+    @defer.inlineCallbacks
+    def _move_messages(self, chan, from_queue, to_queue):
+        """Move all messages from from_queue to to_queue, return the moved messages count"""
+        moved = 0
+        while True:
+            msg = yield chan.basic_get(queue=from_queue, no_ack=False)
+            if msg.method.name == 'get-empty':
+                break
+
+            yield chan.basic_publish(exchange='', routing_key=to_queue, content=msg.content)
+            yield chan.basic_ack(delivery_tag=msg.delivery_tag)
+            moved += 1
+
+        defer.returnValue(moved)
+
     def publish(self, **args):
         """This is a wrapper to channel's publish method
         it is intended for connection checking before publishing
@@ -0,0 +1,33 @@
+"""
+Helpers for messages requeued through retry queues (c.f. AmqpFactory.requeue_delayed)
+
+A retried message is acked and published again to a <queue>.retry.<delay ms> queue, the broker is
+dead-lettering it back to <queue> once its ttl expired; the message is carrying its retry count and
+the routing key it was first published with in its headers.
+"""
+
+RETRY_COUNT_HEADER = 'retry-count'
+RETRY_ROUTING_KEY_HEADER = 'retry-routing-key'
+
+
+def _headers(message):
+    return message.content.properties.get('headers') or {}
+
+
+def retry_count(message):
+    """Return how many times message got retried through retry queues"""
+    return int(_headers(message).get(RETRY_COUNT_HEADER, 0))
+
+
+def original_routing_key(message):
+    """Return the routing key message was first published with"""
+    return _headers(message).get(RETRY_ROUTING_KEY_HEADER, message.routing_key)
+
+
+def backoff_delay(delay, retry, backoff, max_delay):
+    """Return the delay of the retry-th retry (starting from 1), exponentially growing from delay"""
+    return min(delay * backoff ** max(0, retry - 1), max_delay)
+
+
+def retry_queue_name(queue, delay):
+    return '%s.retry.%d' % (queue, int(delay * 1000))
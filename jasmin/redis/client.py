@@ -1,10 +1,12 @@
 import sys
+import time
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import txredisapi as redis
 from twisted.internet import reactor
 from twisted.internet import defer
 from jasmin.redis.configs import RedisForJasminConfig
+from jasmin.redis.stats import RedisStatsCollector
 
 LOG_CATEGORY = "jasmin-redis-client"
 
@@ -22,6 +24,92 @@ class RedisForJasminProtocol(redis.RedisProtocol):
         return redis.RedisProtocol.execute_command(self, *args, **kwargs)
 
 
+class RedisForJasminConnectionHandler(redis.ConnectionHandler):
+    """Adds write coalescing to the connection handler: writes given to hmset_expire() and
+    set_expire() are buffered and flushed together in one redis pipeline"""
+
+    def __init__(self, factory):
+        redis.ConnectionHandler.__init__(self, factory)
+
+        self._write_buffer = []
+        self._flush_timer = None
+
+    def _buffer_write(self, commands):
+        """Buffer a write made of (method, args, kwargs) commands, returns a deferred fired
+        once the commands are written to redis"""
+        d = defer.Deferred()
+        self._write_buffer.append((commands, d))
+
+        if len(self._write_buffer) >= self._factory.config.write_batch_size:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = reactor.callLater(self._factory.config.write_batch_interval / 1000.0, self.flush)
+
+        return d
+
+    def _buffering(self):
+        return self._factory.config is not None and self._factory.config.write_batch_interval > 0
+
+    def hmset_expire(self, key, mapping, expiry):
+        """Set the hash key and its expiry, returns a deferred fired once written to redis"""
+        if not self._buffering():
+            return self.hmset(key, mapping).addCallback(lambda _: self.expire(key, expiry))
+
+        return self._buffer_write([('hmset', (key, mapping), {}), ('expire', (key, expiry), {})])
+
+    def set_expire(self, key, value, expiry):
+        """Set the string key with its expiry (SET EX), returns a deferred fired once written to redis"""
+        if not self._buffering():
+            return self.set(key, value, expire=expiry)
+
+        return self._buffer_write([('set', (key, value), {'expire': expiry})])
+
+    @defer.inlineCallbacks
+    def flush(self):
+        """Write all buffered writes in one pipeline"""
+        if self._flush_timer is not None and self._flush_timer.active():
+            self._flush_timer.cancel()
+        self._flush_timer = None
+
+        batch, self._write_buffer = self._write_buffer, []
+        if len(batch) == 0:
+            return
+
+        stats = RedisStatsCollector().get(self._factory.uuid)
+        size = sum(len(commands) for commands, _ in batch)
+        started_at = time.time()
+        try:
+            pipe = yield self.pipeline()
+            for commands, _ in batch:
+                for method, args, kwargs in commands:
+                    getattr(pipe, method)(*args, **kwargs)
+            yield pipe.execute_pipeline()
+        except Exception as e:
+            stats.inc('pipeline_error_count')
+            self._factory.log.error('Error writing pipeline of %s writes: %s', len(batch), e)
+
+            for _, d in batch:
+                d.errback(e)
+        else:
+            latency = time.time() - started_at
+            stats.inc('pipeline_count')
+            stats.inc('pipeline_command_count', size)
+            stats.set('pipeline_latency_sum', stats.get('pipeline_latency_sum') + latency)
+            stats.set('last_pipeline_size', size)
+            stats.set('last_pipeline_latency', latency)
+            self._factory.log.debug('Written pipeline of %s writes in %.3fs', len(batch), latency)
+
+            for _, d in batch:
+                d.callback(True)
+
+    def disconnect(self):
+        # Write pending buffered writes before disconnecting
+        d = self.flush()
+        d.addBoth(lambda _: redis.ConnectionHandler.disconnect(self))
+
+        return d
+
+
 class RedisForJasminFactory(redis.RedisFactory):
     protocol = RedisForJasminProtocol
 
@@ -38,7 +126,8 @@ class RedisForJasminFactory(redis.RedisFactory):
         self.log.info('Connection failed. Reason: %s', reason)
 
     def __init__(self, uuid, dbid, poolsize, isLazy=True,
-                 handler=redis.ConnectionHandler, config=None):
+                 handler=RedisForJasminConnectionHandler, config=None):
+        self.config = config
         if isinstance(config, RedisForJasminConfig) and config.password is not None:
             redis.RedisFactory.__init__(self, uuid, dbid, poolsize, isLazy, handler, password=config.password)
         else:
@@ -65,7 +154,8 @@ class RedisForJasminFactory(redis.RedisFactory):
 
 def makeConnection(host, port, dbid, poolsize, reconnect, isLazy, _RedisForJasminConfig=None):
     uuid = "%s:%s" % (host, port)
-    factory = RedisForJasminFactory(uuid, None, poolsize, isLazy, redis.ConnectionHandler, _RedisForJasminConfig)
+    factory = RedisForJasminFactory(uuid, None, poolsize, isLazy, RedisForJasminConnectionHandler,
+                                    _RedisForJasminConfig)
     factory.continueTrying = reconnect
     for _ in range(poolsize):
         reactor.connectTCP(host, int(port), factory)
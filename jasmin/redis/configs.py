@@ -29,6 +29,12 @@ class RedisForJasminConfig(ConfigFile):
         self.dbid = self._getint('redis-client', 'dbid', '0')
         self.poolsize = self._getint('redis-client', 'poolsize', 10)
 
+        # Buffered DLR map writes are flushed in one pipeline every write_batch_interval
+        # milliseconds or as soon as write_batch_size writes are buffered, 0 interval (default)
+        # disables buffering
+        self.write_batch_interval = self._getint('redis-client', 'write_batch_interval', 0)
+        self.write_batch_size = self._getint('redis-client', 'write_batch_size', 100)
+
         self.log_level = logging.getLevelName(self._get('redis-client', 'log_level', 'INFO'))
         self.log_file = self._get('redis-client',
                                   'log_file', '%s/redis-client.log' % LOG_PATH)
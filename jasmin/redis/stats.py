@@ -0,0 +1,37 @@
+from jasmin.tools.singleton import Singleton
+from jasmin.tools.stats import Stats
+
+
+class RedisClientStatistics(Stats):
+    """One redis client statistics holder"""
+
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+        self.init()
+
+    def init(self):
+        self._stats = {
+            'pipeline_count': 0,
+            'pipeline_command_count': 0,
+            'pipeline_error_count': 0,
+            # Seconds
+            'pipeline_latency_sum': 0.0,
+            'last_pipeline_size': 0,
+            'last_pipeline_latency': 0.0,
+        }
+
+    def getStats(self):
+        return self._stats
+
+
+class RedisStatsCollector(metaclass=Singleton):
+    """Redis clients statistics collection holder"""
+    clients = {}
+
+    def get(self, uuid):
+        """Return a redis client's stats object or instanciate a new one"""
+        if uuid not in self.clients:
+            self.clients[uuid] = RedisClientStatistics(uuid)
+
+        return self.clients[uuid]
@@ -8,6 +8,7 @@ import datetime
 from jasmin.routing.Routables import Routable
 from jasmin.routing.jasminApi import *
 from jasmin.tools.eval import CompiledNode
+from jasmin.tools.trie import PrefixTrie
 
 
 class InvalidFilterParameterError(Exception):
@@ -25,18 +26,20 @@ class Filter:
     Filters are written for specific Route types, that's why Filter.usedFor should be set for each
     implemented Filter, here's a compatibility matrix of Filter vs Route types:
 
-    Filter / Route type    | mo | mt | comment
-    TransparentFilter      | x  | x  |
-    ConnectorFilter        | x  |    | MT messages are identified by user instead of source connector
-    UserFilter             |    | x  | MO messages are not authenticated
-    GroupFilter            |    | x  | MO messages are not authenticated
-    SourceAddrFilter       | x  | x  |
-    DestinationAddrFilter  | x  | x  |
-    ShortMessageFilter     | x  | x  |
-    DateIntervalFilter     | x  | x  |
-    TimeIntervalFilter     | x  | x  |
-    EvalPyFilter           | x  | x  |
-    TagFilter              | x  | x  |
+    Filter / Route type     | mo | mt | comment
+    TransparentFilter       | x  | x  |
+    ConnectorFilter         | x  |    | MT messages are identified by user instead of source connector
+    UserFilter              |    | x  | MO messages are not authenticated
+    GroupFilter             |    | x  | MO messages are not authenticated
+    SourceAddrFilter        | x  | x  |
+    DestinationAddrFilter   | x  | x  |
+    ShortMessageFilter      | x  | x  |
+    DateIntervalFilter      | x  | x  |
+    TimeIntervalFilter      | x  | x  |
+    EvalPyFilter            | x  | x  |
+    TagFilter               | x  | x  |
+    SourcePrefixFilter      | x  | x  |
+    DestinationPrefixFilter | x  | x  |
     """
 
     usedFor = ['mt', 'mo']
@@ -283,3 +286,66 @@ class TagFilter(Filter):
         Filter.match(self, routable)
 
         return routable.hasTag(self.tag)
+
+
+class PrefixFilter(Filter):
+    """Generic prefix-set filter:
+
+    Will match a routable when its address param (set in _param) starts with any of the
+    given prefixes, lookups are made by longest-prefix match over a trie of all prefixes.
+    """
+    _param = None
+    _repr_key = None
+
+    def __init__(self, prefixes):
+        Filter.__init__(self)
+        if not isinstance(prefixes, (list, tuple, set)):
+            raise InvalidFilterParameterError("prefixes must be a list")
+        if len(prefixes) == 0:
+            raise InvalidFilterParameterError("prefixes must contain at least one prefix")
+        for prefix in prefixes:
+            if not isinstance(prefix, str) or len(prefix) == 0 or len(prefix.split()) != 1:
+                raise InvalidFilterParameterError("Invalid prefix: %s" % prefix)
+
+        self.prefixes = sorted(set(prefixes))
+        self._build()
+
+        self._repr = '<%s (prefixes=%s)>' % (self._repr_key, len(self.prefixes))
+        self._str = '%s:\n%s prefixes (%s) = %s' % (
+            self.__class__.__name__, self._param, len(self.prefixes), ', '.join(self.prefixes))
+
+    def _build(self):
+        # The trie is keyed on bytes to avoid decoding the pdu param on every match
+        self.trie = PrefixTrie()
+        for prefix in self.prefixes:
+            self.trie.insert(prefix.encode())
+
+    def __getstate__(self):
+        # Don't persist the trie, it's rebuilt from self.prefixes
+        state = self.__dict__.copy()
+        del state['trie']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    def getMatchedPrefix(self, routable):
+        """Return the longest prefix matching the routable, None if nothing matched"""
+        Filter.match(self, routable)
+
+        prefix = self.trie.longest_match(routable.pdu.params[self._param])
+        return None if prefix is None else prefix.decode()
+
+    def match(self, routable):
+        return self.getMatchedPrefix(routable) is not None
+
+
+class SourcePrefixFilter(PrefixFilter):
+    _param = 'source_addr'
+    _repr_key = 'SAP'
+
+
+class DestinationPrefixFilter(PrefixFilter):
+    _param = 'destination_addr'
+    _repr_key = 'DAP'
@@ -4,6 +4,7 @@ More info: http://docs.jasminsms.com/en/latest/interception/index.html
 
 from jasmin.routing.Interceptors import Interceptor
 from jasmin.routing.Routables import Routable
+from jasmin.tools.eval import CompiledNode
 
 
 class InvalidInterceptionTableParameterError(Exception):
@@ -20,6 +21,22 @@ class InterceptionTable:
     def __init__(self):
         self.table = []
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Loaded (unpickled) interceptors
+        for r in self.table:
+            self._compile(list(r.values())[0])
+
+    def _compile(self, interceptor):
+        """Compile interceptor's script once for all, it's run by the embedded interceptor
+        without compiling it again"""
+        try:
+            CompiledNode().get(interceptor.script.pyCode)
+        except SyntaxError:
+            # Will be reported when running the script
+            pass
+
     def add(self, interceptor, order):
         if not isinstance(interceptor, Interceptor):
             raise InvalidInterceptionTableParameterError("interceptor is not an instance of Interceptor")
@@ -46,6 +63,7 @@ class InterceptionTable:
         # Replace older interceptors with the same given order
         self.remove(order)
 
+        self._compile(interceptor)
         self.table.append({order: interceptor})
         self.table = sorted(self.table, key=lambda x: sorted(x.keys()), reverse=True)
 
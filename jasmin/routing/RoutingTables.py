@@ -2,8 +2,11 @@
 More info: http://docs.jasminsms.com/en/latest/routing/index.html
 """
 
+from jasmin.routing.Filters import (UserFilter, GroupFilter, ConnectorFilter, TagFilter,
+                                    DestinationAddrFilter, DestinationPrefixFilter)
 from jasmin.routing.Routables import Routable
 from jasmin.routing.Routes import Route
+from jasmin.tools.trie import PrefixTrie
 
 
 class InvalidRoutingTableParameterError(Exception):
@@ -12,6 +15,34 @@ class InvalidRoutingTableParameterError(Exception):
     """
 
 
+def literal_prefix(pattern):
+    """Return the literal prefix every address must start with to match pattern, None is
+    returned if no such prefix can be safely extracted (alternations, quantified first char ..)
+
+    Patterns are matched with re.match(), they are anchored even without the leading '^'
+    """
+    if '|' in pattern:
+        return None
+
+    i = 1 if pattern.startswith('^') else 0
+    chars = []
+    while i < len(pattern):
+        if pattern[i].isascii() and pattern[i].isalnum():
+            chars.append(pattern[i])
+            i += 1
+        elif pattern[i:i + 2] == '\\+':
+            chars.append('+')
+            i += 2
+        else:
+            break
+
+    # Last literal is made optional or repeated by a quantifier
+    if i < len(pattern) and pattern[i] in '?*+{':
+        chars = chars[:-1]
+
+    return ''.join(chars) or None
+
+
 class RoutingTable:
     """Generic Routing table
     """
@@ -19,6 +50,17 @@ class RoutingTable:
 
     def __init__(self):
         self.table = []
+        self._index = None
+
+    def __getstate__(self):
+        # Route index is rebuilt on demand, it is never persisted
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index = None
 
     def add(self, route, order):
         if not isinstance(route, Route):
@@ -61,11 +103,13 @@ class RoutingTable:
 
         self.table.append({order: route})
         self.table = sorted(self.table, key=lambda x: sorted(x.keys()), reverse=True)
+        self._index = None
 
     def remove(self, order):
         for r in self.table:
             if list(r)[0] == order:
                 self.table.remove(r)
+                self._index = None
                 return True
 
         return False
@@ -75,6 +119,98 @@ class RoutingTable:
 
     def flush(self):
         self.table = []
+        self._index = None
+
+    def _compile(self):
+        """Build the route index used by getRouteFor
+
+        Every route is filed under one of its discriminating filters (the routable cannot match
+        the route without satisfying it), routes having none of them are kept in 'scan' and are
+        always candidates. Indexed values are route positions in self.table.
+        """
+        index = {
+            'uid': {},
+            'gid': {},
+            'cid': {},
+            'tag': {},
+            'destination_addr': PrefixTrie(),
+            'scan': [],
+        }
+
+        for position, r in enumerate(self.table):
+            route = list(r.values())[0]
+            filters = getattr(route, 'filters', [])
+
+            # Most selective filters first
+            key = None
+            for _filter in filters:
+                if isinstance(_filter, UserFilter):
+                    key = ('uid', _filter.user.uid)
+                    break
+            if key is None:
+                for _filter in filters:
+                    if isinstance(_filter, ConnectorFilter):
+                        key = ('cid', _filter.connector.cid)
+                        break
+            if key is None:
+                for _filter in filters:
+                    if isinstance(_filter, DestinationAddrFilter):
+                        prefix = literal_prefix(_filter.destination_addr.pattern)
+                        if prefix is not None:
+                            key = ('destination_addr', [prefix])
+                            break
+                    elif isinstance(_filter, DestinationPrefixFilter):
+                        key = ('destination_addr', _filter.prefixes)
+                        break
+            if key is None:
+                for _filter in filters:
+                    if isinstance(_filter, GroupFilter):
+                        key = ('gid', _filter.group.gid)
+                        break
+            if key is None:
+                for _filter in filters:
+                    if isinstance(_filter, TagFilter):
+                        key = ('tag', _filter.tag)
+                        break
+
+            if key is None:
+                index['scan'].append(position)
+            elif key[0] == 'destination_addr':
+                for prefix in key[1]:
+                    index['destination_addr'].insert(prefix, position)
+            else:
+                index[key[0]].setdefault(key[1], []).append(position)
+
+        self._index = index
+
+    def _candidates(self, routable):
+        """Return positions of routes that may match routable, in table order"""
+        if getattr(self, '_index', None) is None:
+            self._compile()
+
+        index = self._index
+        positions = list(index['scan'])
+
+        user = getattr(routable, 'user', None)
+        if user is not None:
+            positions.extend(index['uid'].get(user.uid, []))
+            positions.extend(index['gid'].get(user.group.gid, []))
+
+        connector = getattr(routable, 'connector', None)
+        if connector is not None:
+            positions.extend(index['cid'].get(connector.cid, []))
+
+        for tag in routable.getTags():
+            positions.extend(index['tag'].get(tag, []))
+
+        if len(index['destination_addr']) > 0:
+            destination_addr = routable.pdu.params.get('destination_addr')
+            if destination_addr is not None:
+                for _, _positions in index['destination_addr'].matches(
+                        destination_addr.decode('utf-8', 'replace')):
+                    positions.extend(_positions)
+
+        return sorted(set(positions))
 
     def getRouteFor(self, routable):
         """This will return the right route to send the routable to, None returned otherwise
@@ -83,8 +219,8 @@ class RoutingTable:
         if not isinstance(routable, Routable):
             raise InvalidRoutingTableParameterError("routable is not an instance of Routable")
 
-        for r in self.table:
-            route = list(r.values())[0]
+        for position in self._candidates(routable):
+            route = list(self.table[position].values())[0]
             if route.matchFilters(routable):
                 return route
 
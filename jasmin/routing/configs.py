@@ -7,6 +7,7 @@ import logging
 import os
 
 from jasmin.config import ConfigFile, ROOT_PATH, LOG_PATH
+from jasmin.tools.codec import CODECS
 
 CONFIG_PATH = os.getenv('CONFIG_PATH', '%s/etc/jasmin/' % ROOT_PATH)
 STORE_PATH = os.getenv('STORE_PATH', '%s/store/' % CONFIG_PATH)
@@ -20,6 +21,16 @@ class RouterPBConfig(ConfigFile):
         self.store_path = self._get('router', 'store_path', '%s' % STORE_PATH)
 
         self.persistence_timer_secs = self._getint('router', 'persistence_timer_secs', 60)
+        self.quota_journal_compaction_entries = self._getint('router', 'quota_journal_compaction_entries', 10000)
+
+        # Users balance and submit_sm_count are kept in redis when quota_backend is redis, every
+        # instance charges messages against leases taken from there
+        self.quota_backend = self._get('router', 'quota_backend', 'local')
+        if self.quota_backend not in ['local', 'redis']:
+            raise ValueError('Invalid quota_backend: %s' % self.quota_backend)
+        self.quota_lease_balance = self._getfloat('router', 'quota_lease_balance', 10.0)
+        self.quota_lease_submit_sm_count = self._getint('router', 'quota_lease_submit_sm_count', 100)
+        self.quota_sync_secs = self._getfloat('router', 'quota_sync_secs', 5)
 
         self.bind = self._get('router', 'bind', '0.0.0.0')
         self.port = self._getint('router', 'port', 8988)
@@ -31,6 +42,11 @@ class RouterPBConfig(ConfigFile):
 
         self.pickle_protocol = self._getint('router', 'pickle_protocol', 2)
 
+        # Codec used to encode PDUs published to deliver_sm_thrower.* queues
+        self.pdu_codec = self._get('router', 'pdu_codec', 'pickle')
+        if self.pdu_codec not in CODECS:
+            raise ValueError('Invalid pdu_codec: %s' % self.pdu_codec)
+
         # Logging
         self.log_level = logging.getLevelName(self._get('router', 'log_level', 'INFO'))
         self.log_rotate = self._get('router', 'log_rotate', 'W6')
@@ -49,6 +65,18 @@ class deliverSmThrowerConfig(ConfigFile):
         self.timeout = self._getint('deliversm-thrower', 'http_timeout', 30)
         self.retry_delay = self._getint('deliversm-thrower', 'retry_delay', 30)
         self.max_retries = self._getint('deliversm-thrower', 'max_retries', 3)
+        # Throwing retrials tracker bounds
+        self.retrials_max_size = self._getint('deliversm-thrower', 'retrials_max_size', 100000)
+        self.retrials_ttl = self._getint('deliversm-thrower', 'retrials_ttl', 86400)
+        # 0 for unlimited concurrent throws
+        self.max_inflight = self._getint('deliversm-thrower', 'max_inflight', 0)
+
+        # Outgoing http connections pooling
+        self.http_persistent_connections = self._getbool('deliversm-thrower', 'http_persistent_connections', True)
+        self.http_max_persistent_per_host = self._getint('deliversm-thrower', 'http_max_persistent_per_host', 2)
+        self.http_cached_connection_timeout = self._getint('deliversm-thrower', 'http_cached_connection_timeout', 240)
+        # 0 for unlimited concurrent requests per host
+        self.http_max_concurrent_per_host = self._getint('deliversm-thrower', 'http_max_concurrent_per_host', 0)
 
         # Logging
         self.log_level = logging.getLevelName(self._get('deliversm-thrower', 'log_level', 'INFO'))
@@ -69,6 +97,18 @@ class DLRThrowerConfig(ConfigFile):
         self.timeout = self._getint('dlr-thrower', 'http_timeout', 30)
         self.retry_delay = self._getint('dlr-thrower', 'retry_delay', 30)
         self.max_retries = self._getint('dlr-thrower', 'max_retries', 3)
+        # Throwing retrials tracker bounds
+        self.retrials_max_size = self._getint('dlr-thrower', 'retrials_max_size', 100000)
+        self.retrials_ttl = self._getint('dlr-thrower', 'retrials_ttl', 86400)
+        # 0 for unlimited concurrent throws
+        self.max_inflight = self._getint('dlr-thrower', 'max_inflight', 0)
+
+        # Outgoing http connections pooling
+        self.http_persistent_connections = self._getbool('dlr-thrower', 'http_persistent_connections', True)
+        self.http_max_persistent_per_host = self._getint('dlr-thrower', 'http_max_persistent_per_host', 2)
+        self.http_cached_connection_timeout = self._getint('dlr-thrower', 'http_cached_connection_timeout', 240)
+        # 0 for unlimited concurrent requests per host
+        self.http_max_concurrent_per_host = self._getint('dlr-thrower', 'http_max_concurrent_per_host', 0)
 
         # #139: need configuration to send deliver_sm instead of data_sm for SMPP delivery receipt
         # 20150521: it seems better to get deliver_sm the default pdu for receipts
@@ -29,6 +29,13 @@ class CredentialGeneric(jasminApiGeneric):
     defaults = {}
     quotas = {}
     quotas_updated = False
+    # Set by jasmin.routing.ledger, quotas it manages are updated through it
+    quota_backend = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('quota_backend', None)
+        return state
 
     def setAuthorization(self, key, value):
         if key not in self.authorizations:
@@ -76,6 +83,8 @@ class CredentialGeneric(jasminApiGeneric):
             raise jasminApiCredentialError('%s is not a valid Quata key' % key)
 
         self.quotas[key] = value
+        if self.quota_backend is not None and self.quota_backend.manages(key):
+            self.quota_backend.setQuota(key, value)
 
     def updateQuota(self, key, difference):
         if key not in self.quotas:
@@ -86,6 +95,11 @@ class CredentialGeneric(jasminApiGeneric):
         if isinstance(self.quotas[key], int) and isinstance(difference, float):
             raise jasminApiCredentialError('Type mismatch, cannot update an int with a float value')
 
+        if self.quota_backend is not None and self.quota_backend.manages(key):
+            # Persisted by the backend
+            self.quota_backend.updateQuota(key, difference)
+            return
+
         # If quota is unlimited then initialize it to zero before update
         if self.quotas[key] is None:
             self.quotas[key] = 0
@@ -99,6 +113,13 @@ class CredentialGeneric(jasminApiGeneric):
 
         return self.quotas[key]
 
+    def getAvailableQuota(self, key):
+        """Return what can be charged from key, the backend may have less than getQuota() shows"""
+        if self.quota_backend is not None and self.quota_backend.manages(key):
+            return self.quota_backend.getAvailableQuota(key)
+
+        return self.getQuota(key)
+
 
 class MtMessagingCredential(CredentialGeneric):
     """Credential set for sending MT Messages through"""
@@ -0,0 +1,171 @@
+"""
+Append-only journal of user quota updates
+
+Balance and submit_sm_count updates are happening on every charged message, the journal makes them
+durable at the cost of one short line per update instead of a dump of all users; the users snapshot
+(<profile>.router-users) is rewritten (compacted) only once in a while.
+
+Every entry has a sequence number and the snapshot header records the last sequence it includes: a
+journal left untruncated by a crash right after a compaction will not get its entries replayed twice.
+
+Journal lines are:
+
+    <seq> + <uid> <cred> <quota> <difference>   # updateQuota()
+    <seq> = <uid> <cred> <quota> <value>        # setQuota()
+    <seq> #                                     # checkpoint, written when the journal is truncated
+"""
+
+import os
+import re
+
+UPDATE = '+'
+SET = '='
+CHECKPOINT = '#'
+
+_REGEX_SNAPSHOT_SEQ = re.compile(r'\[quotas journal (?P<seq>\d+)\]')
+
+
+def write_atomically(path, data):
+    """Write data to path through a temporary file renamed over it, path is never left half written"""
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def snapshot_header_suffix(seq):
+    """Return the snapshot header suffix recording the last journal sequence the snapshot includes"""
+    return ' [quotas journal %d]' % seq
+
+
+def snapshot_seq(header):
+    """Return the last journal sequence included in a snapshot given its header, 0 if not recorded"""
+    match = _REGEX_SNAPSHOT_SEQ.search(header)
+    if match is None:
+        return 0
+
+    return int(match.group('seq'))
+
+
+def encode_value(value):
+    if value is None:
+        return 'None'
+    return repr(value)
+
+
+def decode_value(value):
+    if value == 'None':
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_line(line):
+    """Return a (seq, op, uid, cred, quota, value) entry, raise ValueError if line is invalid"""
+    parts = line.decode('ascii').split(' ')
+    seq, op = int(parts[0]), parts[1]
+
+    if op == CHECKPOINT and len(parts) == 2:
+        return seq, op, None, None, None, None
+    elif op in (UPDATE, SET) and len(parts) == 6:
+        return seq, op, parts[2], parts[3], parts[4], decode_value(parts[5])
+
+    raise ValueError('Invalid journal line: %r' % line)
+
+
+class QuotaJournal:
+    """Journal file holder, the file is opened on first use
+
+    A torn (or otherwise invalid) tail left by a crash is dropped when the file is opened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = None
+        # Last sequence number, written entries and entries not synced to disk
+        self.seq = 0
+        self.entries = 0
+        self.unsynced = 0
+
+    def read(self):
+        """Return the valid entries of the journal file and the byte length they span"""
+        try:
+            with open(self.path, 'rb') as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return [], 0
+
+        entries = []
+        valid_length = 0
+        for line in data.split(b'\n')[:-1]:
+            try:
+                entries.append(parse_line(line))
+            except (ValueError, IndexError):
+                break
+            valid_length += len(line) + 1
+
+        return entries, valid_length
+
+    def open(self):
+        if self.fh is not None:
+            return
+
+        entries, valid_length = self.read()
+        for entry in entries:
+            self.seq = max(self.seq, entry[0])
+        self.entries = len([entry for entry in entries if entry[1] != CHECKPOINT])
+
+        self.fh = open(self.path, 'ab')
+        if self.fh.tell() > valid_length:
+            self.fh.truncate(valid_length)
+
+    def replay(self, after_seq):
+        """Return the update and set entries having a sequence greater than after_seq, following
+        sequences will be greater than after_seq as well"""
+        self.open()
+        self.seq = max(self.seq, after_seq)
+
+        entries, _ = self.read()
+        return [entry for entry in entries if entry[1] != CHECKPOINT and entry[0] > after_seq]
+
+    def append(self, op, uid, cred, quota, value):
+        """Append an entry, the entry is handed to the OS right away (it survives a process crash)
+        and is synced to disk by sync()"""
+        self.open()
+
+        self.seq += 1
+        self.fh.write(('%d %s %s %s %s %s\n' % (
+            self.seq, op, uid, cred, quota, encode_value(value))).encode('ascii'))
+        self.fh.flush()
+
+        self.entries += 1
+        self.unsynced += 1
+        return self.seq
+
+    def sync(self):
+        if self.fh is not None and self.unsynced > 0:
+            os.fsync(self.fh.fileno())
+            self.unsynced = 0
+
+    def truncate(self):
+        """Drop all entries, must be called once a snapshot including all of them is written"""
+        self.open()
+        self.fh.close()
+
+        write_atomically(self.path, ('%d %s\n' % (self.seq, CHECKPOINT)).encode('ascii'))
+
+        self.fh = open(self.path, 'ab')
+        self.entries = 0
+        self.unsynced = 0
+
+    def close(self):
+        if self.fh is not None:
+            self.sync()
+            self.fh.close()
+            self.fh = None
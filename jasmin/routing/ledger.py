@@ -0,0 +1,309 @@
+"""
+Redis quota ledger, shares user quotas between jasmind instances
+
+balance and submit_sm_count are kept in the quotas:<uid> redis hash, every instance takes leases
+(reservations) from it with an atomic check-and-decrement script and charges messages against its
+local lease: the hot path is only hitting redis once the lease falls below half its size, or when
+it cannot cover a charge (reserve() acquires the missing amount first, the charge is rejected if
+redis does not have it).
+
+Leases are given back when the ledger is stopped, the leases of an instance that crashed are lost
+from the users' balances.
+
+Attached credentials are going through the ledger when updateQuota() and setQuota() are called for
+a ledger quota, their quotas dict is mirroring the ledger view (what redis had at the last round
+trip plus the local lease) so getQuota() is left untouched.
+
+The first instance attaching a user seeds the hash with the user's persisted quotas, redis values
+are winning afterwards.
+"""
+
+from twisted.internet import defer, task
+
+# Ledger quotas and their types
+LEDGER_QUOTAS = {'balance': float, 'submit_sm_count': int}
+
+# Seeds the user quotas hash on first use, ARGV[3..] are field/value pairs
+_SEED = """
+if redis.call('HSETNX', KEYS[1], 'seeded', '1') == 1 then
+    for i = 3, #ARGV, 2 do
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+"""
+
+# Takes up to ARGV[2] from the ARGV[1] quota, returns taken and left amounts or nil if the quota
+# is unlimited
+ACQUIRE_SCRIPT = _SEED + """
+local left = redis.call('HGET', KEYS[1], ARGV[1])
+if not left then
+    return nil
+end
+left = tonumber(left)
+local taken = math.max(0, math.min(left, tonumber(ARGV[2])))
+if taken > 0 then
+    left = left - taken
+    redis.call('HSET', KEYS[1], ARGV[1], tostring(left))
+end
+return {tostring(taken), tostring(left)}
+"""
+
+# Adds ARGV[2] to the ARGV[1] quota (an unlimited quota is starting from 0), returns the new value
+ADD_SCRIPT = _SEED + """
+local left = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0') + tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], ARGV[1], tostring(left))
+return tostring(left)
+"""
+
+# Sets the ARGV[1] quota to ARGV[2], 'None' is making it unlimited
+SET_SCRIPT = _SEED + """
+if ARGV[2] == 'None' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+return 1
+"""
+
+
+def decode_number(value, _type):
+    if isinstance(value, bytes):
+        value = value.decode('ascii')
+
+    return _type(float(value))
+
+
+class UserQuotas:
+    """Ledger quotas of one user
+
+    For every quota, known is what redis had at the last round trip (None if unlimited) and lease
+    is what is reserved for this instance, a negative lease is a debt settled by the next acquire.
+    """
+
+    def __init__(self, ledger, uid, credential):
+        self.ledger = ledger
+        self.uid = uid
+        self.key = '%s:%s' % (ledger.key_prefix, uid)
+        self.credential = None
+
+        self.known = {}
+        self.lease = {}
+        # Deferreds waiting for the acquire in flight, by quota
+        self.acquiring = {}
+        # Bumped by setQuota(): in flight acquires are not crediting a lease taken before the set
+        self.generation = {}
+        for quota in LEDGER_QUOTAS:
+            self.known[quota] = credential.quotas[quota]
+            self.lease[quota] = 0
+            self.generation[quota] = 0
+
+        self.seed = []
+        for quota, value in sorted(self.known.items()):
+            if value is not None:
+                self.seed.extend([quota, repr(value)])
+
+        self.bind(credential)
+
+    def bind(self, credential):
+        self.credential = credential
+        credential.quota_backend = self
+        for quota in LEDGER_QUOTAS:
+            self.mirror(quota)
+
+    def manages(self, quota):
+        return quota in LEDGER_QUOTAS
+
+    def getQuota(self, quota):
+        if self.known[quota] is None:
+            return None
+
+        return LEDGER_QUOTAS[quota](self.known[quota] + self.lease[quota])
+
+    def getAvailableQuota(self, quota):
+        """What can be charged without asking redis: the lease, known is only a view"""
+        if self.known[quota] is None:
+            return None
+
+        return LEDGER_QUOTAS[quota](self.lease[quota])
+
+    def covers(self, quota, amount):
+        return self.known[quota] is None or self.lease[quota] >= amount
+
+    def mirror(self, quota):
+        if self.credential is not None:
+            self.credential.quotas[quota] = self.getQuota(quota)
+
+    def eval(self, script, quota, amount):
+        return self.ledger.redisClient.eval(script, keys=[self.key], args=[quota, amount] + self.seed)
+
+    def updateQuota(self, quota, difference):
+        if difference >= 0 or self.known[quota] is None:
+            # Credits (and updates of unlimited quotas) are going to redis
+            self.known[quota] = (self.known[quota] or 0) + difference
+            self.mirror(quota)
+            return self.add(quota, difference)
+
+        self.lease[quota] += difference
+        self.mirror(quota)
+        if self.lease[quota] < self.ledger.lease_sizes[quota] / 2:
+            return self.acquire(quota)
+
+    def setQuota(self, quota, value):
+        self.generation[quota] += 1
+        self.known[quota] = value
+        self.lease[quota] = 0
+        self.mirror(quota)
+
+        return self.call(SET_SCRIPT, quota, repr(value), lambda r: None)
+
+    def add(self, quota, difference):
+        generation = self.generation[quota]
+
+        def added(left):
+            if generation == self.generation[quota]:
+                self.known[quota] = decode_number(left, LEDGER_QUOTAS[quota])
+                self.mirror(quota)
+
+        return self.call(ADD_SCRIPT, quota, repr(difference), added)
+
+    def reserve(self, quota, amount):
+        """Make sure the lease covers amount, acquiring the missing part from redis if it does not,
+        fires with False when it cannot"""
+        if self.covers(quota, amount):
+            return defer.succeed(True)
+
+        waited = quota in self.acquiring
+        d = self.acquire(quota, amount)
+        if waited:
+            # The acquire in flight may not have taken enough for amount
+            d.addCallback(lambda _: None if self.covers(quota, amount) else self.acquire(quota, amount))
+        d.addCallback(lambda _: self.covers(quota, amount))
+        return d
+
+    def acquire(self, quota, amount=0):
+        """Top the lease up to the lease size or amount (and settle the debt), refreshes the known
+        value; waits for the acquire in flight if there's one"""
+        if quota in self.acquiring:
+            d = defer.Deferred()
+            self.acquiring[quota].append(d)
+            return d
+
+        self.acquiring[quota] = []
+        generation = self.generation[quota]
+        want = max(0, max(self.ledger.lease_sizes[quota], amount) - self.lease[quota])
+
+        def done():
+            for d in self.acquiring.pop(quota):
+                d.callback(None)
+
+        def acquired(r):
+            if generation != self.generation[quota]:
+                pass
+            elif r is None:
+                # Unlimited, a debt is not owed anymore
+                self.known[quota] = None
+                self.lease[quota] = 0
+                self.mirror(quota)
+            else:
+                taken, left = r
+                self.lease[quota] += decode_number(taken, LEDGER_QUOTAS[quota])
+                self.known[quota] = decode_number(left, LEDGER_QUOTAS[quota])
+                if self.known[quota] + self.lease[quota] < 0:
+                    self.ledger.log.warning('User [uid:%s] %s is overdrawn: %s', self.uid, quota,
+                                            self.known[quota] + self.lease[quota])
+                self.mirror(quota)
+            done()
+
+        def failed(_):
+            done()
+
+        return self.call(ACQUIRE_SCRIPT, quota, repr(want), acquired, failed)
+
+    def release(self):
+        """Give the leases back (or settle the debts)"""
+        dl = []
+        for quota in LEDGER_QUOTAS:
+            if self.lease[quota] != 0 and self.known[quota] is not None:
+                lease, self.lease[quota] = self.lease[quota], 0
+                dl.append(self.call(ADD_SCRIPT, quota, repr(lease), lambda r: None))
+
+        return defer.DeferredList(dl)
+
+    def sync(self):
+        return defer.DeferredList([self.acquire(quota) for quota in LEDGER_QUOTAS])
+
+    def call(self, script, quota, amount, callback, errback=None):
+        def error(e):
+            if errback is not None:
+                errback(e)
+            self.ledger.log.error('Redis quota ledger error for user [uid:%s] %s: %s', self.uid, quota, e)
+
+        d = self.eval(script, quota, amount)
+        d.addCallbacks(callback, error)
+        return d
+
+
+class QuotaLedger:
+    """Keeps the ledger quotas of attached users in redis"""
+
+    def __init__(self, redisClient, lease_sizes, log, key_prefix='quotas'):
+        self.redisClient = redisClient
+        self.lease_sizes = lease_sizes
+        self.log = log
+        self.key_prefix = key_prefix
+
+        self.users = {}
+        self.syncTimer = task.LoopingCall(self.sync)
+
+    def attach(self, user):
+        """Attach user's mt_credential to the ledger, a user already attached (e.g. reloaded from
+        disk) keeps its ledger state"""
+        uid = str(user.uid)
+        if uid in self.users:
+            if self.users[uid].credential is not user.mt_credential:
+                self.users[uid].bind(user.mt_credential)
+        else:
+            self.users[uid] = UserQuotas(self, uid, user.mt_credential)
+            self.users[uid].sync()
+
+    def reserve(self, uid, amounts):
+        """Make sure the user's leases cover amounts ({quota: amount}), fires with False when they
+        cannot"""
+        user_quotas = self.users.get(str(uid))
+        if user_quotas is None:
+            return defer.succeed(True)
+
+        d = defer.gatherResults([user_quotas.reserve(quota, amount)
+                                 for quota, amount in amounts.items() if amount > 0])
+        d.addCallback(all)
+        return d
+
+    def detach(self, uid):
+        user_quotas = self.users.pop(str(uid), None)
+        if user_quotas is None:
+            return defer.succeed(None)
+
+        user_quotas.credential.quota_backend = None
+        return user_quotas.release()
+
+    def attachUsers(self, users):
+        """Attach users and detach the ones not given"""
+        users = {str(user.uid): user for user in users}
+        for uid in list(self.users):
+            if uid not in users:
+                self.detach(uid)
+        for user in users.values():
+            self.attach(user)
+
+    def sync(self):
+        """Refresh every user's view and top the leases up"""
+        return defer.DeferredList([user_quotas.sync() for user_quotas in self.users.values()])
+
+    def start(self, sync_secs):
+        self.syncTimer.start(sync_secs, now=False)
+
+    def stop(self):
+        if self.syncTimer.running:
+            self.syncTimer.stop()
+
+        return defer.DeferredList([self.detach(uid) for uid in list(self.users)])
@@ -15,11 +15,16 @@ from jasmin.routing.InterceptionTables import (MOInterceptionTable,
                                                MTInterceptionTable,
                                                InvalidInterceptionTableParameterError)
 from jasmin.routing.RoutingTables import MORoutingTable, MTRoutingTable, InvalidRoutingTableParameterError
+from jasmin.routing import journal, ledger
 from jasmin.routing.content import RoutedDeliverSmContent
+from jasmin.tools import codec
 from jasmin.tools.migrations.configuration import ConfigurationMigrator
 
 LOG_CATEGORY = "jasmin-router"
 
+# Profile users are persisted to by the persistence timer, its quota updates are journaled
+QUOTAS_PROFILE = 'jcli-prod'
+
 
 class RouterPB(pb.Avatar):
     def __init__(self, RouterPBConfig, persistenceTimer=True):
@@ -49,11 +54,21 @@ class RouterPB(pb.Avatar):
         self.mt_routing_table = MTRoutingTable()
         self.users = []
         self.groups = []
+        # Lookup indexes, they must be kept in sync with self.users and self.groups
+        self.users_by_uid = {}
+        self.users_by_username = {}
+        self.groups_by_gid = {}
 
         # Init interception-related objects
         self.mo_interception_table = MOInterceptionTable()
         self.mt_interception_table = MTInterceptionTable()
 
+        # User quota updates journal, opened on first use
+        self.quota_journal = journal.QuotaJournal(
+            '%s/%s.router-quotas' % (self.config.store_path, QUOTAS_PROFILE))
+        # Redis quota ledger, set by addRedisClient() when quota_backend is redis
+        self.quota_ledger = None
+
         if persistenceTimer:
             # Activate persistenceTimer, used for persisting users and groups whenever critical updates
             # occured
@@ -108,6 +123,24 @@ class RouterPB(pb.Avatar):
             self.bill_request_submit_sm_resp_errback)
         self.log.info('RouterPB is consuming from routing key: %s', routingKey)
 
+    def addRedisClient(self, redisClient):
+        """Keep users balance and submit_sm_count in redis, shared with the other jasmind instances"""
+        self.quota_ledger = ledger.QuotaLedger(
+            redisClient,
+            {'balance': self.config.quota_lease_balance,
+             'submit_sm_count': self.config.quota_lease_submit_sm_count},
+            self.log)
+        self.quota_ledger.attachUsers(self.users_by_uid.values())
+        self.quota_ledger.start(self.config.quota_sync_secs)
+        self.log.info('Added redisClient to RouterPB, users quotas are kept in redis')
+
+    def stopQuotaLedger(self):
+        """Give the quota leases back to redis"""
+        if self.quota_ledger is None:
+            return defer.succeed(None)
+
+        return self.quota_ledger.stop()
+
     @defer.inlineCallbacks
     def rejectMessage(self, message):
         yield self.amqpBroker.chan.basic_reject(delivery_tag=message.delivery_tag, requeue=0)
@@ -137,19 +170,77 @@ class RouterPB(pb.Avatar):
         'This is run every self.config.persistence_timer_secs seconds'
         self.log.debug('persistenceTimerExpired called')
 
-        # If at least one user have its quotas updated, then persist
-        # groups and users to disk
-        for u in self.users:
-            if u.mt_credential.quotas_updated:
-                self.log.info('Detected a user quota update, users and groups will be persisted.')
-                self.perspective_persist(scope='groups')
-                self.perspective_persist(scope='users')
-                u.mt_credential.quotas_updated = False
-                self.log.debug('Persisted successfully')
-                break
+        # Quota updates are journaled as they happen, make them durable and compact the
+        # journal into users snapshot once it is grown enough (or if any update was not journaled)
+        try:
+            self.quota_journal.sync()
+        except IOError as e:
+            self.log.error('Cannot sync quotas journal %s: %s', self.quota_journal.path, e)
+
+        persist = False
+        if self.quota_journal.entries >= self.config.quota_journal_compaction_entries:
+            self.log.info('Quotas journal holds %s entries, users and groups will be persisted.',
+                          self.quota_journal.entries)
+            persist = True
+        else:
+            # Quotas updated without being journaled
+            for u in self.users:
+                if u.mt_credential.quotas_updated:
+                    self.log.info('Detected a user quota update, users and groups will be persisted.')
+                    u.mt_credential.quotas_updated = False
+                    persist = True
+                    break
+
+        if persist:
+            self.perspective_persist(scope='groups')
+            self.perspective_persist(scope='users')
+            self.log.debug('Persisted successfully')
 
         self.activatePersistenceTimer()
 
+    def journalQuota(self, op, user, cred, quota, value):
+        """Append a quota update to the journal, the credential's quotas_updated flag is left
+        set when journaling fails: users and groups get persisted by the persistence timer"""
+        _cred = getattr(user, cred)
+        if _cred.quota_backend is not None and _cred.quota_backend.manages(quota):
+            # Kept in redis
+            return
+
+        try:
+            self.quota_journal.append(op, user.uid, cred, quota, value)
+        except IOError as e:
+            self.log.error('Cannot journal quota update [uid:%s] %s/%s %s %s: %s',
+                           user.uid, cred, quota, op, value, e)
+        else:
+            _cred.quotas_updated = False
+
+    def replayQuotaJournal(self, after_seq):
+        """Apply the journaled quota updates having a sequence greater than after_seq"""
+        try:
+            entries = self.quota_journal.replay(after_seq)
+        except IOError as e:
+            self.log.error('Cannot replay quotas journal %s: %s', self.quota_journal.path, e)
+            return
+
+        replayed = 0
+        for _, op, uid, cred, quota, value in entries:
+            _user = self.users_by_uid.get(uid)
+            if _user is None or not hasattr(_user, cred):
+                continue
+
+            try:
+                if op == journal.SET:
+                    getattr(_user, cred).setQuota(quota, value)
+                else:
+                    getattr(_user, cred).updateQuota(quota, value)
+            except Exception as e:
+                self.log.error('Cannot replay quota update [uid:%s] %s/%s %s %s: %s',
+                               uid, cred, quota, op, value, e)
+            else:
+                replayed += 1
+
+        self.log.info('Replayed %s quota updates from quotas journal (after #%s)', replayed, after_seq)
+
     @defer.inlineCallbacks
     def deliver_sm_callback(self, message):
         """This callback is a queue listener
@@ -161,7 +252,7 @@ class RouterPB(pb.Avatar):
         scid = message.content.properties['headers']['connector-id']
         concatenated = message.content.properties['headers']['concatenated']
         will_be_concatenated = message.content.properties['headers']['will_be_concatenated']
-        routable = pickle.loads(message.content.body)
+        routable = codec.loads(message.content.body)
         self.log.debug("Callbacked a deliver_sm with a DeliverSmPDU[%s] (?): %s", msgid, routable.pdu)
 
         # @todo: Implement MO throttling here, same as in
@@ -213,7 +304,8 @@ class RouterPB(pb.Avatar):
                 yield self.ackMessage(message)
 
                 # Enqueue DeliverSm for delivery through publishing it to deliver_sm_thrower.(type)
-                content = RoutedDeliverSmContent(routable.pdu, msgid, scid, routedConnectors, route_type)
+                content = RoutedDeliverSmContent(routable.pdu, msgid, scid, routedConnectors, route_type,
+                                                 codec=self.config.pdu_codec)
                 self.log.debug("Publishing RoutedDeliverSmContent [msgid:%s] in deliver_sm_thrower.%s",
                                msgid, routedConnectors[0]._type)
                 yield self.amqpBroker.publish(exchange='messaging', routing_key='deliver_sm_thrower.%s' %
@@ -250,14 +342,18 @@ class RouterPB(pb.Avatar):
         if _user is None:
             self.log.error("User [uid:%s] not found, billing request [bid:%s] rejected", uid, bid)
             yield self.rejectMessage(message)
-        elif _user.mt_credential.getQuota('balance') is not None:
-            if _user.mt_credential.getQuota('balance') < amount:
+        elif _user.mt_credential.getAvailableQuota('balance') is not None:
+            if self.quota_ledger is not None:
+                yield self.quota_ledger.reserve(uid, {'balance': amount})
+
+            if _user.mt_credential.getAvailableQuota('balance') < amount:
                 self.log.error(
                     'User [uid:%s] have no sufficient balance (%s/%s) for this billing [bid:%s] request: rejected',
-                    uid, _user.mt_credential.getQuota('balance'), amount, bid)
+                    uid, _user.mt_credential.getAvailableQuota('balance'), amount, bid)
                 yield self.rejectMessage(message)
             else:
                 _user.mt_credential.updateQuota('balance', -amount)
+                self.journalQuota(journal.UPDATE, _user, 'mt_credential', 'balance', -amount)
                 self.log.info('User [uid:%s] charged for amount: %s (bid:%s)', uid, amount, bid)
                 yield self.ackMessage(message)
 
@@ -286,36 +382,80 @@ class RouterPB(pb.Avatar):
     def getMTRoutingTable(self):
         return self.mt_routing_table
 
+    def indexUser(self, user):
+        """Add user to self.users and to the lookup indexes"""
+        self.users.append(user)
+        self.users_by_uid[str(user.uid)] = user
+        self.users_by_username[user.username] = user
+
+        if self.quota_ledger is not None:
+            self.quota_ledger.attach(user)
+
+    def unindexUser(self, user):
+        """Remove user from self.users and from the lookup indexes"""
+        self.users.remove(user)
+        if self.users_by_uid.get(str(user.uid)) is user:
+            del self.users_by_uid[str(user.uid)]
+            if self.quota_ledger is not None:
+                self.quota_ledger.detach(user.uid)
+        if self.users_by_username.get(user.username) is user:
+            del self.users_by_username[user.username]
+
+    def indexGroup(self, group):
+        """Add group to self.groups and to the lookup index, replacing any group having the same gid"""
+        _group = self.groups_by_gid.get(str(group.gid))
+        if _group is not None:
+            self.groups.remove(_group)
+
+        self.groups.append(group)
+        self.groups_by_gid[str(group.gid)] = group
+
+    def unindexGroup(self, group):
+        """Remove group from self.groups and from the lookup index"""
+        self.groups.remove(group)
+        if self.groups_by_gid.get(str(group.gid)) is group:
+            del self.groups_by_gid[str(group.gid)]
+
     def authenticateUser(self, username, password, return_pickled=False):
         """Authenticate a user agains username and password and return user object or None
         """
         # Find user having correct username/password
-        for _user in self.users:
-            if _user.username == username and _user.password == md5(password.encode('ascii')).digest():
-                self.log.debug('authenticateUser [username:%s] returned a User', username)
-
-                # Check if user's group is enabled
-                _group = self.getGroup(_user.group.gid)
-                if _group is not None and not _group.enabled:
-                    self.log.info('authenticateUser [username:%s] returned None (group %s is disabled)',
-                                  username, _user.group)
-                    return None
-
-                # Check if user is enabled
-                if not _user.enabled:
-                    self.log.info('authenticateUser [username:%s] returned None (user is disabled)',
-                                  username)
-                    return None
-
-                # If user/group are enabled:
-                if return_pickled:
-                    return pickle.dumps(_user, self.pickleProtocol)
-                else:
-                    return _user
+        _user = self.users_by_username.get(username)
+        if _user is not None and _user.password == md5(password.encode('ascii')).digest():
+            self.log.debug('authenticateUser [username:%s] returned a User', username)
+
+            # Check if user's group is enabled
+            _group = self.getGroup(_user.group.gid)
+            if _group is not None and not _group.enabled:
+                self.log.info('authenticateUser [username:%s] returned None (group %s is disabled)',
+                              username, _user.group)
+                return None
+
+            # Check if user is enabled
+            if not _user.enabled:
+                self.log.info('authenticateUser [username:%s] returned None (user is disabled)',
+                              username)
+                return None
+
+            # If user/group are enabled:
+            if return_pickled:
+                return pickle.dumps(_user, self.pickleProtocol)
+            else:
+                return _user
 
         self.log.info('authenticateUser [username:%s] returned None', username)
         return None
 
+    def reserveQuotas(self, user, bill, submit_sm_count=1):
+        """Make sure the quota ledger leases are covering the bill before charging it, fires with
+        False when they cannot (always True without a quota ledger)"""
+        if self.quota_ledger is None:
+            return defer.succeed(True)
+
+        return self.quota_ledger.reserve(user.uid, {
+            'balance': bill.getTotalAmounts() * submit_sm_count,
+            'submit_sm_count': bill.getAction('decrement_submit_sm_count') * submit_sm_count})
+
     def chargeUserForSubmitSms(self, user, bill, submit_sm_count=1, requirements=None):
         """Will charge the user using the bill object after checking requirements
         """
@@ -336,46 +476,59 @@ class RouterPB(pb.Avatar):
 
         # Charge _user
         if (bill.getAmount('submit_sm') * submit_sm_count > 0
-            and _user.mt_credential.getQuota('balance') is not None):
-            if _user.mt_credential.getQuota('balance') < bill.getAmount('submit_sm') * submit_sm_count:
+            and _user.mt_credential.getAvailableQuota('balance') is not None):
+            if _user.mt_credential.getAvailableQuota('balance') < bill.getAmount('submit_sm') * submit_sm_count:
                 self.log.info('User [uid:%s] have no sufficient balance (%s) for submit_sm charging: %s',
-                              user.uid, _user.mt_credential.getQuota('balance'),
+                              user.uid, _user.mt_credential.getAvailableQuota('balance'),
                               bill.getAmount('submit_sm') * submit_sm_count)
                 return None
             _user.mt_credential.updateQuota('balance', -(bill.getAmount('submit_sm') * submit_sm_count))
+            self.journalQuota(journal.UPDATE, _user, 'mt_credential', 'balance',
+                              -(bill.getAmount('submit_sm') * submit_sm_count))
             self.log.info('User [uid:%s] charged for submit_sm amount: %s',
                           user.uid, bill.getAmount('submit_sm') * submit_sm_count)
         # Decrement counts
         if (bill.getAction('decrement_submit_sm_count') * submit_sm_count > 0
-            and _user.mt_credential.getQuota('submit_sm_count') is not None):
-            if _user.mt_credential.getQuota('submit_sm_count') < bill.getAction(
+            and _user.mt_credential.getAvailableQuota('submit_sm_count') is not None):
+            if _user.mt_credential.getAvailableQuota('submit_sm_count') < bill.getAction(
                     'decrement_submit_sm_count') * submit_sm_count:
                 self.log.info('User [uid:%s] have no sufficient submit_sm_count (%s) for submit_sm charging: %s',
-                              user.uid, _user.mt_credential.getQuota('submit_sm_count'),
+                              user.uid, _user.mt_credential.getAvailableQuota('submit_sm_count'),
                               bill.getAction('decrement_submit_sm_count') * submit_sm_count)
                 return None
             _user.mt_credential.updateQuota(
                 'submit_sm_count',
                 -(bill.getAction('decrement_submit_sm_count') * submit_sm_count))
+            self.journalQuota(journal.UPDATE, _user, 'mt_credential', 'submit_sm_count',
+                              -(bill.getAction('decrement_submit_sm_count') * submit_sm_count))
             self.log.info('User\'s [uid:%s] submit_sm_count decremented for submit_sm: %s',
                           user.uid, bill.getAction('decrement_submit_sm_count') * submit_sm_count)
 
         return True
 
     def getUser(self, uid):
-        for _user in self.users:
-            if str(_user.uid) == str(uid):
-                self.log.debug('getUser [uid:%s] returned a User', uid)
-                return _user
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            self.log.debug('getUser [uid:%s] returned a User', uid)
+            return _user
 
         self.log.debug('getUser [uid:%s] returned None', uid)
         return None
 
+    def getUserByUsername(self, username):
+        _user = self.users_by_username.get(username)
+        if _user is not None:
+            self.log.debug('getUserByUsername [username:%s] returned a User', username)
+            return _user
+
+        self.log.debug('getUserByUsername [username:%s] returned None', username)
+        return None
+
     def getGroup(self, gid):
-        for _group in self.groups:
-            if str(_group.gid) == str(gid):
-                self.log.debug('getGroup [gid:%s] returned a Group', gid)
-                return _group
+        _group = self.groups_by_gid.get(str(gid))
+        if _group is not None:
+            self.log.debug('getGroup [gid:%s] returned a Group', gid)
+            return _group
 
         self.log.debug('getGroup [gid:%s] returned None', gid)
         return None
@@ -438,12 +591,10 @@ class RouterPB(pb.Avatar):
                 self.log.info('Persisting current Groups configuration to [%s] profile in %s',
                               profile, path)
 
-                fh = open(path, 'wb')
                 # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.groups, self.pickleProtocol))
-                fh.close()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())
+                ).encode('ascii') + pickle.dumps(self.groups, self.pickleProtocol))
 
                 # Set persistance state to True
                 self.persistenceState['groups'] = True
@@ -454,12 +605,16 @@ class RouterPB(pb.Avatar):
                 self.log.info('Persisting current Users configuration to [%s] profile in %s',
                               profile, path)
 
-                fh = open(path, 'wb')
-                # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.users, self.pickleProtocol))
-                fh.close()
+                # Write configuration with datetime stamp and the last journaled quota update it includes
+                self.quota_journal.open()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]%s\n' % (time.strftime("%c"), jasmin.get_release(),
+                                                         journal.snapshot_header_suffix(self.quota_journal.seq))
+                ).encode('ascii') + pickle.dumps(self.users, self.pickleProtocol))
+
+                # Journaled quota updates are all in the snapshot now
+                if profile == QUOTAS_PROFILE:
+                    self.quota_journal.truncate()
 
                 # Set persistance state to True
                 self.persistenceState['users'] = True
@@ -471,12 +626,10 @@ class RouterPB(pb.Avatar):
                 path = '%s/%s.router-moroutes' % (self.config.store_path, profile)
                 self.log.info('Persisting current MORoutingTable to [%s] profile in %s', profile, path)
 
-                fh = open(path, 'wb')
                 # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.mo_routing_table, self.pickleProtocol))
-                fh.close()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())
+                ).encode('ascii') + pickle.dumps(self.mo_routing_table, self.pickleProtocol))
 
                 # Set persistance state to True
                 self.persistenceState['moroutes'] = True
@@ -486,12 +639,10 @@ class RouterPB(pb.Avatar):
                 path = '%s/%s.router-mtroutes' % (self.config.store_path, profile)
                 self.log.info('Persisting current MTRoutingTable to [%s] profile in %s', profile, path)
 
-                fh = open(path, 'wb')
                 # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.mt_routing_table, self.pickleProtocol))
-                fh.close()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())
+                ).encode('ascii') + pickle.dumps(self.mt_routing_table, self.pickleProtocol))
 
                 # Set persistance state to True
                 self.persistenceState['mtroutes'] = True
@@ -502,12 +653,10 @@ class RouterPB(pb.Avatar):
                 self.log.info('Persisting current MOInterceptionTable to [%s] profile in %s',
                               profile, path)
 
-                fh = open(path, 'wb')
                 # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.mo_interception_table, self.pickleProtocol))
-                fh.close()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())
+                ).encode('ascii') + pickle.dumps(self.mo_interception_table, self.pickleProtocol))
 
                 # Set persistance state to True
                 self.persistenceState['mointerceptors'] = True
@@ -518,12 +667,10 @@ class RouterPB(pb.Avatar):
                 self.log.info('Persisting current MTInterceptionTable to [%s] profile in %s',
                               profile, path)
 
-                fh = open(path, 'wb')
                 # Write configuration with datetime stamp
-                fh.write(
-                    ('Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())).encode('ascii'))
-                fh.write(pickle.dumps(self.mt_interception_table, self.pickleProtocol))
-                fh.close()
+                journal.write_atomically(path, (
+                    'Persisted on %s [Jasmin %s]\n' % (time.strftime("%c"), jasmin.get_release())
+                ).encode('ascii') + pickle.dumps(self.mt_interception_table, self.pickleProtocol))
 
                 # Set persistance state to True
                 self.persistenceState['mtinterceptors'] = True
@@ -558,7 +705,8 @@ class RouterPB(pb.Avatar):
                 self.perspective_group_remove_all()
 
                 # Adding new groups
-                self.groups = cf.getMigratedData()
+                for _group in cf.getMigratedData():
+                    self.indexGroup(_group)
                 self.log.info('Added new Groups (%d)', len(self.groups))
 
                 # Set persistance state to True
@@ -583,9 +731,14 @@ class RouterPB(pb.Avatar):
                 self.perspective_user_remove_all()
 
                 # Adding new users
-                self.users = cf.getMigratedData()
+                for _user in cf.getMigratedData():
+                    self.indexUser(_user)
                 self.log.info('Added new Users (%d)', len(self.users))
 
+                # Replay quota updates journaled after the snapshot was written
+                if profile == QUOTAS_PROFILE:
+                    self.replayQuotaJournal(journal.snapshot_seq(lines[0].decode('ascii')))
+
                 # Set persistance state to True
                 self.persistenceState['users'] = True
                 for u in self.users:
@@ -705,25 +858,26 @@ class RouterPB(pb.Avatar):
         self.log.info('Adding a User (id:%s)', user.uid)
 
         # Check if group exists
-        foundGroup = False
-        for _group in self.groups:
-            if _group.gid == user.group.gid:
-                foundGroup = True
-        if not foundGroup:
+        if str(user.group.gid) not in self.groups_by_gid:
             self.log.error("Group with id:%s not found, cancelling user adding.", user.group.gid)
             return False
 
         # Replace existant users
-        for _user in self.users:
-            if user.uid == _user.uid or user.username == _user.username:
-                self.log.warning('User (id:%s) already existant, will be replaced !', user.uid)
-                self.users.remove(_user)
+        _user = self.users_by_uid.get(str(user.uid), self.users_by_username.get(user.username))
+        if _user is not None:
+            self.log.warning('User (id:%s) already existant, will be replaced !', user.uid)
+            self.unindexUser(_user)
 
-                # Save old CnxStatus in new user
-                user.setCnxStatus(_user.getCnxStatus())
-                break
+            # Save old CnxStatus in new user
+            user.setCnxStatus(_user.getCnxStatus())
 
-        self.users.append(user)
+            # Another user may still hold the new user's username
+            _user = self.users_by_username.get(user.username)
+            if _user is not None:
+                self.log.warning('User (id:%s) have the same username, will be replaced !', _user.uid)
+                self.unindexUser(_user)
+
+        self.indexUser(user)
 
         # Set persistance state to False (pending for persistance)
         self.persistenceState['users'] = False
@@ -740,13 +894,13 @@ class RouterPB(pb.Avatar):
         self.log.info('Enabling a User (id:%s)', uid)
 
         # Enable user
-        for _user in self.users:
-            if uid == _user.uid:
-                _user.enable()
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            _user.enable()
 
-                # Set persistance state to False (pending for persistance)
-                self.persistenceState['users'] = False
-                return True
+            # Set persistance state to False (pending for persistance)
+            self.persistenceState['users'] = False
+            return True
 
         self.log.error("User with id:%s not found, not enabling it.", uid)
         return False
@@ -755,13 +909,13 @@ class RouterPB(pb.Avatar):
         self.log.info('Disabling a User (id:%s)', uid)
 
         # Disable user
-        for _user in self.users:
-            if uid == _user.uid:
-                _user.disable()
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            _user.disable()
 
-                # Set persistance state to False (pending for persistance)
-                self.persistenceState['users'] = False
-                return True
+            # Set persistance state to False (pending for persistance)
+            self.persistenceState['users'] = False
+            return True
 
         self.log.error("User with id:%s not found, not disabling it.", uid)
         return False
@@ -770,13 +924,13 @@ class RouterPB(pb.Avatar):
         self.log.info('Removing a User (id:%s)', uid)
 
         # Remove user
-        for _user in self.users:
-            if uid == _user.uid:
-                self.users.remove(_user)
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            self.unindexUser(_user)
 
-                # Set persistance state to False (pending for persistance)
-                self.persistenceState['users'] = False
-                return True
+            # Set persistance state to False (pending for persistance)
+            self.persistenceState['users'] = False
+            return True
 
         self.log.error("User with id:%s not found, not removing it.", uid)
         return False
@@ -784,7 +938,8 @@ class RouterPB(pb.Avatar):
     def perspective_user_remove_all(self):
         self.log.info('Removing all users')
 
-        self.users = []
+        for _user in copy(self.users):
+            self.unindexUser(_user)
 
         # Set persistance state to False (pending for persistance)
         self.persistenceState['users'] = False
@@ -809,28 +964,29 @@ class RouterPB(pb.Avatar):
         self.log.info('Setting a User (id:%s) quota: %s/%s %s', uid, cred, quota, value)
 
         # Find user
-        for _user in self.users:
-            if uid == _user.uid:
-                try:
-                    if not hasattr(_user, cred):
-                        raise Exception("Invalid cred: %s", cred)
-                    else:
-                        _cred = getattr(_user, cred)
-
-                    if quota not in _cred.quotas:
-                        raise Exception("Unknown quota: %s", quota)
-
-                    # Update the quota
-                    _cred.setQuota(quota, value)
-
-                except Exception as e:
-                    self.log.error("Error updating user (id:%s): %s", uid, e)
-                    return False
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            try:
+                if not hasattr(_user, cred):
+                    raise Exception("Invalid cred: %s", cred)
                 else:
-                    # Successful update !
-                    # Set persistance state to False (pending for persistance)
-                    self.persistenceState['users'] = False
-                    return True
+                    _cred = getattr(_user, cred)
+
+                if quota not in _cred.quotas:
+                    raise Exception("Unknown quota: %s", quota)
+
+                # Update the quota
+                _cred.setQuota(quota, value)
+                self.journalQuota(journal.SET, _user, cred, quota, value)
+
+            except Exception as e:
+                self.log.error("Error updating user (id:%s): %s", uid, e)
+                return False
+            else:
+                # Successful update !
+                # Set persistance state to False (pending for persistance)
+                self.persistenceState['users'] = False
+                return True
 
         self.log.error("User with id:%s not found, not updating it.", uid)
 
@@ -840,28 +996,29 @@ class RouterPB(pb.Avatar):
         self.log.info('Updating a User (id:%s) quota: %s/%s %s', uid, cred, quota, value)
 
         # Find user
-        for _user in self.users:
-            if uid == _user.uid:
-                try:
-                    if not hasattr(_user, cred):
-                        raise Exception("Invalid cred: %s", cred)
-                    else:
-                        _cred = getattr(_user, cred)
-
-                    if quota not in _cred.quotas:
-                        raise Exception("Unknown quota: %s", quota)
-
-                    # Update the quota
-                    _cred.updateQuota(quota, value)
-
-                except Exception as e:
-                    self.log.error("Error updating user (id:%s): %s", uid, e)
-                    return False
+        _user = self.users_by_uid.get(str(uid))
+        if _user is not None:
+            try:
+                if not hasattr(_user, cred):
+                    raise Exception("Invalid cred: %s", cred)
                 else:
-                    # Successful update !
-                    # Set persistance state to False (pending for persistance)
-                    self.persistenceState['users'] = False
-                    return True
+                    _cred = getattr(_user, cred)
+
+                if quota not in _cred.quotas:
+                    raise Exception("Unknown quota: %s", quota)
+
+                # Update the quota
+                _cred.updateQuota(quota, value)
+                self.journalQuota(journal.UPDATE, _user, cred, quota, value)
+
+            except Exception as e:
+                self.log.error("Error updating user (id:%s): %s", uid, e)
+                return False
+            else:
+                # Successful update !
+                # Set persistance state to False (pending for persistance)
+                self.persistenceState['users'] = False
+                return True
 
         self.log.error("User with id:%s not found, not updating it.", uid)
 
@@ -872,12 +1029,7 @@ class RouterPB(pb.Avatar):
         self.log.info('Adding a Group (id:%s)', group.gid)
 
         # Replace existant groups
-        for _group in self.groups:
-            if group.gid == _group.gid:
-                self.groups.remove(_group)
-                break
-
-        self.groups.append(group)
+        self.indexGroup(group)
 
         # Set persistance state to False (pending for persistance)
         self.persistenceState['groups'] = False
@@ -888,13 +1040,13 @@ class RouterPB(pb.Avatar):
         self.log.info('Enabling a Group (id:%s)', gid)
 
         # Enable group
-        for _group in self.groups:
-            if gid == _group.gid:
-                _group.enable()
+        _group = self.groups_by_gid.get(str(gid))
+        if _group is not None:
+            _group.enable()
 
-                # Set persistance state to False (pending for persistance)
-                self.persistenceState['groups'] = False
-                return True
+            # Set persistance state to False (pending for persistance)
+            self.persistenceState['groups'] = False
+            return True
 
         self.log.error("Group with id:%s not found, not enabling it.", gid)
         return False
@@ -903,13 +1055,13 @@ class RouterPB(pb.Avatar):
         self.log.info('Disabling a Group (id:%s)', gid)
 
         # Disable group
-        for _group in self.groups:
-            if gid == _group.gid:
-                _group.disable()
+        _group = self.groups_by_gid.get(str(gid))
+        if _group is not None:
+            _group.disable()
 
-                # Set persistance state to False (pending for persistance)
-                self.persistenceState['groups'] = False
-                return True
+            # Set persistance state to False (pending for persistance)
+            self.persistenceState['groups'] = False
+            return True
 
         self.log.error("Group with id:%s not found, not disabling it.", gid)
         return False
@@ -918,18 +1070,18 @@ class RouterPB(pb.Avatar):
         self.log.info('Removing a Group (id:%s)', gid)
 
         # Remove group
-        for _group in self.groups:
-            if gid == _group.gid:
-                # Remove users from this group
-                _users = copy(self.users)
-                for _user in _users:
-                    if _user.group.gid == _group.gid:
-                        self.log.info('Removing a User (id:%s) from the Group (id:%s)', _user.uid, gid)
-                        self.users.remove(_user)
-
-                # Safely remove this group
-                self.groups.remove(_group)
-                return True
+        _group = self.groups_by_gid.get(str(gid))
+        if _group is not None:
+            # Remove users from this group
+            _users = copy(self.users)
+            for _user in _users:
+                if _user.group.gid == _group.gid:
+                    self.log.info('Removing a User (id:%s) from the Group (id:%s)', _user.uid, gid)
+                    self.unindexUser(_user)
+
+            # Safely remove this group
+            self.unindexGroup(_group)
+            return True
 
         self.log.error("Group with id:%s not found, not removing it.", gid)
 
@@ -942,7 +1094,7 @@ class RouterPB(pb.Avatar):
         self.log.info('Removing all groups')
 
         # Remove group
-        for _group in self.groups:
+        for _group in copy(self.groups):
             self.log.debug('Removing a Group: %s', _group)
             self.log.info('Removing a Group (id:%s)', _group.gid)
 
@@ -952,9 +1104,9 @@ class RouterPB(pb.Avatar):
                 if _user.group.gid == _group.gid:
                     self.log.info('Removing a User (id:%s) from the Group (id:%s)',
                                   _user.uid, _group.gid)
-                    self.users.remove(_user)
+                    self.unindexUser(_user)
 
-        self.groups = []
+            self.unindexGroup(_group)
 
         # Set persistance state to False (pending for persistance)
         self.persistenceState['groups'] = False
@@ -0,0 +1,33 @@
+from jasmin.tools.singleton import Singleton
+from jasmin.tools.stats import Stats
+
+
+class ThrowerStatistics(Stats):
+    """One thrower statistics holder"""
+
+    def __init__(self, name):
+        self.name = name
+
+        self.init()
+
+    def init(self):
+        self._stats = {
+            'http_pool_hit_count': 0,
+            'http_pool_miss_count': 0,
+            'inflight_count': 0,
+        }
+
+    def getStats(self):
+        return self._stats
+
+
+class ThrowerStatsCollector(metaclass=Singleton):
+    """Throwers statistics collection holder"""
+    throwers = {}
+
+    def get(self, name):
+        """Return a thrower's stats object or instanciate a new one"""
+        if name not in self.throwers:
+            self.throwers[name] = ThrowerStatistics(name)
+
+        return self.throwers[name]
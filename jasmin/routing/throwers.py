@@ -3,11 +3,12 @@ import pickle
 import sys
 import logging
 from logging.handlers import TimedRotatingFileHandler
+from urllib.parse import urlparse
 
 from twisted.application.service import Service
 from twisted.internet import defer
 from twisted.internet import reactor
-from twisted.web.client import Agent
+from twisted.web.client import Agent, HTTPConnectionPool
 from txamqp.queue import Closed
 from treq.client import HTTPClient
 from treq import text_content
@@ -18,7 +19,11 @@ from jasmin.protocols.smpp.factory import SMPPServerFactory
 from jasmin.protocols.smpp.operations import SMPPOperationFactory
 from jasmin.protocols.smpp.proxies import SMPPServerPBProxy
 from jasmin.protocols.http.errors import HttpApiError
-
+from jasmin.queues.retry import retry_count, original_routing_key
+from jasmin.routing.stats import ThrowerStatsCollector
+from jasmin.tools import codec
+from jasmin.tools.latency import LatencyStatsCollector
+from jasmin.tools.retrials import RetrialTracker
 
 
 class MessageAcknowledgementError(Exception):
@@ -46,6 +51,22 @@ class DeliveringFailed(Exception):
     """Raised when delivering a pdu errored"""
 
 
+class ThrowerHTTPConnectionPool(HTTPConnectionPool):
+    """A HTTPConnectionPool counting reused (hits) and new (misses) connections"""
+
+    def __init__(self, _reactor, stats, persistent=True):
+        HTTPConnectionPool.__init__(self, _reactor, persistent)
+        self.stats = stats
+
+    def getConnection(self, key, endpoint):
+        if len(self._connections.get(key, [])) > 0:
+            self.stats.inc('http_pool_hit_count')
+        else:
+            self.stats.inc('http_pool_miss_count')
+
+        return HTTPConnectionPool.getConnection(self, key, endpoint)
+
+
 class Thrower(Service):
     name = 'abstract thrower'
     log_category = 'abstract-thrower'
@@ -56,7 +77,6 @@ class Thrower(Service):
     callback = None
     errback = None
     requeueTimers = {}
-    throwing_retrials = {}
 
     def __init__(self, config):
         self.config = config
@@ -71,6 +91,23 @@ class Thrower(Service):
         self.smpps = None
         self.smpps_access = None
 
+        self.stats = ThrowerStatsCollector().get(self.name)
+        self.throwing_retrials = RetrialTracker(self.name, self.config.retrials_max_size, self.config.retrials_ttl)
+
+        # One http connection pool shared by all throws
+        self.http_pool = ThrowerHTTPConnectionPool(reactor, self.stats,
+                                                   persistent=self.config.http_persistent_connections)
+        self.http_pool.maxPersistentPerHost = self.config.http_max_persistent_per_host
+        self.http_pool.cachedConnectionTimeout = self.config.http_cached_connection_timeout
+        self.http_client = HTTPClient(Agent(reactor, pool=self.http_pool))
+        self.http_host_semaphores = {}
+
+        # Bound the number of messages being thrown at once, 0 for unlimited
+        if self.config.max_inflight > 0:
+            self.inflight_semaphore = defer.DeferredSemaphore(self.config.max_inflight)
+        else:
+            self.inflight_semaphore = None
+
         # Set up a dedicated logger
         self.log = logging.getLogger(self.log_category)
         if len(self.log.handlers) != 1:
@@ -92,6 +129,7 @@ class Thrower(Service):
 
         if isinstance(smpps, SMPPServerPBProxy):
             self.smpps_access = 'perspectivebroker'
+            smpps.log = self.log
         elif isinstance(smpps, SMPPServerFactory):
             self.smpps_access = 'direct'
 
@@ -101,23 +139,45 @@ class Thrower(Service):
         return self.throwing_retrials.get(message.content.properties['message-id'], 0)
 
     def delThrowingRetrials(self, message):
-        if message.content.properties['message-id'] in self.throwing_retrials:
-            del self.throwing_retrials[message.content.properties['message-id']]
-            return True
-        else:
-            return False
+        return self.throwing_retrials.pop(message.content.properties['message-id']) is not None
 
     def incThrowingRetrials(self, message):
-        if message.content.properties['message-id'] in self.throwing_retrials:
-            self.throwing_retrials[message.content.properties['message-id']] += 1
+        # Messages coming back from a retry queue are carrying their retry count
+        self.throwing_retrials.inc(message.content.properties['message-id'], 1 + retry_count(message))
+
+    def consume(self):
+        """Get the next message from thrower_q and throw it, waiting for a free in-flight
+        slot first when max_inflight is set"""
+        if self.inflight_semaphore is None:
+            d = self.thrower_q.get()
         else:
-            self.throwing_retrials[message.content.properties['message-id']] = 1
+            d = self.inflight_semaphore.acquire()
+            d.addCallback(lambda _: self.thrower_q.get())
+            d.addErrback(self._release_inflight)
+
+        d.addCallback(self.throw).addErrback(self.errback)
+
+    def _release_inflight(self, result):
+        if self.inflight_semaphore is not None:
+            self.inflight_semaphore.release()
+
+        return result
+
+    def throw(self, message):
+        self.stats.inc('inflight_count')
+
+        def _done(result):
+            self.stats.dec('inflight_count')
+            return self._release_inflight(result)
+
+        return LatencyStatsCollector().timeDeferred(
+            defer.maybeDeferred(self.callback, message), 'throw', self.name).addBoth(_done)
 
     def throwing_callback(self, message):
         # Init retrial mechanism
         self.incThrowingRetrials(message)
 
-        self.thrower_q.get().addCallback(self.callback).addErrback(self.errback)
+        self.consume()
 
     def throwing_errback(self, error):
         """It appears that when closing a queue with the close() method it errbacks with
@@ -155,6 +215,28 @@ class Thrower(Service):
 
         self.clearAllTimers()
 
+        return self.http_pool.closeCachedConnections()
+
+    @defer.inlineCallbacks
+    def _http_request(self, method, url, **kwargs):
+        response = yield self.http_client.request(method, url, **kwargs)
+        content = yield text_content(response)
+
+        defer.returnValue((response, content))
+
+    def http_request(self, method, url, **kwargs):
+        """Run a http request through the shared connection pool and return a (response, content)
+        tuple, concurrent requests to the same host are capped by http_max_concurrent_per_host"""
+        if self.config.http_max_concurrent_per_host <= 0:
+            return self._http_request(method, url, **kwargs)
+
+        _url = urlparse(url if isinstance(url, str) else url.decode())
+        host = (_url.scheme, _url.netloc)
+        if host not in self.http_host_semaphores:
+            self.http_host_semaphores[host] = defer.DeferredSemaphore(self.config.http_max_concurrent_per_host)
+
+        return self.http_host_semaphores[host].run(self._http_request, method, url, **kwargs)
+
     @defer.inlineCallbacks
     def addAmqpBroker(self, amqpBroker):
         self.amqpBroker = amqpBroker
@@ -176,14 +258,21 @@ class Thrower(Service):
                                                  no_ack=False,
                                                  consumer_tag=self.consumerTag)
         self.thrower_q = yield self.amqpBroker.client.queue(self.consumerTag)
-        self.thrower_q.get().addCallback(self.callback).addErrback(self.errback)
+        self.consume()
         self.log.info('Consuming from routing key: %s', self.routingKey)
 
     @defer.inlineCallbacks
     def rejectAndRequeueMessage(self, message, delay=True):
         msgid = message.content.properties['message-id']
 
-        if delay:
+        if delay and self.amqpBroker.config.retry_queues:
+            # Requeue through a retry queue, nothing is held by this process
+            requeue_delay = yield self.amqpBroker.requeue_delayed(
+                self.queueName, message, self.config.retry_delay, self.getThrowingRetrials(message))
+            yield self.ackMessage(message)
+            self.log.debug("Requeued Content[%s] through a retry queue with delay: %s seconds",
+                           msgid, requeue_delay)
+        elif delay:
             self.log.debug("Requeuing Content[%s] with delay: %s seconds",
                            msgid, self.config.retry_delay)
 
@@ -236,7 +325,7 @@ class deliverSmThrower(Thrower):
         msgid = message.content.properties['message-id']
         route_type = message.content.properties['headers']['route-type']
         dcs = pickle.loads(message.content.properties['headers']['dst-connectors'])
-        RoutedDeliverSmContent = pickle.loads(message.content.body)
+        RoutedDeliverSmContent = codec.loads(message.content.body)
         self.log.debug('Got one message (msgid:%s) to throw: %s', msgid, RoutedDeliverSmContent)
 
         # If any, clear requeuing timer
@@ -311,9 +400,7 @@ class deliverSmThrower(Thrower):
                     postdata = args
 
                 self.log.debug('Calling %s with args %s using %s method.', dc.baseurl, args, _method)
-                agent = Agent(reactor)
-                client = HTTPClient(agent)
-                response = yield client.request(
+                response, content = yield self.http_request(
                     _method,
                     baseurl,
                     params=params,
@@ -324,9 +411,7 @@ class deliverSmThrower(Thrower):
                              'User-Agent': 'Jasmin gateway/1.0 deliverSmHttpThrower'})
                 self.log.info('Throwed message [msgid:%s] to connector (%s %s/%s)[cid:%s] using http to %s.',
                               msgid, route_type, counter, len(dcs), dc.cid, dc.baseurl)
-                
-                content = yield text_content(response)
-                
+
                 if response.code >= 400:
                     raise HttpApiError(response.code, content)
 
@@ -387,9 +472,8 @@ class deliverSmThrower(Thrower):
         msgid = message.content.properties['message-id']
         route_type = message.content.properties['headers']['route-type']
         dcs = pickle.loads(message.content.properties['headers']['dst-connectors'])
-        pdu = pickle.loads(message.content.body)
-        RoutedDeliverSmContent = pickle.loads(message.content.body)
-        self.log.debug('Got one message (msgid:%s) to throw: %s', msgid, RoutedDeliverSmContent)
+        pdu = codec.loads(message.content.body)
+        self.log.debug('Got one message (msgid:%s) to throw: %s', msgid, pdu)
 
         # If any, clear requeuing timer
         self.clearRequeueTimer(msgid)
@@ -417,6 +501,9 @@ class deliverSmThrower(Thrower):
                 # Get bound connections (or systemids)
                 if self.smpps_access == 'direct':
                     bound_systemdids = self.smpps.bound_connections
+                elif self.smpps.bound_systemids is not None:
+                    # Kept current by SMPPServerPB, no round trip needed
+                    bound_systemdids = self.smpps.bound_systemids
                 else:
                     bound_systemdids = yield self.smpps.list_bound_systemids()
 
@@ -432,7 +519,8 @@ class deliverSmThrower(Thrower):
 
                     yield deliverer.sendRequest(pdu, deliverer.config().responseTimerSecs)
                 else:
-                    r = yield self.smpps.deliverer_send_request(dc.cid, pdu)
+                    # Body is sent as consumed, SMPPServerPB will decode it
+                    r = yield self.smpps.deliverer_send_request(dc.cid, message.content.body)
                     if not r:
                         raise DeliveringFailed('Delivering failed, check %s smpps logs for more details' % dc.cid)
             except Exception as e:
@@ -492,12 +580,13 @@ class deliverSmThrower(Thrower):
     def deliver_sm_throwing_callback(self, message):
         Thrower.throwing_callback(self, message)
 
-        if message.routing_key == 'deliver_sm_thrower.http':
+        routing_key = original_routing_key(message)
+        if routing_key == 'deliver_sm_thrower.http':
             yield self.http_deliver_sm_callback(message)
-        elif message.routing_key == 'deliver_sm_thrower.smpps':
+        elif routing_key == 'deliver_sm_thrower.smpps':
             yield self.smpp_deliver_sm_callback(message)
         else:
-            self.log.error('Unknown routing_key in deliver_sm_throwing_callback: %s', message.routing_key)
+            self.log.error('Unknown routing_key in deliver_sm_throwing_callback: %s', routing_key)
             yield self.rejectMessage(message)
 
 
@@ -555,9 +644,7 @@ class DLRThrower(Thrower):
                 postdata = args
 
             self.log.debug('Calling %s with args %s using %s method.', baseurl, args, method)
-            agent = Agent(reactor)
-            client = HTTPClient(agent)
-            response = yield client.request(
+            response, content = yield self.http_request(
                 method,
                 baseurl,
                 params=params,
@@ -568,8 +655,6 @@ class DLRThrower(Thrower):
                          'User-Agent': 'Jasmin gateway/1.0 %s' % self.name})
             self.log.info('Throwed DLR [msgid:%s] to %s.', msgid, baseurl)
 
-            content = yield text_content(response)
-            
             if response.code >= 400:
                 raise HttpApiError(response.code, content)
 
@@ -630,6 +715,9 @@ class DLRThrower(Thrower):
             # Get bound connections (or systemids)
             if self.smpps_access == 'direct':
                 bound_systemdids = self.smpps.bound_connections
+            elif self.smpps.bound_systemids is not None:
+                # Kept current by SMPPServerPB, no round trip needed
+                bound_systemdids = self.smpps.bound_systemids
             else:
                 bound_systemdids = yield self.smpps.list_bound_systemids()
 
@@ -693,10 +781,11 @@ class DLRThrower(Thrower):
     def dlr_throwing_callback(self, message):
         Thrower.throwing_callback(self, message)
 
-        if message.routing_key == 'dlr_thrower.http':
+        routing_key = original_routing_key(message)
+        if routing_key == 'dlr_thrower.http':
             yield self.http_dlr_callback(message)
-        elif message.routing_key == 'dlr_thrower.smpps':
+        elif routing_key == 'dlr_thrower.smpps':
             yield self.smpp_dlr_callback(message)
         else:
-            self.log.error('Unknown routing_key in dlr_throwing_callback: %s', message.routing_key)
+            self.log.error('Unknown routing_key in dlr_throwing_callback: %s', routing_key)
             yield self.rejectMessage(message)
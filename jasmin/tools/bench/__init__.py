@@ -0,0 +1,12 @@
+"""
+End to end benchmark harness
+
+A bench run is made of an in-process fake SMSC (jasmin's SMPP client connector binds to it), a
+fake HTTP receiver for MO messages and DLRs thrown by jasmin, and load drivers pushing messages
+through jasmin's HTTP /send endpoint and SMPP server at a target rate.
+
+Every message carries its bench sequence number in its content, the fake SMSC and the receiver
+are recording when each message is crossing them to report latencies per stage.
+
+Run it with `python -m jasmin.tools.bench --help` (or jasminbench.py) against a running jasmind.
+"""
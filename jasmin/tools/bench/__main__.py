@@ -0,0 +1,3 @@
+from jasmin.tools.bench.cli import main
+
+main()
@@ -0,0 +1,197 @@
+"""
+jasminbench command line
+"""
+
+import itertools
+import sys
+import time
+
+from twisted.internet import defer, reactor
+from twisted.python import usage
+from twisted.web import server
+from treq import get, text_content
+
+from jasmin.tools.bench import report
+from jasmin.tools.bench.load import HTTPSendDriver, SMPPSendDriver, MOSendDriver
+from jasmin.tools.bench.provision import Provisioner
+from jasmin.tools.bench.receiver import Receiver
+from jasmin.tools.bench.smsc import BenchSMSCFactory
+
+
+class Options(usage.Options):
+    optParameters = [
+        # Load
+        ['http-rate', None, 100, 'HTTP /send messages per second', float],
+        ['http-count', None, 1000, 'Number of messages sent through HTTP /send', int],
+        ['smpp-rate', None, 0, 'SMPP server submit_sm per second', float],
+        ['smpp-count', None, 0, 'Number of messages sent through SMPP server', int],
+        ['mo-rate', None, 0, 'MO messages per second sent by the fake SMSC', float],
+        ['mo-count', None, 0, 'Number of MO messages sent by the fake SMSC', int],
+        ['max-inflight', None, 100, 'Maximum messages waiting for acceptance, per driver', int],
+        ['drain', None, 10, 'Maximum seconds waiting for DLRs and MOs once all messages are accepted', float],
+        # Fake SMSC and receiver
+        ['smsc-port', None, 2776, 'Fake SMSC listening port', int],
+        ['resp-latency', None, 0, 'Fake SMSC submit_sm_resp latency in seconds', float],
+        ['error-ratio', None, 0, 'Ratio of submit_sm getting an error submit_sm_resp', float],
+        ['dlr-ratio', None, 1, 'Ratio of accepted submit_sm getting a DLR', float],
+        ['dlr-delay', None, 0, 'DLR delay in seconds', float],
+        ['receiver-port', None, 1402, 'Fake HTTP MO/DLR receiver listening port', int],
+        # Jasmin
+        ['http-url', None, 'http://127.0.0.1:1401/send', 'Jasmin HTTP /send url'],
+        ['metrics-url', None, None, 'Jasmin /metrics url, its latency histograms are reported when set'],
+        ['smpps-host', None, '127.0.0.1', 'Jasmin SMPP server host'],
+        ['smpps-port', None, 2775, 'Jasmin SMPP server port', int],
+        ['username', None, 'bench', 'Bench user username (and uid when provisioning)'],
+        ['password', None, 'bench', 'Bench user password'],
+        ['jasmind-pid', None, None, 'Report jasmind cpu usage as well'],
+        # Provisioning
+        ['smppcm-port', None, 8989, 'SMPP client manager perspective broker port', int],
+        ['smppcm-username', None, 'cmadmin', 'SMPP client manager perspective broker username'],
+        ['smppcm-password', None, 'cmpwd', 'SMPP client manager perspective broker password'],
+        ['router-port', None, 8988, 'Router perspective broker port', int],
+        ['router-username', None, 'radmin', 'Router perspective broker username'],
+        ['router-password', None, 'rpwd', 'Router perspective broker password'],
+    ]
+
+    optFlags = [
+        ['provision', 'p', 'Provision (and remove at the end) the bench connector, user and routes'],
+        ['no-dlr', None, 'Do not request DLRs'],
+    ]
+
+
+def wait(seconds):
+    d = defer.Deferred()
+    reactor.callLater(seconds, d.callback, None)
+    return d
+
+
+@defer.inlineCallbacks
+def scrape_latency_histograms(url):
+    response = yield get(url)
+    text = yield text_content(response)
+
+    defer.returnValue(report.latency_histograms(report.parse_metrics(text)))
+
+
+class Bench:
+    def __init__(self, options):
+        self.options = options
+        self.recorder = report.Recorder()
+        self.provisioner = None
+        self.drivers = []
+        self.smscPort = None
+        self.receiverPort = None
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        o = self.options
+
+        self.smsc = BenchSMSCFactory(
+            self.recorder, resp_latency=o['resp-latency'], error_ratio=o['error-ratio'],
+            dlr_ratio=o['dlr-ratio'], dlr_delay=o['dlr-delay'])
+        self.smscPort = reactor.listenTCP(o['smsc-port'], self.smsc)
+        self.receiverPort = reactor.listenTCP(o['receiver-port'], server.Site(Receiver(self.recorder)))
+        receiver_url = 'http://127.0.0.1:%s' % o['receiver-port']
+
+        if o['provision']:
+            self.provisioner = Provisioner(
+                '127.0.0.1', o['smppcm-port'], o['smppcm-username'], o['smppcm-password'],
+                '127.0.0.1', o['router-port'], o['router-username'], o['router-password'])
+            yield self.provisioner.provision(o['smsc-port'], '%s/mo' % receiver_url, o['username'], o['password'])
+
+        # Wait for jasmin's connector to bind to the fake SMSC
+        for _ in range(100):
+            if len(self.smsc.clients) > 0:
+                break
+            yield wait(0.1)
+        else:
+            raise Exception('No connector bound to the fake SMSC on port %s' % o['smsc-port'])
+
+        dlr_url = None if o['no-dlr'] else '%s/dlr' % receiver_url
+        sequence = itertools.count(1)
+        if o['http-count'] > 0:
+            self.drivers.append(HTTPSendDriver(
+                self.recorder, sequence, o['http-rate'], o['http-count'], o['http-url'], o['username'],
+                o['password'], dlr_url=dlr_url, max_inflight=o['max-inflight']))
+        if o['smpp-count'] > 0:
+            self.drivers.append(SMPPSendDriver(
+                self.recorder, sequence, o['smpp-rate'], o['smpp-count'], o['smpps-host'], o['smpps-port'],
+                o['username'], o['password'], dlr=not o['no-dlr'], max_inflight=o['max-inflight']))
+        if o['mo-count'] > 0:
+            self.drivers.append(MOSendDriver(self.recorder, itertools.count(1), o['mo-rate'], o['mo-count'],
+                                             self.smsc))
+
+    @defer.inlineCallbacks
+    def run(self):
+        o = self.options
+        histograms = None
+
+        if o['metrics-url'] is not None:
+            histograms_before = yield scrape_latency_histograms(o['metrics-url'])
+        cpu_before = {'bench': report.process_cpu_time(), 'jasmind': report.process_cpu_time(o['jasmind-pid'])}
+
+        started_at = time.monotonic()
+        yield defer.gatherResults([driver.start() for driver in self.drivers],
+                                  consumeErrors=True)
+        duration = time.monotonic() - started_at
+
+        # Wait for DLRs and MOs still on their way
+        drain_until = time.monotonic() + o['drain']
+        while time.monotonic() < drain_until:
+            if (self.recorder.count('dlr_received') >= self.recorder.count('dlr_sent')
+                    and self.recorder.count('mo_received') >= self.recorder.count('mo_sent')):
+                break
+            yield wait(0.1)
+
+        cpu_times = {'bench': report.process_cpu_time() - cpu_before['bench']}
+        if o['jasmind-pid'] is not None:
+            cpu_after = report.process_cpu_time(o['jasmind-pid'])
+            cpu_times['jasmind'] = None if None in (cpu_after, cpu_before['jasmind']) \
+                else cpu_after - cpu_before['jasmind']
+
+        if o['metrics-url'] is not None:
+            histograms_after = yield scrape_latency_histograms(o['metrics-url'])
+            histograms = report.diff_histograms(histograms_before, histograms_after)
+
+        print(report.format_report(self.recorder, duration, cpu_times, histograms))
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for driver in self.drivers:
+            driver.stop()
+            yield driver.close()
+
+        if self.provisioner is not None:
+            yield self.provisioner.unprovision(self.options['username'])
+
+        for port in (self.smscPort, self.receiverPort):
+            if port is not None:
+                yield port.stopListening()
+
+
+@defer.inlineCallbacks
+def run(options):
+    bench = Bench(options)
+    try:
+        yield bench.setUp()
+        yield bench.run()
+    except Exception as e:
+        print('Bench failed: %s' % e)
+    finally:
+        try:
+            yield bench.tearDown()
+        finally:
+            reactor.stop()
+
+
+def main():
+    try:
+        options = Options()
+        options.parseOptions()
+    except usage.UsageError as errortext:
+        print('%s: %s' % (sys.argv[0], errortext))
+        print('%s: Try --help for usage details.' % (sys.argv[0]))
+        sys.exit(1)
+
+    reactor.callWhenRunning(run, options)
+    reactor.run()
@@ -0,0 +1,241 @@
+"""
+Load drivers sending bench messages to jasmin at a target rate
+"""
+
+import logging
+import re
+import time
+
+from twisted.internet import defer, reactor, task
+from twisted.web.client import Agent, HTTPConnectionPool
+from treq.client import HTTPClient
+from treq import text_content
+from smpp.pdu.pdu_types import CommandStatus, RegisteredDelivery, RegisteredDeliveryReceipt
+
+from jasmin.protocols.smpp.configs import SMPPClientConfig
+from jasmin.protocols.smpp.factory import SMPPClientFactory
+from jasmin.protocols.smpp.operations import SMPPOperationFactory
+from jasmin.tools.bench.smsc import CONTENT
+
+DLR_ID_REGEX = re.compile(rb'id:(\S+)')
+
+
+class SendFailed(Exception):
+    """Raised when jasmin is not accepting a message"""
+
+    def __init__(self, kind):
+        Exception.__init__(self, kind)
+        self.kind = kind
+
+
+class RateDriver:
+    """Sends count messages at rate messages per second, keeping at most max_inflight of them
+    waiting for their acceptance response
+
+    Bench sequence numbers are taken from sequence, it is shared by all the drivers of a run.
+    """
+
+    # Messages due since last tick are sent in a burst
+    tick_interval = 0.01
+
+    def __init__(self, recorder, sequence, rate, count, max_inflight=100):
+        self.recorder = recorder
+        self.sequence = sequence
+        self.rate = float(rate)
+        self.count = count
+        self.max_inflight = max_inflight
+
+        self.sent = 0
+        self.inflight = 0
+        self.started_at = None
+        self.looping = None
+        self.done = None
+
+    def start(self):
+        """Start sending, return a deferred fired when all messages are sent and responded"""
+        self.started_at = time.monotonic()
+        self.done = defer.Deferred()
+
+        if self.count <= 0 or self.rate <= 0:
+            self.done.callback(self)
+        else:
+            self.looping = task.LoopingCall(self.tick)
+            self.looping.start(self.tick_interval)
+
+        return self.done
+
+    def stop(self):
+        if self.looping is not None and self.looping.running:
+            self.looping.stop()
+
+    def close(self):
+        """Release the driver's connections"""
+
+    def tick(self):
+        due = min(int((time.monotonic() - self.started_at) * self.rate) + 1, self.count) - self.sent
+        while due > 0 and self.inflight < self.max_inflight:
+            due -= 1
+            self.sendOne()
+
+        if self.sent >= self.count:
+            self.stop()
+
+    def sendOne(self):
+        seq = next(self.sequence)
+        self.sent += 1
+        self.inflight += 1
+
+        self.recorder.mark('sent', seq)
+        d = defer.maybeDeferred(self.send, seq)
+        d.addCallback(lambda msgid: self.recorder.accepted(seq, msgid))
+        d.addErrback(self.failed)
+        d.addBoth(self.responded)
+
+    def send(self, seq):
+        """Send message seq, return a deferred fired with its jasmin message id"""
+        raise NotImplementedError
+
+    def failed(self, failure):
+        self.recorder.error(self.errorKind(failure))
+
+    def errorKind(self, failure):
+        if failure.check(SendFailed):
+            return failure.value.kind
+        return failure.value.__class__.__name__
+
+    def responded(self, _):
+        self.inflight -= 1
+
+        if self.sent >= self.count and self.inflight == 0 and not self.done.called:
+            self.done.callback(self)
+
+
+class HTTPSendDriver(RateDriver):
+    """Sends bench messages through jasmin's HTTP /send endpoint, DLRs are requested to dlr_url"""
+
+    def __init__(self, recorder, sequence, rate, count, url, username, password, dlr_url=None,
+                 to='33600000000', max_inflight=100):
+        RateDriver.__init__(self, recorder, sequence, rate, count, max_inflight)
+
+        self.url = url
+        self.username = username
+        self.password = password
+        self.dlr_url = dlr_url
+        self.to = to
+
+        self.http_pool = HTTPConnectionPool(reactor)
+        self.http_pool.maxPersistentPerHost = max_inflight
+        self.http_client = HTTPClient(Agent(reactor, pool=self.http_pool))
+
+    @defer.inlineCallbacks
+    def send(self, seq):
+        args = {
+            'username': self.username,
+            'password': self.password,
+            'to': self.to,
+            'content': CONTENT % seq,
+        }
+        if self.dlr_url is not None:
+            args.update({'dlr': 'yes', 'dlr-url': self.dlr_url, 'dlr-level': '2', 'dlr-method': 'POST'})
+        else:
+            args['dlr'] = 'no'
+
+        response = yield self.http_client.post(self.url, data=args)
+        content = yield text_content(response)
+
+        if response.code != 200 or not content.startswith('Success "'):
+            raise SendFailed('http_%s' % response.code)
+
+        defer.returnValue(content[len('Success "'):-1])
+
+    def close(self):
+        return self.http_pool.closeCachedConnections()
+
+
+class SMPPSendDriver(RateDriver):
+    """Sends bench messages through a transceiver bind to jasmin's SMPP server, DLRs are requested
+    when dlr is True"""
+
+    def __init__(self, recorder, sequence, rate, count, host, port, username, password, dlr=True,
+                 source_addr='1234', destination_addr='33600000000', max_inflight=100):
+        RateDriver.__init__(self, recorder, sequence, rate, count, max_inflight)
+
+        self.dlr = dlr
+        self.source_addr = source_addr
+        self.destination_addr = destination_addr
+
+        self.config = SMPPClientConfig(
+            id='bench_esme', host=host, port=port, username=username, password=password,
+            bindOperation='transceiver', reconnectOnConnectionLoss=False, reconnectOnConnectionFailure=False,
+            log_file='stdout', log_level=logging.CRITICAL)
+        self.opFactory = SMPPOperationFactory(self.config)
+        self.client = SMPPClientFactory(self.config, msgHandler=self.msgHandler)
+
+    @defer.inlineCallbacks
+    def start(self):
+        yield self.client.connectAndBind()
+
+        done = yield RateDriver.start(self)
+        defer.returnValue(done)
+
+    def close(self):
+        return self.client.disconnectAndDontRetryToConnect()
+
+    def msgHandler(self, smpp, pdu):
+        """Receive the DLRs"""
+        msgid = pdu.params.get('receipted_message_id')
+        if msgid is None:
+            m = DLR_ID_REGEX.search(pdu.params.get('short_message') or b'')
+            msgid = None if m is None else m.group(1)
+
+        if msgid is None:
+            self.recorder.error('unknown_deliver_sm')
+            return
+
+        if isinstance(msgid, bytes):
+            msgid = msgid.decode()
+        self.recorder.markMsgid('dlr_received', msgid)
+
+    def send(self, seq):
+        registered_delivery = RegisteredDeliveryReceipt.NO_SMSC_DELIVERY_RECEIPT_REQUESTED
+        if self.dlr:
+            registered_delivery = RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED
+
+        pdu = self.opFactory.SubmitSM(
+            short_message=(CONTENT % seq).encode(),
+            source_addr=self.source_addr,
+            destination_addr=self.destination_addr,
+            registered_delivery=RegisteredDelivery(registered_delivery),
+        )
+
+        return self.client.smpp.sendDataRequest(pdu).addCallback(self.submitSmResp)
+
+    def submitSmResp(self, r):
+        if r.response.status != CommandStatus.ESME_ROK:
+            raise SendFailed('smpp_%s' % r.response.status.name)
+
+        msgid = r.response.params['message_id']
+        if isinstance(msgid, bytes):
+            msgid = msgid.decode()
+
+        return msgid
+
+
+class MOSendDriver(RateDriver):
+    """Makes the fake SMSC send bench MO messages to jasmin, MO messages have their own
+    sequence"""
+
+    def __init__(self, recorder, sequence, rate, count, smsc):
+        RateDriver.__init__(self, recorder, sequence, rate, count)
+
+        self.smsc = smsc
+
+    def sendOne(self):
+        seq = next(self.sequence)
+        self.sent += 1
+
+        if not self.smsc.sendMO(seq):
+            self.recorder.error('mo_unbound_smsc')
+
+        if self.sent >= self.count and not self.done.called:
+            self.done.callback(self)
@@ -0,0 +1,62 @@
+"""
+Bench provisioning of a running jasmind through its perspective brokers
+"""
+
+from twisted.internet import defer
+
+from jasmin.managers.proxies import SMPPClientManagerPBProxy
+from jasmin.protocols.smpp.configs import SMPPClientConfig
+from jasmin.routing.Routes import DefaultRoute
+from jasmin.routing.jasminApi import Group, User, HttpConnector, SmppClientConnector
+from jasmin.routing.proxies import RouterPBProxy
+
+CID = 'bench_smsc'
+MO_CID = 'bench_receiver'
+GID = 'bench'
+
+
+class Provisioner:
+    """Adds (and removes) the bench connector, user and default routes
+
+    The bench user gets unlimited credentials and the bench SMPP client connector has no
+    throughput limit, default routes are used: jasmind should be dedicated to the bench run.
+    """
+
+    def __init__(self, smppcm_host, smppcm_port, smppcm_username, smppcm_password,
+                 router_host, router_port, router_username, router_password):
+        self.smppcm = (smppcm_host, smppcm_port, smppcm_username, smppcm_password)
+        self.router = (router_host, router_port, router_username, router_password)
+
+        self.smppcm_proxy = SMPPClientManagerPBProxy()
+        self.router_proxy = RouterPBProxy()
+
+    @defer.inlineCallbacks
+    def provision(self, smsc_port, receiver_url, username, password):
+        yield self.smppcm_proxy.connect(*self.smppcm)
+        yield self.router_proxy.connect(*self.router)
+
+        yield self.smppcm_proxy.add(SMPPClientConfig(
+            id=CID, host='127.0.0.1', port=smsc_port, username='bench', password='bench',
+            submit_sm_throughput=0, reconnectOnConnectionFailureDelay=1))
+        yield self.smppcm_proxy.start(CID)
+
+        group = Group(GID)
+        yield self.router_proxy.group_add(group)
+        yield self.router_proxy.user_add(User(username, group, username, password))
+
+        yield self.router_proxy.mtroute_add(DefaultRoute(SmppClientConnector(CID)), 0)
+        yield self.router_proxy.moroute_add(DefaultRoute(HttpConnector(MO_CID, receiver_url, 'POST')), 0)
+
+    @defer.inlineCallbacks
+    def unprovision(self, username):
+        if self.router_proxy.isConnected:
+            yield self.router_proxy.mtroute_remove(0)
+            yield self.router_proxy.moroute_remove(0)
+            yield self.router_proxy.user_remove(username)
+            yield self.router_proxy.group_remove(GID)
+            yield self.router_proxy.disconnect()
+
+        if self.smppcm_proxy.isConnected:
+            yield self.smppcm_proxy.stop(CID)
+            yield self.smppcm_proxy.remove(CID)
+            yield self.smppcm_proxy.disconnect()
@@ -0,0 +1,44 @@
+"""
+Fake HTTP receiver of MO messages and DLRs thrown by jasmin
+"""
+
+from twisted.web.resource import Resource
+
+from jasmin.tools.bench.smsc import bench_seq
+
+
+class Receiver(Resource):
+    """Acknowledges everything thrown to /mo and /dlr, MO messages are identified by their content
+    and DLRs by their jasmin message id"""
+    isLeaf = True
+
+    def __init__(self, recorder):
+        Resource.__init__(self)
+
+        self.recorder = recorder
+
+    def render_GET(self, request):
+        return self.receive(request)
+
+    def render_POST(self, request):
+        return self.receive(request)
+
+    def receive(self, request):
+        args = request.args
+
+        if request.postpath == [b'mo']:
+            seq = bench_seq(args.get(b'content', [None])[0])
+            if seq is None:
+                self.recorder.error('unknown_mo')
+            else:
+                self.recorder.mark('mo_received', seq)
+        elif request.postpath == [b'dlr']:
+            if b'id' not in args:
+                self.recorder.error('unknown_dlr')
+            else:
+                self.recorder.markMsgid('dlr_received', args[b'id'][0].decode())
+        else:
+            request.setResponseCode(404)
+            return b''
+
+        return b'ACK/Jasmin'
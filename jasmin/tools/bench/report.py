@@ -0,0 +1,239 @@
+"""
+Bench measurements and report
+"""
+
+import math
+import os
+import re
+import time
+
+# stage: (start event, end event)
+# Events are marked by the load drivers (sent, accepted, dlr_received), the fake SMSC
+# (smsc, dlr_sent, mo_sent) and the receiver (dlr_received, mo_received)
+STAGES = {
+    'accept': ('sent', 'accepted'),
+    'to_smsc': ('sent', 'smsc'),
+    'dlr': ('dlr_sent', 'dlr_received'),
+    'end_to_end': ('sent', 'dlr_received'),
+    'mo': ('mo_sent', 'mo_received'),
+}
+
+PERCENTILES = (50, 95, 99)
+
+METRIC_REGEX = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?P<labels>.*)\})?\s+(?P<value>\S+)$')
+LABEL_REGEX = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of values, None if empty"""
+    if len(values) == 0:
+        return None
+
+    values = sorted(values)
+    rank = max(int(math.ceil(p / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def parse_metrics(text):
+    """Parse a prometheus text exposition, return a list of (name, labels dict, value)"""
+    samples = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+
+        m = METRIC_REGEX.match(line)
+        if m is None:
+            continue
+
+        labels = dict(LABEL_REGEX.findall(m.group('labels') or ''))
+        samples.append((m.group('name'), labels, float(m.group('value'))))
+
+    return samples
+
+
+def histogram_quantile(q, buckets):
+    """Estimate the q quantile (0 < q < 1) from cumulative (upper bound, count) buckets the
+    same way prometheus's histogram_quantile() does: linear interpolation inside the bucket
+    """
+    buckets = sorted(buckets)
+    if len(buckets) == 0 or buckets[-1][1] == 0:
+        return None
+
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if math.isinf(upper_bound):
+                # Highest finite bound is the best estimation
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+
+    return lower_bound
+
+
+def latency_histograms(samples):
+    """Group latency_*_seconds_bucket samples exported by /metrics by (stage, label value),
+    return a dict of cumulative (upper bound, count) buckets"""
+    histograms = {}
+    for name, labels, value in samples:
+        if not (name.startswith('latency_') and name.endswith('_seconds_bucket')):
+            continue
+
+        stage = name[len('latency_'):-len('_seconds_bucket')]
+        label = ','.join('%s=%s' % (k, v) for k, v in sorted(labels.items()) if k != 'le')
+        histograms.setdefault((stage, label), []).append((float(labels['le']), value))
+
+    return histograms
+
+
+def diff_histograms(before, after):
+    """Return after histograms minus before ones, keeps what was observed in between"""
+    histograms = {}
+    for key, buckets in after.items():
+        previous = dict(before.get(key, []))
+        histograms[key] = [(le, count - previous.get(le, 0)) for le, count in buckets]
+
+    return histograms
+
+
+def clock_ticks():
+    try:
+        return os.sysconf('SC_CLK_TCK')
+    except (AttributeError, ValueError):
+        return 100
+
+
+def process_cpu_time(pid=None):
+    """CPU time (user + system) in seconds consumed by pid, or by the current process when pid
+    is None, return None when not available (pid's cpu time is read from /proc)"""
+    if pid is None:
+        return time.process_time()
+
+    try:
+        with open('/proc/%s/stat' % pid, 'r') as f:
+            # comm (2nd field) may hold spaces, fields are counted after its closing parenthesis
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, IndexError):
+        return None
+
+    # utime and stime are the 14th and 15th fields
+    return (int(fields[11]) + int(fields[12])) / float(clock_ticks())
+
+
+class Recorder:
+    """Bench events recorder, holds the time every message (identified by its bench sequence number)
+    is crossing an event"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.events = {}
+        self.errors = {}
+        # jasmin message id: bench sequence number
+        self.msgids = {}
+        # jasmin message id: [(event, time)] marked before the message id was known
+        self.pending = {}
+
+    def mark(self, event, seq, at=None):
+        """Record the first time seq crossed event"""
+        events = self.events.setdefault(event, {})
+        if seq not in events:
+            events[seq] = self.clock() if at is None else at
+
+    def accepted(self, seq, msgid):
+        """Record seq got accepted by jasmin as msgid"""
+        self.mark('accepted', seq)
+        self.msgids[msgid] = seq
+
+        for event, at in self.pending.pop(msgid, []):
+            self.mark(event, seq, at)
+
+    def markMsgid(self, event, msgid):
+        """Record the first time jasmin's msgid crossed event, the DLR of a message can be received
+        before its acceptance response"""
+        if msgid in self.msgids:
+            self.mark(event, self.msgids[msgid])
+        else:
+            self.pending.setdefault(msgid, []).append((event, self.clock()))
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def count(self, event):
+        return len(self.events.get(event, {}))
+
+    def latencies(self, start_event, end_event):
+        start = self.events.get(start_event, {})
+        end = self.events.get(end_event, {})
+        return [end[seq] - start[seq] for seq in end if seq in start]
+
+    def stages(self):
+        """Return {stage: {'count': n, 50: p50, 95: p95, 99: p99}} for stages having samples"""
+        stages = {}
+        for stage, (start_event, end_event) in STAGES.items():
+            values = self.latencies(start_event, end_event)
+            if len(values) == 0:
+                continue
+
+            stages[stage] = {'count': len(values)}
+            for p in PERCENTILES:
+                stages[stage][p] = percentile(values, p)
+
+        return stages
+
+
+def format_ms(seconds):
+    if seconds is None:
+        return '-'
+    return '%.1f' % (seconds * 1000)
+
+
+def format_report(recorder, duration, cpu_times, server_histograms=None):
+    """Return the bench report as text
+
+    cpu_times is a dict of process name: consumed cpu seconds (or None when unknown),
+    server_histograms is the result of latency_histograms() on the /metrics difference
+    """
+    sent = recorder.count('sent')
+    accepted = recorder.count('accepted')
+    lines = []
+
+    lines.append('Duration: %.2fs' % duration)
+    lines.append('Sent: %s, accepted: %s, at SMSC: %s, DLRs received: %s, MOs received: %s' % (
+        sent, accepted, recorder.count('smsc'), recorder.count('dlr_received'), recorder.count('mo_received')))
+    if len(recorder.errors) > 0:
+        lines.append('Errors: %s' % ', '.join('%s=%s' % (k, v) for k, v in sorted(recorder.errors.items())))
+    if duration > 0:
+        lines.append('Throughput: %.1f msg/s sent, %.1f msg/s accepted, %.1f msg/s at SMSC' % (
+            sent / duration, accepted / duration, recorder.count('smsc') / duration))
+
+    lines.append('')
+    lines.append('%-12s %8s %10s %10s %10s' % ('Stage', 'Count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+    for stage, values in recorder.stages().items():
+        lines.append('%-12s %8s %10s %10s %10s' % (
+            stage, values['count'], format_ms(values[50]), format_ms(values[95]), format_ms(values[99])))
+
+    if server_histograms:
+        lines.append('')
+        lines.append('%-32s %8s %10s %10s %10s' % ('Server stage', 'Count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+        for (stage, label), buckets in sorted(server_histograms.items()):
+            count = max(count for _, count in buckets)
+            if count == 0:
+                continue
+
+            name = stage if label == '' else '%s{%s}' % (stage, label)
+            lines.append('%-32s %8d %10s %10s %10s' % (
+                name, count, *[format_ms(histogram_quantile(p / 100.0, buckets)) for p in PERCENTILES]))
+
+    lines.append('')
+    messages = max(accepted, 1)
+    for name, cpu in cpu_times.items():
+        if cpu is None:
+            lines.append('CPU (%s): not available' % name)
+        else:
+            lines.append('CPU (%s): %.2fs, %.3fs per 1k messages' % (name, cpu, cpu * 1000.0 / messages))
+
+    return '\n'.join(lines)
@@ -0,0 +1,166 @@
+"""
+Fake SMSC jasmin's bench SMPP client connector is bound to
+"""
+
+import random
+import re
+import struct
+from io import BytesIO
+
+from twisted.internet import reactor
+from twisted.internet.protocol import Protocol, ServerFactory
+from smpp.pdu.operations import (
+    BindTransmitter, BindTransceiver, BindReceiver, EnquireLink, Unbind, SubmitSM, DeliverSM)
+from smpp.pdu.pdu_encoding import PDUEncoder
+from smpp.pdu.pdu_types import CommandStatus, PDURequest, MessageState
+
+# Bench messages (MT and MO) content
+CONTENT = 'bench %d'
+CONTENT_REGEX = re.compile(rb'^bench (\d+)')
+
+message_state_map = {
+    'DELIVRD': MessageState.DELIVERED,
+    'UNDELIV': MessageState.UNDELIVERABLE,
+    'REJECTD': MessageState.REJECTED,
+    'EXPIRED': MessageState.EXPIRED,
+}
+
+
+def bench_seq(content):
+    """Return the bench sequence number carried by a message content, None if not a bench message"""
+    if isinstance(content, str):
+        content = content.encode()
+    if content is None:
+        return None
+
+    m = CONTENT_REGEX.match(content)
+    if m is None:
+        return None
+
+    return int(m.group(1))
+
+
+class BenchSMSC(Protocol):
+    """Accepts all binds, responds to submit_sm after factory.resp_latency with an error status
+    for factory.error_ratio of them and sends back a DLR for factory.dlr_ratio of the accepted ones
+    """
+
+    def __init__(self):
+        self.recvBuffer = b""
+        self.lastSeqNum = 0
+        self.encoder = PDUEncoder()
+        self.responseMap = {
+            BindTransmitter: self.sendSuccessResponse,
+            BindReceiver: self.handleBind,
+            BindTransceiver: self.handleBind,
+            EnquireLink: self.sendSuccessResponse,
+            Unbind: self.sendSuccessResponse,
+            SubmitSM: self.handleSubmit,
+        }
+
+    def connectionLost(self, reason):
+        if self in self.factory.clients:
+            self.factory.clients.remove(self)
+
+    def dataReceived(self, data):
+        self.recvBuffer = self.recvBuffer + data
+
+        while len(self.recvBuffer) > 3:
+            (length,) = struct.unpack('!L', self.recvBuffer[:4])
+            if len(self.recvBuffer) < length:
+                break
+            message = self.recvBuffer[:length]
+            self.recvBuffer = self.recvBuffer[length:]
+            self.PDUReceived(self.encoder.decode(BytesIO(message)))
+
+    def PDUReceived(self, pdu):
+        if pdu.__class__ in self.responseMap:
+            self.responseMap[pdu.__class__](pdu)
+
+    def sendSuccessResponse(self, reqPDU):
+        self.sendPDU(reqPDU.requireAck(reqPDU.seqNum, status=CommandStatus.ESME_ROK))
+
+    def handleBind(self, reqPDU):
+        self.sendSuccessResponse(reqPDU)
+        self.factory.clients.append(self)
+
+    def sendPDU(self, pdu):
+        if isinstance(pdu, PDURequest) and pdu.seqNum is None:
+            self.lastSeqNum += 1
+            pdu.seqNum = self.lastSeqNum
+
+        if self.transport is not None and self.transport.connected:
+            self.transport.write(self.encoder.encode(pdu))
+
+    def handleSubmit(self, reqPDU):
+        seq = bench_seq(reqPDU.params.get('short_message'))
+        if seq is not None:
+            self.factory.recorder.mark('smsc', seq)
+
+        if self.factory.resp_latency > 0:
+            reactor.callLater(self.factory.resp_latency, self.sendSubmitSmResponse, reqPDU, seq)
+        else:
+            self.sendSubmitSmResponse(reqPDU, seq)
+
+    def sendSubmitSmResponse(self, reqPDU, seq):
+        if random.random() < self.factory.error_ratio:
+            self.sendPDU(reqPDU.requireAck(reqPDU.seqNum, status=self.factory.error_status))
+            return
+
+        self.factory.lastMsgId += 1
+        msgid = str(self.factory.lastMsgId)
+        self.sendPDU(reqPDU.requireAck(reqPDU.seqNum, status=CommandStatus.ESME_ROK, message_id=msgid))
+
+        if random.random() < self.factory.dlr_ratio:
+            reactor.callLater(self.factory.dlr_delay, self.sendDLR, reqPDU, msgid, seq)
+
+    def sendDLR(self, submitPDU, msgid, seq):
+        pdu = DeliverSM(
+            source_addr=submitPDU.params['destination_addr'],
+            destination_addr=submitPDU.params['source_addr'],
+            short_message='id:%s sub:001 dlvrd:001 submit date:1305050826 done date:1305050826 '
+                          'stat:%s err:000 text:' % (msgid, self.factory.dlr_stat),
+            message_state=message_state_map[self.factory.dlr_stat],
+            receipted_message_id=msgid,
+        )
+
+        if seq is not None:
+            self.factory.recorder.mark('dlr_sent', seq)
+        self.sendPDU(pdu)
+
+    def sendMO(self, seq, source_addr, destination_addr):
+        self.factory.recorder.mark('mo_sent', seq)
+        self.sendPDU(DeliverSM(
+            source_addr=source_addr,
+            destination_addr=destination_addr,
+            short_message=(CONTENT % seq).encode(),
+        ))
+
+
+class BenchSMSCFactory(ServerFactory):
+    protocol = BenchSMSC
+
+    def __init__(self, recorder, resp_latency=0, error_ratio=0, error_status=CommandStatus.ESME_RSYSERR,
+                 dlr_ratio=1, dlr_delay=0, dlr_stat='DELIVRD'):
+        if dlr_stat not in message_state_map:
+            raise ValueError('Invalid dlr_stat: %s' % dlr_stat)
+
+        self.recorder = recorder
+        self.resp_latency = resp_latency
+        self.error_ratio = error_ratio
+        self.error_status = error_status
+        self.dlr_ratio = dlr_ratio
+        self.dlr_delay = dlr_delay
+        self.dlr_stat = dlr_stat
+
+        # Bound receivers and transceivers
+        self.clients = []
+        self.lastMsgId = 0
+
+    def sendMO(self, seq, source_addr='33700000000', destination_addr='1234'):
+        """Send a MO message through the first connected client, return False if none is connected"""
+        if len(self.clients) == 0:
+            return False
+
+        self.clients[0].sendMO(seq, source_addr, destination_addr)
+        return True
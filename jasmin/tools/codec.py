@@ -0,0 +1,177 @@
+"""
+Content codec for PDUs published on AMQP queues
+
+Two codecs are available:
+- pickle: the whole object is pickled (default)
+- smpp: PDUs are encoded in their binary SMPP form (smpp.pdu.pdu_encoding) behind a small
+        header, this is much smaller than pickled enum-heavy PDUs (saving broker memory and
+        bandwidth) but slower to encode and decode than C pickle.
+
+loads() detects the codec a body was encoded with, so consumers do not need to know what
+codec the publisher is configured with.
+"""
+
+import copy
+import io
+import logging
+import pickle
+import struct
+
+from smpp.pdu.constants import data_coding_default_value_map
+from smpp.pdu.error import SMPPError
+from smpp.pdu.pdu_encoding import PDUEncoder, DataCodingEncoder
+from smpp.pdu.pdu_types import DataCoding, DataCodingDefault
+from smpp.pdu.operations import PDU
+
+CODECS = ['pickle', 'smpp']
+
+# A pickle never starts with 0xff
+MAGIC = b'\xffJ'
+# Bump when changing the layout below, older versions must still be decoded
+VERSION = 1
+
+KIND_PDU = 1
+KIND_ROUTABLE = 2
+
+# magic, version, kind, pdus count
+HEADER = struct.Struct('!2sBBH')
+# Length of the pickled routable (without its pdu)
+ROUTABLE_LENGTH = struct.Struct('!I')
+# Flags restoring the in-memory values that are not representable on the wire
+PDU_FLAGS = struct.Struct('!B')
+FLAG_NO_SEQNUM = 1
+FLAG_INT_DATA_CODING = 2
+FLAG_EXTRAS = 4
+# Length of the pickled extra attributes (e.g. deliver_sm's dlr)
+EXTRAS_LENGTH = struct.Struct('!I')
+# PDU attributes carried on the wire
+WIRE_ATTRIBUTES = ['id', 'seqNum', 'status', 'params', 'custom_tlvs', 'nextPdu']
+
+_encoder = PDUEncoder()
+
+# Raised when an object cannot be represented with the smpp codec (TypeError) or when the
+# encoder rejects one of its values
+ENCODING_ERRORS = (TypeError, ValueError, KeyError, NotImplementedError, struct.error, SMPPError)
+
+logger = logging.getLogger('jasmin-codec')
+
+
+class CodecError(Exception):
+    """Raised when a body cannot be decoded"""
+
+
+def _pdu_chain(pdu):
+    pdus = [pdu]
+    while getattr(pdus[-1], 'nextPdu', None) is not None:
+        pdus.append(pdus[-1].nextPdu)
+
+    return pdus
+
+
+def _encode_pdu(pdu):
+    if len(getattr(pdu, 'custom_tlvs', [])) > 0:
+        raise TypeError('Custom TLVs cannot be decoded without their definitions')
+
+    flags = 0
+    extras = b''
+    _pdu = copy.copy(pdu)
+    _pdu.params = dict(pdu.params)
+
+    if _pdu.seqNum is None:
+        flags |= FLAG_NO_SEQNUM
+        _pdu.seqNum = 1
+    if isinstance(_pdu.params.get('data_coding'), int):
+        # Jasmin keeps data_coding as an int until it is sent
+        flags |= FLAG_INT_DATA_CODING
+        _pdu.params['data_coding'] = DataCoding(
+            schemeData=getattr(DataCodingDefault, data_coding_default_value_map[_pdu.params['data_coding']]))
+    _extras = {k: v for k, v in vars(pdu).items() if k not in WIRE_ATTRIBUTES}
+    if len(_extras) > 0:
+        flags |= FLAG_EXTRAS
+        extras = pickle.dumps(_extras, pickle.HIGHEST_PROTOCOL)
+        extras = EXTRAS_LENGTH.pack(len(extras)) + extras
+
+    return PDU_FLAGS.pack(flags) + extras + _encoder.encode(_pdu)
+
+
+def _decode_pdus(stream, count):
+    pdus = []
+    for _ in range(count):
+        flags, = PDU_FLAGS.unpack(stream.read(PDU_FLAGS.size))
+        extras = {}
+        if flags & FLAG_EXTRAS:
+            length, = EXTRAS_LENGTH.unpack(stream.read(EXTRAS_LENGTH.size))
+            extras = pickle.loads(stream.read(length))
+        pdu = _encoder.decode(stream)
+        pdu.__dict__.update(extras)
+
+        if flags & FLAG_NO_SEQNUM:
+            pdu.seqNum = None
+        if flags & FLAG_INT_DATA_CODING:
+            pdu.params['data_coding'] = DataCodingEncoder().encode(pdu.params['data_coding'])[0]
+
+        if len(pdus) > 0:
+            pdus[-1].nextPdu = pdu
+        pdus.append(pdu)
+
+    return pdus[0]
+
+
+def _smpp_dumps(obj):
+    if isinstance(obj, PDU):
+        pdus = _pdu_chain(obj)
+        return HEADER.pack(MAGIC, VERSION, KIND_PDU, len(pdus)) + b''.join([_encode_pdu(p) for p in pdus])
+    elif isinstance(getattr(obj, 'pdu', None), PDU):
+        # A routable: the pdu is encoded and the rest is pickled
+        pdus = _pdu_chain(obj.pdu)
+        routable = copy.copy(obj)
+        routable.pdu = None
+        pickled = pickle.dumps(routable, pickle.HIGHEST_PROTOCOL)
+
+        return (HEADER.pack(MAGIC, VERSION, KIND_ROUTABLE, len(pdus)) + ROUTABLE_LENGTH.pack(len(pickled)) +
+                pickled + b''.join([_encode_pdu(p) for p in pdus]))
+
+    raise TypeError('Cannot encode %s' % type(obj))
+
+
+def dumps(obj, codec='pickle', pickleProtocol=pickle.HIGHEST_PROTOCOL):
+    """Encode obj (a PDU or a routable) with the given codec, objects the smpp codec cannot
+    encode are pickled"""
+    if codec == 'smpp':
+        try:
+            return _smpp_dumps(obj)
+        except TypeError as e:
+            # Custom TLVs for example, loads() is handling both codecs
+            logger.debug('Pickling %s: %s', type(obj).__name__, e)
+        except ENCODING_ERRORS as e:
+            logger.warning('Cannot encode %s with the smpp codec, pickling it: %r', type(obj).__name__, e)
+
+    return pickle.dumps(obj, pickleProtocol)
+
+
+def loads(body):
+    """Decode a body encoded with any codec"""
+    if not body.startswith(MAGIC):
+        return pickle.loads(body)
+
+    try:
+        _, version, kind, count = HEADER.unpack_from(body)
+        if version != VERSION:
+            raise CodecError('Unsupported codec version: %s' % version)
+
+        stream = io.BytesIO(body)
+        stream.seek(HEADER.size)
+        if kind == KIND_PDU:
+            return _decode_pdus(stream, count)
+        elif kind == KIND_ROUTABLE:
+            length, = ROUTABLE_LENGTH.unpack(stream.read(ROUTABLE_LENGTH.size))
+            routable = pickle.loads(stream.read(length))
+            routable.pdu = _decode_pdus(stream, count)
+
+            return routable
+        else:
+            raise CodecError('Unknown content kind: %s' % kind)
+    except CodecError:
+        raise
+    except Exception as e:
+        raise CodecError('Cannot decode body: %r' % e)
@@ -25,12 +25,8 @@ class SmppsRealm:
         self.router_factory = router_factory
 
     def requestAvatar(self, avatarId, mind, *interfaces):
-        user = None
         # Lookout for user from router
-        for _user in self.router_factory.users:
-            if avatarId == _user.username:
-                user = _user
-                break
+        user = self.router_factory.getUserByUsername(avatarId)
 
         if user is None:
             return ('SMPPs', None, lambda: None)
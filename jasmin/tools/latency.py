@@ -0,0 +1,62 @@
+"""
+Latency histograms of the messaging path stages, exported by the http api's /metrics endpoint
+"""
+
+import time
+
+from jasmin.tools.singleton import Singleton
+from jasmin.tools.stats import Histogram
+
+# stage: label name (None for unlabeled stages) and help text
+STAGES = {
+    'httpapi_send': {'label': None,
+                     'help': b'HTTP /send request to submit.sm enqueuing latency.'},
+    'submit_sm_queue': {'label': 'cid',
+                        'help': b'Time spent by SubmitSm in submit.sm queue before being consumed.'},
+    'submit_sm_queue_priority': {'label': 'priority',
+                                 'help': b'Time spent by SubmitSm in submit.sm queues by priority level.'},
+    'submit_sm_resp': {'label': 'cid',
+                       'help': b'SubmitSm to SubmitSmResp round trip latency.'},
+    'interceptor': {'label': None,
+                    'help': b'Interceptor script run latency, including the RPC.'},
+    'dlr_lookup': {'label': None,
+                   'help': b'DLR lookup latency.'},
+    'throw': {'label': 'thrower',
+              'help': b'DeliverSm and DLR throwing latency.'},
+}
+
+
+class LatencyStatsCollector(metaclass=Singleton):
+    """Latency histograms collection holder, histograms are identified by a stage and
+    a label value (a cid for example)"""
+    histograms = {}
+    buckets = None
+
+    def setBuckets(self, buckets):
+        """Set buckets (upper bounds in seconds) of all histograms, existing ones are reset
+        when buckets are changed"""
+        buckets = tuple(sorted(buckets))
+        if buckets != (self.buckets or Histogram.default_buckets):
+            self.buckets = buckets
+            self.histograms.clear()
+
+    def get(self, stage, label=None):
+        """Return a stage histogram or instanciate a new one"""
+        key = (stage, label)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets)
+
+        return self.histograms[key]
+
+    def observe(self, stage, value, label=None):
+        self.get(stage, label).observe(value)
+
+    def timeDeferred(self, d, stage, label=None):
+        """Observe the time d is taking to fire (whatever the result is), return d"""
+        start = time.monotonic()
+
+        def _observe(result):
+            self.observe(stage, time.monotonic() - start, label)
+            return result
+
+        return d.addBoth(_observe)
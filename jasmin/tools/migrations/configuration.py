@@ -11,7 +11,7 @@ _REGEX_VER = re.compile(r'^(?P<major>(\d+))'
                         r'\.(?P<minor>(\d+))'
                         r'([a-z.]*)'
                         r'(?P<patch>(\d+))$')
-_REGEX_HEADER = re.compile(r'^Persisted on (?P<date>(.*)) \[Jasmin (?P<release_version>(.*))\]')
+_REGEX_HEADER = re.compile(r'^Persisted on (?P<date>(.*?)) \[Jasmin (?P<release_version>([^\]]*))\]')
 
 
 def version_parse(version):
@@ -1,3 +1,5 @@
+import time
+
 from twisted.internet import defer, reactor
 
 
@@ -7,3 +9,67 @@ def slow_down(seconds):
     waitDeferred = defer.Deferred()
     reactor.callLater(seconds, waitDeferred.callback, None)
     yield waitDeferred
+
+
+class TokenBucket:
+    """Token bucket rate limiter
+
+    The bucket is refilled with `rate` tokens per second up to `burst` tokens, tokens are
+    reserved ahead of time: concurrent consumers are queued behind each other and the
+    configured rate is respected whatever the number of messages in flight is.
+
+    A rate of 0 (or lower) disables limiting.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+
+        self.clock = clock
+        self.rate = float(rate)
+        self.burst = float(burst)
+        # Start with a full bucket
+        self.tokens = self.burst
+        self.last_refill_at = clock()
+
+    def set_rate(self, rate, burst=None):
+        """Change rate (and burst) without losing the reserved tokens"""
+        self._refill()
+        if self.rate <= 0:
+            # Limiting was disabled
+            self.tokens = self.burst
+
+        self.rate = float(rate)
+        if burst is not None:
+            if burst < 1:
+                raise ValueError('burst must be at least 1')
+            self.tokens += burst - self.burst
+            self.burst = float(burst)
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = self.clock()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill_at) * self.rate)
+        self.last_refill_at = now
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket and return the delay (in seconds) to wait
+        before using them"""
+        if self.rate <= 0:
+            return 0
+
+        self._refill()
+        self.tokens -= tokens
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / self.rate
+
+    def consume(self, tokens=1):
+        """Return a deferred fired when tokens can be used"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            return slow_down(delay)
+
+        return defer.succeed(delay)
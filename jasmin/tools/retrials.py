@@ -0,0 +1,122 @@
+"""
+Bounded retrial trackers, counting how many times a message (by its id) was tried
+
+Trackers are evicting entries not updated for ttl seconds and the least recently updated ones
+when holding more than max_size entries: messages leaving the queue through a path not removing
+their tracker entry are not kept forever.
+"""
+
+import time
+from collections import OrderedDict
+
+from jasmin.tools.singleton import Singleton
+from jasmin.tools.stats import Stats
+
+
+class RetrialTrackerStatistics(Stats):
+    """One retrial tracker statistics holder"""
+
+    def __init__(self, name):
+        self.name = name
+
+        self.init()
+
+    def init(self):
+        self._stats = {
+            'size': 0,
+            'hit_count': 0,
+            'miss_count': 0,
+            'eviction_count': 0,
+            'expiry_count': 0,
+        }
+
+    def getStats(self):
+        return self._stats
+
+
+class RetrialTrackerStatsCollector(metaclass=Singleton):
+    """Retrial trackers statistics collection holder"""
+    trackers = {}
+
+    def get(self, name):
+        """Return a tracker's stats object or instanciate a new one"""
+        if name not in self.trackers:
+            self.trackers[name] = RetrialTrackerStatistics(name)
+
+        return self.trackers[name]
+
+
+class RetrialTracker:
+    """Retrial counts by message id, with ttl and lru eviction"""
+
+    def __init__(self, name, max_size=100000, ttl=86400, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = RetrialTrackerStatsCollector().get(name)
+
+        # msgid: (count, last update time), least recently updated first
+        self._counts = OrderedDict()
+
+    def _expire(self):
+        now = self.clock()
+        while self._counts:
+            msgid, (_, updated_at) = next(iter(self._counts.items()))
+            if now - updated_at < self.ttl:
+                break
+
+            del self._counts[msgid]
+            self.stats.inc('expiry_count')
+
+        self.stats.set('size', len(self._counts))
+
+    def __len__(self):
+        self._expire()
+        return len(self._counts)
+
+    def __contains__(self, msgid):
+        self._expire()
+        return msgid in self._counts
+
+    def __getitem__(self, msgid):
+        self._expire()
+        return self._counts[msgid][0]
+
+    def __setitem__(self, msgid, count):
+        self._counts.pop(msgid, None)
+        self._counts[msgid] = (count, self.clock())
+
+        while len(self._counts) > self.max_size:
+            self._counts.popitem(last=False)
+            self.stats.inc('eviction_count')
+
+        self._expire()
+
+    def __delitem__(self, msgid):
+        del self._counts[msgid]
+        self.stats.set('size', len(self._counts))
+
+    def get(self, msgid, default=None):
+        self._expire()
+        if msgid in self._counts:
+            return self._counts[msgid][0]
+
+        return default
+
+    def pop(self, msgid, default=None):
+        count, _ = self._counts.pop(msgid, (default, None))
+        self.stats.set('size', len(self._counts))
+        return count
+
+    def inc(self, msgid, initial=1):
+        """Count a new try of msgid, starting from initial if it is not tracked, return its count"""
+        count = self.get(msgid)
+        if count is None:
+            self.stats.inc('miss_count')
+            count = initial
+        else:
+            self.stats.inc('hit_count')
+            count += 1
+
+        self[msgid] = count
+        return count
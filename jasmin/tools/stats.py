@@ -1,3 +1,6 @@
+import bisect
+
+
 class KeyNotFound(Exception):
     """
     Raised when setting or getting an unknown statistics key
@@ -40,3 +43,35 @@ class Stats:
             raise KeyNotIncrementable(key)
 
         self._stats[key] -= inc
+
+
+class Histogram:
+    """Latency histogram with cumulative buckets (upper bounds in seconds), like
+    prometheus histograms
+    """
+
+    # Milliseconds to seconds
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.bounds = tuple(sorted(buckets or self.default_buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record a value (in seconds)"""
+        # The last count is the +Inf bucket
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def getBuckets(self):
+        """Return a list of (upper bound, cumulative count), the last upper bound being +Inf"""
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+
+        return buckets
@@ -0,0 +1,57 @@
+class PrefixTrie:
+    """A character trie mapping string prefixes to values
+
+    Used for prefix lookups on addresses (e.g. destination_addr), every lookup is bound
+    to the length of the looked up key instead of the number of stored prefixes.
+    """
+
+    def __init__(self):
+        # Every node is a [children, values] pair
+        self._root = [{}, []]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, prefix, value=True):
+        """Attach value to prefix, a prefix can hold many values"""
+        node = self._root
+        for c in prefix:
+            children = node[0]
+            if c not in children:
+                children[c] = [{}, []]
+            node = children[c]
+
+        if len(node[1]) == 0:
+            self._size += 1
+        node[1].append(value)
+
+    def __contains__(self, prefix):
+        node = self._root
+        for c in prefix:
+            node = node[0].get(c)
+            if node is None:
+                return False
+
+        return len(node[1]) > 0
+
+    def matches(self, key):
+        """Yield (prefix, values) for every stored prefix of key, shortest first"""
+        node = self._root
+        if len(node[1]) > 0:
+            yield '', node[1]
+
+        for i, c in enumerate(key):
+            node = node[0].get(c)
+            if node is None:
+                return
+            if len(node[1]) > 0:
+                yield key[:i + 1], node[1]
+
+    def longest_match(self, key):
+        """Return the longest stored prefix of key or None if there's no match"""
+        longest = None
+        for prefix, _ in self.matches(key):
+            longest = prefix
+
+        return longest
@@ -1,5 +1,4 @@
 # Gist from https://gist.github.com/farirat/5701d71bf6e404d17cb4
-import cPickle as pickle
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet import reactor
 from twisted.internet.protocol import ClientCreator
@@ -10,6 +9,9 @@ from txamqp.client import TwistedDelegate
 
 import txamqp.spec
 
+# Bodies may be pickled or encoded with the smpp pdu_codec
+from jasmin.tools import codec
+
 @inlineCallbacks
 def gotConnection(conn, username, password):
     print("Connected to broker.")
@@ -33,7 +35,7 @@ def gotConnection(conn, username, password):
     while True:
         msg = yield queue.get()
         props = msg.content.properties
-        pdu = pickle.loads(msg.content.body)
+        pdu = codec.loads(msg.content.body)
 
     	if msg.routing_key[:15] == 'submit.sm.resp.':
     		print('SubmitSMResp: status: %s, msgid: %s' % (pdu.status,)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 """This script will log all sent sms through Jasmin with user information.
 
+Note: cdrd (jasmin/bin/cdrd.py, configured through cdr.cfg) is writing the same records in batches
+and is acking messages once they are committed, it should be preferred to this script.
+
 Requirement:
 - Activate publish_submit_sm_resp in jasmin.cfg
 - Install psycopg2:             # Used for PostgreSQL connection
@@ -99,6 +102,8 @@ import txamqp.spec
 
 from smpp.pdu.pdu_types import DataCoding
 
+from jasmin.tools import codec
+
 from mysql.connector import connect as _mysql_connect
 from psycopg2 import pool as _postgres_pool
 from psycopg2 import Error as _postgres_error
@@ -271,7 +276,7 @@ def gotConnection(conn, username, password):
                     pass
 
         if msg.routing_key[:10] == 'submit.sm.' and msg.routing_key[:15] != 'submit.sm.resp.':
-            pdu = pickle.loads(msg.content.body)
+            pdu = codec.loads(msg.content.body)
             pdu_count = 1
             short_message = pdu.params['short_message']
             billing = props['headers']
@@ -325,7 +330,7 @@ def gotConnection(conn, username, password):
         elif msg.routing_key[:15] == 'submit.sm.resp.':
             # It's a submit_sm_resp
 
-            pdu = pickle.loads(msg.content.body)
+            pdu = codec.loads(msg.content.body)
             if props['message-id'] not in q:
                 print('*** Got resp of an unknown submit_sm: %s' % props['message-id'], flush=True)
                 chan.basic_ack(delivery_tag=msg.delivery_tag)
@@ -0,0 +1,165 @@
+"""
+Test cases for the CDR writer and its sqlite sink
+"""
+
+from twisted.internet import defer, task
+from twisted.trial.unittest import TestCase
+from smpp.pdu.operations import SubmitSMResp
+from smpp.pdu.pdu_types import CommandStatus
+
+from jasmin.cdr.configs import CDRConfig
+from jasmin.cdr.sinks import SQLSink
+from jasmin.cdr.writer import CDRWriter
+from jasmin.protocols.smpp.configs import SMPPClientConfig
+from jasmin.protocols.smpp.operations import SMPPOperationFactory
+from jasmin.tools import codec
+
+
+class CDRWriterTestCase(TestCase):
+    def setUp(self):
+        self.config = CDRConfig()
+        self.config.sqlite_path = self.mktemp()
+        self.config.log_file = 'stdout'
+        self.sink = SQLSink(self.config)
+        self.writer = CDRWriter(self.config, self.sink)
+        self.opFactory = SMPPOperationFactory(SMPPClientConfig(id='test-id'))
+
+    def tearDown(self):
+        self.sink.close()
+
+    def submit_sm(self, msgid, cid='abc'):
+        pdu = self.opFactory.SubmitSM(short_message=b'hello', source_addr=b'jasmin',
+                                      destination_addr=b'06155423')
+        properties = {'message-id': msgid,
+                      'headers': {'source_connector': 'httpapi', 'created_at': '2026-01-01 00:00:00'}}
+        self.writer.handle('submit.sm.%s' % cid, properties, codec.dumps(pdu))
+
+    def submit_sm_resp(self, msgid, status=CommandStatus.ESME_ROK, cid='abc'):
+        pdu = SubmitSMResp(seqNum=1, status=status, message_id='remote-%s' % msgid)
+        properties = {'message-id': msgid, 'headers': {'created_at': '2026-01-01 00:00:01'}}
+        self.writer.handle('submit.sm.resp.%s' % cid, properties, codec.dumps(pdu))
+
+    def dlr(self, msgid, message_status):
+        self.writer.handle('dlr_thrower.http', {'message-id': msgid, 'headers': {'message_status': message_status}},
+                           msgid)
+
+    def select(self):
+        return self.sink.pool.runQuery('SELECT msgid, routed_cid, destination_addr, short_message, status, trials '
+                                       'FROM submit_log ORDER BY msgid')
+
+    @defer.inlineCallbacks
+    def test_write(self):
+        yield self.sink.setup()
+
+        self.submit_sm('msg1')
+        self.submit_sm_resp('msg1')
+        self.submit_sm('msg2')
+        self.writer.last_delivery_tag = 3
+        yield self.writer.flush()
+
+        # msg2 is waiting for its SubmitSmResp
+        rows = yield self.select()
+        self.assertEqual([('msg1', 'abc', '06155423', b'hello', 'ESME_ROK', 1),
+                          ('msg2', 'abc', '06155423', b'hello', 'PENDING', 0)], rows)
+        self.assertEqual(0, len(self.writer.records))
+        self.assertEqual(None, self.writer.last_delivery_tag)
+
+        self.submit_sm_resp('msg2')
+        self.writer.last_delivery_tag = 4
+        yield self.writer.flush()
+
+        rows = yield self.select()
+        self.assertEqual(('msg2', 'ESME_ROK', 1), (rows[1][0], rows[1][4], rows[1][5]))
+
+    @defer.inlineCallbacks
+    def test_status_update(self):
+        yield self.sink.setup()
+
+        # Receipt of a buffered record
+        self.submit_sm('msg1')
+        self.submit_sm_resp('msg1')
+        self.dlr('msg1', 'ESME_ROK')
+        self.dlr('msg1', 'DELIVRD')
+        # Receipt of a record written with an earlier batch
+        self.submit_sm('msg2')
+        self.submit_sm_resp('msg2')
+        self.writer.last_delivery_tag = 6
+        yield self.writer.flush()
+        self.dlr('msg2', 'UNDELIV')
+        self.writer.last_delivery_tag = 7
+        yield self.writer.flush()
+
+        rows = yield self.select()
+        self.assertEqual(['DELIVRD', 'UNDELIV'], [row[4] for row in rows])
+
+    @defer.inlineCallbacks
+    def test_trials(self):
+        yield self.sink.setup()
+
+        # Retried in the same batch
+        self.submit_sm('msg1')
+        self.submit_sm_resp('msg1', CommandStatus.ESME_RTHROTTLED)
+        self.submit_sm('msg1')
+        self.submit_sm_resp('msg1')
+        # Retried across batches
+        self.submit_sm('msg2')
+        self.submit_sm_resp('msg2', CommandStatus.ESME_RTHROTTLED)
+        self.writer.last_delivery_tag = 6
+        yield self.writer.flush()
+        self.submit_sm('msg2')
+        self.submit_sm_resp('msg2')
+        self.writer.last_delivery_tag = 8
+        yield self.writer.flush()
+
+        rows = yield self.select()
+        self.assertEqual([('msg1', 'ESME_ROK', 2), ('msg2', 'ESME_ROK', 2)],
+                         [(row[0], row[4], row[5]) for row in rows])
+
+    @defer.inlineCallbacks
+    def test_failed_batch_is_retried(self):
+        # The table is not created yet, the batch cannot be written
+        self.submit_sm('msg1')
+        self.submit_sm_resp('msg1')
+        self.writer.last_delivery_tag = 2
+        yield self.writer.flush()
+
+        self.assertIn('msg1', self.writer.records)
+        self.assertEqual(2, self.writer.last_delivery_tag)
+
+        yield self.sink.setup()
+        self.submit_sm('msg2')
+        self.submit_sm_resp('msg2')
+        self.writer.last_delivery_tag = 4
+        yield self.writer.flush()
+
+        rows = yield self.select()
+        self.assertEqual(['msg1', 'msg2'], [row[0] for row in rows])
+        self.assertEqual(0, len(self.writer.records))
+
+    @defer.inlineCallbacks
+    def test_ack_error_keeps_flushing(self):
+        yield self.sink.setup()
+
+        class ClosedChannel:
+            def basic_ack(self, delivery_tag, multiple):
+                return defer.fail(Exception('Channel closed'))
+
+        class Broker:
+            chan = ClosedChannel()
+
+        self.writer.amqpBroker = Broker()
+        clock = task.Clock()
+        self.writer.flushTimer.clock = clock
+        self.writer.flushTimer.start(1, now=False)
+        self.addCleanup(self.writer.flushTimer.stop)
+
+        for i, msgid in enumerate(['msg1', 'msg2']):
+            self.submit_sm(msgid)
+            self.writer.last_delivery_tag = i + 1
+            clock.advance(1)
+            yield self.writer.flushing
+
+        # The periodic flush is still running after the failed acks
+        self.assertTrue(self.writer.flushTimer.running)
+        rows = yield self.select()
+        self.assertEqual(['msg1', 'msg2'], [row[0] for row in rows])
@@ -1,15 +1,17 @@
+import pickle
 from datetime import datetime
 
 from testfixtures import LogCapture
 from twisted.cred import portal
 from twisted.cred.checkers import AllowAnonymousAccess, InMemoryUsernamePasswordDatabaseDontUse
-from twisted.internet import reactor, defer
+from twisted.internet import reactor, defer, task
 from twisted.spread import pb
 from twisted.trial.unittest import TestCase
 
 from jasmin.interceptor.configs import InterceptorPBConfig
 from jasmin.interceptor.interceptor import InterceptorPB
-from jasmin.interceptor.proxies import InterceptorPBProxy, InvalidRoutableObject, InvalidScriptObject
+from jasmin.interceptor.proxies import (InterceptorPBProxy, InterceptorEmbedded, InvalidRoutableObject,
+                                       InvalidScriptObject)
 from jasmin.routing.Routables import SimpleRoutablePDU, Routable
 from jasmin.routing.jasminApi import *
 from jasmin.tools.cred.portal import JasminPBRealm
@@ -27,9 +29,9 @@ class InterceptorPBTestCase(TestCase):
         self.InterceptorPBConfigInstance.authentication = authentication
 
         # Launch the interceptor pb server
-        pbRoot = InterceptorPB(self.InterceptorPBConfigInstance)
+        self.pbRoot = self.interceptorPB(self.InterceptorPBConfigInstance)
 
-        p = portal.Portal(JasminPBRealm(pbRoot))
+        p = portal.Portal(JasminPBRealm(self.pbRoot))
         if not authentication:
             p.registerChecker(AllowAnonymousAccess())
         else:
@@ -64,8 +66,12 @@ class InterceptorPBTestCase(TestCase):
         self.script_http_status = InterceptorScript('http_status = 404')
         self.script_smpp_status = InterceptorScript('smpp_status = 64')
 
+    def interceptorPB(self, config):
+        return InterceptorPB(config)
+
     @defer.inlineCallbacks
     def tearDown(self):
+        self.pbRoot.stop()
         yield self.IPBServer.stopListening()
 
 class IntercentorPBProxyTestCase(InterceptorPBProxy, InterceptorPBTestCase):
@@ -192,11 +198,152 @@ class RunScriptTestCases(IntercentorPBProxyTestCase):
         yield self.run_script(self.script_3_second, self.routable_simple)
 
         # Assert last logged line:
-        self.assertEqual('Execution delay [3s] for script [import time;time.sleep(3)].', lc.records[len(lc.records) - 1].getMessage())
+        self.assertRegex(lc.records[len(lc.records) - 1].getMessage(),
+                         r'^Execution delay \[3\.\d{3}s\] for script \[import time;time.sleep\(3\)\]\.$')
 
         # Set threshold to 5s
         self.InterceptorPBConfigInstance.log_slow_script = 5
         # Dont log script with ~3s execution time
         yield self.run_script(self.script_3_second, self.routable_simple)
         # Assert last logged line:
-        self.assertEqual('... took 3 seconds.', lc.records[len(lc.records) - 1].getMessage())
+        self.assertRegex(lc.records[len(lc.records) - 1].getMessage(), r'^\.\.\. took 3\.\d{3} seconds\.$')
+
+
+class PoolRunScriptTestCases(RunScriptTestCases):
+    """Same as RunScriptTestCases with scripts run in worker processes"""
+
+    def interceptorPB(self, config):
+        config.workers = 2
+        config.script_timeout = 2
+        config.max_pending_scripts = 2
+        return RunScriptTestCases.interceptorPB(self, config)
+
+    @defer.inlineCallbacks
+    def test_slow_script_logging(self):
+        self.pbRoot.pool.timeout = 5
+
+        yield RunScriptTestCases.test_slow_script_logging(self)
+
+    @defer.inlineCallbacks
+    def test_timeout(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        r = yield self.run_script(self.script_3_second, self.routable_simple)
+        self.assertEqual({'http_status': 504, 'smpp_status': 8, 'extra': {}, 'error': 'timeout'}, r)
+        self.assertEqual(1, self.pbRoot.stats.get(self.script_3_second.pyCode).get('timeout_count'))
+
+        # Worker was restarted
+        r = yield self.run_script(self.script_generic, self.routable_simple)
+        self.assertTrue(isinstance(self.unpickle(r), Routable))
+
+    @defer.inlineCallbacks
+    def test_timeout_does_not_fail_other_scripts(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        # Started while the other worker is running the script that will time out
+        script = InterceptorScript('import time;time.sleep(1.5)')
+        d_timeout = self.run_script(self.script_3_second, self.routable_simple)
+        yield task.deferLater(reactor, 1, lambda: None)
+        d = self.run_script(script, self.routable_simple)
+
+        r = yield d_timeout
+        self.assertEqual('timeout', r['error'])
+        r = yield d
+        self.assertTrue(isinstance(self.unpickle(r), Routable))
+
+    @defer.inlineCallbacks
+    def test_max_pending_scripts(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        script = InterceptorScript('import time;time.sleep(0.5)')
+        r = yield defer.gatherResults([self.run_script(script, self.routable_simple) for _ in range(3)])
+
+        self.assertEqual({'http_status': 503, 'smpp_status': 8, 'extra': {}, 'error': 'overload'}, r[2])
+        for _r in r[:2]:
+            self.assertTrue(isinstance(self.unpickle(_r), Routable))
+
+    @defer.inlineCallbacks
+    def test_script_defining_a_function(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        script = InterceptorScript("def set_status(status):\n"
+                                   "    return status\n"
+                                   "smpp_status = set_status(8)\n"
+                                   "http_status = set_status(403)")
+        r = yield self.run_script(script, self.routable_simple)
+
+        self.assertEqual({'http_status': 403, 'smpp_status': 8, 'extra': {}}, r)
+
+    @defer.inlineCallbacks
+    def test_script_creating_a_logging_handler(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        script = InterceptorScript("import logging\n"
+                                   "hdlr = logging.StreamHandler()\n"
+                                   "logger = logging.getLogger('test-pool-logging')\n"
+                                   "logger.addHandler(hdlr)\n"
+                                   "routable.pdu.params['service_type'] = 'CMT'")
+        r = yield self.run_script(script, self.routable_simple)
+
+        self.assertEqual('CMT', self.unpickle(r).pdu.params['service_type'])
+
+    @defer.inlineCallbacks
+    def test_stats(self):
+        yield self.connect('127.0.0.1', self.ipbPort)
+
+        script = InterceptorScript('somevar = "stats"')
+        yield self.run_script(script, self.routable_simple)
+        yield self.run_script(script, self.routable_simple)
+
+        stats = yield self.stats()
+        script_stats = stats[self.pbRoot.stats.get(script.pyCode).script_id]
+        self.assertEqual(2, script_stats['run_count'])
+        self.assertEqual(2, script_stats['latency']['count'])
+        # Both took less than 1 second
+        self.assertEqual((1.0, 2), script_stats['latency']['buckets'][9])
+
+
+class EmbeddedTestCases(InterceptorPBTestCase):
+    def setUp(self, authentication=False):
+        InterceptorPBTestCase.setUp(self, authentication)
+
+        self.interceptor = InterceptorEmbedded(self.InterceptorPBConfigInstance)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.interceptor.disconnect()
+        yield InterceptorPBTestCase.tearDown(self)
+
+    @defer.inlineCallbacks
+    def test_routable_is_not_pickled(self):
+        script = InterceptorScript("routable.pdu.params['service_type'] = 'CMT'")
+
+        r = yield self.interceptor.run_script(script, self.routable_simple)
+
+        # The routable itself is updated
+        self.assertIs(r, self.routable_simple)
+        self.assertEqual('CMT', r.pdu.params['service_type'])
+
+    @defer.inlineCallbacks
+    def test_return_value(self):
+        r = yield self.interceptor.run_script(self.script_syntax_error, self.routable_simple)
+        self.assertFalse(r)
+
+        r = yield self.interceptor.run_script(self.script_http_status, self.routable_simple)
+        self.assertEqual({'http_status': 404, 'smpp_status': 255, 'extra': {}}, r)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(InvalidRoutableObject, self.interceptor.run_script, self.script_generic, 'anything')
+        self.assertRaises(InvalidScriptObject, self.interceptor.run_script, 'anything', self.routable_simple)
+
+    @defer.inlineCallbacks
+    def test_pool(self):
+        yield self.interceptor.disconnect()
+        self.InterceptorPBConfigInstance.workers = 1
+        self.interceptor = InterceptorEmbedded(self.InterceptorPBConfigInstance)
+
+        script = InterceptorScript("routable.pdu.params['service_type'] = 'CMT'")
+        r = yield self.interceptor.run_script(script, self.routable_simple)
+
+        # Routable is pickled for being sent to the worker
+        self.assertEqual('CMT', pickle.loads(r).pdu.params['service_type'])
@@ -0,0 +1,218 @@
+"""
+Test cases for the benchmark harness
+"""
+
+import itertools
+import logging
+
+from twisted.internet import defer, reactor
+from twisted.trial.unittest import TestCase
+from twisted.web.test.requesthelper import DummyRequest
+from smpp.pdu.pdu_types import CommandStatus, RegisteredDelivery, RegisteredDeliveryReceipt
+
+from jasmin.protocols.smpp.configs import SMPPClientConfig
+from jasmin.protocols.smpp.factory import SMPPClientFactory
+from jasmin.protocols.smpp.operations import SMPPOperationFactory
+from jasmin.tools.bench import report
+from jasmin.tools.bench.load import SMPPSendDriver
+from jasmin.tools.bench.receiver import Receiver
+from jasmin.tools.bench.smsc import BenchSMSCFactory, bench_seq
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReportTestCase(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(50, report.percentile(values, 50))
+        self.assertEqual(95, report.percentile(values, 95))
+        self.assertEqual(99, report.percentile(values, 99))
+        self.assertEqual(7, report.percentile([7], 99))
+        self.assertEqual(None, report.percentile([], 50))
+
+    def test_histogram_quantile(self):
+        buckets = [(0.1, 50), (0.2, 100), (float('inf'), 100)]
+
+        self.assertAlmostEqual(0.1, report.histogram_quantile(0.5, buckets))
+        self.assertAlmostEqual(0.15, report.histogram_quantile(0.75, buckets))
+        self.assertEqual(None, report.histogram_quantile(0.5, [(0.1, 0), (float('inf'), 0)]))
+
+        # Falling in +Inf bucket returns the highest finite bound
+        self.assertAlmostEqual(0.2, report.histogram_quantile(0.99, [(0.2, 1), (float('inf'), 2)]))
+
+    def test_latency_histograms(self):
+        before = report.latency_histograms(report.parse_metrics(
+            '# TYPE latency_submit_sm_resp_seconds histogram\n'
+            'latency_submit_sm_resp_seconds_bucket{cid="abc",le="0.1"} 1\n'
+            'latency_submit_sm_resp_seconds_bucket{cid="abc",le="+Inf"} 2\n'
+            'latency_submit_sm_resp_seconds_count{cid="abc"} 2\n'
+            'smppc_submit_sm_count{cid="abc"} 2\n'))
+        after = report.latency_histograms(report.parse_metrics(
+            'latency_submit_sm_resp_seconds_bucket{cid="abc",le="0.1"} 4\n'
+            'latency_submit_sm_resp_seconds_bucket{cid="abc",le="+Inf"} 6\n'
+            'latency_httpapi_send_seconds_bucket{le="+Inf"} 3\n'))
+
+        self.assertEqual({('submit_sm_resp', 'cid=abc'): [(0.1, 1), (float('inf'), 2)]}, before)
+        self.assertEqual({('submit_sm_resp', 'cid=abc'): [(0.1, 3), (float('inf'), 4)],
+                          ('httpapi_send', ''): [(float('inf'), 3)]},
+                         report.diff_histograms(before, after))
+
+    def test_recorder(self):
+        clock = Clock()
+        recorder = report.Recorder(clock=clock)
+
+        recorder.mark('sent', 1)
+        clock.now += 0.5
+        # DLR is received before its acceptance response
+        recorder.markMsgid('dlr_received', 'msgid-1')
+        clock.now += 0.5
+        recorder.accepted(1, 'msgid-1')
+
+        self.assertEqual([1.0], recorder.latencies('sent', 'accepted'))
+        self.assertEqual([0.5], recorder.latencies('sent', 'dlr_received'))
+        self.assertEqual({'count': 1, 50: 1.0, 95: 1.0, 99: 1.0}, recorder.stages()['accept'])
+
+        # First mark is kept
+        recorder.mark('sent', 1)
+        self.assertEqual([1.0], recorder.latencies('sent', 'accepted'))
+
+    def test_receiver(self):
+        recorder = report.Recorder()
+        recorder.accepted(1, 'msgid-1')
+        receiver = Receiver(recorder)
+
+        request = DummyRequest([b'dlr'])
+        request.args = {b'id': [b'msgid-1'], b'message_status': [b'DELIVRD']}
+        self.assertEqual(b'ACK/Jasmin', receiver.render_POST(request))
+
+        request = DummyRequest([b'mo'])
+        request.args = {b'content': [b'bench 7']}
+        self.assertEqual(b'ACK/Jasmin', receiver.render_POST(request))
+
+        self.assertEqual(1, recorder.count('dlr_received'))
+        self.assertIn(7, recorder.events['mo_received'])
+
+    def test_bench_seq(self):
+        self.assertEqual(12, bench_seq(b'bench 12'))
+        self.assertEqual(12, bench_seq('bench 12'))
+        self.assertEqual(None, bench_seq(b'hello'))
+        self.assertEqual(None, bench_seq(None))
+
+
+class BenchSMSCTestCase(TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.recorder = report.Recorder()
+        self.smsc = BenchSMSCFactory(self.recorder)
+        self.smscPort = reactor.listenTCP(0, self.smsc)
+
+        self.received = []
+        self.config = SMPPClientConfig(id='bench_test', port=self.smscPort.getHost().port,
+                                       log_level=logging.CRITICAL)
+        self.opFactory = SMPPOperationFactory(self.config)
+        self.client = SMPPClientFactory(self.config, msgHandler=lambda smpp, pdu: self.received.append(pdu))
+        yield self.client.connectAndBind()
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.client.disconnectAndDontRetryToConnect()
+        yield self.smscPort.stopListening()
+
+    def submit_sm(self, content):
+        return self.client.smpp.sendDataRequest(self.opFactory.SubmitSM(
+            short_message=content, source_addr='1234', destination_addr='4567',
+            registered_delivery=RegisteredDelivery(RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED)))
+
+    def wait(self, seconds):
+        d = defer.Deferred()
+        reactor.callLater(seconds, d.callback, None)
+        return d
+
+    @defer.inlineCallbacks
+    def test_submit_sm_and_dlr(self):
+        r = yield self.submit_sm(b'bench 3')
+        yield self.wait(0.1)
+
+        self.assertIn(3, self.recorder.events['smsc'])
+        self.assertIn(3, self.recorder.events['dlr_sent'])
+        self.assertEqual(1, len(self.received))
+        self.assertEqual(r.response.params['message_id'], self.received[0].params['receipted_message_id'])
+
+    @defer.inlineCallbacks
+    def test_error_ratio(self):
+        self.smsc.error_ratio = 1
+
+        r = yield self.submit_sm(b'bench 4')
+        self.assertEqual(CommandStatus.ESME_RSYSERR, r.response.status)
+        yield self.wait(0.1)
+
+        self.assertIn(4, self.recorder.events['smsc'])
+        self.assertNotIn('dlr_sent', self.recorder.events)
+        self.assertEqual(0, len(self.received))
+
+    @defer.inlineCallbacks
+    def test_resp_latency(self):
+        self.smsc.resp_latency = 0.2
+        self.smsc.dlr_ratio = 0
+
+        yield self.submit_sm(b'bench 5')
+        self.assertGreaterEqual(self.recorder.clock() - self.recorder.events['smsc'][5], 0.2)
+        self.assertNotIn('dlr_sent', self.recorder.events)
+
+    @defer.inlineCallbacks
+    def test_mo(self):
+        self.assertTrue(self.smsc.sendMO(9))
+        yield self.wait(0.1)
+
+        self.assertIn(9, self.recorder.events['mo_sent'])
+        self.assertEqual(b'bench 9', self.received[0].params['short_message'])
+
+
+class SMPPSendDriverTestCase(TestCase):
+    "The fake SMSC is standing for jasmin's SMPP server"
+
+    def setUp(self):
+        self.recorder = report.Recorder()
+        self.smsc = BenchSMSCFactory(self.recorder)
+        self.smscPort = reactor.listenTCP(0, self.smsc)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.driver.close()
+        yield self.smscPort.stopListening()
+
+    @defer.inlineCallbacks
+    def test_rate(self):
+        self.driver = SMPPSendDriver(self.recorder, itertools.count(1), 200, 20, '127.0.0.1',
+                                     self.smscPort.getHost().port, 'bench', 'bench')
+        yield self.driver.start()
+
+        # 20 messages at 200 msg/s
+        sent = sorted(self.recorder.events['sent'].values())
+        self.assertGreaterEqual(sent[-1] - sent[0], 0.08)
+        self.assertEqual(20, self.recorder.count('accepted'))
+        self.assertEqual(20, self.recorder.count('smsc'))
+        self.assertEqual({}, self.recorder.errors)
+
+        waitDeferred = defer.Deferred()
+        reactor.callLater(0.1, waitDeferred.callback, None)
+        yield waitDeferred
+        self.assertEqual(20, self.recorder.count('dlr_received'))
+        self.assertEqual(20, self.recorder.stages()['end_to_end']['count'])
+
+    @defer.inlineCallbacks
+    def test_errors(self):
+        self.smsc.error_ratio = 1
+        self.driver = SMPPSendDriver(self.recorder, itertools.count(1), 100, 5, '127.0.0.1',
+                                     self.smscPort.getHost().port, 'bench', 'bench')
+        yield self.driver.start()
+
+        self.assertEqual(0, self.recorder.count('accepted'))
+        self.assertEqual({'smpp_ESME_RSYSERR': 5}, self.recorder.errors)
@@ -0,0 +1,189 @@
+"""
+Test cases for the PDU content codec
+"""
+
+import io
+import os
+import pickle
+import timeit
+
+from twisted.python import log
+from twisted.trial.unittest import TestCase
+from smpp.pdu.operations import DeliverSM
+from smpp.pdu.pdu_encoding import PDUEncoder
+from smpp.pdu.pdu_types import AddrTon, RegisteredDelivery, RegisteredDeliveryReceipt
+
+from jasmin.managers.configs import SMPPClientPBConfig
+from jasmin.managers.content import DeliverSmContent, SubmitSmRespContent
+from jasmin.protocols.smpp.configs import SMPPClientConfig
+from jasmin.protocols.smpp.operations import SMPPOperationFactory
+from jasmin.routing.Routables import RoutableDeliverSm
+from jasmin.routing.content import RoutedDeliverSmContent
+from jasmin.routing.jasminApi import SmppClientConnector, HttpConnector
+from jasmin.tools import codec
+
+
+class CodecTestCase(TestCase):
+    def setUp(self):
+        self.opFactory = SMPPOperationFactory(SMPPClientConfig(id='test-codec'))
+
+    def submit_sm(self, short_message=b'Hello world !', split='sar', **kwargs):
+        self.opFactory.long_content_split = split
+        return self.opFactory.SubmitSM(short_message=short_message, source_addr=b'20203060',
+                                       destination_addr=b'20203060', **kwargs)
+
+    def deliver_sm(self):
+        pdu = DeliverSM(seqNum=1, source_addr=b'06155423', destination_addr=b'1234',
+                        short_message=b'Hello world !', source_addr_ton=AddrTon.NATIONAL)
+
+        # As received from the wire, where optional params are set to their defaults
+        return PDUEncoder().decode(io.BytesIO(PDUEncoder().encode(pdu)))
+
+    def assertSamePDU(self, pdu, decoded):
+        pdus, decoded_pdus = codec._pdu_chain(pdu), codec._pdu_chain(decoded)
+
+        self.assertEqual(len(pdus), len(decoded_pdus))
+        for p, d in zip(pdus, decoded_pdus):
+            self.assertEqual(p.__class__, d.__class__)
+            self.assertEqual(p.seqNum, d.seqNum)
+            for param in ['source_addr', 'destination_addr', 'short_message', 'data_coding',
+                          'registered_delivery', 'esm_class', 'sar_msg_ref_num', 'sar_segment_seqnum']:
+                self.assertEqual(p.params.get(param), d.params.get(param))
+
+
+class PDUTestCase(CodecTestCase):
+    def test_submit_sm(self):
+        pdu = self.submit_sm(data_coding=8,
+                             registered_delivery=RegisteredDelivery(
+                                 RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED))
+        body = codec.dumps(pdu, 'smpp')
+
+        self.assertTrue(body.startswith(codec.MAGIC))
+        decoded = codec.loads(body)
+        self.assertSamePDU(pdu, decoded)
+        # data_coding is kept as an int
+        self.assertEqual(decoded.params['data_coding'], 8)
+        self.assertEqual(decoded.seqNum, None)
+
+    def test_long_submit_sm(self):
+        for split in ['sar', 'udh']:
+            pdu = self.submit_sm(b'0123456789' * 50, split)
+            decoded = codec.loads(codec.dumps(pdu, 'smpp'))
+
+            self.assertSamePDU(pdu, decoded)
+            self.assertFalse(hasattr(codec._pdu_chain(decoded)[-1], 'nextPdu'))
+
+    def test_deliver_sm_extra_attributes(self):
+        pdu = self.deliver_sm()
+        pdu.dlr = {'id': b'1234', 'stat': 'DELIVRD'}
+        decoded = codec.loads(codec.dumps(pdu, 'smpp'))
+
+        self.assertSamePDU(pdu, decoded)
+        self.assertEqual(decoded.dlr, pdu.dlr)
+
+    def test_routable(self):
+        routable = RoutableDeliverSm(self.deliver_sm(), SmppClientConnector('abc'))
+        decoded = codec.loads(codec.dumps(routable, 'smpp'))
+
+        self.assertEqual(decoded.__class__, RoutableDeliverSm)
+        self.assertEqual(decoded.connector.cid, 'abc')
+        self.assertEqual(decoded.datetime, routable.datetime)
+        self.assertSamePDU(routable.pdu, decoded.pdu)
+
+    def test_pickle(self):
+        pdu = self.submit_sm()
+
+        self.assertSamePDU(pdu, codec.loads(codec.dumps(pdu)))
+        self.assertSamePDU(pdu, codec.loads(pickle.dumps(pdu, 2)))
+
+    def test_fallback_to_pickle(self):
+        # Not a PDU
+        self.assertEqual(codec.loads(codec.dumps({'any': 'object'}, 'smpp')), {'any': 'object'})
+
+        # A value rejected by the encoder is logged
+        pdu = self.submit_sm()
+        pdu.params['source_addr'] = b'0' * 30
+        with self.assertLogs('jasmin-codec', 'WARNING'):
+            body = codec.dumps(pdu, 'smpp')
+        self.assertFalse(body.startswith(codec.MAGIC))
+        self.assertSamePDU(pdu, codec.loads(body))
+
+    def test_encoder_bug(self):
+        def broken(obj):
+            raise AttributeError('broken')
+        self.patch(codec, '_smpp_dumps', broken)
+
+        # Not hidden behind a fallback to pickle
+        self.assertRaises(AttributeError, codec.dumps, self.submit_sm(), 'smpp')
+
+    def test_invalid(self):
+        body = codec.dumps(self.submit_sm(), 'smpp')
+
+        self.assertRaises(codec.CodecError, codec.loads, body[:20])
+        self.assertRaises(codec.CodecError, codec.loads, body[:2] + b'\x09' + body[3:])
+
+
+class ContentTestCase(CodecTestCase):
+    def test_deliver_sm_content(self):
+        routable = RoutableDeliverSm(self.deliver_sm(), SmppClientConnector('abc'))
+        c = DeliverSmContent(routable, 'abc', codec='smpp')
+
+        self.assertSamePDU(routable.pdu, codec.loads(c.body).pdu)
+
+    def test_submit_sm_resp_content(self):
+        pdu = self.deliver_sm()
+        c = SubmitSmRespContent(pdu, 'msgid', codec='smpp')
+
+        self.assertSamePDU(pdu, codec.loads(c.body))
+
+    def test_routed_deliver_sm_content(self):
+        pdu = self.deliver_sm()
+        c = RoutedDeliverSmContent(pdu, 'msgid', 'abc', [HttpConnector('dst', 'http://127.0.0.1')], codec='smpp')
+
+        self.assertSamePDU(pdu, codec.loads(c.body))
+        self.assertEqual(pickle.loads(c['headers']['dst-connectors'])[0].cid, 'dst')
+
+
+class SizeTestCase(CodecTestCase):
+    def test_smaller_than_pickle(self):
+        samples = [
+            self.submit_sm(),
+            self.submit_sm(b'0123456789' * 45),
+            RoutableDeliverSm(self.deliver_sm(), SmppClientConnector('abc')),
+        ]
+
+        for obj in samples:
+            self.assertLess(len(codec.dumps(obj, 'smpp', 2)), len(codec.dumps(obj, 'pickle', 2)))
+
+
+class BenchmarkTestCase(CodecTestCase):
+    """Compare encode/decode time and bytes per message of the smpp codec against pickle with the
+    configured pickle_protocol, results are reported in trial's test.log"""
+    if 'JASMIN_BENCHMARK' not in os.environ:
+        skip = 'Benchmark, set JASMIN_BENCHMARK to run it'
+
+    def measure(self, obj, _codec, pickle_protocol, number=2000):
+        body = codec.dumps(obj, _codec, pickle_protocol)
+        encode = min(timeit.repeat(lambda: codec.dumps(obj, _codec, pickle_protocol),
+                                   repeat=3, number=number)) / number
+        decode = min(timeit.repeat(lambda: codec.loads(body), repeat=3, number=number)) / number
+
+        return len(body), encode, decode
+
+    def test_benchmark(self):
+        pickle_protocol = SMPPClientPBConfig().pickle_protocol
+        samples = {
+            'submit_sm': self.submit_sm(),
+            'long submit_sm (3 parts)': self.submit_sm(b'0123456789' * 45),
+            'deliver_sm routable': RoutableDeliverSm(self.deliver_sm(), SmppClientConnector('abc')),
+        }
+
+        for name, obj in samples.items():
+            results = {}
+            for _codec in codec.CODECS:
+                results[_codec] = self.measure(obj, _codec, pickle_protocol)
+                log.msg('%s / %s (pickle_protocol %s): %s bytes, encode %.1f us, decode %.1f us per message' % (
+                    name, _codec, pickle_protocol, results[_codec][0],
+                    results[_codec][1] * 1e6, results[_codec][2] * 1e6))
+
+            self.assertLess(results['smpp'][0], results['pickle'][0])
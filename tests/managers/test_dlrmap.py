@@ -0,0 +1,167 @@
+"""
+Test cases for DLR maps compact encoding
+"""
+
+import datetime
+import os
+import uuid
+
+from twisted.internet import defer
+from twisted.trial.unittest import TestCase
+from smpp.pdu.pdu_types import AddrTon, AddrNpi, RegisteredDeliveryReceipt
+
+from jasmin.managers import dlrmap
+from jasmin.redis.client import ConnectionWithConfiguration
+from jasmin.redis.configs import RedisForJasminConfig
+
+
+def httpapi_map(expiry=86400):
+    return {'sc': 'httpapi',
+            'url': 'http://127.0.0.1:8080/dlr',
+            'level': 3,
+            'method': 'POST',
+            'connector': 'smppc_01',
+            'expiry': expiry}
+
+
+def smppsapi_map(expiry=86400):
+    return {'sc': 'smppsapi',
+            'system_id': 'user_01',
+            'source_addr_ton': AddrTon.NATIONAL,
+            'source_addr_npi': AddrNpi.ISDN,
+            'source_addr': b'0033612345678',
+            'dest_addr_ton': AddrTon.INTERNATIONAL,
+            'dest_addr_npi': AddrNpi.ISDN,
+            'destination_addr': b'21698700177',
+            'sub_date': datetime.datetime.now(),
+            'rd_receipt': RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED,
+            'expiry': expiry}
+
+
+class CodecTestCase(TestCase):
+    def test_httpapi(self):
+        m = httpapi_map()
+
+        self.assertEqual(dlrmap.decode(dlrmap.encode(m)), m)
+
+    def test_smppsapi(self):
+        m = smppsapi_map()
+        d = dlrmap.decode(dlrmap.encode(m))
+
+        # Values are decoded the same way a legacy hash is read back from redis
+        self.assertEqual(d['source_addr_ton'], str(AddrTon.NATIONAL))
+        self.assertEqual(d['dest_addr_npi'], str(AddrNpi.ISDN))
+        self.assertEqual(d['rd_receipt'], str(RegisteredDeliveryReceipt.SMSC_DELIVERY_RECEIPT_REQUESTED))
+        self.assertEqual(d['source_addr'], '0033612345678')
+        self.assertEqual(d['destination_addr'], '21698700177')
+        self.assertEqual(d['sub_date'], str(m['sub_date']))
+        self.assertEqual(d['system_id'], 'user_01')
+        self.assertEqual(d['expiry'], 86400)
+
+    def test_smppsapi_from_legacy_strings(self):
+        m = smppsapi_map()
+        m['source_addr_ton'] = str(AddrTon.NATIONAL)
+        m['dest_addr_npi'] = None
+        m['sub_date'] = str(m['sub_date'])
+        d = dlrmap.decode(dlrmap.encode(m))
+
+        self.assertEqual(d['source_addr_ton'], str(AddrTon.NATIONAL))
+        self.assertEqual(d['dest_addr_npi'], 'None')
+        self.assertEqual(d['sub_date'], m['sub_date'])
+
+    def test_queue_msgid(self):
+        m = {'msgid': str(uuid.uuid4()), 'connector_type': 'smppsapi'}
+
+        self.assertEqual(dlrmap.decode(dlrmap.encode(m)), m)
+
+    def test_decode_utf8_decoded_reply(self):
+        m = {'msgid': str(uuid.uuid4()), 'connector_type': 'httpapi'}
+
+        self.assertEqual(dlrmap.decode(dlrmap.encode(m).decode()), m)
+
+    def test_invalid(self):
+        raw = dlrmap.encode(smppsapi_map())
+
+        self.assertRaises(dlrmap.DLRMapCodecError, dlrmap.decode, raw[:10])
+        self.assertRaises(dlrmap.DLRMapCodecError, dlrmap.decode, b'\x09' + raw[1:])
+        self.assertRaises(dlrmap.DLRMapCodecError, dlrmap.encode, {'sc': 'unknown'})
+        self.assertRaises(dlrmap.DLRMapCodecError, dlrmap.encode, {'sc': 'httpapi'})
+
+
+class RedisDLRMapTestCase(TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        RedisForJasminConfigInstance = RedisForJasminConfig()
+        self.redisClient = yield ConnectionWithConfiguration(RedisForJasminConfigInstance)
+        if RedisForJasminConfigInstance.password is not None:
+            yield self.redisClient.auth(RedisForJasminConfigInstance.password)
+            yield self.redisClient.select(RedisForJasminConfigInstance.dbid)
+        yield self.redisClient._connected
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        keys = yield self.redisClient.keys('dlrmap-test:*')
+        if len(keys) > 0:
+            yield self.redisClient.delete(*keys)
+        yield self.redisClient.disconnect()
+
+
+class GetSetTestCase(RedisDLRMapTestCase):
+    @defer.inlineCallbacks
+    def test_both_formats(self):
+        m = httpapi_map(expiry=60)
+        yield dlrmap.set_dlr_map(self.redisClient, 'dlrmap-test:legacy', m, 60)
+        yield dlrmap.set_dlr_map(self.redisClient, 'dlrmap-test:compact', m, 60, compact=True)
+
+        # Whatever the configured format is, maps written in the other one are still read
+        for configured_compact in [False, True]:
+            legacy = yield dlrmap.get_dlr_map(self.redisClient, 'dlrmap-test:legacy', configured_compact)
+            compact = yield dlrmap.get_dlr_map(self.redisClient, 'dlrmap-test:compact', configured_compact)
+            self.assertEqual(legacy, m)
+            self.assertEqual(compact, m)
+
+        ttl = yield self.redisClient.ttl('dlrmap-test:compact')
+        self.assertTrue(0 < ttl <= 60)
+
+    @defer.inlineCallbacks
+    def test_not_found(self):
+        m = yield dlrmap.get_dlr_map(self.redisClient, 'dlrmap-test:unknown')
+        self.assertEqual(m, {})
+
+        m = yield dlrmap.get_dlr_map(self.redisClient, 'dlrmap-test:unknown', compact=True)
+        self.assertEqual(m, {})
+
+
+class MemoryBenchmarkTestCase(RedisDLRMapTestCase):
+    """Compare redis memory used by pending DLR maps (one dlr: and one queue-msgid: key per
+    message) in legacy and compact formats"""
+    samples = 1000
+    if 'JASMIN_BENCHMARK' not in os.environ:
+        skip = 'Benchmark, set JASMIN_BENCHMARK to run it'
+
+    @defer.inlineCallbacks
+    def memory_per_million(self, compact, make_map):
+        writes = []
+        keys = []
+        for i in range(self.samples):
+            msgid = str(uuid.uuid4())
+            for key, m in [('dlrmap-test:dlr:%s' % msgid, make_map()),
+                           ('dlrmap-test:queue-msgid:%s' % i, {'msgid': msgid, 'connector_type': make_map()['sc']})]:
+                keys.append(key)
+                writes.append(dlrmap.set_dlr_map(self.redisClient, key, m, 86400, compact))
+        yield defer.DeferredList(writes, fireOnOneErrback=True)
+
+        used = 0
+        for key in keys:
+            usage = yield self.redisClient.execute_command('MEMORY', 'USAGE', key)
+            used += usage
+        yield self.redisClient.delete(*keys)
+
+        defer.returnValue(used * 1000000 // self.samples)
+
+    @defer.inlineCallbacks
+    def test_memory_per_million_dlrs(self):
+        for name, make_map in [('httpapi', httpapi_map), ('smppsapi', smppsapi_map)]:
+            legacy = yield self.memory_per_million(False, make_map)
+            compact = yield self.memory_per_million(True, make_map)
+            self.assertLess(compact, legacy)
@@ -18,7 +18,7 @@ from twisted.trial.unittest import TestCase
 from smpp.twisted.protocol import SMPPSessionStates
 
 import jasmin
-from jasmin.managers.clients import SMPPClientManagerPB
+from jasmin.managers.clients import SMPPClientManagerPB, aggregate_session_state
 from jasmin.managers.configs import SMPPClientPBConfig
 from jasmin.managers.proxies import SMPPClientManagerPBProxy
 from jasmin.protocols.smpp.configs import SMPPClientConfig
@@ -27,9 +27,11 @@ from tests.protocols.smpp.smsc_simulator import HappySMSC, HappySMSCRecorder, De
 from jasmin.queues.configs import AmqpConfig
 from jasmin.queues.factory import AmqpFactory
 from jasmin.routing.Bills import SubmitSmBill
+from jasmin.routing.Filters import TransparentFilter
+from jasmin.routing.Routes import FailoverMTRoute
 from jasmin.routing.Routables import RoutableDeliverSm
 from jasmin.routing.configs import RouterPBConfig
-from jasmin.routing.jasminApi import Group, User
+from jasmin.routing.jasminApi import Group, User, SmppClientConnector
 from jasmin.routing.router import RouterPB
 from jasmin.tools.cred.portal import JasminPBRealm
 from jasmin.tools.proxies import ConnectError
@@ -66,6 +68,7 @@ class SMPPClientPBTestCase(TestCase):
 
         # Launch the client manager server
         pbRoot = SMPPClientManagerPB(self.SMPPClientPBConfigInstance)
+        self.pbRoot = pbRoot
 
         yield pbRoot.addAmqpBroker(self.amqpBroker)
         p = portal.Portal(JasminPBRealm(pbRoot))
@@ -1160,6 +1163,79 @@ class ClientConnectorStatusTestCases(SMSCSimulator):
 
         yield self.stopall()
 
+    @defer.inlineCallbacks
+    def test_session_states_index(self):
+        yield self.connect('127.0.0.1', self.pbPort)
+
+        yield self.add(self.defaultConfig)
+        self.assertEqual(SMPPSessionStates.NONE, self.pbRoot.session_states[self.defaultConfig.id])
+        self.assertFalse(self.pbRoot.isConnectorBound(self.defaultConfig.id))
+
+        yield self.start(self.defaultConfig.id)
+        self.assertEqual(SMPPSessionStates.BOUND_TRX, self.pbRoot.session_states[self.defaultConfig.id])
+        self.assertTrue(self.pbRoot.isConnectorBound(self.defaultConfig.id))
+
+        yield self.stop(self.defaultConfig.id)
+
+        # Wait for unbound state
+        yield waitFor(2)
+        self.assertEqual(SMPPSessionStates.UNBOUND, self.pbRoot.session_states[self.defaultConfig.id])
+        self.assertFalse(self.pbRoot.isConnectorBound(self.defaultConfig.id))
+
+        yield self.remove(self.defaultConfig.id)
+        self.assertNotIn(self.defaultConfig.id, self.pbRoot.session_states)
+
+        yield self.stopall()
+
+    @defer.inlineCallbacks
+    def test_session_state_multi_bind(self):
+        yield self.connect('127.0.0.1', self.pbPort)
+
+        localConfig = copy.copy(self.defaultConfig)
+        localConfig.bind_count = 3
+        yield self.add(localConfig)
+
+        cDetails = yield self.connector_details(localConfig.id)
+        self.assertEqual(3, cDetails['bind_count'])
+        self.assertEqual(0, cDetails['bound_count'])
+        self.assertEqual([SMPPSessionStates.NONE.name] * 3, cDetails['bind_session_states'])
+
+        yield self.start(localConfig.id)
+
+        # Wait for every bind to get bound
+        yield waitFor(1)
+
+        cDetails = yield self.connector_details(localConfig.id)
+        self.assertEqual(SMPPSessionStates.BOUND_TRX.name, cDetails['session_state'])
+        self.assertEqual(3, cDetails['bound_count'])
+        self.assertTrue(self.pbRoot.isConnectorBound(localConfig.id))
+        # Bound binds are competing consumers of the connector's queue
+        connector = self.pbRoot.getConnector(localConfig.id)
+        self.assertEqual(['SMPPClientFactory-%s' % localConfig.id,
+                          'SMPPClientFactory-%s-1' % localConfig.id,
+                          'SMPPClientFactory-%s-2' % localConfig.id],
+                         [bind['consumer_tag'] for bind in connector['binds']])
+        # and are sharing its throughput
+        self.assertIs(connector['binds'][0]['sm_listener'].qos_bucket,
+                      connector['binds'][2]['sm_listener'].qos_bucket)
+
+        yield self.stop(localConfig.id)
+
+        # Wait for unbound state
+        yield waitFor(2)
+
+        cDetails = yield self.connector_details(localConfig.id)
+        self.assertEqual(0, cDetails['bound_count'])
+        self.assertEqual([None] * 3, [bind['consumer_tag'] for bind in connector['binds']])
+
+        # Binds are dropped on restart
+        connector['config'].bind_count = 1
+        yield self.start(localConfig.id)
+        cDetails = yield self.connector_details(localConfig.id)
+        self.assertEqual(1, cDetails['bind_count'])
+
+        yield self.stopall()
+
     @defer.inlineCallbacks
     def test_session_state_none(self):
         yield self.connect('127.0.0.1', self.pbPort)
@@ -1180,3 +1256,55 @@ class ClientConnectorStatusTestCases(SMSCSimulator):
 
         # Give a grace time for stopping
         yield waitFor(0.2)
+
+
+class AggregateSessionStateTestCases(TestCase):
+    def test_first_bound_bind(self):
+        self.assertEqual(SMPPSessionStates.BOUND_TRX, aggregate_session_state(
+            [SMPPSessionStates.UNBOUND, SMPPSessionStates.BOUND_TRX, SMPPSessionStates.BIND_TRX_PENDING]))
+
+    def test_no_bound_bind(self):
+        self.assertEqual(SMPPSessionStates.NONE, aggregate_session_state(
+            [SMPPSessionStates.NONE, SMPPSessionStates.BIND_TRX_PENDING]))
+
+
+class FailoverConnectorTestCases(TestCase):
+    def setUp(self):
+        self.SMPPClientPBConfigInstance = SMPPClientPBConfig()
+        self.pbRoot = SMPPClientManagerPB(self.SMPPClientPBConfigInstance)
+
+        self.route = FailoverMTRoute([TransparentFilter()],
+                                     [SmppClientConnector('c1'), SmppClientConnector('c2'),
+                                      SmppClientConnector('c3')], 0.0)
+        # As done by route.matchFilters()
+        self.route.seq = -1
+
+    def test_first_bound_connector(self):
+        self.pbRoot.session_states = {'c1': SMPPSessionStates.UNBOUND,
+                                      'c2': SMPPSessionStates.BOUND_TX,
+                                      'c3': SMPPSessionStates.BOUND_TRX}
+
+        self.assertEqual('c2', self.pbRoot.getFailoverConnector(self.route).cid)
+
+    def test_no_bound_connector(self):
+        self.pbRoot.session_states = {'c1': SMPPSessionStates.NONE,
+                                      'c2': SMPPSessionStates.BIND_TRX_PENDING}
+
+        self.assertEqual(None, self.pbRoot.getFailoverConnector(self.route))
+
+    def test_overloaded_connector_is_skipped(self):
+        self.SMPPClientPBConfigInstance.failover_max_queue_depth = 100
+        self.pbRoot.session_states = {'c1': SMPPSessionStates.BOUND_TRX,
+                                      'c2': SMPPSessionStates.UNBOUND,
+                                      'c3': SMPPSessionStates.BOUND_TRX}
+        self.pbRoot.queue_depths = {'c1': 101, 'c3': 100}
+
+        self.assertEqual('c3', self.pbRoot.getFailoverConnector(self.route).cid)
+
+    def test_all_connectors_overloaded(self):
+        self.SMPPClientPBConfigInstance.failover_max_queue_depth = 100
+        self.pbRoot.session_states = {'c1': SMPPSessionStates.BOUND_TRX,
+                                      'c3': SMPPSessionStates.BOUND_TRX}
+        self.pbRoot.queue_depths = {'c1': 500, 'c3': 200}
+
+        self.assertEqual('c1', self.pbRoot.getFailoverConnector(self.route).cid)
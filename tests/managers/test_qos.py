@@ -0,0 +1,96 @@
+"""
+Test cases for the token bucket rate limiter
+"""
+
+from twisted.internet import defer
+from twisted.trial.unittest import TestCase
+
+from jasmin.tools.qos import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTestCase(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_rate(self):
+        bucket = TokenBucket(4, clock=self.clock)
+
+        # First one goes through, next ones are spaced by 1/rate
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.25)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+
+        self.clock.now += 0.5
+        self.assertAlmostEqual(bucket.reserve(), 0.25)
+
+    def test_whole_seconds_are_not_ignored(self):
+        bucket = TokenBucket(0.5, clock=self.clock)
+
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 2)
+
+        self.clock.now += 1.5
+        self.assertAlmostEqual(bucket.reserve(), 2.5)
+
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=5, clock=self.clock)
+
+        for _ in range(5):
+            self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+
+        # Idle time does not refill more than burst
+        self.clock.now += 60
+        for _ in range(5):
+            self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+
+    def test_exact_rate_over_time(self):
+        bucket = TokenBucket(500, clock=self.clock)
+
+        # Consumers waiting for their delay before reserving again
+        sent = 0
+        end = self.clock.now + 10
+        while self.clock.now < end:
+            self.clock.now += bucket.reserve()
+            sent += 1
+
+        self.assertApproximates(sent, 5000, 1)
+
+    def test_disabled(self):
+        bucket = TokenBucket(0, clock=self.clock)
+
+        for _ in range(100):
+            self.assertEqual(bucket.reserve(), 0)
+
+    def test_set_rate(self):
+        bucket = TokenBucket(0, clock=self.clock)
+        bucket.reserve()
+        bucket.set_rate(2)
+
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+
+        # Raising burst makes the extra capacity available at once
+        bucket.set_rate(2, burst=3)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+
+    def test_invalid_burst(self):
+        self.assertRaises(ValueError, TokenBucket, 1, 0)
+
+    @defer.inlineCallbacks
+    def test_consume(self):
+        bucket = TokenBucket(20)
+
+        delay = yield bucket.consume()
+        self.assertEqual(delay, 0)
+        yield bucket.consume()
@@ -0,0 +1,134 @@
+"""
+Test cases for long deliver_sm reassembly buffer
+"""
+
+from twisted.internet import defer, reactor
+from twisted.trial.unittest import TestCase
+from smpp.pdu.operations import DeliverSM
+
+from jasmin.managers import reassembly
+from jasmin.redis.client import ConnectionWithConfiguration
+from jasmin.redis.configs import RedisForJasminConfig
+
+
+def sar_parts(contents, msg_ref_num=17):
+    pdus = []
+    for i, content in enumerate(contents):
+        pdus.append(DeliverSM(source_addr='1234', destination_addr='4567', short_message=content,
+                              sar_total_segments=len(contents), sar_msg_ref_num=msg_ref_num,
+                              sar_segment_seqnum=i + 1))
+    return pdus
+
+
+class PayloadTestCase(TestCase):
+    def test_sar(self):
+        parts = sar_parts([b'first ', b'second ', b'last'])
+        payloads = [reassembly.segment_payload(pdu, 'sar') for pdu in parts]
+        self.assertEqual([b'first ', b'second ', b'last'], payloads)
+
+        pdu = reassembly.reassemble(parts[1], 'sar', payloads)
+        self.assertEqual(b'first second last', pdu.params['short_message'])
+        self.assertNotIn('sar_msg_ref_num', pdu.params)
+        self.assertNotIn('sar_segment_seqnum', pdu.params)
+        self.assertNotIn('sar_total_segments', pdu.params)
+
+        # The part itself is kept as is
+        self.assertEqual(b'second ', parts[1].params['short_message'])
+        self.assertEqual(2, parts[1].params['sar_segment_seqnum'])
+
+    def test_udh(self):
+        pdu = DeliverSM(source_addr='1234', destination_addr='4567',
+                        short_message=b'\x05\x00\x03\x11\x02\x01first ')
+        self.assertEqual(b'first ', reassembly.segment_payload(pdu, 'udh'))
+
+        pdu = reassembly.reassemble(pdu, 'udh', [b'first ', b'last'])
+        self.assertEqual(b'first last', pdu.params['short_message'])
+        self.assertEqual(None, pdu.params['esm_class'])
+
+    def test_message_payload(self):
+        pdu = sar_parts([b''])[0]
+        pdu.params['message_payload'] = b'payload'
+
+        self.assertEqual('message_payload', reassembly.content_key(pdu))
+        self.assertEqual(b'payload', reassembly.segment_payload(pdu, 'sar'))
+
+
+class RedisReassemblyTestCase(TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        RedisForJasminConfigInstance = RedisForJasminConfig()
+        self.redisClient = yield ConnectionWithConfiguration(RedisForJasminConfigInstance)
+        if RedisForJasminConfigInstance.password is not None:
+            yield self.redisClient.auth(RedisForJasminConfigInstance.password)
+            yield self.redisClient.select(RedisForJasminConfigInstance.dbid)
+        yield self.redisClient._connected
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        keys = yield self.redisClient.keys('longDeliverSm*:reassembly-test*')
+        if len(keys) > 0:
+            yield self.redisClient.delete(*keys)
+        yield self.redisClient.disconnect()
+
+    @defer.inlineCallbacks
+    def add_parts(self, payloads, order, expiry=60):
+        key = reassembly.parts_key('reassembly-test', 17, '4567')
+
+        results = []
+        for i in order:
+            r = yield reassembly.add_part(self.redisClient, 'reassembly-test', key, i + 1, len(payloads),
+                                          payloads[i], expiry)
+            results.append(r)
+
+        defer.returnValue(results)
+
+    @defer.inlineCallbacks
+    def test_in_order(self):
+        payloads = [b'first ', b'second ', b'last']
+        results = yield self.add_parts(payloads, [0, 1, 2])
+
+        self.assertEqual([(reassembly.PENDING, 0, None), (reassembly.PENDING, 0, None)], results[:2])
+        self.assertEqual((reassembly.COMPLETE, 0, payloads), results[2])
+
+    @defer.inlineCallbacks
+    def test_last_part_first(self):
+        payloads = [b'first ', b'second ', b'last']
+        results = yield self.add_parts(payloads, [2, 0, 1])
+
+        self.assertEqual(reassembly.PENDING, results[0][0])
+        self.assertEqual(reassembly.PENDING, results[1][0])
+        self.assertEqual((reassembly.COMPLETE, 0, payloads), results[2])
+
+        # Buffer is removed once completed
+        exists = yield self.redisClient.exists(reassembly.parts_key('reassembly-test', 17, '4567'))
+        self.assertFalse(exists)
+
+    @defer.inlineCallbacks
+    def test_binary_payloads(self):
+        "Payloads looking like numbers or text must be kept as bytes"
+        payloads = [b'123', b'\xe9t\xe9', b'45']
+        results = yield self.add_parts(payloads, [1, 2, 0])
+
+        self.assertEqual((reassembly.COMPLETE, 0, payloads), results[2])
+
+    @defer.inlineCallbacks
+    def test_duplicate_part(self):
+        payloads = [b'first ', b'second ', b'last']
+        results = yield self.add_parts(payloads, [0, 0, 1, 2])
+
+        self.assertEqual(reassembly.DUPLICATE, results[1][0])
+        self.assertEqual((reassembly.COMPLETE, 0, payloads), results[3])
+
+    @defer.inlineCallbacks
+    def test_expired_partials(self):
+        yield self.add_parts([b'first ', b'last'], [0], expiry=1)
+
+        # Wait for partial expiry
+        waitDeferred = defer.Deferred()
+        reactor.callLater(2.1, waitDeferred.callback, None)
+        yield waitDeferred
+
+        # Expired partial is counted once, and the late part is pending again
+        results = yield self.add_parts([b'first ', b'last'], [1, 1])
+        self.assertEqual((reassembly.PENDING, 1, None), results[0])
+        self.assertEqual((reassembly.DUPLICATE, 0, None), results[1])
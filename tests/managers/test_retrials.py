@@ -0,0 +1,75 @@
+"""
+Test cases for the bounded retrial trackers
+"""
+
+from twisted.trial.unittest import TestCase
+
+from jasmin.tools.retrials import RetrialTracker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RetrialTrackerTestCase(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_inc(self):
+        tracker = RetrialTracker('test_inc', clock=self.clock)
+
+        self.assertEqual(1, tracker.inc('msg1'))
+        self.assertEqual(2, tracker.inc('msg1'))
+        # Starting from a retry count carried by the message
+        self.assertEqual(3, tracker.inc('msg2', 3))
+        self.assertEqual(2, tracker['msg1'])
+        self.assertEqual(1, tracker.stats.get('hit_count'))
+        self.assertEqual(2, tracker.stats.get('miss_count'))
+
+        self.assertEqual(2, tracker.pop('msg1'))
+        self.assertEqual(None, tracker.pop('msg1'))
+        self.assertNotIn('msg1', tracker)
+        self.assertEqual(1, tracker.stats.get('size'))
+
+    def test_lru_eviction(self):
+        tracker = RetrialTracker('test_lru_eviction', max_size=2, clock=self.clock)
+        tracker.inc('msg1')
+        tracker.inc('msg2')
+        # msg1 is now the most recently updated
+        tracker.inc('msg1')
+        tracker.inc('msg3')
+
+        self.assertIn('msg1', tracker)
+        self.assertNotIn('msg2', tracker)
+        self.assertIn('msg3', tracker)
+        self.assertEqual(1, tracker.stats.get('eviction_count'))
+
+    def test_ttl_expiry(self):
+        tracker = RetrialTracker('test_ttl_expiry', ttl=60, clock=self.clock)
+        tracker.inc('msg1')
+        self.clock.now += 30
+        tracker.inc('msg2')
+
+        self.clock.now += 40
+        self.assertNotIn('msg1', tracker)
+        self.assertEqual(1, tracker.get('msg2'))
+        self.assertEqual(1, len(tracker))
+        self.assertEqual(1, tracker.stats.get('expiry_count'))
+
+        # Expired messages are starting over
+        self.assertEqual(1, tracker.inc('msg1'))
+
+    def test_bounded(self):
+        """Messages never leaving the tracker are not growing it past max_size"""
+        tracker = RetrialTracker('test_bounded', max_size=1000, clock=self.clock)
+        for i in range(200000):
+            tracker.inc('msg%s' % i)
+            if i % 3 == 0:
+                tracker.inc('msg%s' % i)
+
+        self.assertEqual(1000, len(tracker))
+        self.assertEqual(199000, tracker.stats.get('eviction_count'))
@@ -181,7 +181,8 @@ class FilterTypingTestCases(FiltersTestCases):
                                    'SourceAddrFilter', 'DestinationAddrFilter',
                                    'ShortMessageFilter', 'DateIntervalFilter',
                                    'TimeIntervalFilter', 'EvalPyFilter',
-                                   'TagFilter'])
+                                   'TagFilter', 'SourcePrefixFilter',
+                                   'DestinationPrefixFilter'])
 
         # Check if FilterTypingTestCases is covering all the filters
         for f in filters:
@@ -462,6 +463,66 @@ else:
                         'Total Filters: 1']
         yield self._test('jcli : ', [{'command': 'filter -l', 'expect': expectedList}])
 
+    @defer.inlineCallbacks
+    def test_add_SourcePrefixFilter(self):
+        prefixesFile = 'prefixes.txt'
+        with open(prefixesFile, 'w') as f:
+            f.write('# Operator prefixes\n2126\n\n2127,2128\n')
+        ftype = 'SourcePrefixFilter'
+        _str_ = ['%s:' % ftype, 'source_addr prefixes \(3\) = 2126, 2127, 2128']
+        _repr_ = '<SAP \(prefixes=3\)>'
+
+        # Add filter
+        extraCommands = [{'command': 'fid filter_id'},
+                         {'command': 'type %s' % ftype},
+                         {'command': 'prefixes %s' % prefixesFile}, ]
+        yield self.add_filter(r'jcli : ', extraCommands)
+
+        # Make asserts
+        expectedList = _str_
+        yield self._test('jcli : ', [{'command': 'filter -s filter_id', 'expect': expectedList}])
+        expectedList = ['#Filter id        Type                   Routes Description',
+                        '#filter_id        %s     MO MT  %s' % (ftype, _repr_),
+                        'Total Filters: 1']
+        yield self._test('jcli : ', [{'command': 'filter -l', 'expect': expectedList}])
+
+        # Delete prefixes file
+        os.unlink(prefixesFile)
+
+    @defer.inlineCallbacks
+    def test_add_DestinationPrefixFilter(self):
+        prefixesFile = 'prefixes.txt'
+        with open(prefixesFile, 'w') as f:
+            f.write('\n'.join('%s' % p for p in range(2120, 2130)))
+        ftype = 'DestinationPrefixFilter'
+        _str_ = ['%s:' % ftype, 'destination_addr prefixes \(10\) = 2120, 2121, ']
+        _repr_ = '<DAP \(prefixes=10\)>'
+
+        # Add filter
+        extraCommands = [{'command': 'fid filter_id'},
+                         {'command': 'type %s' % ftype},
+                         {'command': 'prefixes %s' % prefixesFile}, ]
+        yield self.add_filter(r'jcli : ', extraCommands)
+
+        # Make asserts
+        expectedList = _str_
+        yield self._test('jcli : ', [{'command': 'filter -s filter_id', 'expect': expectedList}])
+        expectedList = ['#Filter id        Type                   Routes Description',
+                        '#filter_id        %s MO MT  %s' % (ftype, _repr_),
+                        'Total Filters: 1']
+        yield self._test('jcli : ', [{'command': 'filter -l', 'expect': expectedList}])
+
+        # Delete prefixes file
+        os.unlink(prefixesFile)
+
+    @defer.inlineCallbacks
+    def test_add_PrefixFilter_invalid_file(self):
+        extraCommands = [{'command': 'fid filter_id'},
+                         {'command': 'type DestinationPrefixFilter'},
+                         {'command': 'prefixes /nonexistent/prefixes.txt', 'expect': r'\[IO\]: '},
+                         {'command': 'ko'}, ]
+        yield self.add_filter(r'jcli : ', extraCommands)
+
 
 class FilterPersistenceTestCases(FiltersTestCases):
     def tearDown(self):
@@ -801,3 +862,34 @@ else:
                         '#filter_id        %s              MO MT  %s' % (ftype, _repr_),
                         'Total Filters: 1']
         yield self._test('jcli : ', [{'command': 'filter -l', 'expect': expectedList}])
+
+    @defer.inlineCallbacks
+    def test_DestinationPrefixFilter(self):
+        prefixesFile = 'prefixes.txt'
+        with open(prefixesFile, 'w') as f:
+            f.write('2126\n2127\n')
+        ftype = 'DestinationPrefixFilter'
+        _str_ = ['%s:' % ftype, 'destination_addr prefixes \(2\) = 2126, 2127']
+        _repr_ = '<DAP \(prefixes=2\)>'
+
+        # Add filter
+        extraCommands = [{'command': 'fid filter_id'},
+                         {'command': 'type %s' % ftype},
+                         {'command': 'prefixes %s' % prefixesFile}, ]
+        yield self.add_filter(r'jcli : ', extraCommands)
+
+        # Persist & load
+        yield self._test('jcli : ', [{'command': 'persist'},
+                               {'command': 'filter -r filter_id'},
+                               {'command': 'load'}])
+
+        # Make asserts
+        expectedList = _str_
+        yield self._test('jcli : ', [{'command': 'filter -s filter_id', 'expect': expectedList}])
+        expectedList = ['#Filter id        Type                   Routes Description',
+                        '#filter_id        %s MO MT  %s' % (ftype, _repr_),
+                        'Total Filters: 1']
+        yield self._test('jcli : ', [{'command': 'filter -l', 'expect': expectedList}])
+
+        # Delete prefixes file
+        os.unlink(prefixesFile)
@@ -177,6 +177,10 @@ class BasicTestCases(HappySMSCTestCase):
             r'dst_npi 1',
             r'trx_to 300',
             r'ssl no',
+            r'submit_prefetch 1',
+            r'submit_ack_batch 1',
+            r'submit_ack_interval 0.1',
+            r'binds 1',
         ]
         commands = [{'command': 'smppccm -s %s' % cid, 'expect': expectedList}]
         yield self._test(r'jcli : ', commands)
@@ -262,6 +266,10 @@ class BasicTestCases(HappySMSCTestCase):
             r'dst_npi 1',
             r'trx_to 300',
             r'ssl no',
+            r'submit_prefetch 1',
+            r'submit_ack_batch 1',
+            r'submit_ack_interval 0.1',
+            r'binds 1',
         ]
         commands = [{'command': 'smppccm -s %s' % cid, 'expect': expectedList}]
         yield self._test(r'jcli : ', commands)
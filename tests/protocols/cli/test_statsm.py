@@ -166,6 +166,7 @@ class SmppcStatsTestCases(SmppccmTestCases):
                         '#other_submit_error_count  0',
                         '#interceptor_error_count   0',
                         '#interceptor_count         0',
+                        '#long_mo_expired_count     0',
                         ]
         commands = [{'command': 'stats --smppc=test_smppc', 'expect': expectedList}]
         yield self._test(r'jcli : ', commands)
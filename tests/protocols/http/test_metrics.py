@@ -1,5 +1,7 @@
 from twisted.internet import defer
 
+from jasmin.tools.latency import LatencyStatsCollector
+from jasmin.tools.retrials import RetrialTracker
 from .test_server import HTTPApiTestCases
 
 
@@ -64,3 +66,49 @@ class HttpapiTestCases(MetricsTestCases):
                          int(_after['httpapi_request_count'].encode()))
         self.assertEqual(int(_before['httpapi_server_error_count'].encode()) + 1,
                          int(_after['httpapi_server_error_count'].encode()))
+
+
+class LatencyTestCases(MetricsTestCases):
+    @defer.inlineCallbacks
+    def test_histogram(self):
+        _before = yield self.get_metric()
+        _key = 'latency_submit_sm_resp_seconds_%s{cid="latency_test"%s}'
+
+        LatencyStatsCollector().observe('submit_sm_resp', 0.003, 'latency_test')
+        LatencyStatsCollector().observe('submit_sm_resp', 20, 'latency_test')
+
+        _after = yield self.get_metric()
+        self.assertEqual(int(_before.get(_key % ('bucket', ',le="0.0025"'), 0)),
+                         int(_after[_key % ('bucket', ',le="0.0025"')]))
+        self.assertEqual(int(_before.get(_key % ('bucket', ',le="0.005"'), 0)) + 1,
+                         int(_after[_key % ('bucket', ',le="0.005"')]))
+        self.assertEqual(int(_before.get(_key % ('bucket', ',le="10"'), 0)) + 1,
+                         int(_after[_key % ('bucket', ',le="10"')]))
+        self.assertEqual(int(_before.get(_key % ('bucket', ',le="+Inf"'), 0)) + 2,
+                         int(_after[_key % ('bucket', ',le="+Inf"')]))
+        self.assertEqual(int(_before.get(_key % ('count', ''), 0)) + 2,
+                         int(_after[_key % ('count', '')]))
+
+    @defer.inlineCallbacks
+    def test_unlabeled_histogram(self):
+        LatencyStatsCollector().observe('dlr_lookup', 0.1)
+
+        _after = yield self.get_metric()
+        self.assertIn('latency_dlr_lookup_seconds_bucket{le="0.1"}', _after)
+        self.assertIn('latency_dlr_lookup_seconds_sum', _after)
+        self.assertIn('latency_dlr_lookup_seconds_count', _after)
+
+
+class RetrialTrackerTestCases(MetricsTestCases):
+    @defer.inlineCallbacks
+    def test_tracker(self):
+        tracker = RetrialTracker('metrics_test', max_size=1)
+        tracker.inc('msg1')
+        tracker.inc('msg1')
+        tracker.inc('msg2')
+
+        _after = yield self.get_metric()
+        self.assertEqual('1', _after['retrial_tracker_size{tracker="metrics_test"}'])
+        self.assertEqual('1', _after['retrial_tracker_hit_count{tracker="metrics_test"}'])
+        self.assertEqual('2', _after['retrial_tracker_miss_count{tracker="metrics_test"}'])
+        self.assertEqual('1', _after['retrial_tracker_eviction_count{tracker="metrics_test"}'])
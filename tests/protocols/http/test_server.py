@@ -1,5 +1,5 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from twisted.internet import defer
 from twisted.trial.unittest import TestCase
@@ -9,7 +9,7 @@ from jasmin.managers.configs import SMPPClientPBConfig
 from jasmin.protocols.http.configs import HTTPApiConfig
 from jasmin.protocols.http.server import HTTPApi
 from jasmin.protocols.http.stats import HttpAPIStatsCollector
-from jasmin.routing.Filters import GroupFilter
+from jasmin.routing.Filters import GroupFilter, DestinationAddrFilter
 from jasmin.routing.Routes import DefaultRoute, StaticMTRoute
 from jasmin.routing.router import RouterPB
 from jasmin.routing.configs import RouterPBConfig
@@ -26,8 +26,8 @@ class HTTPApiTestCases(TestCase):
         # Provision Router with User and Route
         self.g1 = Group(1)
         self.u1 = User(1, self.g1, 'nathalie', 'correct')
-        self.RouterPB_f.groups.append(self.g1)
-        self.RouterPB_f.users.append(self.u1)
+        self.RouterPB_f.indexGroup(self.g1)
+        self.RouterPB_f.indexUser(self.u1)
         self.RouterPB_f.mt_routing_table.add(DefaultRoute(SmppClientConnector('abc')), 0)
 
         # Instanciate a SMPPClientManagerPB (a requirement for HTTPApi)
@@ -413,6 +413,108 @@ class SendTestCases(HTTPApiTestCases):
             self.assertEqual(response.value()[:22], b"Error \"Argument [sdt] ")
 
 
+class SendBulkTestCases(HTTPApiTestCases):
+    username = 'nathalie'
+
+    def setUp(self):
+        HTTPApiTestCases.setUp(self)
+
+        self.u1.mt_credential.setAuthorization('http_bulk', True)
+
+    def sendbulk(self, **json_data):
+        json_data.setdefault('username', self.username)
+        json_data.setdefault('password', 'correct')
+        return self.web.post(b'sendbulk', json_data=json_data, headers={b'Content-type': [b'application/json']})
+
+    @defer.inlineCallbacks
+    def test_auth_failure(self):
+        response = yield self.sendbulk(password='incorrec', to=['06155423', '06155424'], content='anycontent')
+
+        self.assertEqual(response.responseCode, 403)
+        self.assertEqual(json.loads(response.value()), "Authentication failure for username:%s" % self.username)
+
+    @defer.inlineCallbacks
+    def test_without_bulk_authorization(self):
+        self.u1.mt_credential.setAuthorization('http_bulk', False)
+        response = yield self.sendbulk(to=['06155423', '06155424'], content='anycontent')
+
+        self.assertEqual(response.responseCode, 400)
+        self.assertEqual(json.loads(response.value()),
+                         "Authorization failed for user [%s] (Cannot send bulk MT messages)." % self.u1)
+
+    @defer.inlineCallbacks
+    def test_invalid_destination(self):
+        response = yield self.sendbulk(to=['06155423', '0615542A'], content='anycontent')
+
+        self.assertEqual(response.responseCode, 400)
+        self.assertEqual(json.loads(response.value()), "Argument [to] has an invalid value: [b'0615542A'].")
+
+    @defer.inlineCallbacks
+    def test_invalid_messages(self):
+        response = yield self.sendbulk(messages=[{'to': '06155423'}])
+        self.assertEqual(response.responseCode, 400)
+
+        response = yield self.sendbulk(messages=[{'to': '06155423', 'content': 'a'}], to=['06155424'])
+        self.assertEqual(response.responseCode, 400)
+
+        response = yield self.sendbulk(to=[], content='anycontent')
+        self.assertEqual(response.responseCode, 400)
+
+    @defer.inlineCallbacks
+    def test_too_many_messages(self):
+        response = yield self.sendbulk(to=['0615%04d' % i for i in range(1001)], content='anycontent')
+
+        self.assertEqual(response.responseCode, 400)
+        self.assertEqual(json.loads(response.value()), "Too many messages (1001), maximum is 1000.")
+
+    @defer.inlineCallbacks
+    def test_per_destination_results(self):
+        response = yield self.sendbulk(to=['06155423', '06155424'], content='anycontent')
+
+        self.assertEqual(response.responseCode, 200)
+        messages = json.loads(response.value())['messages']
+        self.assertEqual([m['to'] for m in messages], ['06155423', '06155424'])
+        # This is a normal error since SMPPClientManagerPB is not really running
+        for m in messages:
+            self.assertEqual(m['error'], 'Cannot send submit_sm, check SMPPClientManagerPB log file for details')
+
+    @defer.inlineCallbacks
+    def test_throughput_counts_every_message(self):
+        self.u1.mt_credential.setQuota('http_throughput', 1)
+        self.u1.getCnxStatus().httpapi['qos_last_submit_sm_at'] = 0
+        response = yield self.sendbulk(to=['06155423', '06155424', '06155425'], content='anycontent')
+        self.assertEqual(response.responseCode, 200)
+
+        # The next request is waiting for the 3 messages
+        self.assertGreater(self.u1.getCnxStatus().httpapi['qos_last_submit_sm_at'],
+                           datetime.now() + timedelta(seconds=1))
+        response = yield self.sendbulk(to=['06155423'], content='anycontent')
+        self.assertEqual(response.responseCode, 403)
+        self.assertEqual(json.loads(response.value()), 'User throughput exceeded')
+
+    @defer.inlineCallbacks
+    def test_per_message_content(self):
+        response = yield self.sendbulk(messages=[{'to': '06155423', 'content': 'anycontent'},
+                                                 {'to': '06155424', 'hex-content': '0041'}], coding=8)
+
+        self.assertEqual(response.responseCode, 200)
+        messages = json.loads(response.value())['messages']
+        self.assertEqual([m['to'] for m in messages], ['06155423', '06155424'])
+
+    @defer.inlineCallbacks
+    def test_per_destination_filter(self):
+        self.RouterPB_f.mt_routing_table.flush()
+        self.RouterPB_f.mt_routing_table.add(
+            StaticMTRoute([DestinationAddrFilter(r'^0615')], SmppClientConnector('abc'), 0.0), 10)
+
+        response = yield self.sendbulk(to=['06155423', '07155424'], content='anycontent')
+
+        self.assertEqual(response.responseCode, 200)
+        messages = json.loads(response.value())['messages']
+        self.assertNotEqual(messages[0]['error'], 'No route found')
+        self.assertEqual(messages[1]['error'], 'No route found')
+
+
 class RateTestCases(HTTPApiTestCases):
     def setUp(self):
         HTTPApiTestCases.setUp(self)
@@ -421,8 +523,8 @@ class RateTestCases(HTTPApiTestCases):
         u2 = User(2, Group(2), 'user2', 'correct')
         u3 = User(3, Group(2), 'user3', 'correct')
         u3.mt_credential.setQuota('balance', 10)
-        self.RouterPB_f.users.append(u2)
-        self.RouterPB_f.users.append(u3)
+        self.RouterPB_f.indexUser(u2)
+        self.RouterPB_f.indexUser(u3)
         filters = [GroupFilter(Group(2))]
         route = StaticMTRoute(filters, SmppClientConnector('abc'), 1.5)
         self.RouterPB_f.mt_routing_table.add(route, 2)
@@ -520,8 +622,8 @@ class BalanceTestCases(HTTPApiTestCases):
         u2.mt_credential.setQuota('submit_sm_count', 30)
         u3 = User(3, Group(2), 'user3', 'correct')
         u3.mt_credential.setQuota('balance', 10)
-        self.RouterPB_f.users.append(u2)
-        self.RouterPB_f.users.append(u3)
+        self.RouterPB_f.indexUser(u2)
+        self.RouterPB_f.indexUser(u3)
 
     @defer.inlineCallbacks
     def test_balance_with_correct_args(self):
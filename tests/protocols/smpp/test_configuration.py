@@ -4,7 +4,7 @@ Test cases for jasmin.protocols.smpp.configs module.
 
 from twisted.trial.unittest import TestCase
 
-from jasmin.protocols.smpp.configs import ConfigUndefinedIdError, ConfigInvalidIdError
+from jasmin.protocols.smpp.configs import ConfigUndefinedIdError, ConfigInvalidIdError, TypeMismatch, UnknownValue
 from jasmin.protocols.smpp.configs import SMPPClientConfig
 
 
@@ -16,3 +16,20 @@ class SMPPClientConfigCases(TestCase):
         invalidValues = ['zzz s', '', 'a,', 'r#r', '9a', '&"()=+~#{[|\`\^@]}', 'a123456789012345678901234-', 'aa']
         for invalidValue in invalidValues:
             self.assertRaises(ConfigInvalidIdError, SMPPClientConfig, id=invalidValue)
+
+    def test_submit_sm_window_validation(self):
+        config = SMPPClientConfig(id='abc')
+        self.assertEqual(config.submit_sm_prefetch_count, 1)
+        self.assertEqual(config.submit_sm_ack_batch_size, 1)
+
+        self.assertRaises(TypeMismatch, SMPPClientConfig, id='abc', submit_sm_prefetch_count='10')
+        self.assertRaises(UnknownValue, SMPPClientConfig, id='abc', submit_sm_prefetch_count=-1)
+        self.assertRaises(UnknownValue, SMPPClientConfig, id='abc', submit_sm_ack_batch_size=0)
+        self.assertRaises(TypeMismatch, SMPPClientConfig, id='abc', submit_sm_ack_batch_interval='1')
+
+    def test_bind_count_validation(self):
+        config = SMPPClientConfig(id='abc')
+        self.assertEqual(config.bind_count, 1)
+
+        self.assertRaises(TypeMismatch, SMPPClientConfig, id='abc', bind_count='2')
+        self.assertRaises(UnknownValue, SMPPClientConfig, id='abc', bind_count=0)
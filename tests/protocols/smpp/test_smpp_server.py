@@ -150,6 +150,21 @@ class BindTestCases(SMPPClientTestCases):
         yield self.smppc_factory.smpp.unbindAndDisconnect()
         self.assertEqual(self.smppc_factory.smpp.sessionState, SMPPSessionStates.UNBOUND)
 
+    @defer.inlineCallbacks
+    def test_bound_systemid_observers(self):
+        changes = []
+        self.smpps_factory.addBoundSystemIdObserver(lambda system_id, bound: changes.append((system_id, bound)))
+
+        # Connect and bind
+        yield self.smppc_factory.connectAndBind()
+        self.assertEqual([('username', True)], changes)
+
+        # Unbind & Disconnect
+        yield self.smppc_factory.smpp.unbindAndDisconnect()
+        while len(changes) < 2:
+            yield waitFor(0.1)
+        self.assertEqual([('username', True), ('username', False)], changes)
+
     @defer.inlineCallbacks
     def test_bind_successfull_tx(self):
         self.smppc_config.bindOperation = 'transmitter'
@@ -1,3 +1,4 @@
+import pickle
 from hashlib import md5
 
 from twisted.cred import portal
@@ -11,6 +12,7 @@ from jasmin.protocols.smpp.pb import SMPPServerPB
 from jasmin.protocols.smpp.proxies import SMPPServerPBProxy
 from tests.protocols.smpp.smsc_simulator import *
 from tests.protocols.smpp.test_smpp_server import SMPPServerTestCases
+from jasmin.tools import codec
 from jasmin.tools.cred.portal import JasminPBRealm
 from jasmin.tools.proxies import ConnectError
 from jasmin.tools.spread.pb import JasminPBPortalRoot
@@ -126,3 +128,67 @@ class BasicTestCases(SMPPServerPBProxyTestCase):
 
         # Returns False because there's no deliverers
         self.assertEqual(False, r)
+
+    @defer.inlineCallbacks
+    def test_deliverer_send_requests(self):
+        yield self.connect('127.0.0.1', self.pbPort)
+
+        pdu = DeliverSM(
+            source_addr='1111',
+            destination_addr='22222',
+            short_message='Some content',
+        )
+
+        # Requests made at once are sent in one round trip
+        calls = []
+        callRemote = self.pb.callRemote
+        self.pb.callRemote = lambda *args: calls.append(args[0]) or callRemote(*args)
+        r = yield defer.gatherResults([self.deliverer_send_request('any_system_id', pdu) for _ in range(3)])
+
+        # Returns False because there's no deliverers
+        self.assertEqual([False, False, False], r)
+        self.assertEqual(['deliverer_send_requests'], calls)
+
+    @defer.inlineCallbacks
+    def test_older_smppserverpb(self):
+        # Missing subscribe_bound_systemids and deliverer_send_requests, only unpickling pdus
+        def missing(*args):
+            raise AttributeError('No such method')
+        self.patch(SMPPServerPB, 'perspective_subscribe_bound_systemids', missing)
+        self.patch(SMPPServerPB, 'perspective_deliverer_send_requests', missing)
+
+        yield self.connect('127.0.0.1', self.pbPort)
+        self.assertEqual(None, self.bound_systemids)
+
+        pdu = DeliverSM(
+            source_addr='1111',
+            destination_addr='22222',
+            short_message='Some content',
+        )
+
+        # Requests are sent one by one, pickled
+        calls = []
+        callRemote = self.pb.callRemote
+        self.pb.callRemote = lambda *args: calls.append(args) or callRemote(*args)
+        r = yield defer.gatherResults([self.deliverer_send_request('any_system_id', codec.dumps(pdu, 'smpp'))
+                                       for _ in range(2)])
+
+        self.assertEqual([False, False], r)
+        self.assertEqual(['deliverer_send_request', 'deliverer_send_request'], [args[0] for args in calls])
+        self.assertEqual(b'Some content', pickle.loads(calls[0][2]).params['short_message'])
+        # Logged by SMPPServerPB
+        self.flushLoggedErrors(AttributeError)
+
+    @defer.inlineCallbacks
+    def test_bound_systemids_registry(self):
+        yield self.connect('127.0.0.1', self.pbPort)
+        self.assertEqual(set(), self.bound_systemids)
+
+        # Binding changes are pushed by SMPPServerPB
+        self.smpps_factory.notifyBoundSystemIdObservers('some_system_id', True)
+        yield self.version()
+        self.assertEqual({'some_system_id'}, self.bound_systemids)
+
+        self.smpps_factory.notifyBoundSystemIdObservers('some_system_id', False)
+        yield self.version()
+        self.assertEqual(set(), self.bound_systemids)
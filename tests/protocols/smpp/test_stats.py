@@ -50,12 +50,14 @@ class SMPPClientStatsCollectorBasicTestCases(TestCase):
                                         'elink_count': 0,
                                         'interceptor_count': 0,
                                         'interceptor_error_count': 0,
+                                        'interceptor_timeout_count': 0,
                                         'last_received_elink_at': 0,
                                         'last_received_pdu_at': 0,
                                         'last_sent_elink_at': 0,
                                         'last_sent_pdu_at': 0,
                                         'last_seqNum': None,
                                         'last_seqNum_at': 0,
+                                        'long_mo_expired_count': 0,
                                         'other_submit_error_count': 0,
                                         'submit_sm_count': 0,
                                         'submit_sm_request_count': 0,
@@ -142,6 +144,7 @@ class SMPPServerStatsCollectorBasicTestCases(TestCase):
                                         'unbind_count': 0,
                                         'interceptor_count': 0,
                                         'interceptor_error_count': 0,
+                                        'interceptor_timeout_count': 0,
                                         })
 
     def test_stats_set(self):
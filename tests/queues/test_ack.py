@@ -0,0 +1,84 @@
+"""
+Test cases for AckBatcher
+"""
+
+from twisted.internet import defer, task
+from twisted.trial.unittest import TestCase
+
+from jasmin.queues.ack import AckBatcher
+
+
+class Channel:
+    def __init__(self):
+        self.acks = []
+        self.rejects = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+        return defer.succeed(None)
+
+    def basic_reject(self, delivery_tag, requeue=0):
+        self.rejects.append((delivery_tag, requeue))
+        return defer.succeed(None)
+
+
+class AckBatcherTestCase(TestCase):
+    def setUp(self):
+        self.chan = Channel()
+        self.clock = task.Clock()
+
+    def deliver(self, batcher, count):
+        for tag in range(1, count + 1):
+            batcher.delivered(tag)
+
+    def test_no_batching(self):
+        batcher = AckBatcher(self.chan, clock=self.clock)
+        self.deliver(batcher, 2)
+
+        batcher.ack(2)
+        batcher.ack(1)
+        self.assertEqual(self.chan.acks, [(2, False), (1, False)])
+
+    def test_batch_size(self):
+        batcher = AckBatcher(self.chan, batch_size=3, clock=self.clock)
+        self.deliver(batcher, 6)
+
+        for tag in [2, 1, 3, 4, 5]:
+            batcher.ack(tag)
+
+        self.assertEqual(self.chan.acks, [(3, True)])
+        self.assertEqual(batcher.pending, [4, 5])
+
+    def test_interval(self):
+        batcher = AckBatcher(self.chan, batch_size=10, interval=0.5, clock=self.clock)
+        self.deliver(batcher, 3)
+
+        batcher.ack(1)
+        batcher.ack(2)
+        self.clock.advance(0.4)
+        self.assertEqual(self.chan.acks, [])
+
+        self.clock.advance(0.1)
+        self.assertEqual(self.chan.acks, [(2, True)])
+        self.assertEqual(batcher.timer, None)
+
+    def test_unsettled_are_not_acked(self):
+        batcher = AckBatcher(self.chan, batch_size=4, clock=self.clock)
+        self.deliver(batcher, 6)
+
+        # 3 is waiting for a delayed requeue
+        for tag in [1, 2, 4, 5]:
+            batcher.ack(tag)
+        self.assertEqual(self.chan.acks, [(2, True), (4, False), (5, False)])
+
+        batcher.reject(3, requeue=1)
+        self.assertEqual(self.chan.rejects, [(3, 1)])
+
+    def test_single_ack(self):
+        batcher = AckBatcher(self.chan, batch_size=4, clock=self.clock)
+        self.deliver(batcher, 1)
+
+        batcher.ack(1)
+        batcher.flush()
+        self.assertEqual(self.chan.acks, [(1, False)])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
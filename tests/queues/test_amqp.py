@@ -10,11 +10,13 @@ import uuid
 
 from twisted.internet import defer, reactor
 from twisted.trial.unittest import TestCase
+from txamqp.client import ChannelClosed
 from txamqp.content import Content
 from txamqp.queue import Closed
 
 from jasmin.queues.configs import AmqpConfig
 from jasmin.queues.factory import AmqpFactory
+from jasmin.queues.retry import backoff_delay, retry_count, original_routing_key
 
 
 @defer.inlineCallbacks
@@ -438,3 +440,118 @@ class RejectAndRequeueTestCase(ConsumeTools):
         self.assertEqual(self.consumedMessages, 50)
 
         yield self.amqp.disconnect()
+
+
+class PriorityQueueTestCase(AmqpTestCase):
+    queue_name = 'submit.sm.test_priority_queue'
+
+    @defer.inlineCallbacks
+    def publish(self, priorities):
+        for priority in priorities:
+            yield self.amqp.publish(exchange='messaging', routing_key=self.queue_name,
+                                    content=Content(str(priority), properties={'priority': priority}))
+
+    @defer.inlineCallbacks
+    def get_all(self):
+        bodies = []
+        while True:
+            msg = yield self.amqp.chan.basic_get(queue=self.queue_name, no_ack=True)
+            if msg.method.name == 'get-empty':
+                break
+            bodies.append(msg.content.body)
+
+        defer.returnValue(bodies)
+
+    @defer.inlineCallbacks
+    def test_migrating_queue_declare(self):
+        yield self.connect()
+        yield self.amqp.chan.exchange_declare(exchange='messaging', type='topic')
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+
+        # A FIFO queue holding messages
+        yield self.amqp.migrating_queue_declare(self.queue_name, {}, exchange='messaging',
+                                                routing_key=self.queue_name)
+        yield self.publish([0, 1])
+        yield waitFor(0.2)
+
+        # Migrated to a priority queue, messages are kept
+        yield self.amqp.migrating_queue_declare(self.queue_name, {'x-max-priority': 3}, exchange='messaging',
+                                                routing_key=self.queue_name)
+        yield self.publish([3])
+        yield waitFor(0.2)
+
+        self.assertEqual([b'3', b'1', b'0'], (yield self.get_all()))
+
+        # Declaring it again does not migrate it
+        yield self.amqp.migrating_queue_declare(self.queue_name, {'x-max-priority': 3}, exchange='messaging',
+                                                routing_key=self.queue_name)
+
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+        yield self.amqp.disconnect()
+
+    @defer.inlineCallbacks
+    def test_interrupted_migration(self):
+        yield self.connect()
+        yield self.amqp.chan.exchange_declare(exchange='messaging', type='topic')
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+
+        # Left bound and holding messages by a crashed migration
+        migration_queue = '%s.migration' % self.queue_name
+        yield self.amqp.chan.queue_declare(queue=migration_queue, arguments={'x-max-priority': 3})
+        yield self.amqp.chan.queue_bind(queue=migration_queue, exchange='messaging', routing_key=self.queue_name)
+        yield self.publish([0, 1])
+        yield waitFor(0.2)
+
+        yield self.amqp.migrating_queue_declare(self.queue_name, {'x-max-priority': 3}, exchange='messaging',
+                                                routing_key=self.queue_name)
+        yield self.publish([2])
+        yield waitFor(0.2)
+
+        self.assertEqual([b'2', b'1', b'0'], (yield self.get_all()))
+        chan = yield self.amqp.open_channel()
+        yield self.assertFailure(chan.queue_declare(queue=migration_queue, passive=True), ChannelClosed)
+
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+        yield self.amqp.disconnect()
+
+
+class RetryQueueTestCase(AmqpTestCase):
+    queue_name = 'test_retry_queue'
+
+    def test_backoff_delay(self):
+        self.assertEqual(5, backoff_delay(5, 1, 2, 3600))
+        self.assertEqual(20, backoff_delay(5, 3, 2, 3600))
+        self.assertEqual(30, backoff_delay(5, 10, 2, 30))
+
+    @defer.inlineCallbacks
+    def test_requeue_delayed(self):
+        yield self.connect()
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+        yield self.amqp.chan.queue_delete(queue='%s.retry.400' % self.queue_name)
+        yield self.amqp.named_queue_declare(queue=self.queue_name)
+        yield self.amqp.publish(exchange='', routing_key=self.queue_name,
+                                content=Content(self.message, properties={'message-id': 'abc'}))
+        yield waitFor(0.2)
+
+        msg = yield self.amqp.chan.basic_get(queue=self.queue_name, no_ack=False)
+        self.assertEqual(0, retry_count(msg))
+
+        # Second retry is backed off
+        delay = yield self.amqp.requeue_delayed(self.queue_name, msg, 0.2, 2)
+        yield self.amqp.chan.basic_ack(delivery_tag=msg.delivery_tag)
+        self.assertEqual(0.4, delay)
+
+        msg = yield self.amqp.chan.basic_get(queue=self.queue_name, no_ack=True)
+        self.assertEqual('get-empty', msg.method.name)
+
+        # Dead-lettered back once the delay expired
+        yield waitFor(0.8)
+        msg = yield self.amqp.chan.basic_get(queue=self.queue_name, no_ack=True)
+        self.assertEqual('get-ok', msg.method.name)
+        self.assertEqual(2, retry_count(msg))
+        self.assertEqual(self.queue_name, original_routing_key(msg))
+        self.assertEqual('abc', msg.content.properties['message-id'])
+
+        yield self.amqp.chan.queue_delete(queue=self.queue_name)
+        yield self.amqp.chan.queue_delete(queue='%s.retry.400' % self.queue_name)
+        yield self.amqp.disconnect()
@@ -3,6 +3,7 @@ import txredisapi as redis
 from twisted.internet import reactor, defer
 from jasmin.redis.configs import RedisForJasminConfig
 from jasmin.redis.client import ConnectionWithConfiguration
+from jasmin.redis.stats import RedisStatsCollector
 
 
 @defer.inlineCallbacks
@@ -125,6 +126,45 @@ class DataTestCase(object):
         g = yield self.redisClient.hgetall('h_test')
         self.assertEqual(g, {})
 
+    @defer.inlineCallbacks
+    def test_hmset_expire(self):
+        stats = RedisStatsCollector().get(self.redisClient._factory.uuid)
+        pipeline_count = stats.get('pipeline_count')
+
+        # Writes are written immediately by default
+        yield self.redisClient.hmset_expire('h_test_default', {'key_a': 'value_a'}, 5)
+        self.assertEqual(stats.get('pipeline_count'), pipeline_count)
+
+        # Writes are buffered and flushed together
+        self.redisClient._factory.config.write_batch_interval = 10
+        yield defer.DeferredList([
+            self.redisClient.hmset_expire('h_test_%s' % i, {'key_a': 'value_a', 'key_b': i}, 5)
+            for i in range(3)])
+
+        self.assertEqual(stats.get('pipeline_count'), pipeline_count + 1)
+        self.assertEqual(stats.get('last_pipeline_size'), 6)
+        for i in range(3):
+            g = yield self.redisClient.hgetall('h_test_%s' % i)
+            self.assertEqual(g, {'key_a': 'value_a', 'key_b': i})
+            ttl = yield self.redisClient.ttl('h_test_%s' % i)
+            self.assertTrue(0 < ttl <= 5)
+
+    @defer.inlineCallbacks
+    def test_hmset_expire_batch_size(self):
+        stats = RedisStatsCollector().get(self.redisClient._factory.uuid)
+        pipeline_count = stats.get('pipeline_count')
+        self.redisClient._factory.config.write_batch_interval = 60000
+        self.redisClient._factory.config.write_batch_size = 2
+
+        # Buffer is flushed as soon as write_batch_size writes are buffered
+        yield defer.DeferredList([
+            self.redisClient.hmset_expire('h_test_%s' % i, {'key_a': 'value_a'}, 5)
+            for i in range(2)])
+
+        self.assertEqual(stats.get('pipeline_count'), pipeline_count + 1)
+        self.assertEqual(stats.get('last_pipeline_size'), 4)
+
+
 class DataTestCaseWithAuth(AuthenticationTestCase, DataTestCase):
     pass
 
@@ -47,6 +47,20 @@ class TimeoutLeafServer(Resource):
         return 'render_POST'
 
 
+class DelayedAckServer(Resource):
+    """Acks after delay seconds without blocking the reactor"""
+    isLeaf = True
+    delay = 1
+
+    def render_POST(self, request):
+        reactor.callLater(self.delay, self._ack, request)
+        return server.NOT_DONE_YET
+
+    def _ack(self, request):
+        request.write(b'ACK/Jasmin')
+        request.finish()
+
+
 class Error404Server(Resource):
     isLeaf = True
 
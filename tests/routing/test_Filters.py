@@ -259,3 +259,48 @@ class TagFilterTestCase(FilterTestCase):
     def test_invalid_parameter(self):
         self.assertRaises(InvalidFilterParameterError, self.f.match, object)
         self.assertRaises(InvalidFilterParameterError, self._filter, object)
+
+
+class SourcePrefixFilterTestCase(FilterTestCase):
+    _filter = SourcePrefixFilter
+
+    def setUp(self):
+        FilterTestCase.setUp(self)
+        self.f = self._filter(['33', '2020', '202030'])
+
+    def test_standard(self):
+        self.assertTrue(self.f.match(self.routable))
+        self.assertEqual(self.f.getMatchedPrefix(self.routable), '202030')
+
+    def test_no_match(self):
+        f = self._filter(['33', '2021'])
+        self.assertFalse(f.match(self.routable))
+        self.assertEqual(f.getMatchedPrefix(self.routable), None)
+
+    def test_invalid_parameter(self):
+        self.assertRaises(InvalidFilterParameterError, self.f.match, object)
+        self.assertRaises(InvalidFilterParameterError, self._filter, object)
+        self.assertRaises(InvalidFilterParameterError, self._filter, [])
+        self.assertRaises(InvalidFilterParameterError, self._filter, [''])
+        self.assertRaises(InvalidFilterParameterError, self._filter, ['20 20'])
+
+    def test_is_picklable(self):
+        unpickledFilter = pickle.loads(pickle.dumps(self.f, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickledFilter.prefixes, self.f.prefixes)
+        self.assertEqual(unpickledFilter.getMatchedPrefix(self.routable), '202030')
+
+
+class DestinationPrefixFilterTestCase(FilterTestCase):
+    _filter = DestinationPrefixFilter
+
+    def setUp(self):
+        FilterTestCase.setUp(self)
+        self.f = self._filter(['%s' % p for p in range(1000, 3000)] + ['20203'])
+
+    def test_standard(self):
+        self.assertTrue(self.f.match(self.routable))
+        self.assertEqual(self.f.getMatchedPrefix(self.routable), '20203')
+
+    def test_invalid_parameter(self):
+        self.assertRaises(InvalidFilterParameterError, self.f.match, object)
+        self.assertRaises(InvalidFilterParameterError, self._filter, object)
@@ -1,11 +1,14 @@
 # pylint: disable=W0401,W0611
 
+import pickle
+
 from twisted.trial.unittest import TestCase
 from jasmin.routing.InterceptionTables import *
 from jasmin.routing.Interceptors import *
 from jasmin.routing.Filters import *
 from smpp.pdu.operations import SubmitSM, DeliverSM
 from jasmin.routing.Routables import RoutableSubmitSm, RoutableDeliverSm
+from jasmin.tools.eval import CompiledNode
 
 
 class InterceptionTableTests:
@@ -77,6 +80,16 @@ class InterceptionTableTests:
         allInterceptors = interception_t.getAll()
         self.assertEqual(len(allInterceptors), 1)
 
+    def test_scripts_are_compiled(self):
+        interception_t = self._interceptionTable()
+        interception_t.add(self.interceptor4, 0)
+        self.assertIn(hash(self.interceptor4.script.pyCode), CompiledNode().nodes)
+
+        # Loaded interceptors too
+        CompiledNode().nodes.clear()
+        pickle.loads(pickle.dumps(interception_t))
+        self.assertIn(hash(self.interceptor4.script.pyCode), CompiledNode().nodes)
+
 
 class MTInterceptionTableTestCase(InterceptionTableTests, TestCase):
     _interceptionTable = MTInterceptionTable
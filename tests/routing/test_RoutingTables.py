@@ -1,5 +1,7 @@
 # pylint: disable=W0401,W0611
 
+import pickle
+
 from twisted.trial.unittest import TestCase
 from jasmin.routing.RoutingTables import *
 from jasmin.routing.Routes import *
@@ -150,3 +152,89 @@ class MORoutingTableTestCase(RoutingTableTests, TestCase):
         self.routable_matching_route1 = RoutableDeliverSm(self.PDU_dst_1, self.connector1)
         self.routable_matching_route2 = RoutableDeliverSm(self.PDU_dst_2, self.connector1)
         self.routable_notmatching_any = RoutableDeliverSm(self.PDU_dst_3, self.connector1)
+
+
+class RoutingTableIndexTestCase(TestCase):
+    def setUp(self):
+        self.group100 = Group(100)
+        self.group200 = Group(200)
+        self.user1 = User(1, self.group100, 'username1', 'password')
+        self.user2 = User(2, self.group200, 'username2', 'password')
+        self.connectors = [SmppClientConnector('c%s' % i) for i in range(6)]
+
+    def linear_lookup(self, routing_t, routable):
+        for r in routing_t.getAll():
+            route = list(r.values())[0]
+            if route.matchFilters(routable):
+                return route
+
+        return None
+
+    def routable(self, destination_addr, user, tags=None):
+        routable = RoutableSubmitSm(SubmitSM(
+            source_addr=b'x',
+            destination_addr=destination_addr,
+            short_message=b'hello world',
+        ), user)
+        for tag in tags or []:
+            routable.addTag(tag)
+
+        return routable
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix(r'^2126\d+'), '2126')
+        self.assertEqual(literal_prefix(r'2126\d+'), '2126')
+        self.assertEqual(literal_prefix(r'^\+33\d+'), '+33')
+        self.assertEqual(literal_prefix(r'^2126$'), '2126')
+        self.assertEqual(literal_prefix(r'^212?6'), '21')
+        self.assertEqual(literal_prefix(r'^2{3}'), None)
+        self.assertEqual(literal_prefix(r'^21|^33'), None)
+        self.assertEqual(literal_prefix(r'^\d+'), None)
+        self.assertEqual(literal_prefix(r'.*'), None)
+
+    def test_same_result_as_linear_scan(self):
+        routing_t = MTRoutingTable()
+        routing_t.add(StaticMTRoute([UserFilter(self.user1), DestinationAddrFilter(r'^33\d+')],
+                                    self.connectors[0], 0.0), 90)
+        routing_t.add(StaticMTRoute([DestinationAddrFilter(r'^336\d+')], self.connectors[1], 0.0), 80)
+        routing_t.add(StaticMTRoute([GroupFilter(self.group200)], self.connectors[2], 0.0), 70)
+        routing_t.add(StaticMTRoute([TagFilter(32)], self.connectors[3], 0.0), 60)
+        routing_t.add(StaticMTRoute([DestinationAddrFilter(r'^(33|44)\d+')], self.connectors[4], 0.0), 50)
+        routing_t.add(StaticMTRoute([DestinationAddrFilter(r'^3')], self.connectors[5], 0.0), 40)
+        routing_t.add(DefaultRoute(self.connectors[0]), 0)
+
+        for destination_addr in [b'33612345', b'33712345', b'44712345', b'3', b'99', b'']:
+            for user in [self.user1, self.user2]:
+                for tags in [None, [32], [32, 32, 'x']]:
+                    routable = self.routable(destination_addr, user, tags)
+                    self.assertEqual(routing_t.getRouteFor(routable), self.linear_lookup(routing_t, routable))
+
+    def test_index_invalidation(self):
+        routing_t = MTRoutingTable()
+        route_1 = StaticMTRoute([DestinationAddrFilter(r'^33\d+')], self.connectors[1], 0.0)
+        route_2 = StaticMTRoute([UserFilter(self.user1)], self.connectors[2], 0.0)
+        routing_t.add(route_1, 10)
+        routable = self.routable(b'33612345', self.user1)
+        self.assertEqual(routing_t.getRouteFor(routable), route_1)
+
+        # Add a higher priority route
+        routing_t.add(route_2, 20)
+        self.assertEqual(routing_t.getRouteFor(routable), route_2)
+
+        # Remove it
+        routing_t.remove(20)
+        self.assertEqual(routing_t.getRouteFor(routable), route_1)
+
+        # Flush all
+        routing_t.flush()
+        self.assertEqual(routing_t.getRouteFor(routable), None)
+
+    def test_index_not_persisted(self):
+        routing_t = MTRoutingTable()
+        route = StaticMTRoute([DestinationAddrFilter(r'^33\d+')], self.connectors[1], 0.0)
+        routing_t.add(route, 10)
+        routing_t.getRouteFor(self.routable(b'33612345', self.user1))
+
+        self.assertNotIn('_index', routing_t.__getstate__())
+        loaded = pickle.loads(pickle.dumps(routing_t))
+        self.assertEqual(str(loaded.getRouteFor(self.routable(b'33612345', self.user1))), str(route))
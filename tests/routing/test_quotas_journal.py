@@ -0,0 +1,165 @@
+import os
+import pickle
+
+from twisted.trial.unittest import TestCase
+
+from jasmin.routing import journal
+from jasmin.routing.configs import RouterPBConfig
+from jasmin.routing.jasminApi import User, Group, MtMessagingCredential
+from jasmin.routing.router import RouterPB
+
+
+class QuotaJournalTestCases(TestCase):
+    def setUp(self):
+        self.path = self.mktemp()
+        self.journal = journal.QuotaJournal(self.path)
+
+    def tearDown(self):
+        self.journal.close()
+
+    def test_append_and_replay(self):
+        self.journal.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -1.5)
+        self.journal.append(journal.SET, 'u1', 'mt_credential', 'submit_sm_count', 10)
+        self.journal.append(journal.SET, 'u2', 'mt_credential', 'balance', None)
+        self.journal.close()
+
+        reopened = journal.QuotaJournal(self.path)
+        self.assertEqual([(2, '=', 'u1', 'mt_credential', 'submit_sm_count', 10),
+                          (3, '=', 'u2', 'mt_credential', 'balance', None)],
+                         reopened.replay(1))
+
+        # Sequence is going on where it was left
+        self.assertEqual(4, reopened.append(journal.UPDATE, 'u1', 'mt_credential', 'submit_sm_count', -1))
+        self.assertEqual(4, reopened.entries)
+        reopened.close()
+
+    def test_torn_tail_is_dropped(self):
+        self.journal.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -1.0)
+        self.journal.close()
+        with open(self.path, 'ab') as fh:
+            fh.write(b'2 + u1 mt_cre')
+
+        reopened = journal.QuotaJournal(self.path)
+        reopened.open()
+        self.assertEqual(1, reopened.seq)
+        reopened.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -2.0)
+        reopened.close()
+
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(b'1 + u1 mt_credential balance -1.0\n2 + u1 mt_credential balance -2.0\n', fh.read())
+
+    def test_truncate_keeps_sequence(self):
+        self.journal.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -1.0)
+        self.journal.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -1.0)
+        self.journal.truncate()
+        self.assertEqual(0, self.journal.entries)
+        self.journal.close()
+
+        reopened = journal.QuotaJournal(self.path)
+        self.assertEqual([], reopened.replay(0))
+        self.assertEqual(3, reopened.append(journal.UPDATE, 'u1', 'mt_credential', 'balance', -1.0))
+        reopened.close()
+
+    def test_snapshot_header(self):
+        header = 'Persisted on Sun Oct 18 10:00:00 2026 [Jasmin 0.11.1]%s\n' % journal.snapshot_header_suffix(42)
+
+        self.assertEqual(42, journal.snapshot_seq(header))
+        self.assertEqual(0, journal.snapshot_seq('Persisted on Sun Oct 18 10:00:00 2026 [Jasmin 0.11.1]\n'))
+
+
+class RouterQuotasJournalTestCases(TestCase):
+    def setUp(self):
+        self.store_path = self.mktemp()
+        os.mkdir(self.store_path)
+        self.routers = []
+        self.router = self.start_router()
+
+        mt_credential = MtMessagingCredential()
+        mt_credential.setQuota('balance', 10.0)
+        mt_credential.setQuota('submit_sm_count', 100)
+        self.router.perspective_group_add(pickle.dumps(Group('g1')))
+        self.router.perspective_user_add(pickle.dumps(User('u1', Group('g1'), 'username', 'password', mt_credential)))
+        self.assertTrue(self.router.perspective_persist())
+
+    def tearDown(self):
+        for router in self.routers:
+            router.cancelPersistenceTimer()
+            router.quota_journal.close()
+
+    def start_router(self):
+        config = RouterPBConfig()
+        config.store_path = self.store_path
+        router = RouterPB(config, persistenceTimer=False)
+        self.routers.append(router)
+
+        return router
+
+    def restart_router(self):
+        self.router.quota_journal.close()
+        self.router = self.start_router()
+        self.assertTrue(self.router.perspective_load())
+
+    def quotas(self):
+        mt_credential = self.router.getUser('u1').mt_credential
+        return mt_credential.getQuota('balance'), mt_credential.getQuota('submit_sm_count')
+
+    def test_updates_are_replayed_on_load(self):
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.5)
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'submit_sm_count', -1)
+        self.router.perspective_user_set_quota('u1', 'mt_credential', 'submit_sm_count', 50)
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'submit_sm_count', -2)
+
+        # Only the journal got written
+        self.assertEqual(4, self.router.quota_journal.entries)
+
+        self.restart_router()
+        self.assertEqual((8.5, 48), self.quotas())
+
+    def test_no_double_count_after_compaction_crash(self):
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+        journal_path = self.router.quota_journal.path
+        with open(journal_path, 'rb') as fh:
+            untruncated = fh.read()
+
+        # Crash right after the snapshot is written: journal is left untruncated
+        self.assertTrue(self.router.perspective_persist(scope='users'))
+        self.router.quota_journal.close()
+        with open(journal_path, 'wb') as fh:
+            fh.write(untruncated)
+
+        self.restart_router()
+        self.assertEqual((9.0, 100), self.quotas())
+
+        # Following updates are replayed
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+        self.restart_router()
+        self.assertEqual((8.0, 100), self.quotas())
+
+    def test_compaction(self):
+        self.router.config.quota_journal_compaction_entries = 2
+
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+        self.router.persistenceTimerExpired()
+        self.assertEqual(1, self.router.quota_journal.entries)
+
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+        self.router.persistenceTimerExpired()
+        self.assertEqual(0, self.router.quota_journal.entries)
+
+        self.restart_router()
+        self.assertEqual((8.0, 100), self.quotas())
+
+    def test_unjournaled_update_is_persisted(self):
+        self.router.getUser('u1').mt_credential.updateQuota('balance', -1.0)
+        self.router.persistenceTimerExpired()
+
+        self.restart_router()
+        self.assertEqual((9.0, 100), self.quotas())
+
+    def test_other_profiles_do_not_replay(self):
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+        self.assertTrue(self.router.perspective_persist(profile='other', scope='users'))
+        self.router.perspective_user_update_quota('u1', 'mt_credential', 'balance', -1.0)
+
+        self.assertTrue(self.router.perspective_load(profile='other', scope='users'))
+        self.assertEqual((9.0, 100), self.quotas())
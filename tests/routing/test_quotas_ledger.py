@@ -0,0 +1,168 @@
+import logging
+import pickle
+
+from twisted.internet import defer, reactor
+from twisted.trial.unittest import TestCase
+
+from jasmin.redis.client import ConnectionWithConfiguration
+from jasmin.redis.configs import RedisForJasminConfig
+from jasmin.routing.jasminApi import User, Group, MtMessagingCredential
+from jasmin.routing.ledger import QuotaLedger
+
+
+@defer.inlineCallbacks
+def waitFor(seconds):
+    # Wait seconds
+    waitDeferred = defer.Deferred()
+    reactor.callLater(seconds, waitDeferred.callback, None)
+    yield waitDeferred
+
+
+def make_user(balance=100.0, submit_sm_count=None):
+    mt_credential = MtMessagingCredential()
+    mt_credential.setQuota('balance', balance)
+    mt_credential.setQuota('submit_sm_count', submit_sm_count)
+
+    return User('ledger_u1', Group('g1'), 'username', 'password', mt_credential)
+
+
+class QuotaLedgerTestCases(TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        RedisForJasminConfigInstance = RedisForJasminConfig()
+        RedisForJasminConfigInstance.password = None
+        self.redisClient = yield ConnectionWithConfiguration(RedisForJasminConfigInstance)
+        yield self.redisClient._connected
+        yield self.redisClient.delete('quotas:ledger_u1')
+
+        self.ledgers = []
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for ledger in self.ledgers:
+            yield ledger.stop()
+        yield self.redisClient.delete('quotas:ledger_u1')
+        yield self.redisClient.disconnect()
+
+    def new_ledger(self, balance_lease=10.0, submit_sm_count_lease=10):
+        ledger = QuotaLedger(self.redisClient, {'balance': balance_lease, 'submit_sm_count': submit_sm_count_lease},
+                             logging.getLogger('test'))
+        self.ledgers.append(ledger)
+
+        return ledger
+
+    @defer.inlineCallbacks
+    def redis_quota(self, quota):
+        value = yield self.redisClient.hget('quotas:ledger_u1', quota)
+        defer.returnValue(None if value is None else float(value))
+
+    @defer.inlineCallbacks
+    def test_seed_and_lease(self):
+        user = make_user(submit_sm_count=50)
+        self.new_ledger().attach(user)
+        yield waitFor(0.1)
+
+        self.assertEqual(90.0, (yield self.redis_quota('balance')))
+        self.assertEqual(40, (yield self.redis_quota('submit_sm_count')))
+        self.assertEqual(100.0, user.mt_credential.getQuota('balance'))
+        self.assertEqual(50, user.mt_credential.getQuota('submit_sm_count'))
+
+        # Redis is authoritative once seeded
+        other_user = make_user(balance=1000.0)
+        self.new_ledger().attach(other_user)
+        yield waitFor(0.1)
+        self.assertEqual(90.0, other_user.mt_credential.getQuota('balance'))
+
+    @defer.inlineCallbacks
+    def test_shared_balance(self):
+        user_a, user_b = make_user(), make_user()
+        ledger_a, ledger_b = self.new_ledger(), self.new_ledger()
+        ledger_a.attach(user_a)
+        yield waitFor(0.1)
+        ledger_b.attach(user_b)
+        yield waitFor(0.1)
+
+        # Charged against the local lease, then topped up
+        user_a.mt_credential.updateQuota('balance', -15.0)
+        self.assertEqual(85.0, user_a.mt_credential.getQuota('balance'))
+        yield waitFor(0.1)
+        self.assertEqual(65.0, (yield self.redis_quota('balance')))
+
+        yield ledger_b.sync()
+        self.assertEqual(75.0, user_b.mt_credential.getQuota('balance'))
+
+        # Leases are given back
+        yield ledger_a.stop()
+        yield ledger_b.stop()
+        self.assertEqual(85.0, (yield self.redis_quota('balance')))
+
+    @defer.inlineCallbacks
+    def test_reserve(self):
+        user_a, user_b = make_user(balance=30.0), make_user()
+        ledger_a, ledger_b = self.new_ledger(), self.new_ledger()
+        ledger_a.attach(user_a)
+        yield waitFor(0.1)
+
+        # A fresh instance has no lease yet, its persisted balance is not charged
+        ledger_b.attach(user_b)
+        self.assertEqual(100.0, user_b.mt_credential.getQuota('balance'))
+        self.assertEqual(0, user_b.mt_credential.getAvailableQuota('balance'))
+
+        # Taken from redis when the lease cannot cover it
+        self.assertTrue((yield ledger_b.reserve(user_b.uid, {'balance': 15.0})))
+        self.assertEqual(15.0, user_b.mt_credential.getAvailableQuota('balance'))
+        self.assertEqual(5.0, (yield self.redis_quota('balance')))
+
+        # Rejected when redis does not have it
+        self.assertFalse((yield ledger_a.reserve(user_a.uid, {'balance': 20.0})))
+        self.assertEqual(15.0, user_a.mt_credential.getAvailableQuota('balance'))
+
+    @defer.inlineCallbacks
+    def test_no_lease(self):
+        user = make_user(balance=2.0, submit_sm_count=3)
+        self.new_ledger(balance_lease=0, submit_sm_count_lease=0).attach(user)
+        yield waitFor(0.1)
+
+        user.mt_credential.updateQuota('balance', -1.5)
+        user.mt_credential.updateQuota('submit_sm_count', -1)
+        yield waitFor(0.1)
+
+        self.assertEqual(0.5, (yield self.redis_quota('balance')))
+        self.assertEqual(2, (yield self.redis_quota('submit_sm_count')))
+        self.assertEqual(0.5, user.mt_credential.getQuota('balance'))
+        self.assertEqual(2, user.mt_credential.getQuota('submit_sm_count'))
+
+    @defer.inlineCallbacks
+    def test_set_and_credit(self):
+        user_a, user_b = make_user(), make_user()
+        ledger_a, ledger_b = self.new_ledger(), self.new_ledger()
+        ledger_a.attach(user_a)
+        ledger_b.attach(user_b)
+        yield waitFor(0.1)
+
+        user_a.mt_credential.setQuota('balance', 50.0)
+        yield waitFor(0.1)
+        user_a.mt_credential.updateQuota('balance', 5.0)
+        yield waitFor(0.1)
+        self.assertEqual(55.0, (yield self.redis_quota('balance')))
+
+        # Unlimited
+        user_a.mt_credential.setQuota('balance', None)
+        yield waitFor(0.1)
+        yield ledger_b.sync()
+        self.assertEqual(None, user_b.mt_credential.getQuota('balance'))
+
+    @defer.inlineCallbacks
+    def test_detach(self):
+        user = make_user()
+        ledger = self.new_ledger()
+        ledger.attach(user)
+        yield waitFor(0.1)
+
+        yield ledger.detach(user.uid)
+        self.assertEqual(None, user.mt_credential.quota_backend)
+        self.assertEqual(100.0, (yield self.redis_quota('balance')))
+
+        # Backend is not pickled
+        ledger.attach(user)
+        self.assertEqual(None, pickle.loads(pickle.dumps(user.mt_credential)).quota_backend)
@@ -0,0 +1,106 @@
+import glob
+import os
+import pickle
+import timeit
+
+from twisted.trial.unittest import TestCase
+
+from jasmin.routing.configs import RouterPBConfig
+from jasmin.routing.jasminApi import User, Group
+from jasmin.routing.router import RouterPB
+
+
+class RouterPBUsersTestCase(TestCase):
+    def setUp(self):
+        self.RouterPBConfigInstance = RouterPBConfig()
+        self.pbRoot_f = RouterPB(self.RouterPBConfigInstance, persistenceTimer=False)
+
+    def tearDown(self):
+        for path in glob.glob('%s/users-index-test.*' % self.RouterPBConfigInstance.store_path):
+            os.unlink(path)
+
+    def add_users(self, count, gid='g1'):
+        self.pbRoot_f.perspective_group_add(pickle.dumps(Group(gid)))
+        for i in range(count):
+            self.pbRoot_f.perspective_user_add(
+                pickle.dumps(User('u%s' % i, Group(gid), 'username%s' % i, 'password')))
+
+
+class UsersIndexTestCases(RouterPBUsersTestCase):
+    def test_add_and_get(self):
+        self.add_users(10)
+
+        self.assertEqual(self.pbRoot_f.getUser('u3').username, 'username3')
+        self.assertEqual(self.pbRoot_f.getUserByUsername('username3').uid, 'u3')
+        self.assertEqual(self.pbRoot_f.getGroup('g1').gid, 'g1')
+        self.assertEqual(self.pbRoot_f.authenticateUser('username3', 'password').uid, 'u3')
+        self.assertEqual(self.pbRoot_f.authenticateUser('username3', 'wrong'), None)
+        self.assertEqual(self.pbRoot_f.authenticateUser('unknown', 'password'), None)
+
+    def test_replace_user(self):
+        self.add_users(2)
+
+        # Replace u0 with a user having u1's username
+        self.pbRoot_f.perspective_user_add(pickle.dumps(User('u0', Group('g1'), 'username1', 'password')))
+
+        self.assertEqual(len(self.pbRoot_f.users), 1)
+        self.assertEqual(self.pbRoot_f.getUser('u1'), None)
+        self.assertEqual(self.pbRoot_f.getUserByUsername('username0'), None)
+        self.assertEqual(self.pbRoot_f.authenticateUser('username1', 'password').uid, 'u0')
+
+    def test_remove_user(self):
+        self.add_users(2)
+        self.assertTrue(self.pbRoot_f.perspective_user_remove('u0'))
+
+        self.assertEqual(len(self.pbRoot_f.users), 1)
+        self.assertEqual(self.pbRoot_f.getUser('u0'), None)
+        self.assertEqual(self.pbRoot_f.authenticateUser('username0', 'password'), None)
+        self.assertFalse(self.pbRoot_f.perspective_user_remove('u0'))
+
+    def test_remove_group(self):
+        self.add_users(2, 'g1')
+        self.add_users(1, 'g2')
+        self.assertTrue(self.pbRoot_f.perspective_group_remove('g1'))
+
+        self.assertEqual(self.pbRoot_f.getGroup('g1'), None)
+        self.assertEqual(self.pbRoot_f.getUser('u1'), None)
+        self.assertEqual(self.pbRoot_f.getUser('u0').group.gid, 'g2')
+
+        self.pbRoot_f.perspective_group_remove_all()
+        self.assertEqual(self.pbRoot_f.getGroup('g2'), None)
+        self.assertEqual(self.pbRoot_f.getUser('u0'), None)
+
+    def test_persist_and_load(self):
+        self.add_users(5)
+        self.assertTrue(self.pbRoot_f.perspective_persist(profile='users-index-test'))
+        self.pbRoot_f.perspective_user_remove_all()
+        self.pbRoot_f.perspective_group_remove_all()
+        self.assertEqual(self.pbRoot_f.getUser('u4'), None)
+
+        self.assertTrue(self.pbRoot_f.perspective_load(profile='users-index-test', scope='groups'))
+        self.assertTrue(self.pbRoot_f.perspective_load(profile='users-index-test', scope='users'))
+        self.assertEqual(self.pbRoot_f.getGroup('g1').gid, 'g1')
+        self.assertEqual(self.pbRoot_f.authenticateUser('username4', 'password').uid, 'u4')
+
+
+class AuthenticationBenchmarkTestCases(RouterPBUsersTestCase):
+    """Micro-benchmark: authenticateUser latency must not grow with the user count"""
+    if 'JASMIN_BENCHMARK' not in os.environ:
+        skip = 'Benchmark, set JASMIN_BENCHMARK to run it'
+
+    def auth_latency(self, users_count, iterations=2000):
+        self.add_users(users_count)
+
+        # Authenticate the last added user, the worst case of a linear scan
+        username = 'username%s' % (users_count - 1)
+        timer = timeit.Timer(lambda: self.pbRoot_f.authenticateUser(username, 'password'))
+        return min(timer.repeat(repeat=5, number=iterations)) / iterations
+
+    def test_auth_latency_vs_user_count(self):
+        latencies = {}
+        for users_count in [100, 20000]:
+            self.pbRoot_f.perspective_group_remove_all()
+            latencies[users_count] = self.auth_latency(users_count)
+
+        # A linear scan would be ~200 times slower with 20k users
+        self.assertLess(latencies[20000], latencies[100] * 10)
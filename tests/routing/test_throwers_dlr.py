@@ -10,7 +10,7 @@ from jasmin.queues.configs import AmqpConfig
 from jasmin.queues.factory import AmqpFactory
 from jasmin.routing.configs import DLRThrowerConfig
 from jasmin.routing.proxies import RouterPBProxy
-from tests.routing.http_server import TimeoutLeafServer, AckServer, NoAckServer, Error404Server
+from tests.routing.http_server import TimeoutLeafServer, AckServer, NoAckServer, Error404Server, DelayedAckServer
 from tests.routing.test_router import SubmitSmTestCaseTools
 from tests.routing.test_router_smpps import SMPPClientTestCases
 from jasmin.routing.throwers import DLRThrower
@@ -26,6 +26,8 @@ def waitFor(seconds):
 
 
 class DLRThrowerTestCases(TestCase):
+    max_inflight = 0
+
     @defer.inlineCallbacks
     def setUp(self):
         # Initiating config objects without any filename
@@ -46,6 +48,7 @@ class DLRThrowerTestCases(TestCase):
         DLRThrowerConfigInstance.timeout = 2
         DLRThrowerConfigInstance.retry_delay = 1
         DLRThrowerConfigInstance.max_retries = 2
+        DLRThrowerConfigInstance.max_inflight = self.max_inflight
 
         # Launch the DLRThrower
         self.DLRThrower = DLRThrower(DLRThrowerConfigInstance)
@@ -208,6 +211,62 @@ class HTTPDLRThrowerTestCase(DLRThrowerTestCases):
         self.assertEqual(callArgs[b'connector'][0], dlr_connector.encode())
 
 
+    @defer.inlineCallbacks
+    def test_throwing_http_connector_persistent_connection(self):
+        """Consecutive DLRs to the same host must reuse a pooled connection"""
+        self.AckServerResource.render_GET = Mock(wraps=self.AckServerResource.render_GET)
+        stats = self.DLRThrower.stats
+        hits, misses = stats.get('http_pool_hit_count'), stats.get('http_pool_miss_count')
+
+        dlr_url = 'http://127.0.0.1:%s/dlr' % self.AckServer.getHost().port
+        self.publishDLRContentForHttpapi('DELIVRD', 'msgid-1', dlr_url, 1, method='GET')
+        yield waitFor(1)
+        self.publishDLRContentForHttpapi('DELIVRD', 'msgid-2', dlr_url, 1, method='GET')
+        yield waitFor(1)
+
+        self.assertEqual(self.AckServerResource.render_GET.call_count, 2)
+        self.assertEqual(stats.get('http_pool_miss_count') - misses, 1)
+        self.assertEqual(stats.get('http_pool_hit_count') - hits, 1)
+
+
+class HTTPDLRThrowerMaxInflightTestCase(DLRThrowerTestCases):
+    max_inflight = 2
+    publishDLRContentForHttpapi = HTTPDLRThrowerTestCase.publishDLRContentForHttpapi
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield DLRThrowerTestCases.setUp(self)
+
+        self.DelayedAckServerResource = DelayedAckServer()
+        self.DelayedAckServer = reactor.listenTCP(0, server.Site(self.DelayedAckServerResource))
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield DLRThrowerTestCases.tearDown(self)
+
+        yield self.DelayedAckServer.stopListening()
+
+    @defer.inlineCallbacks
+    def test_throwing_http_connector_max_inflight(self):
+        self.DelayedAckServerResource.render_POST = Mock(wraps=self.DelayedAckServerResource.render_POST)
+        stats = self.DLRThrower.stats
+
+        dlr_url = 'http://127.0.0.1:%s/dlr' % self.DelayedAckServer.getHost().port
+        for i in range(4):
+            self.publishDLRContentForHttpapi('DELIVRD', 'msgid-%s' % i, dlr_url, 1)
+
+        yield waitFor(0.5)
+
+        # Only max_inflight DLRs are thrown at once
+        self.assertEqual(self.DelayedAckServerResource.render_POST.call_count, 2)
+        self.assertEqual(stats.get('inflight_count'), 2)
+
+        yield waitFor(2.5)
+
+        self.assertEqual(self.DelayedAckServerResource.render_POST.call_count, 4)
+        self.assertEqual(stats.get('inflight_count'), 0)
+
+
 class SMPPDLRThrowerTestCases(RouterPBProxy, SMPPClientTestCases, SubmitSmTestCaseTools):
     @defer.inlineCallbacks
     def setUp(self):